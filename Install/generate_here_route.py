@@ -4,13 +4,25 @@ import sys
 import traceback
 import pythonaddins
 
-from src.util.helper import get_scratch_gdb, clear_scratch_gdb
+from src.util.helper import ScratchWorkspace, get_default_parameters, with_scratch_workspace
 from src.config.schema import default_schemas
+from src.tss.ags import build_numeric_in_sql_expression, build_string_in_sql_expression
+from src.tss.ags.dao_util import get_count
+from src.tss.ags.field_util import get_field_details
+from src.tss.ags.table_join_util import join_to_dataset, get_transferable_fields
+from src.tss.ags.spatial_index_util import load_route_locator
+from src.tss.ags.feature_array_util import load_polyline_array
+from src.tss.ags.route_util import validate_route_dataset, write_route_validation_table, get_validation_table_path, \
+    write_routes
+from src.tss.route_builder_util import build_routes
+from src.tss.route_validation_util import validate_routes
+from src.tss.instrument_util import RunReport, get_report_path
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+@with_scratch_workspace
 def generate_here_route(**kwargs):
     """
     Generate a route feature from HERE link segments.
@@ -26,39 +38,61 @@ def generate_here_route(**kwargs):
     check_non_monotonic_routes = kwargs.get('check_non_monotonic_routes', True)
     only_generate_continuous_routes = kwargs.get('only_generate_continuous_routes', True)
     only_generate_monotonic_routes = kwargs.get('only_generate_monotonic_routes', True)
+    gap_tolerance = kwargs.get('gap_tolerance', 0.0)
+    route_engine = kwargs.get('route_engine', 'arcpy')
+    validation_table = kwargs.get('validation_table', None) or get_validation_table_path(output_here_route)
+    run_report = kwargs.get('run_report', None) or RunReport('generate_here_route', get_count)
+    scratch_workspace = kwargs['scratch_workspace']
 
-    scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
-
-    arcpy.env.workspace = scratch_gdb
     arcpy.env.overwriteOutput = True
 
-    # Intermediate output
-    here_route_raw = os.path.join(scratch_gdb, 'here_route_raw')
-    here_route_tbg = os.path.join(scratch_gdb, 'here_route_tbg')
-
-    # Create Route
-    arcpy.CreateRoutes_lr(here_link, route_id_field, here_route_raw, "LENGTH", "#", "#", "LOWER_LEFT")
-
-    # Check gaps
-    multi_part_routes = []
-    if check_gaps:
-        logger.info("Checking gaps along routes...")
-        with arcpy.da.SearchCursor(here_route_raw, [route_id_field, 'SHAPE@']) as sCur:
-            for row in sCur:
-                rid = row[0]
-                shape = row[1]
-
-                if shape.isMultipart:
-                    arcpy.AddMessage("Gap(s) detected on route: '{0}'".format(rid))
-                    if rid not in multi_part_routes:
-                        multi_part_routes.append(rid)
-        del sCur
+    # Intermediate output, there are fewer routes than links
+    here_route_raw = scratch_workspace.path('here_route_raw', get_count(here_link))
+    here_route_tbg = 'here_route_tbg'
+
+    routes = build = None
+    if route_engine == 'in_memory':
+        # Order the links of every route by walking their end points and check the routes while they are built,
+        # nothing is written before the output routes
+        with run_report.stage('build_routes', inputs=here_link) as stage:
+            spatial_reference = arcpy.Describe(here_link).spatialReference
+            links, attributes = load_polyline_array(here_link, route_id_field, spatial_reference=spatial_reference)
+            routes, build = build_routes(links, links.ids, spatial_reference.XYTolerance)
+            stage.output_rows = len(routes)
+    else:
+        # Create Route
+        with run_report.stage('create_routes', inputs=here_link, outputs=here_route_raw):
+            arcpy.CreateRoutes_lr(here_link, route_id_field, here_route_raw, "LENGTH", "#", "#", "LOWER_LEFT")
+
+    # Check gaps and monotonicity in one pass, the diagnostics of every route go to the validation table
+    with run_report.stage('validate_routes', inputs=here_route_raw if routes is None else None,
+                          outputs=validation_table) as stage:
+        multi_part_routes = []
+        non_monotonic_routes = []
+        if check_gaps or check_non_monotonic_routes:
+            logger.info("Checking gaps and non-monotonic routes...")
+            if routes is None:
+                validation = validate_route_dataset(here_route_raw, route_id_field, gap_tolerance)
+                route_id_field_details = get_field_details(here_route_raw, route_id_field)
+            else:
+                validation = validate_routes(routes, gap_tolerance)
+                route_id_field_details = get_field_details(here_link, route_id_field)
+            write_route_validation_table(validation, validation_table, route_id_field, route_id_field_details,
+                                         build=build)
+            if check_gaps:
+                multi_part_routes = validation.gapped_route_ids()
+                if build is not None:
+                    # a branch is a gap of the route as well, CreateRoutes would have made it another part
+                    multi_part_routes = sorted(set(multi_part_routes) | set(build.branched_route_ids()))
+            if check_non_monotonic_routes:
+                non_monotonic_routes = validation.non_monotonic_route_ids()
+            stage.output_rows = len(validation)
 
     if len(multi_part_routes):
-        logger.warning("Please fix gaps detected on routes listed above before continuing.")
+        logger.warning("Gap(s) detected on {0} route(s), see the GAP_COUNT field of the validation table '{1}'. "
+                       "Please fix them before continuing.".format(len(multi_part_routes), validation_table))
 
-        msg = "Gaps are detected on routes listed above! Do you want to continue anyway? \n " \
+        msg = "Gaps are detected on routes listed in the validation table! Do you want to continue anyway? \n " \
               "(Click 'Yes' to continue. Click 'No' to quit. No output will be generated.)"
         logger.info(msg)
 
@@ -69,15 +103,10 @@ def generate_here_route(**kwargs):
             sys.exit()
         logger.info("User selected 'Yes' to continue.")
 
-    # Check monotonic
-    non_monotonic_routes = []
-    if check_non_monotonic_routes:
-        logger.info("Checking non-monotonic routes...")
-        non_monotonic_routes = detect_non_monotonic_routes(here_route_raw, route_id_field)
-        for route in non_monotonic_routes:
-            arcpy.AddMessage("Non-monotonic route (id: '{0}') is found!".format(route))
-
     if len(non_monotonic_routes) > 0:
+        logger.warning("{0} non-monotonic route(s) found, see the MONOTONIC field of the validation table '{1}'."
+                       .format(len(non_monotonic_routes), validation_table))
+
         msg = "Non-monotonic routes are found! Do you want to generate route features anyway? \n " \
               "(Click 'Yes' to continue. Click 'No' to quit. No output will be generated.)"
         logger.info(msg)
@@ -92,27 +121,33 @@ def generate_here_route(**kwargs):
     # TODO: add ability to compare the length of generated HERE route features and DOT route features
 
 
-    if not only_generate_continuous_routes and not only_generate_monotonic_routes:
-        arcpy.CopyFeatures_management(here_route_raw, output_here_route)
-        return
-
-
     rid_tbr = []
     if only_generate_continuous_routes and len(multi_part_routes):
         logger.info('Only continuous routes will be generated in the output...')
-        for route in multi_part_routes:
-            rid_tbr.append("'{0}'".format(route))
+        rid_tbr.extend(multi_part_routes)
 
     if only_generate_monotonic_routes and len(non_monotonic_routes):
         logger.info('Only continuous routes will be generated in the output...')
-        for route in non_monotonic_routes:
-            rid_tbr.append("'{0}'".format(route))
-
-    where_clause = "{0} NOT IN ({1})".format(route_id_field, ','.join(rid_tbr)) if len(rid_tbr) else "1=1"
-    arcpy.MakeFeatureLayer_management(here_route_raw, here_route_tbg, where_clause=where_clause)
-    arcpy.CopyFeatures_management(here_route_tbg, output_here_route)
-
-
+        rid_tbr.extend(non_monotonic_routes)
+
+    with run_report.stage('write_routes', outputs=output_here_route):
+        if routes is not None:
+            rid_tbr = set(rid_tbr)
+            write_routes(routes, output_here_route, route_id_field, get_field_details(here_link, route_id_field),
+                         spatial_reference, [i for i, rid in enumerate(routes.ids) if rid not in rid_tbr])
+        elif len(rid_tbr):
+            rid_tbr = list(set(rid_tbr))
+            where_clause = "NOT ({0})".format(
+                build_string_in_sql_expression(route_id_field, rid_tbr)
+                if get_field_details(here_route_raw, route_id_field)['field_type'] == 'TEXT'
+                else build_numeric_in_sql_expression(route_id_field, rid_tbr))
+            arcpy.MakeFeatureLayer_management(here_route_raw, here_route_tbg, where_clause=where_clause)
+            arcpy.CopyFeatures_management(here_route_tbg, output_here_route)
+        else:
+            arcpy.CopyFeatures_management(here_route_raw, output_here_route)
+
+
+@with_scratch_workspace
 def linear_reference_here_link_along_route(**kwargs):
     """
     Linear referencing link feature along route
@@ -125,82 +160,117 @@ def linear_reference_here_link_along_route(**kwargs):
     route_id_field = kwargs.get('route_id_field', None)
     here_link = kwargs.get('here_link', None)
     output_here_link_event = kwargs.get('output_here_link_event', None)
+    locate_engine = kwargs.get('locate_engine', 'arcpy')
+    run_report = kwargs.get('run_report', None) or RunReport('generate_here_route', get_count)
+    scratch_workspace = kwargs['scratch_workspace']
 
-    scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
-
-    arcpy.env.workspace = scratch_gdb
     arcpy.env.overwriteOutput = True
 
+    if locate_engine == 'in_memory':
+        with run_report.stage('locate_links', inputs=here_link, outputs=output_here_link_event):
+            locate_here_link_along_route_in_memory(here_route, route_id_field, here_link, output_here_link_event)
+        return
+
     # Intermediate outputs
-    here_link_for_locate= os.path.join(scratch_gdb, 'here_link_for_locate')
-    here_link_along_route_locate_table = os.path.join(scratch_gdb, 'here_link_along_route_locate_table')
+    link_count = get_count(here_link)
+    here_link_for_locate = scratch_workspace.path('here_link_for_locate', link_count)
+    here_link_along_route_locate_table = scratch_workspace.path('here_link_along_route_locate_table', link_count)
 
-    arcpy.CopyFeatures_management(here_link, here_link_for_locate)
+    with run_report.stage('locate_links', inputs=here_link, outputs=here_link_along_route_locate_table):
+        arcpy.CopyFeatures_management(here_link, here_link_for_locate)
 
-    # arcpy.MakeFeatureLayer_management(here_link, here_link_for_locate_lyr)
-    arcpy.AddField_management(here_link_for_locate, 'TSSID', 'LONG')
-    arcpy.CalculateField_management(here_link_for_locate, 'TSSID', '!%s!' % arcpy.Describe(here_link_for_locate).OIDFieldName, 'PYTHON')
+        # arcpy.MakeFeatureLayer_management(here_link, here_link_for_locate_lyr)
+        arcpy.AddField_management(here_link_for_locate, 'TSSID', 'LONG')
+        arcpy.CalculateField_management(here_link_for_locate, 'TSSID', '!%s!' % arcpy.Describe(here_link_for_locate).OIDFieldName, 'PYTHON')
 
-    arcpy.LocateFeaturesAlongRoutes_lr(here_link_for_locate, here_route, route_id_field, '0 Meters', here_link_along_route_locate_table,
-                                       'RID LINE FMEAS TMEAS')
+        arcpy.LocateFeaturesAlongRoutes_lr(here_link_for_locate, here_route, route_id_field, '0 Meters', here_link_along_route_locate_table,
+                                           'RID LINE FMEAS TMEAS')
 
-    arcpy.JoinField_management(here_link_for_locate, 'TSSID', here_link_along_route_locate_table, 'TSSID', ['RID', 'FMEAS', 'TMEAS'])
+        arcpy.JoinField_management(here_link_for_locate, 'TSSID', here_link_along_route_locate_table, 'TSSID', ['RID', 'FMEAS', 'TMEAS'])
 
     # Get links that are correctly located to the candidate route
-    here_link_for_locate_lyr = 'here_link_for_locate_lyr'
-    arcpy.MakeFeatureLayer_management(here_link_for_locate, here_link_for_locate_lyr)
-    arcpy.SelectLayerByAttribute_management(here_link_for_locate_lyr, 'NEW_SELECTION', "{1} IS NOT NULL AND {0} = {1}".format(route_id_field, 'RID'))
-
-    out_here_link_fields = []
-    for field in arcpy.ListFields(here_link_for_locate_lyr):
-        if field.name.lower() not in ['objectid', 'shape', 'shape_length']:
-            out_here_link_fields.append(field.name)
-
-    field_mappings = arcpy.FieldMappings()
-    for field in out_here_fields + ['RID', 'FMEAS', 'TMEAS']:
-        # arcpy.AddMessage("{0}".format(field))
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(here_link_for_locate_lyr, field)
-        field_name = field_map.outputField
-        field_name.name = field if field != 'RID' else 'DOT_RID'
-        field_name.aliasName = field if field != 'RID' else 'DOT_RID'
-        field_map.outputField = field_name
-        field_mappings.addFieldMap(field_map)
-
-    arcpy.FeatureClassToFeatureClass_conversion(here_link_for_locate_lyr, os.path.dirname(output_here_link_event),
-                                                os.path.basename(output_here_link_event),
-                                                field_mapping=field_mappings)
+    with run_report.stage('write_link_events', outputs=output_here_link_event):
+        here_link_for_locate_lyr = 'here_link_for_locate_lyr'
+        arcpy.MakeFeatureLayer_management(here_link_for_locate, here_link_for_locate_lyr)
+        arcpy.SelectLayerByAttribute_management(here_link_for_locate_lyr, 'NEW_SELECTION', "{1} IS NOT NULL AND {0} = {1}".format(route_id_field, 'RID'))
+
+        out_here_link_fields = []
+        for field in arcpy.ListFields(here_link_for_locate_lyr):
+            if field.name.lower() not in ['objectid', 'shape', 'shape_length']:
+                out_here_link_fields.append(field.name)
+
+        field_mappings = arcpy.FieldMappings()
+        for field in out_here_fields + ['RID', 'FMEAS', 'TMEAS']:
+            # arcpy.AddMessage("{0}".format(field))
+            field_map = arcpy.FieldMap()
+            field_map.addInputField(here_link_for_locate_lyr, field)
+            field_name = field_map.outputField
+            field_name.name = field if field != 'RID' else 'DOT_RID'
+            field_name.aliasName = field if field != 'RID' else 'DOT_RID'
+            field_map.outputField = field_name
+            field_mappings.addFieldMap(field_map)
+
+        arcpy.FeatureClassToFeatureClass_conversion(here_link_for_locate_lyr, os.path.dirname(output_here_link_event),
+                                                    os.path.basename(output_here_link_event),
+                                                    field_mapping=field_mappings)
+
+
+def locate_here_link_along_route_in_memory(here_route, route_id_field, here_link, output_here_link_event):
+    """
+    Locate the HERE links along the HERE routes without LocateFeaturesAlongRoutes: the routes are loaded into a
+    RouteLocator once and the end points of every link are projected on them. Only the links located on the route of
+    their candidate are written, with the fields of the HERE link feature class and their from/to measures.
+    :param here_route:
+    :param route_id_field:
+    :param here_link: HERE links with the route id of their candidate
+    :param output_here_link_event:
+    :return:
+    """
+    spatial_reference = arcpy.Describe(here_route).spatialReference
+    locator = load_route_locator(here_route, route_id_field, spatial_reference=spatial_reference)
+    route_code_dict = dict((route_id, i) for i, route_id in enumerate(locator.route_ids))
+
+    link_fields = [field.name for field in get_transferable_fields(here_link)]
+    link_rows = []
+    start_points = []
+    end_points = []
+    with arcpy.da.SearchCursor(here_link, ['SHAPE@'] + link_fields, spatial_reference=spatial_reference) as sCur:
+        for row in sCur:
+            shape = row[0]
+            if shape is None:
+                continue
+            link_rows.append(row)
+            start_points.append((shape.firstPoint.X, shape.firstPoint.Y))
+            end_points.append((shape.lastPoint.X, shape.lastPoint.Y))
+
+    line_index, route_index, from_measure, to_measure, distance = locator.locate_lines(
+        start_points, end_points, spatial_reference.XYTolerance)
+
+    # keep the location on the candidate route of every link
+    route_id_index = [field.lower() for field in link_fields].index(route_id_field.lower()) + 1
+    link_route_codes = [route_code_dict.get(row[route_id_index], -1) for row in link_rows]
+    arcpy.CreateFeatureclass_management(os.path.dirname(output_here_link_event),
+                                        os.path.basename(output_here_link_event), 'POLYLINE', here_link,
+                                        spatial_reference=spatial_reference)
+    arcpy.AddField_management(output_here_link_event, 'FMEAS', 'DOUBLE')
+    arcpy.AddField_management(output_here_link_event, 'TMEAS', 'DOUBLE')
+    located_count = 0
+    with arcpy.da.InsertCursor(output_here_link_event, ['SHAPE@'] + link_fields + ['FMEAS', 'TMEAS']) as iCur:
+        for i, r, fmeas, tmeas in zip(line_index.tolist(), route_index.tolist(), from_measure.tolist(),
+                                      to_measure.tolist()):
+            if link_route_codes[i] == r:
+                iCur.insertRow(tuple(link_rows[i]) + (fmeas, tmeas))
+                located_count += 1
+    logger.info("{0} of {1} HERE links located along their route".format(located_count, len(link_rows)))
 
 
 """
 Head up! In our use cases, if two consecutive vertices have the same m-value, that route is still considered
-monotonic (increasing/decreasing with levels). If you want to exclude those routes in the output, you can just
-replace the “<=” and “>=” in line 20 & 23 with “<” and “>”
+monotonic (increasing/decreasing with levels). Those routes have a LEVEL_RUN_COUNT above 0 in the validation table if
+you want to exclude them from the output.
 """
 def detect_non_monotonic_routes(route, route_id_field_name):
-    sCur = arcpy.SearchCursor(route)
-    LoopRouteList = []
-    for sRec in sCur:
-        shape = sRec.shape
-        if not measure_strictly_aligned(shape):
-            LoopRouteList.append(sRec.getValue(route_id_field_name))
-    return LoopRouteList
-
-def measure_strictly_aligned(shape):
-    measure_list = []
-    for part_num in xrange(0, shape.partCount):
-        for pnt in shape.getPart(part_num):
-            if pnt:
-                # If the pnt is None, this represents an interior ring
-                measure_list.append(pnt.M)
-    return strictly_increasing_or_with_levels(measure_list) or strictly_decreasing_or_with_levels(measure_list)
-
-def strictly_increasing_or_with_levels(L):
-    return all(x<=y for x, y in zip(L, L[1:]))
-
-def strictly_decreasing_or_with_levels(L):
-    return all(x>=y for x, y in zip(L, L[1:]))
+    return validate_route_dataset(route, route_id_field_name).non_monotonic_route_ids()
 
 
 
@@ -217,10 +287,16 @@ if __name__ == '__main__':
     check_non_monotonic_routes = arcpy.GetParameter(8)
     only_generate_monotonic_routes = arcpy.GetParameter(9)
 
+    Config = get_default_parameters()
+    in_memory_max_rows = Config.get('Default', 'in_memory_max_rows') if Config.has_option('Default', 'in_memory_max_rows') else None
+    route_gap_tolerance = Config.get('Default', 'route_gap_tolerance') if Config.has_option('Default', 'route_gap_tolerance') else None
+    locate_engine = Config.get('Default', 'locate_engine') if Config.has_option('Default', 'locate_engine') else 'arcpy'
+    route_engine = Config.get('Default', 'route_engine') if Config.has_option('Default', 'route_engine') else 'arcpy'
+
     scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    scratch_workspace = ScratchWorkspace(scratch_folder, in_memory_max_rows=int(in_memory_max_rows) if in_memory_max_rows else 0)
 
-    arcpy.env.workspace = scratch_gdb
+    arcpy.env.workspace = scratch_workspace.gdb
     arcpy.env.overwriteOutput = True
 
     SECTION = "candidate_table"
@@ -245,103 +321,64 @@ if __name__ == '__main__':
     conf_lvl_options = ['Medium', 'High', 'User Confirmed']
 
     # Temporary output
+    link_count = get_count(here_link)
     match_candidate_above_conf_lvl_thld_tabv = 'match_candidate_above_conf_lvl_thld_tbv'
-    match_candidate_above_conf_lvl_thld = os.path.join(scratch_gdb, 'match_candidate_above_conf_lvl_thld')
-    match_candidate_above_conf_lvl_thld_frq = os.path.join(scratch_gdb, 'match_candidate_above_conf_lvl_thld_frq')
-    here_link_copy = os.path.join(scratch_gdb, 'here_link_copy')
-    here_link_above_conf_lvl_thld = os.path.join(scratch_gdb, 'here_link_above_conf_lvl_thld')
-    here_link_above_conf_lvl_w_rid = os.path.join(scratch_gdb, 'here_link_above_conf_lvl_w_rid')
+    match_candidate_above_conf_lvl_thld = scratch_workspace.path('match_candidate_above_conf_lvl_thld', link_count)
+    match_candidate_above_conf_lvl_thld_frq = scratch_workspace.path('match_candidate_above_conf_lvl_thld_frq', link_count)
+    here_link_above_conf_lvl_w_rid = scratch_workspace.path('here_link_above_conf_lvl_w_rid', link_count)
+
+    run_report = RunReport('generate_here_route', get_count)
+    run_report.parameters = {'match_candidate_table': match_candidate_table, 'here_link': here_link,
+                             'conf_lvl_thld': conf_lvl_thld, 'output_here_route': output_here_route,
+                             'output_here_link_event': output_here_link_event}
 
     try:
         # Get match candidate of interest
-        conf_lvl_tbv = []
-        for i in range(conf_lvl_options.index(conf_lvl_thld), len(conf_lvl_options)):
-            conf_lvl_tbv.append("'{0}'".format(conf_lvl_options[i]))
+        with run_report.stage('select_candidates', inputs=match_candidate_table, outputs=match_candidate_above_conf_lvl_thld):
+            conf_lvl_tbv = []
+            for i in range(conf_lvl_options.index(conf_lvl_thld), len(conf_lvl_options)):
+                conf_lvl_tbv.append("'{0}'".format(conf_lvl_options[i]))
 
-        where_clause = "{0} IN ({1})".format(candidate_table_conf_lvl_field, ','.join(conf_lvl_tbv))
-        arcpy.MakeTableView_management(match_candidate_table, match_candidate_above_conf_lvl_thld_tabv,
-                                       where_clause=where_clause)
+            where_clause = "{0} IN ({1})".format(candidate_table_conf_lvl_field, ','.join(conf_lvl_tbv))
+            arcpy.MakeTableView_management(match_candidate_table, match_candidate_above_conf_lvl_thld_tabv,
+                                           where_clause=where_clause)
 
-        arcpy.CopyRows_management(match_candidate_above_conf_lvl_thld_tabv, match_candidate_above_conf_lvl_thld)
+            arcpy.CopyRows_management(match_candidate_above_conf_lvl_thld_tabv, match_candidate_above_conf_lvl_thld)
 
         # Check if there any duplicate of match candidates on link id and route id
-        arcpy.Frequency_analysis(match_candidate_above_conf_lvl_thld, match_candidate_above_conf_lvl_thld_frq,
-                                 frequency_fields=[candidate_table_here_lid_field, candidate_table_dot_rid_field])
-
-        link_route_match_duplicates_dict = {}
-        with arcpy.da.SearchCursor(match_candidate_above_conf_lvl_thld_frq,
-                                   [candidate_table_here_lid_field, candidate_table_dot_rid_field, 'FREQUENCY']) as sCur:
-            for row in sCur:
-                here_lid = row[0]
-                dot_rid = row[1]
-                frq = row[2]
-
-                if frq > 1:
-                    if here_lid not in link_route_match_duplicates_dict.keys():
-                        link_route_match_duplicates_dict[here_lid] = []
-                    if dot_rid not in link_route_match_duplicates_dict[here_lid]:
-                        link_route_match_duplicates_dict[here_lid].append(dot_rid)
-                    logger.info("Multiple records exist for the match between HERE link (id: '{0}') and DOT route (id: {1})!".format(here_lid, dot_rid))
-
-        del sCur
+        with run_report.stage('check_duplicates', inputs=match_candidate_above_conf_lvl_thld):
+            arcpy.Frequency_analysis(match_candidate_above_conf_lvl_thld, match_candidate_above_conf_lvl_thld_frq,
+                                     frequency_fields=[candidate_table_here_lid_field, candidate_table_dot_rid_field])
+
+            link_route_match_duplicates_dict = {}
+            with arcpy.da.SearchCursor(match_candidate_above_conf_lvl_thld_frq,
+                                       [candidate_table_here_lid_field, candidate_table_dot_rid_field, 'FREQUENCY']) as sCur:
+                for row in sCur:
+                    here_lid = row[0]
+                    dot_rid = row[1]
+                    frq = row[2]
+
+                    if frq > 1:
+                        if here_lid not in link_route_match_duplicates_dict.keys():
+                            link_route_match_duplicates_dict[here_lid] = []
+                        if dot_rid not in link_route_match_duplicates_dict[here_lid]:
+                            link_route_match_duplicates_dict[here_lid].append(dot_rid)
+                        logger.info("Multiple records exist for the match between HERE link (id: '{0}') and DOT route (id: {1})!".format(here_lid, dot_rid))
+
+            del sCur
 
         if len(link_route_match_duplicates_dict.keys()):
             logger.warning("Please remove all match candidate duplicates listed above before continue!")
             sys.exit()
 
-        # Join one-to-many link route candidates to here link features
-        arcpy.CopyFeatures_management(here_link, here_link_copy)
-
-        out_here_fields = []
-        for field in arcpy.ListFields(here_link):
-            if field.name.lower() not in ['objectid', 'shape', 'shape_length']:
-                out_here_fields.append(field.name)
-
-        # Do one-to-many joining by 'Make Query Table'
-        here_link_above_conf_lvl_thld_lyr = 'here_link_above_conf_lvl_thld_lyr'
-        try:
-            # Assumes 'here_link_id_field' and 'candidate_table_here_lid_field' are the same type
-            arcpy.MakeQueryTable_management([here_link_copy, match_candidate_above_conf_lvl_thld],
-                                            here_link_above_conf_lvl_thld_lyr, 'ADD_VIRTUAL_KEY_FIELD',
-                                            where_clause='{0}.{1} = {2}.{3}'.format(os.path.basename(here_link_copy), here_link_id_field,
-                                                                                    os.path.basename(match_candidate_above_conf_lvl_thld), candidate_table_here_lid_field))
-        except:
-            # If they are not the same type, add and use the 'TSS_LID' field (String type)
-            arcpy.AddField_management(here_link_copy, 'TSS_LID', 'TEXT', field_length=255)
-            arcpy.CalculateField_management(here_link_copy, 'TSS_LID', '!%s!' % candidate_table_here_lid_field, 'PYTHON')
-            arcpy.MakeQueryTable_management([here_link_copy, match_candidate_above_conf_lvl_thld],
-                                            here_link_above_conf_lvl_thld_lyr, 'ADD_VIRTUAL_KEY_FIELD',
-                                            where_clause='{0}.{1} = {2}.{3}'.format(os.path.basename(here_link_copy), 'TSS_LID',
-                                                                                    os.path.basename(match_candidate_above_conf_lvl_thld), candidate_table_here_lid_field))
-
-        arcpy.CopyFeatures_management(here_link_above_conf_lvl_thld_lyr, here_link_above_conf_lvl_thld)
-
-        # Format output query table
-        # Keep fields originally from the HERE link feature class and the assigned route id field from the match candidate table
-        field_mappings = arcpy.FieldMappings()
-
-        for field in out_here_fields:
-            field_map = arcpy.FieldMap()
-            field_map.addInputField(here_link_above_conf_lvl_thld, '{0}_{1}'.format(os.path.basename(here_link_copy), field))
-            field_name = field_map.outputField
-            field_name.name = field
-            field_name.aliasName = field
-            field_map.outputField = field_name
-            field_mappings.addFieldMap(field_map)
-
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(here_link_above_conf_lvl_thld,
-                                '{0}_{1}'.format(os.path.basename(match_candidate_above_conf_lvl_thld), candidate_table_dot_rid_field))
-        field_name = field_map.outputField
-        field_name.name = candidate_table_dot_rid_field
-        field_name.aliasName = candidate_table_dot_rid_field
-        field_map.outputField = field_name
-
-        field_mappings.addFieldMap(field_map)
-
-        arcpy.FeatureClassToFeatureClass_conversion(here_link_above_conf_lvl_thld, scratch_gdb,
-                                                    os.path.basename(here_link_above_conf_lvl_w_rid),
-                                                    field_mapping=field_mappings)
+        # Join one-to-many link route candidates to here link features, keeping the fields of the HERE link feature
+        # class and the assigned route id field from the match candidate table
+        with run_report.stage('join_candidates', inputs=[here_link, match_candidate_above_conf_lvl_thld],
+                              outputs=here_link_above_conf_lvl_w_rid):
+            out_here_fields = [field.name for field in get_transferable_fields(here_link)]
+            join_to_dataset(here_link, here_link_id_field, match_candidate_above_conf_lvl_thld,
+                            candidate_table_here_lid_field, here_link_above_conf_lvl_w_rid,
+                            target_fields=out_here_fields, join_fields=[candidate_table_dot_rid_field])
 
         # Generate HERE route
         generate_here_route(
@@ -351,7 +388,11 @@ if __name__ == '__main__':
             check_gaps = check_gaps,
             check_non_monotonic_routes = check_non_monotonic_routes,
             only_generate_continuous_routes = only_generate_continuous_routes,
-            only_generate_monotonic_routes = only_generate_monotonic_routes
+            only_generate_monotonic_routes = only_generate_monotonic_routes,
+            gap_tolerance = float(route_gap_tolerance) if route_gap_tolerance else 0.0,
+            route_engine = route_engine,
+            run_report = run_report,
+            scratch_workspace = scratch_workspace
         )
 
         # Linear referencing HERE links on HERE route
@@ -359,10 +400,15 @@ if __name__ == '__main__':
             here_route=output_here_route,
             route_id_field=candidate_table_dot_rid_field,
             here_link=here_link_above_conf_lvl_w_rid,
-            output_here_link_event=output_here_link_event
+            output_here_link_event=output_here_link_event,
+            locate_engine=locate_engine,
+            run_report=run_report,
+            scratch_workspace=scratch_workspace
         )
+        run_report.status = 'success'
 
     except Exception, err:
+        run_report.status = 'failed'
         logger.error("Error: {0}".format(err.args[0]))
         logger.error(traceback.format_exc())
 
@@ -373,5 +419,8 @@ if __name__ == '__main__':
             arcpy.Delete_management(output_here_link_event)
 
     finally:
-        clear_scratch_gdb(scratch_gdb)
+        # the run is cancelled if the user quits after the gap or monotonicity check
+        run_report.status = run_report.status or 'cancelled'
+        run_report.save(get_report_path(output_here_route, 'generate_here_route'))
+        scratch_workspace.cleanup()
         pass
\ No newline at end of file
@@ -1,22 +1,42 @@
 import arcpy
 import os
+import math
 import traceback
 from datetime import datetime
 
-from src.util.helper import get_scratch_gdb, clear_scratch_gdb
-from src.tss.ags.geometry_util import angle_between_two_vectors
+from src.util.helper import ScratchWorkspace, get_default_parameters, with_scratch_workspace
+from src.tss.ags.geometry_util import line_angles
 from src.tss.ags.field_util import get_field_details
+from src.here.match_util import match_link_route_in_memory, filter_candidate_rows, score_candidate_rows
+from src.here.partition_util import match_link_route_partitioned
+from src.here.incremental_util import match_link_route_incremental
 from src.config.schema import default_schemas
+from src.tss.ags.dao_util import get_count
+from src.tss.instrument_util import RunReport, get_report_path
+from src.tss.checkpoint_util import CheckpointStore
+from src.tss.ags.route_metrics_util import get_dataset_stamp
+from src.tss.ags.spatial_index_util import build_active_where_clause
 
 import logging
 logger = logging.getLogger(__name__)
 
 round_decimal_places = 6
 
+@with_scratch_workspace
 def generate_match_candidate(**kwargs):
     """
     Generate the HERE link and DOT Route match candidate table
-    :param kwargs:
+    :param kwargs: 'matching_engine' can be 'arcpy' (default, geoprocessing tools on the scratch geodatabase) or
+    'in_memory' (links and routes are loaded once and matched on coordinate arrays). Both produce the same rows.
+    The in-memory engine keeps the route index of each LRS version ('lrs_version') in 'route_index_folder'.
+    'partitioned' runs the in-memory matching county by county in 'processes' worker processes, each with its own
+    scratch workspace under 'partition_folder', and merges the rows of every county.
+    If 'previous_here_link' and 'previous_candidate_table' (the links and output of the previous HERE release) are
+    specified, only the new, changed or spatially affected links are matched again with the in-memory engine, the
+    rows of the other links are copied from the previous candidate table, and the reviewer decisions are kept.
+    'checkpoints' (CheckpointStore) records every completed matching stage, a rerun with the same inputs and
+    parameters restarts after the last completed stage.
+    Intermediates are written to 'scratch_workspace' (ScratchWorkspace of the run), small ones are kept in memory.
     :return:
     """
 
@@ -33,6 +53,16 @@ def generate_match_candidate(**kwargs):
     output_table = kwargs.get('output_table', None)
     search_radius = kwargs.get('search_radius', None)
     angle_tolerance = kwargs.get('angle_tolerance', None)
+    matching_engine = kwargs.get('matching_engine', 'arcpy')
+    route_index_folder = kwargs.get('route_index_folder', None)
+    lrs_version = kwargs.get('lrs_version', None)
+    partition_folder = kwargs.get('partition_folder', None)
+    processes = kwargs.get('processes', None)
+    previous_here_link = kwargs.get('previous_here_link', None)
+    previous_candidate_table = kwargs.get('previous_candidate_table', None)
+    run_report = kwargs.get('run_report', None) or RunReport('generate_match_candidate', get_count)
+    checkpoints = kwargs.get('checkpoints', None) or CheckpointStore(None, 'generate_match_candidate')
+    scratch_workspace = kwargs['scratch_workspace']
 
     if here_link is None or not arcpy.Exists(here_link):
         logger.warning("HERE Link feature: '{0}' does not exist!".format(here_link))
@@ -42,23 +72,23 @@ def generate_match_candidate(**kwargs):
         logger.warning("DOT Network feature: '{0}' does not exist!".format(dot_network))
         return
 
-    # intermediate outputs
-    here_link_sj_dot_network_raw= os.path.join(scratch_gdb, 'here_link_sj_dot_network_raw')
-    here_link_sj_dot_network_valid = os.path.join(scratch_gdb, 'here_link_sj_dot_network_valid')
-    here_link_sj_dot_network_valid_buffer = os.path.join(scratch_gdb, 'here_link_sj_dot_network_valid_buffer')
-    here_link_sj_dot_network_valid_frq = os.path.join(scratch_gdb, 'here_link_sj_dot_network_valid_frq')
-
-    active_dot_network_layer = os.path.join(scratch_gdb, 'active_{0}'.format(os.path.basename(dot_network)))
-    dot_network_here_link_buffer_intersect_pnt = os.path.join(scratch_gdb, 'dot_network_here_link_buffer_intersect_pnt')
-    dot_network_split = os.path.join(scratch_gdb, 'dot_network_split')
-    dot_network_split_sj_here_link_buffer = os.path.join(scratch_gdb, 'dot_network_split_sj_here_link_buffer')
-    dot_network_split_sj_here_link_buffer_valid = os.path.join(scratch_gdb, 'dot_network_split_sj_here_link_buffer_valid')
-    dot_network_seg_within_here_link_buffer = os.path.join(scratch_gdb, 'dot_network_seg_within_here_link_buffer')
+    # intermediate outputs, about two link/route pairs per link. The outputs of the checkpointed stages are kept on
+    # disk so that a failed run can be resumed
+    estimated_rows = get_count(here_link) * 2
+    here_link_sj_dot_network_raw = scratch_workspace.path('here_link_sj_dot_network_raw', estimated_rows, checkpoints.enabled)
+    here_link_sj_dot_network_valid = scratch_workspace.path('here_link_sj_dot_network_valid', estimated_rows, checkpoints.enabled)
+    here_link_sj_dot_network_valid_buffer = scratch_workspace.path('here_link_sj_dot_network_valid_buffer', estimated_rows, checkpoints.enabled)
+    here_link_sj_dot_network_valid_frq = scratch_workspace.path('here_link_sj_dot_network_valid_frq', estimated_rows)
+
+    active_dot_network_layer = 'active_{0}'.format(os.path.basename(dot_network))
+    dot_network_here_link_buffer_intersect_pnt = scratch_workspace.path('dot_network_here_link_buffer_intersect_pnt', estimated_rows)
+    dot_network_split = scratch_workspace.path('dot_network_split', estimated_rows)
+    dot_network_split_sj_here_link_buffer = scratch_workspace.path('dot_network_split_sj_here_link_buffer', estimated_rows)
+    dot_network_split_sj_here_link_buffer_valid = scratch_workspace.path('dot_network_split_sj_here_link_buffer_valid', estimated_rows)
+    dot_network_seg_within_here_link_buffer = scratch_workspace.path('dot_network_seg_within_here_link_buffer', estimated_rows, checkpoints.enabled)
 
     here_link_sj_dot_network_raw_lyr = 'here_link_sj_dot_network_raw_lyr'
 
-    output_table_frq = os.path.join(scratch_gdb, 'output_table_frq')
-
     # outputs
     output_schema_name = 'candidate_table'
     schemas = default_schemas.get(output_schema_name)
@@ -73,32 +103,9 @@ def generate_match_candidate(**kwargs):
     output_conf_lvl_field = schemas.get('conf_lvl_field')
     output_verified_match_field = schemas.get('verified_match_field')
     output_false_match_field = schemas.get('false_match_field')
-
-    logger.info("Finish initiation")
-    ####################################################################################################################
-
-
-    ####################################################################################################################
-    logger.info("[{0}] Start matching HERE links and DOT routes...".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S')))
-
-    active_where_clause = "1=1" if not dot_network_fdate_field or not dot_network_fdate_field else \
-        "({start_date_field} is null or {start_date_field} <= CURRENT_TIMESTAMP) and " \
-        "({end_date_field} is null or {end_date_field} > CURRENT_TIMESTAMP)".format(
-            start_date_field=dot_network_fdate_field,
-            end_date_field=dot_network_tdate_field)
-
-    arcpy.MakeFeatureLayer_management(dot_network, active_dot_network_layer, active_where_clause)
-
-    # get links with one-to-one match and links with one-to-many match with the specified tolerance
-    arcpy.SpatialJoin_analysis(here_link, active_dot_network_layer, here_link_sj_dot_network_raw, "JOIN_ONE_TO_MANY",
-                               match_option="WITHIN_A_DISTANCE", search_radius=search_radius)
-
-    arcpy.MakeFeatureLayer_management(here_link_sj_dot_network_raw, here_link_sj_dot_network_raw_lyr)
-    arcpy.SelectLayerByAttribute_management(here_link_sj_dot_network_raw_lyr, 'NEW_SELECTION', '"JOIN_FID" <> -1')
-    arcpy.CopyFeatures_management(here_link_sj_dot_network_raw_lyr, here_link_sj_dot_network_valid)
-
-    arcpy.Frequency_analysis(here_link_sj_dot_network_valid, here_link_sj_dot_network_valid_frq, [here_link_id_field])
-    arcpy.JoinField_management(here_link_sj_dot_network_raw, here_link_id_field, here_link_sj_dot_network_valid_frq, here_link_id_field, ['FREQUENCY'])
+    candidate_table_fields = [output_dot_rid_field, output_here_lid_field, output_dot_rt_name_field,
+                              output_dot_cnty_id_field, output_here_st_name_field, output_here_cnty_id_field,
+                              output_conf_lvl_field, output_verified_match_field, output_false_match_field]
 
     # TODO: Wrap this into a function
     dot_network_rid_field_type = 'TEXT'
@@ -125,272 +132,279 @@ def generate_match_candidate(**kwargs):
 
     here_lid_field_details = get_field_details(here_link, here_link_id_field)
 
-    # Add 'TSS_RID' as an identifier of matched DOT route id for later comparison
-    arcpy.AddField_management(here_link_sj_dot_network_valid, 'TSS_RID', field_type=dot_network_rid_field_type, field_length=dot_network_rid_field_length)
-    arcpy.CalculateField_management(here_link_sj_dot_network_valid, 'TSS_RID', "!{0}!".format(dot_network_rid_field), "PYTHON_9.3")
+    logger.info("Finish initiation")
     ####################################################################################################################
 
+
     ####################################################################################################################
-    logger.info("[{0}] Filtering out false positive matches...".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S')))
-
-    # filter out false positive matches
-    arcpy.Buffer_analysis(here_link_sj_dot_network_valid, here_link_sj_dot_network_valid_buffer, search_radius)
-
-    # head up! Here we rank Here link buffer higher than DOT network to guarantee the intersection point will be generated
-    # for each pair of intersecting buffer and route
-    arcpy.Intersect_analysis([[here_link_sj_dot_network_valid_buffer, 1], [active_dot_network_layer, 2]],
-                             dot_network_here_link_buffer_intersect_pnt, cluster_tolerance='0.001 FEET', output_type='POINT')
-    arcpy.SplitLineAtPoint_management(active_dot_network_layer, dot_network_here_link_buffer_intersect_pnt, dot_network_split, search_radius)
-    arcpy.SpatialJoin_analysis(dot_network_split, here_link_sj_dot_network_valid_buffer,
-                               dot_network_split_sj_here_link_buffer, "JOIN_ONE_TO_MANY", join_type='KEEP_COMMON', match_option="WITHIN")
-    # We only want records whose dot rid equals 'TSS_RID'. If dot rid value does not equal to 'TSS_RID' value,
-    # it means this route seg just accidentally within the link buffer but hasn't been found when spatial joining link and route.
-    arcpy.FeatureClassToFeatureClass_conversion(dot_network_split_sj_here_link_buffer, scratch_gdb,
-                                                os.path.basename(dot_network_split_sj_here_link_buffer_valid),
-                                                where_clause="{0}={1}".format(dot_network_rid_field, 'TSS_RID'))
-
-    # Dissolve on here link id and dot route id to get the dot network segment within the HERE link buffer
-    arcpy.Dissolve_management(dot_network_split_sj_here_link_buffer_valid, dot_network_seg_within_here_link_buffer, [here_link_id_field, dot_network_rid_field])
-
-    # ------------------------------------------------------------------------------------------------------------------
-    here_linkid_geometry_dot_route_seg_dict_dict_dict = {}
-
-    # Get link geometry
-    with arcpy.da.SearchCursor(here_link_sj_dot_network_valid, [here_link_id_field, 'SHAPE@']) as sCur:
-        for row in sCur:
-            link_id, geometry = row
-
-            if geometry is None:
-                logger.warning("[{0}] Invalid geometry! Geometry of link {1} is NoneType!".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S'), link_id))
-                continue
-
-            if link_id not in here_linkid_geometry_dot_route_seg_dict_dict_dict.keys():
-                here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id] = {}
-                here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['link_geometry'] = {'link_firstPoint_x': geometry.firstPoint.X,
-                                                                                               'link_firstPoint_y': geometry.firstPoint.Y,
-                                                                                               'link_lastPoint_x': geometry.lastPoint.X,
-                                                                                               'link_lastPoint_y': geometry.lastPoint.Y}
-                here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['route_segments'] = {}
-
-    del sCur
-
-    # Get geometry of route segments within link buffer
-    with arcpy.da.SearchCursor(dot_network_seg_within_here_link_buffer, [here_link_id_field, dot_network_rid_field, 'SHAPE@']) as sCur:
-        for row in sCur:
-            link_id, dot_rid, geometry = row
-
-            if link_id not in here_linkid_geometry_dot_route_seg_dict_dict_dict.keys():
-                continue
-
-            if geometry is None:
-                logger.warning("[{0}] Invalid geometry! Geometry of route {1} segment within link {2} buffer is NoneType!".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S'), dot_rid, link_id))
-                continue
-
-            if dot_rid not in here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['route_segments'].keys():
-                here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['route_segments'][dot_rid] = {'route_seg_firstPoint_x': geometry.firstPoint.X,
-                                                                                                         'route_seg_firstPoint_y': geometry.firstPoint.Y,
-                                                                                                         'route_seg_lastPoint_x': geometry.lastPoint.X,
-                                                                                                         'route_seg_lastPoint_y': geometry.lastPoint.Y}
-
-    del sCur
-    # ------------------------------------------------------------------------------------------------------------------
-
-    # Calculate angle
-    arcpy.AddField_management(here_link_sj_dot_network_raw, 'TSS_Angle', "DOUBLE")
-    with arcpy.da.UpdateCursor(here_link_sj_dot_network_raw, [here_link_id_field, dot_network_rid_field, 'TSS_Angle']) as uCur:
-        for row in uCur:
-            here_link_id = row[0]
-            dot_route_id = row[1]
-            if here_link_id not in here_linkid_geometry_dot_route_seg_dict_dict_dict.keys():
-                continue
-            elif dot_route_id not in here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['route_segments'].keys():
-                continue
-            else:
-                here_link_geometry_firstPoint_x = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['link_geometry']['link_firstPoint_x']
-                here_link_geometry_firstPoint_y = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['link_geometry']['link_firstPoint_y']
-                here_link_geometry_lastPoint_x = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['link_geometry']['link_lastPoint_x']
-                here_link_geometry_lastPoint_y = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['link_geometry']['link_lastPoint_y']
-
-                dot_route_seg_geometry_firstPoint_x = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['route_segments'][dot_route_id]['route_seg_firstPoint_x']
-                dot_route_seg_geometry_firstPoint_y = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['route_segments'][dot_route_id]['route_seg_firstPoint_y']
-                dot_route_seg_geometry_lastPoint_x = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['route_segments'][dot_route_id]['route_seg_lastPoint_x']
-                dot_route_seg_geometry_lastPoint_y = here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['route_segments'][dot_route_id]['route_seg_lastPoint_y']
-
-                try:
-                    # A minimum six decimal places need to be used otherwise the angle return could be far from accurate
-                    angle = angle_between_two_vectors((round(here_link_geometry_firstPoint_x - here_link_geometry_lastPoint_x, round_decimal_places),
-                                                       round(here_link_geometry_firstPoint_y - here_link_geometry_lastPoint_y, round_decimal_places)),
-                                                      (round(dot_route_seg_geometry_firstPoint_x - dot_route_seg_geometry_lastPoint_x, round_decimal_places),
-                                                       round(dot_route_seg_geometry_firstPoint_y - dot_route_seg_geometry_lastPoint_y, round_decimal_places)))
-                except:
-                    # if it fails to calculate the angle for some reasons, report the error, skip this one, and continue
-                    logger.warning("Failed to calculate the angle between link: '{0}' and route: '{1}'".format(here_link_id, dot_route_id))
-                    logger.warning("here_link_geometry_firstPoint_x: {0}, here_link_geometry_firstPoint_y: {1}".format(here_link_geometry_firstPoint_x, here_link_geometry_firstPoint_y))
-                    logger.warning("here_link_geometry_lastPoint_x: {0}, here_link_geometry_lastPoint_y: {1}".format(here_link_geometry_lastPoint_x, here_link_geometry_lastPoint_y))
-                    logger.warning("dot_route_seg_geometry_firstPoint_x: {0}, dot_route_seg_geometry_firstPoint_y: {1}".format(dot_route_seg_geometry_firstPoint_x, dot_route_seg_geometry_firstPoint_y))
-                    logger.warning("dot_route_seg_geometry_lastPoint_x: {0}, dot_route_seg_geometry_lastPoint_y: {1}".format(dot_route_seg_geometry_lastPoint_x, dot_route_seg_geometry_lastPoint_y))
-                    logger.warning(" ")
-                    continue
-
-                if angle == -1: # It is likely there is zero vector, ignore and continue to the next one
-                    continue
-                if angle > 90:  # From angle of vectors to angle of non-directional lines
-                    angle = 180 - angle
-
-                here_linkid_geometry_dot_route_seg_dict_dict_dict[here_link_id]['route_segments'][dot_route_id]['angle'] = angle
-                uCur.updateRow((here_link_id, dot_route_id, angle))
-
-    del uCur
+    logger.info("[{0}] Start matching HERE links and DOT routes...".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S')))
+
+    active_where_clause = build_active_where_clause(dot_network_fdate_field, dot_network_tdate_field)
+
+    with run_report.stage('select_active_routes', inputs=dot_network):
+        arcpy.MakeFeatureLayer_management(dot_network, active_dot_network_layer, active_where_clause)
+
+    incremental = previous_here_link and arcpy.Exists(previous_here_link) and \
+        previous_candidate_table and arcpy.Exists(previous_candidate_table)
+    kept_rows, reviewer_decisions = [], {}
+
+    if (incremental or matching_engine in ('in_memory', 'partitioned')) and not checkpoints.should_run('match_links'):
+        matched_rows, kept_rows, reviewer_decisions = checkpoints.load_rows('match_links')
+    elif incremental:
+        with run_report.stage('match_links', inputs=here_link) as stage:
+            matched_rows, rematch_link_ids, kept_rows, reviewer_decisions = match_link_route_incremental(
+                here_link=here_link,
+                here_link_id_field=here_link_id_field,
+                here_st_name_field=here_st_name_field,
+                here_county_id_field=here_county_id_field,
+                dot_network=dot_network,
+                dot_network_rid_field=dot_network_rid_field,
+                dot_network_route_name_field=dot_network_route_name_field,
+                dot_network_county_id_field=dot_network_county_id_field,
+                dot_network_where_clause=active_where_clause,
+                search_radius=search_radius,
+                route_index_folder=route_index_folder,
+                lrs_version=lrs_version,
+                previous_here_link=previous_here_link,
+                previous_candidate_table=previous_candidate_table,
+                candidate_table_fields=candidate_table_fields
+            )
+            stage.output_rows = len(matched_rows)
+        checkpoints.complete('match_links', rows=(matched_rows, kept_rows, reviewer_decisions))
+    elif matching_engine == 'in_memory':
+        with run_report.stage('match_links', inputs=here_link) as stage:
+            matched_rows = match_link_route_in_memory(
+                here_link=here_link,
+                here_link_id_field=here_link_id_field,
+                here_st_name_field=here_st_name_field,
+                here_county_id_field=here_county_id_field,
+                dot_network=dot_network,
+                dot_network_rid_field=dot_network_rid_field,
+                dot_network_route_name_field=dot_network_route_name_field,
+                dot_network_county_id_field=dot_network_county_id_field,
+                dot_network_where_clause=active_where_clause,
+                search_radius=search_radius,
+                route_index_folder=route_index_folder,
+                lrs_version=lrs_version
+            )
+            stage.output_rows = len(matched_rows)
+        checkpoints.complete('match_links', rows=(matched_rows, kept_rows, reviewer_decisions))
+    elif matching_engine == 'partitioned':
+        with run_report.stage('match_links', inputs=here_link) as stage:
+            matched_rows = match_link_route_partitioned(
+                here_link=here_link,
+                here_link_id_field=here_link_id_field,
+                here_st_name_field=here_st_name_field,
+                here_county_id_field=here_county_id_field,
+                dot_network=dot_network,
+                dot_network_rid_field=dot_network_rid_field,
+                dot_network_route_name_field=dot_network_route_name_field,
+                dot_network_county_id_field=dot_network_county_id_field,
+                dot_network_where_clause=active_where_clause,
+                search_radius=search_radius,
+                route_index_folder=route_index_folder,
+                lrs_version=lrs_version,
+                partition_folder=partition_folder,
+                processes=processes
+            )
+            stage.output_rows = len(matched_rows)
+        checkpoints.complete('match_links', rows=(matched_rows, kept_rows, reviewer_decisions))
+    else:
+        # get links with one-to-one match and links with one-to-many match with the specified tolerance
+        if checkpoints.should_run('spatial_join'):
+            with run_report.stage('spatial_join', inputs=here_link, outputs=here_link_sj_dot_network_raw):
+                arcpy.SpatialJoin_analysis(here_link, active_dot_network_layer, here_link_sj_dot_network_raw, "JOIN_ONE_TO_MANY",
+                                           match_option="WITHIN_A_DISTANCE", search_radius=search_radius)
+
+                arcpy.MakeFeatureLayer_management(here_link_sj_dot_network_raw, here_link_sj_dot_network_raw_lyr)
+                arcpy.SelectLayerByAttribute_management(here_link_sj_dot_network_raw_lyr, 'NEW_SELECTION', '"JOIN_FID" <> -1')
+                arcpy.CopyFeatures_management(here_link_sj_dot_network_raw_lyr, here_link_sj_dot_network_valid)
+
+                arcpy.Frequency_analysis(here_link_sj_dot_network_valid, here_link_sj_dot_network_valid_frq, [here_link_id_field])
+                arcpy.JoinField_management(here_link_sj_dot_network_raw, here_link_id_field, here_link_sj_dot_network_valid_frq, here_link_id_field, ['FREQUENCY'])
+
+                # Add 'TSS_RID' as an identifier of matched DOT route id for later comparison
+                arcpy.AddField_management(here_link_sj_dot_network_valid, 'TSS_RID', field_type=dot_network_rid_field_type, field_length=dot_network_rid_field_length)
+                arcpy.CalculateField_management(here_link_sj_dot_network_valid, 'TSS_RID', "!{0}!".format(dot_network_rid_field), "PYTHON_9.3")
+            checkpoints.complete('spatial_join', [here_link_sj_dot_network_raw, here_link_sj_dot_network_valid])
+        ####################################################################################################################
+
+        ####################################################################################################################
+        logger.info("[{0}] Filtering out false positive matches...".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S')))
+
+        # filter out false positive matches
+        if checkpoints.should_run('filter_false_positives'):
+            with run_report.stage('filter_false_positives', outputs=dot_network_seg_within_here_link_buffer):
+                arcpy.Buffer_analysis(here_link_sj_dot_network_valid, here_link_sj_dot_network_valid_buffer, search_radius)
+
+                # head up! Here we rank Here link buffer higher than DOT network to guarantee the intersection point will be generated
+                # for each pair of intersecting buffer and route
+                arcpy.Intersect_analysis([[here_link_sj_dot_network_valid_buffer, 1], [active_dot_network_layer, 2]],
+                                         dot_network_here_link_buffer_intersect_pnt, cluster_tolerance='0.001 FEET', output_type='POINT')
+                arcpy.SplitLineAtPoint_management(active_dot_network_layer, dot_network_here_link_buffer_intersect_pnt, dot_network_split, search_radius)
+                arcpy.SpatialJoin_analysis(dot_network_split, here_link_sj_dot_network_valid_buffer,
+                                           dot_network_split_sj_here_link_buffer, "JOIN_ONE_TO_MANY", join_type='KEEP_COMMON', match_option="WITHIN")
+                # We only want records whose dot rid equals 'TSS_RID'. If dot rid value does not equal to 'TSS_RID' value,
+                # it means this route seg just accidentally within the link buffer but hasn't been found when spatial joining link and route.
+                arcpy.FeatureClassToFeatureClass_conversion(dot_network_split_sj_here_link_buffer,
+                                                            os.path.dirname(dot_network_split_sj_here_link_buffer_valid),
+                                                            os.path.basename(dot_network_split_sj_here_link_buffer_valid),
+                                                            where_clause="{0}={1}".format(dot_network_rid_field, 'TSS_RID'))
+
+                # Dissolve on here link id and dot route id to get the dot network segment within the HERE link buffer
+                arcpy.Dissolve_management(dot_network_split_sj_here_link_buffer_valid, dot_network_seg_within_here_link_buffer, [here_link_id_field, dot_network_rid_field])
+            checkpoints.complete('filter_false_positives', [here_link_sj_dot_network_valid_buffer,
+                                                               dot_network_seg_within_here_link_buffer])
+
+        # ------------------------------------------------------------------------------------------------------------------
+        if checkpoints.should_run('calculate_angles'):
+            with run_report.stage('read_geometries', inputs=[here_link_sj_dot_network_valid, dot_network_seg_within_here_link_buffer]):
+                here_linkid_geometry_dot_route_seg_dict_dict_dict = {}
+
+                # Get link geometry
+                with arcpy.da.SearchCursor(here_link_sj_dot_network_valid, [here_link_id_field, 'SHAPE@']) as sCur:
+                    for row in sCur:
+                        link_id, geometry = row
+
+                        if geometry is None:
+                            logger.warning("[{0}] Invalid geometry! Geometry of link {1} is NoneType!".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S'), link_id))
+                            continue
+
+                        if link_id not in here_linkid_geometry_dot_route_seg_dict_dict_dict.keys():
+                            here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id] = {}
+                            here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['link_geometry'] = {'link_firstPoint_x': geometry.firstPoint.X,
+                                                                                                           'link_firstPoint_y': geometry.firstPoint.Y,
+                                                                                                           'link_lastPoint_x': geometry.lastPoint.X,
+                                                                                                           'link_lastPoint_y': geometry.lastPoint.Y}
+                            here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['route_segments'] = {}
+
+                del sCur
+
+                # Get geometry of route segments within link buffer
+                with arcpy.da.SearchCursor(dot_network_seg_within_here_link_buffer, [here_link_id_field, dot_network_rid_field, 'SHAPE@']) as sCur:
+                    for row in sCur:
+                        link_id, dot_rid, geometry = row
+
+                        if link_id not in here_linkid_geometry_dot_route_seg_dict_dict_dict.keys():
+                            continue
+
+                        if geometry is None:
+                            logger.warning("[{0}] Invalid geometry! Geometry of route {1} segment within link {2} buffer is NoneType!".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S'), dot_rid, link_id))
+                            continue
+
+                        if dot_rid not in here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['route_segments'].keys():
+                            here_linkid_geometry_dot_route_seg_dict_dict_dict[link_id]['route_segments'][dot_rid] = {'route_seg_firstPoint_x': geometry.firstPoint.X,
+                                                                                                                     'route_seg_firstPoint_y': geometry.firstPoint.Y,
+                                                                                                                     'route_seg_lastPoint_x': geometry.lastPoint.X,
+                                                                                                                     'route_seg_lastPoint_y': geometry.lastPoint.Y}
+
+                del sCur
+            # ------------------------------------------------------------------------------------------------------------------
+
+            # Calculate angle of all the link and route segment pairs at once
+            with run_report.stage('calculate_angles', inputs=here_link_sj_dot_network_raw):
+                link_route_keys = []
+                link_vectors = []
+                route_seg_vectors = []
+                for here_link_id, link_route_seg_dict in here_linkid_geometry_dot_route_seg_dict_dict_dict.items():
+                    link_geometry = link_route_seg_dict['link_geometry']
+                    for dot_route_id, route_seg_geometry in link_route_seg_dict['route_segments'].items():
+                        link_route_keys.append((here_link_id, dot_route_id))
+                        link_vectors.append((link_geometry['link_firstPoint_x'] - link_geometry['link_lastPoint_x'],
+                                             link_geometry['link_firstPoint_y'] - link_geometry['link_lastPoint_y']))
+                        route_seg_vectors.append((route_seg_geometry['route_seg_firstPoint_x'] - route_seg_geometry['route_seg_lastPoint_x'],
+                                                  route_seg_geometry['route_seg_firstPoint_y'] - route_seg_geometry['route_seg_lastPoint_y']))
+                link_route_angle_dict = dict(zip(link_route_keys, line_angles(link_vectors, route_seg_vectors, round_decimal_places).tolist()))
+
+                # The field is already there if a previous run failed after adding it
+                if not arcpy.ListFields(here_link_sj_dot_network_raw, 'TSS_Angle'):
+                    arcpy.AddField_management(here_link_sj_dot_network_raw, 'TSS_Angle', "DOUBLE")
+                with arcpy.da.UpdateCursor(here_link_sj_dot_network_raw, [here_link_id_field, dot_network_rid_field, 'TSS_Angle']) as uCur:
+                    for row in uCur:
+                        here_link_id = row[0]
+                        dot_route_id = row[1]
+                        angle = link_route_angle_dict.get((here_link_id, dot_route_id))
+                        if angle is None:  # No route segment found within the link buffer
+                            continue
+                        if math.isnan(angle):  # It is likely there is zero vector, ignore and continue to the next one
+                            continue
+                        uCur.updateRow((here_link_id, dot_route_id, angle))
+
+                del uCur
+            checkpoints.complete('calculate_angles', [here_link_sj_dot_network_raw])
     ####################################################################################################################
 
     ####################################################################################################################
     logger.info("[{0}] Generating link route matching table...".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S')))
 
     # create link route matching table
-    arcpy.CreateTable_management(output_workspace, output_table_name)
-    arcpy.AddField_management(output_table, output_dot_rid_field, dot_network_rid_field_type, field_length=255)
-    arcpy.AddField_management(output_table, output_here_lid_field, here_lid_field_details['field_type'], field_length=255)
-    arcpy.AddField_management(output_table, output_dot_rt_name_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_table, output_dot_cnty_id_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_table, output_here_st_name_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_table, output_here_cnty_id_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_table, output_conf_lvl_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_table, output_verified_match_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_table, output_false_match_field, "TEXT", field_length=255)
-
-    candidate_table_fields = [output_dot_rid_field, output_here_lid_field, output_dot_rt_name_field,
-                              output_dot_cnty_id_field, output_here_st_name_field, output_here_cnty_id_field,
-                              output_conf_lvl_field, output_verified_match_field, output_false_match_field]
+    with run_report.stage('create_candidate_table'):
+        arcpy.CreateTable_management(output_workspace, output_table_name)
+        arcpy.AddField_management(output_table, output_dot_rid_field, dot_network_rid_field_type, field_length=255)
+        arcpy.AddField_management(output_table, output_here_lid_field, here_lid_field_details['field_type'], field_length=255)
+        arcpy.AddField_management(output_table, output_dot_rt_name_field, "TEXT", field_length=255)
+        arcpy.AddField_management(output_table, output_dot_cnty_id_field, "TEXT", field_length=255)
+        arcpy.AddField_management(output_table, output_here_st_name_field, "TEXT", field_length=255)
+        arcpy.AddField_management(output_table, output_here_cnty_id_field, "TEXT", field_length=255)
+        arcpy.AddField_management(output_table, output_conf_lvl_field, "TEXT", field_length=255)
+        arcpy.AddField_management(output_table, output_verified_match_field, "TEXT", field_length=255)
+        arcpy.AddField_management(output_table, output_false_match_field, "TEXT", field_length=255)
 
     # Populate link route matching table
-    bad_matches_dict = {}
     fields_of_interest = [dot_network_rid_field, here_link_id_field, dot_network_route_name_field, dot_network_county_id_field,
                           here_st_name_field, here_county_id_field, 'TSS_Angle', 'FREQUENCY']
 
-    iCur = arcpy.da.InsertCursor(output_table, candidate_table_fields)
-    with arcpy.da.SearchCursor(here_link_sj_dot_network_raw, fields_of_interest,
-                               sql_clause = (None, 'ORDER BY {0}'.format(here_link_id_field))) as sCur:
-        for row in sCur:
-            dot_route_id = row[0]
-            here_link_id = row[1]
-            dot_route_name = row[2]
-            dot_county_id = row[3]
-            here_st_name = row[4]
-            here_county_id = row[5]
-            angle = row[6]
-            frequency = row[7]
-
-            # No match
-            if dot_route_id is None or dot_route_id.strip() == "":
-                iCur.insertRow((None, here_link_id, None, None, here_st_name, here_county_id, 'No Match', None, None))
-                continue
-
-            # Bad matches-------------------------------------------------------------------------------------------
-            # If the link and route match is found but their angle is None, it means either the link and route seg
-            # has bad geometry and their angle cannot be calculated. It is considered a bad match
-            if angle is None or angle > angle_tolerance:
-                # Bad and the only match
-                if frequency == 1:
-                    iCur.insertRow((None, here_link_id, None, None, here_st_name, here_county_id, 'No Match', None, None))
-                    continue
-
-                # Bad but not the only match
-                if here_link_id not in bad_matches_dict.keys():
-                    bad_matches_dict[here_link_id] = []
-
-                bad_matches_dict[here_link_id].append(dot_route_id)
-
-                if len(bad_matches_dict[here_link_id]) == frequency: # None of its matches is good
-                    iCur.insertRow((None, here_link_id, None, None, here_st_name, here_county_id, 'No Match', None, None))
-
-                continue
-            # ------------------------------------------------------------------------------------------------------
-
-            # Potential matches
-            confidence = 'High' if frequency == 1 else 'Low'
-            iCur.insertRow((dot_route_id, here_link_id, dot_route_name, dot_county_id, here_st_name, here_county_id, confidence, None, None))
-
-    del iCur
-    del sCur
+    with run_report.stage('filter_candidates') as stage:
+        if not incremental and matching_engine not in ('in_memory', 'partitioned'):
+            matched_rows = arcpy.da.SearchCursor(here_link_sj_dot_network_raw, fields_of_interest,
+                                                 sql_clause=(None, 'ORDER BY {0}'.format(here_link_id_field)))
+
+        candidate_rows = filter_candidate_rows(matched_rows, angle_tolerance)
+
+        del matched_rows
+
+        # Keep the reviewer decisions of the pairs found again for the re-matched links
+        if reviewer_decisions:
+            candidate_rows = [tuple(row[:7]) + reviewer_decisions.get((row[1], row[0]), tuple(row[7:]))
+                              for row in candidate_rows]
+        stage.output_rows = len(candidate_rows)
     ####################################################################################################################
 
     ####################################################################################################################
     logger.info("[{0}] Apply one-to-one match knowledge...".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S')))
 
-    dot_county_route_name_here_county_street_name_knowledge_dict = {}
-    with arcpy.da.SearchCursor(output_table, candidate_table_fields,
-                               where_clause="{0} = 'High'".format(output_conf_lvl_field)) as sCur:
-        for row in sCur:
-            # dot_route_id = row[0]
-            # here_link_id = row[1]
-            dot_route_name = row[2]
-            dot_county_id = row[3]
-            here_st_name = row[4]
-            here_county_id = row[5]
-            # confidence = row[6]
-            # verified_match = row[7]
-            # false_match = row[8]
-
-            here_knowledge = '{0}-{1}'.format(here_county_id, here_st_name)
-            dot_knowledge = '{0}-{1}'.format(dot_county_id, dot_route_name)
-
-            if dot_knowledge not in dot_county_route_name_here_county_street_name_knowledge_dict.keys():
-                dot_county_route_name_here_county_street_name_knowledge_dict[dot_knowledge] = []
-
-            if here_knowledge not in dot_county_route_name_here_county_street_name_knowledge_dict[dot_knowledge]:
-                dot_county_route_name_here_county_street_name_knowledge_dict[dot_knowledge].append(here_knowledge)
-
-    del sCur
-
-    arcpy.Frequency_analysis(output_table, output_table_frq, [output_here_lid_field])
-    single_match_here_lid_list = []
-    with arcpy.da.SearchCursor(output_table_frq, ['FREQUENCY', output_here_lid_field], where_clause="FREQUENCY = 1") as sCur:
-        for row in sCur:
-            here_lid = row[1]
-
-            if here_lid not in single_match_here_lid_list:
-                single_match_here_lid_list.append(here_lid)
-
-    # Head up!: Opening simultaneous insert and/or update operations on the same workspace using different cursors
-    # requires the start of an edit session.
-    with arcpy.da.Editor(output_workspace) as editor:
-        # Apply one-to-one match knowledge to one-to-many matches cases
-        with arcpy.da.UpdateCursor(output_table, candidate_table_fields, where_clause="{0} = 'Low'".format(output_conf_lvl_field)) as uCur:
-            for row in uCur:
-                dot_route_id = row[0]
-                here_link_id = row[1]
-                dot_route_name = row[2]
-                dot_county_id = row[3]
-                here_st_name = row[4]
-                here_county_id = row[5]
-                confidence = row[6]
-                verified_match = row[7]
-                false_match = row[8]
-
-                here_knowledge = '{0}-{1}'.format(here_county_id, here_st_name)
-                dot_knowledge = '{0}-{1}'.format(dot_county_id, dot_route_name)
-
-                # If this is the only match candidate for the link, bump the confidence level up to 'High'
-                if here_link_id in single_match_here_lid_list:
-                    confidence = 'High'
-                    uCur.updateRow((dot_route_id, here_link_id, dot_route_name, dot_county_id, here_st_name,
-                                    here_county_id, confidence, verified_match, false_match))
-                    continue
-
-                if dot_knowledge not in dot_county_route_name_here_county_street_name_knowledge_dict.keys():
-                    continue
-
-                if here_knowledge in dot_county_route_name_here_county_street_name_knowledge_dict[dot_knowledge]:
-                    confidence = 'Medium'
-                    uCur.updateRow((dot_route_id, here_link_id, dot_route_name, dot_county_id, here_st_name,
-                                    here_county_id, confidence, verified_match, false_match))
-
-    del uCur
+    # Rows of the links not matched again are copied from the previous candidate table as they are
+    with run_report.stage('score_candidates') as stage:
+        candidate_rows = score_candidate_rows(candidate_rows + kept_rows, set(row[1] for row in kept_rows))
+        stage.input_rows = stage.output_rows = len(candidate_rows)
+
+    with run_report.stage('write_candidate_table', outputs=output_table):
+        iCur = arcpy.da.InsertCursor(output_table, candidate_table_fields)
+        for row in candidate_rows:
+            iCur.insertRow(row)
+        del iCur
     ####################################################################################################################
 
     logger.info("[{0}] Success! Output: {1}".format(datetime.now().strftime('%m/%d/%Y %H:%M:%S'), output_table))
 
 
+def get_checkpoint_parameters(parameters, input_datasets):
+    """
+    Parameters of the checkpoint run key: the tool parameters and the stamp of every input dataset. The stamps only
+    depend on the files of the input datasets (see get_dataset_stamp), so the output table written or deleted by a
+    failed run, even in the workspace of the inputs, does not change the key and the rerun resumes from its
+    checkpoints.
+    :param parameters: dict of the tool parameters
+    :param input_datasets: dict of parameter name -> input dataset
+    :return:
+    """
+    checkpoint_parameters = dict(parameters)
+    for name, dataset in input_datasets.items():
+        checkpoint_parameters['{0}_stamp'.format(name)] = get_dataset_stamp(dataset) if dataset and \
+            arcpy.Exists(dataset) else None
+    return checkpoint_parameters
+
+
 if __name__ == '__main__':
     here_link = arcpy.GetParameterAsText(0)
     here_link_id_field = arcpy.GetParameterAsText(1)
@@ -406,13 +420,50 @@ if __name__ == '__main__':
     search_radius = arcpy.GetParameterAsText(11)
     angle_tolerance = arcpy.GetParameter(12)
 
+    Config = get_default_parameters()
+    matching_engine = Config.get('Default', 'matching_engine') if Config.has_option('Default', 'matching_engine') else 'arcpy'
+    lrs_version = Config.get('Default', 'lrs_version') if Config.has_option('Default', 'lrs_version') else None
+    processes = Config.get('Default', 'processes') if Config.has_option('Default', 'processes') else None
+    previous_here_link = Config.get('Default', 'previous_here_link') if Config.has_option('Default', 'previous_here_link') else None
+    previous_candidate_table = Config.get('Default', 'previous_candidate_table') if Config.has_option('Default', 'previous_candidate_table') else None
+    resume = Config.get('Default', 'resume_from_checkpoints') if Config.has_option('Default', 'resume_from_checkpoints') else 'true'
+    in_memory_max_rows = Config.get('Default', 'in_memory_max_rows') if Config.has_option('Default', 'in_memory_max_rows') else None
+
     scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    route_index_folder = os.path.join(scratch_folder, 'route_index')
+    checkpoint_folder = os.path.join(scratch_folder, 'checkpoints')
 
-    arcpy.env.workspace = scratch_gdb
     arcpy.env.overwriteOutput = True
 
+    run_report = RunReport('generate_match_candidate', get_count)
+    run_report.parameters = {'here_link': here_link, 'dot_network': dot_network, 'output_table': output_table,
+                             'search_radius': search_radius, 'angle_tolerance': angle_tolerance,
+                             'matching_engine': matching_engine}
+    checkpoints = CheckpointStore(None, 'generate_match_candidate')
+    scratch_workspace = None
+
     try:
+        if resume.lower() == 'true':
+            checkpoint_parameters = dict(run_report.parameters)
+            checkpoint_parameters.update({
+                'fields': [here_link_id_field, here_st_name_field, here_county_id_field, dot_network_rid_field,
+                           dot_network_route_name_field, dot_network_county_id_field, dot_network_fdate_field,
+                           dot_network_tdate_field],
+                'lrs_version': lrs_version, 'previous_here_link': previous_here_link,
+                'previous_candidate_table': previous_candidate_table
+            })
+            checkpoint_parameters = get_checkpoint_parameters(checkpoint_parameters,
+                                                              {'here_link': here_link, 'dot_network': dot_network})
+            checkpoints = CheckpointStore(checkpoint_folder, 'generate_match_candidate', checkpoint_parameters,
+                                          arcpy.Exists)
+
+        # A resumed run uses the workspace of the failed run with the same inputs, other runs get their own workspace
+        scratch_workspace = ScratchWorkspace(scratch_folder,
+                                             'generate_match_candidate_{0}'.format(checkpoints.run_key[:12])
+                                             if checkpoints.enabled else None,
+                                             int(in_memory_max_rows) if in_memory_max_rows else 0)
+        arcpy.env.workspace = scratch_workspace.gdb
+
         generate_match_candidate(
             here_link=here_link,
             here_link_id_field=here_link_id_field,
@@ -426,16 +477,37 @@ if __name__ == '__main__':
             dot_network_tdate_field=dot_network_tdate_field,
             output_table=output_table,
             search_radius=search_radius,
-            angle_tolerance=angle_tolerance
+            angle_tolerance=angle_tolerance,
+            matching_engine=matching_engine,
+            route_index_folder=route_index_folder,
+            lrs_version=lrs_version or None,
+            partition_folder=os.path.join(scratch_workspace.folder, 'partitions'),
+            processes=int(processes) if processes else None,
+            previous_here_link=previous_here_link or None,
+            previous_candidate_table=previous_candidate_table or None,
+            run_report=run_report,
+            checkpoints=checkpoints,
+            scratch_workspace=scratch_workspace
         )
+        run_report.status = 'success'
+
+        # Intermediates are only removed once the run succeeded, a failed run is resumed from its checkpoints
+        checkpoints.clear()
+        scratch_workspace.cleanup()
 
     except Exception, err:
+        run_report.status = 'failed'
         logger.error("Error: {0}".format(err.args[0]))
         logger.error(traceback.format_exc())
 
         if arcpy.Exists(output_table):
             arcpy.Delete_management(output_table)
+        if checkpoints.stages:
+            logger.info("Completed stages {0} are kept in '{1}', the next run with the same inputs resumes after them".format(
+                [record['name'] for record in checkpoints.stages], scratch_workspace.folder))
+        elif scratch_workspace is not None:
+            scratch_workspace.cleanup()
 
     finally:
-        clear_scratch_gdb(scratch_gdb)
-        pass
\ No newline at end of file
+        run_report.parameters['resumed_stages'] = checkpoints.resumed_stages
+        run_report.save(get_report_path(output_table, 'generate_match_candidate'))
\ No newline at end of file
@@ -1,9 +1,16 @@
 import arcpy
 import pythonaddins
 import os
+import math
 import traceback
 
-from src.util.helper import get_scratch_gdb, clear_scratch_gdb
+from src.util.helper import ScratchWorkspace, get_default_parameters
+from src.tss.ags.route_metrics_util import get_route_metrics
+from src.tss.ags.spatial_index_util import build_active_where_clause
+from src.tss.calibration_util import calibrate_measures
+from src.tss.xref_util import XrefSummary, stream_xref_rows
+from src.tss.instrument_util import RunReport, get_report_path
+from src.tss.ags.dao_util import get_count
 from src.config.schema import default_schemas
 
 import logging
@@ -11,6 +18,36 @@ logger = logging.getLogger(__name__)
 
 measure_decimal_places = 3
 
+def create_xref_table(output_xref_table, xref_table_fields):
+    """
+    Create the empty XREF table
+    :param output_xref_table:
+    :param xref_table_fields: HERE link id, DOT route id, from measure and to measure field names
+    :return:
+    """
+    here_lid_field, dot_rid_field, fmeas_field, tmeas_field = xref_table_fields
+    arcpy.CreateTable_management(os.path.dirname(output_xref_table), os.path.basename(output_xref_table))
+    arcpy.AddField_management(output_xref_table, here_lid_field, "TEXT", field_length=255)
+    arcpy.AddField_management(output_xref_table, dot_rid_field, "TEXT", field_length=255)
+    arcpy.AddField_management(output_xref_table, fmeas_field, "DOUBLE")
+    arcpy.AddField_management(output_xref_table, tmeas_field, "DOUBLE")
+
+
+def warn_invalid_routes(invalid_here_routes, invalid_dot_routes):
+    """
+    One warning per route left out of the XREF table
+    :param invalid_here_routes: dict of HERE route id to the number of links on it
+    :param invalid_dot_routes: dict of DOT route id to the number of links on it
+    :return:
+    """
+    for here_rid in sorted(invalid_here_routes):
+        arcpy.AddWarning("HERE route '{0}' has invalid geometry! {1} link(s) left out of the XREF table".format(
+            here_rid, invalid_here_routes[here_rid]))
+    for dot_rid in sorted(invalid_dot_routes):
+        arcpy.AddWarning("DOT route '{0}' has invalid geometry! {1} link(s) left out of the XREF table".format(
+            dot_rid, invalid_dot_routes[dot_rid]))
+
+
 def generate_link_route_xref_table(**kwargs):
     logger.info("Start generating the XREF table...")
 
@@ -26,6 +63,9 @@ def generate_link_route_xref_table(**kwargs):
     dot_route_fd_field = kwargs.get('dot_route_fd_field', None)
     dot_route_td_field = kwargs.get('dot_route_td_field', None)
     output_xref_table = kwargs.get('output_xref_table', None)
+    route_metrics_folder = kwargs.get('route_metrics_folder', None)
+    xref_mode = kwargs.get('xref_mode', 'in_memory')
+    run_report = kwargs.get('run_report', None) or RunReport('generate_xref_table', get_count)
 
     output_schema_name = 'xref_table'
     schemas = default_schemas.get(output_schema_name)
@@ -35,111 +75,90 @@ def generate_link_route_xref_table(**kwargs):
     output_fmeas_field = schemas.get('fmeas_field')
     output_tmeas_field = schemas.get('tmeas_field')
 
-    # Intermediate output
-    active_dot_network_layer = 'active_{0}'.format(os.path.basename(dot_route))
-
+    xref_table_fields = [output_here_lid_field, output_dot_rid_field, output_fmeas_field, output_tmeas_field]
+    link_event_fields = [here_link_event_lid_field, here_link_event_rid_field, here_link_event_fmeas_field,
+                         here_link_event_tmeas_field]
+
+    # route length and measure range, read from the route metrics cache when available
+    with run_report.stage('read_route_metrics', inputs=[here_route, dot_route]):
+        here_route_metrics = get_route_metrics(here_route, here_route_rid_field, cache_folder=route_metrics_folder)
+
+        active_where_clause = build_active_where_clause(dot_route_fd_field, dot_route_td_field)
+        dot_route_metrics = get_route_metrics(dot_route, dot_route_rid_field, active_where_clause, route_metrics_folder)
+
+    if xref_mode == 'streaming':
+        # the link events come ordered by route id, the links of one route are calibrated and written at a time
+        with run_report.stage('stream_xref_table', inputs=here_link_event, outputs=output_xref_table) as stage:
+            create_xref_table(output_xref_table, xref_table_fields)
+            summary = XrefSummary()
+            with arcpy.da.SearchCursor(here_link_event, link_event_fields,
+                                       sql_clause=(None, 'ORDER BY {0}'.format(here_link_event_rid_field))) as sCur, \
+                    arcpy.da.InsertCursor(output_xref_table, xref_table_fields) as iCur:
+                for xref_rows in stream_xref_rows(sCur, here_route_metrics, dot_route_metrics, measure_decimal_places,
+                                                  summary):
+                    for xref_row in xref_rows:
+                        iCur.insertRow(xref_row)
+            stage.input_rows = summary.link_rows
+
+        if summary.duplicate_rows:
+            logger.info("{0} duplicate link event(s) skipped".format(summary.duplicate_rows))
+        if summary.unordered_routes:
+            logger.warning("The link events of {0} route(s) are not ordered by route id, duplicate links of those "
+                           "routes may be written more than once".format(len(summary.unordered_routes)))
+        warn_invalid_routes(summary.invalid_source_routes, summary.invalid_target_routes)
+        logger.info("The XREF table has been generated successfully! '{0}'".format(output_xref_table))
+        return
 
     link_route_measure_dict = {}
-    with arcpy.da.SearchCursor(here_link_event, [here_link_event_lid_field, here_link_event_rid_field,
-                                                 here_link_event_fmeas_field, here_link_event_tmeas_field]) as sCur:
-        for row in sCur:
-            here_lid = row[0]
-            here_rid = row[1]
-            here_fmeas = row[2]
-            here_tmeas = row[3]
-
-            if here_lid not in link_route_measure_dict.keys():
-                link_route_measure_dict[here_lid] = {}
-
-            if here_rid not in link_route_measure_dict[here_lid].keys():
-                link_route_measure_dict[here_lid][here_rid] = {}
-
-            link_route_measure_dict[here_lid][here_rid]['fmeas'] = here_fmeas
-            link_route_measure_dict[here_lid][here_rid]['tmeas'] = here_tmeas
-
-    del sCur
-
-    here_route_dict = {}
-    with arcpy.da.SearchCursor(here_route, [here_route_rid_field, 'SHAPE@']) as sCur:
-        for row in sCur:
-            here_rid = row[0]
-            shape = row[1]
-
-            if shape is None:
-                continue
-
-            if here_rid not in here_route_dict.keys():
-                here_route_dict[here_rid] = {}
-
-            here_route_dict[here_rid]['length'] = shape.length
-            here_route_dict[here_rid]['mmax'] = shape.extent.MMax
-            here_route_dict[here_rid]['mmin'] = shape.extent.MMin
-
-    del sCur
-
-    dot_route_dict = {}
-    active_where_clause = "1=1" if not dot_route_fd_field or not dot_route_td_field else \
-        "({start_date_field} is null or {start_date_field} <= CURRENT_TIMESTAMP) and " \
-        "({end_date_field} is null or {end_date_field} > CURRENT_TIMESTAMP)".format(
-            start_date_field=dot_route_fd_field,
-            end_date_field=dot_route_td_field)
-    arcpy.MakeFeatureLayer_management(dot_route, active_dot_network_layer, active_where_clause)
-    with arcpy.da.SearchCursor(active_dot_network_layer, [dot_route_rid_field, 'SHAPE@']) as sCur:
-        for row in sCur:
-            dot_rid = row[0]
-            shape = row[1]
-
-            if shape is None:
-                continue
-
-            if dot_rid not in dot_route_dict.keys():
-                dot_route_dict[dot_rid] = {}
-
-            dot_route_dict[dot_rid]['length'] = shape.length
-            dot_route_dict[dot_rid]['mmax'] = shape.extent.MMax
-            dot_route_dict[dot_rid]['mmin'] = shape.extent.MMin
-
-    del sCur
+    with run_report.stage('read_link_events', inputs=here_link_event) as stage:
+        with arcpy.da.SearchCursor(here_link_event, link_event_fields) as sCur:
+            for row in sCur:
+                here_lid = row[0]
+                here_rid = row[1]
+                here_fmeas = row[2]
+                here_tmeas = row[3]
+
+                link_route_measure_dict.setdefault(here_lid, {})[here_rid] = {'fmeas': here_fmeas,
+                                                                              'tmeas': here_tmeas}
+
+        del sCur
+        stage.output_rows = sum(len(here_route_info) for here_route_info in link_route_measure_dict.values())
+
+    # calibrate the link measures on HERE routes to DOT routes, all at once
+    with run_report.stage('calibrate_measures') as stage:
+        here_lids = []
+        here_rids = []
+        here_measures = []
+        for here_lid, here_route_info in link_route_measure_dict.items():
+            for here_rid, here_link_measures in here_route_info.items():
+                here_lids.append(here_lid)
+                here_rids.append(here_rid)
+                here_measures.append((here_link_measures['fmeas'], here_link_measures['tmeas']))
+        adjusted_measures, here_route_valid, dot_route_valid = calibrate_measures(here_rids, here_measures,
+                                                                                  here_route_metrics, dot_route_metrics,
+                                                                                  measure_decimal_places)
+        stage.input_rows = len(here_rids)
+        stage.output_rows = int((here_route_valid & dot_route_valid).sum())
+
+        invalid_here_routes = {}
+        invalid_dot_routes = {}
+        for here_rid, here_valid, dot_valid in zip(here_rids, here_route_valid.tolist(), dot_route_valid.tolist()):
+            if not here_valid:
+                invalid_here_routes[here_rid] = invalid_here_routes.get(here_rid, 0) + 1
+            elif not dot_valid:
+                invalid_dot_routes[here_rid] = invalid_dot_routes.get(here_rid, 0) + 1
+        warn_invalid_routes(invalid_here_routes, invalid_dot_routes)
 
     # create XREF table
-    arcpy.CreateTable_management(os.path.dirname(output_xref_table), os.path.basename(output_xref_table))
-    arcpy.AddField_management(output_xref_table, output_here_lid_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_xref_table, output_dot_rid_field, "TEXT", field_length=255)
-    arcpy.AddField_management(output_xref_table, output_fmeas_field, "DOUBLE")
-    arcpy.AddField_management(output_xref_table, output_tmeas_field, "DOUBLE")
+    with run_report.stage('write_xref_table', outputs=output_xref_table):
+        create_xref_table(output_xref_table, xref_table_fields)
 
-    xref_table_fields = [output_here_lid_field, output_dot_rid_field, output_fmeas_field, output_tmeas_field]
-
-    with arcpy.da.InsertCursor(output_xref_table, xref_table_fields) as iCur:
-        for here_lid, here_route_info in link_route_measure_dict.items():
-            for here_rid, here_link_measures in here_route_info.items():
-                here_fmeas = here_link_measures['fmeas']
-                here_tmeas = here_link_measures['tmeas']
-
-                here_route_length = here_route_dict[here_rid]['length'] if here_rid in here_route_dict.keys() else None
-                here_route_mmax = here_route_dict[here_rid]['mmax'] if here_rid in here_route_dict.keys() else None
-                here_route_mmin = here_route_dict[here_rid]['mmin'] if here_rid in here_route_dict.keys() else None
-                dot_route_length = dot_route_dict[here_rid]['length'] if here_rid in dot_route_dict.keys() else None
-                dot_route_mmax = dot_route_dict[here_rid]['mmax'] if here_rid in dot_route_dict.keys() else None
-                dot_route_mmin = dot_route_dict[here_rid]['mmin'] if here_rid in dot_route_dict.keys() else None
-
-                if here_route_length is None or here_route_mmax is None or here_route_mmin is None:
-                    arcpy.AddWarning("HERE route '{0}' has invalid geometry!".format(here_rid))
-                    arcpy.AddWarning("### Details: {0}, {1}, {2} ###".format(here_route_length, here_route_mmax, here_route_mmin))
-                    continue
-                if dot_route_length is None or dot_route_mmax is None or dot_route_mmin is None:
-                    arcpy.AddWarning("DOT route '{0}' has invalid geometry!".format(here_rid))
-                    arcpy.AddWarning("### Details: {0}, {1}, {2} ###".format(dot_route_length, dot_route_mmax, dot_route_mmin))
-                    continue
-
-                here_dot_length_ratio = here_route_length / dot_route_length
-                here_measure_length_ratio = abs(here_route_mmax - here_route_mmin) / here_route_length
-                dot_measure_length_ratio = abs(dot_route_mmax - dot_route_mmin) / dot_route_length
-
-                adjusted_here_fmeas = round((here_fmeas - here_route_mmin) / here_measure_length_ratio / here_dot_length_ratio * dot_measure_length_ratio + dot_route_mmin, measure_decimal_places)
-                adjusted_here_tmeas = round((here_tmeas - here_route_mmin) / here_measure_length_ratio / here_dot_length_ratio * dot_measure_length_ratio + dot_route_mmin, measure_decimal_places)
-
-                iCur.insertRow((here_lid, here_rid, adjusted_here_fmeas, adjusted_here_tmeas))
+        valid = here_route_valid & dot_route_valid
+        with arcpy.da.InsertCursor(output_xref_table, xref_table_fields) as iCur:
+            for i in valid.nonzero()[0].tolist():
+                adjusted_here_fmeas, adjusted_here_tmeas = [None if math.isnan(meas) else meas
+                                                            for meas in adjusted_measures[i].tolist()]
+                iCur.insertRow((here_lids[i], here_rids[i], adjusted_here_fmeas, adjusted_here_tmeas))
 
     logger.info("The XREF table has been generated successfully! '{0}'".format(output_xref_table))
 
@@ -159,12 +178,20 @@ if __name__ == '__main__':
     dot_route_td_field = arcpy.GetParameterAsText(10)
     output_xref_table = arcpy.GetParameterAsText(11)
 
+    Config = get_default_parameters()
+    in_memory_max_rows = Config.get('Default', 'in_memory_max_rows') if Config.has_option('Default', 'in_memory_max_rows') else None
+    xref_mode = Config.get('Default', 'xref_mode') if Config.has_option('Default', 'xref_mode') else 'in_memory'
+
     scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    scratch_workspace = ScratchWorkspace(scratch_folder, in_memory_max_rows=int(in_memory_max_rows) if in_memory_max_rows else 0)
 
-    arcpy.env.workspace = scratch_gdb
+    arcpy.env.workspace = scratch_workspace.gdb
     arcpy.env.overwriteOutput = True
 
+    run_report = RunReport('generate_xref_table', get_count)
+    run_report.parameters = {'here_route': here_route, 'here_link_event': here_link_event, 'dot_route': dot_route,
+                             'output_xref_table': output_xref_table}
+
     try:
         generate_link_route_xref_table(
             here_route=here_route,
@@ -178,14 +205,20 @@ if __name__ == '__main__':
             dot_route_rid_field=dot_route_rid_field,
             dot_route_fd_field=dot_route_fd_field,
             dot_route_td_field=dot_route_td_field,
-            output_xref_table=output_xref_table
+            output_xref_table=output_xref_table,
+            route_metrics_folder=os.path.join(scratch_folder, 'route_metrics'),
+            xref_mode=xref_mode,
+            run_report=run_report
         )
+        run_report.status = 'success'
     except Exception, err:
+        run_report.status = 'failed'
         logger.error("Error: {0}".format(err.args[0]))
         logger.error(traceback.format_exc())
 
     finally:
-        clear_scratch_gdb(scratch_gdb)
+        run_report.save(get_report_path(output_xref_table, 'generate_xref_table'))
+        scratch_workspace.cleanup()
         pass
 
 
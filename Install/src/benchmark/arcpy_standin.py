@@ -0,0 +1,31 @@
+import sys
+import types
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def install():
+    """
+    Register a minimal 'arcpy' module when ArcGIS is not available, so that the in-memory engines (which live in
+    packages importing arcpy) can be benchmarked on any machine with numpy. It only satisfies the imports and the
+    messaging functions, any geoprocessing call fails.
+    :return: True if the stand-in was installed, False if arcpy is available
+    """
+    try:
+        import arcpy
+        return False
+    except ImportError:
+        pass
+
+    module = types.ModuleType('arcpy')
+    module.__doc__ = 'Stand-in of arcpy for running the benchmarks without ArcGIS'
+    module.env = types.ModuleType('arcpy.env')
+    module.da = types.ModuleType('arcpy.da')
+    module.AddMessage = lambda message: logger.info(message)
+    module.AddWarning = lambda message: logger.warning(message)
+    module.AddError = lambda message: logger.error(message)
+    module.ExecuteError = type('ExecuteError', (Exception,), {})
+    sys.modules['arcpy'] = module
+    logger.info("arcpy is not available, a stand-in is used, geoprocessing stages are not run")
+    return True
@@ -0,0 +1,101 @@
+"""
+Cross-check of the in-memory link/route matching engine against the arcpy engine (SpatialJoin, Buffer,
+SplitLineAtPoint and Dissolve) on a real network.
+
+    python -m src.benchmark.compare_matching_engines here.gdb/links LINK_ID ST_NAME COUNTY_ID lrs.gdb/routes ROUTE_ID
+        ROUTE_NAME COUNTY_ID --search-radius "50 Feet" --angle-tolerance 45 --output engines.json
+
+Run from the Install folder with ArcGIS. generate_match_candidate runs once with each engine into a scratch file
+geodatabase, then the candidate tables are compared by link id and route id: the pairs found by only one engine, the
+pairs with another confidence level, and the pairs written more than once are logged and saved to the output JSON file.
+The exit code is 1 if the engines disagree.
+
+Known differences: the arcpy engine writes one row per link and route feature, so a route split into several features
+gives duplicate pairs (and a higher frequency) there, while the in-memory engine dissolves them into one pair.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+
+import arcpy
+
+from src.util.helper import ScratchWorkspace
+from src.config.schema import default_schemas
+from src.here.match_util import compare_candidate_rows
+from generate_match_candidate import generate_match_candidate
+
+logger = logging.getLogger(__name__)
+
+
+def read_candidate_rows(candidate_table):
+    schemas = default_schemas.get('candidate_table')
+    fields = [schemas.get('dot_rid_field'), schemas.get('here_lid_field'), schemas.get('dot_rt_name_field'),
+              schemas.get('dot_cnty_id_field'), schemas.get('here_st_name_field'), schemas.get('here_cnty_id_field'),
+              schemas.get('conf_lvl_field')]
+    with arcpy.da.SearchCursor(candidate_table, fields) as sCur:
+        rows = [row for row in sCur]
+    del sCur
+    return rows
+
+
+def run_engines(folder, engines=('arcpy', 'in_memory'), **kwargs):
+    """
+    Run generate_match_candidate with every engine
+    :param folder: folder of the scratch geodatabase of the outputs
+    :param engines:
+    :param kwargs: parameters of generate_match_candidate
+    :return: dict of engine -> candidate rows
+    """
+    arcpy.CreateFileGDB_management(folder, 'engines.gdb')
+    engine_rows = {}
+    for engine in engines:
+        output_table = os.path.join(folder, 'engines.gdb', 'candidates_{0}'.format(engine))
+        scratch_workspace = ScratchWorkspace(folder)
+        try:
+            arcpy.env.workspace = scratch_workspace.gdb
+            generate_match_candidate(output_table=output_table, matching_engine=engine,
+                                     scratch_workspace=scratch_workspace, **kwargs)
+        finally:
+            scratch_workspace.cleanup()
+        engine_rows[engine] = read_candidate_rows(output_table)
+        logger.info("{0} candidate rows with the {1} engine".format(len(engine_rows[engine]), engine))
+    return engine_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the in-memory matching engine with the arcpy engine')
+    for name in ['here_link', 'here_link_id_field', 'here_st_name_field', 'here_county_id_field', 'dot_network',
+                 'dot_network_rid_field', 'dot_network_route_name_field', 'dot_network_county_id_field']:
+        parser.add_argument(name)
+    parser.add_argument('--dot-network-fdate-field', default=None)
+    parser.add_argument('--dot-network-tdate-field', default=None)
+    parser.add_argument('--search-radius', default='50 Feet')
+    parser.add_argument('--angle-tolerance', type=float, default=45.0, help='in degrees')
+    parser.add_argument('--output', default='matching_engines.json')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    arcpy.env.overwriteOutput = True
+
+    folder = tempfile.mkdtemp()
+    try:
+        engine_rows = run_engines(folder, **dict((name, value) for name, value in vars(args).items()
+                                                 if name != 'output'))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    differences = compare_candidate_rows(engine_rows['arcpy'], engine_rows['in_memory'])
+    for name, items in sorted(differences.items()):
+        logger.info("{0}: {1} pair(s) {2}".format(name, len(items), items[:10]))
+    with open(args.output, 'w') as f:
+        json.dump(differences, f, indent=2, default=str)
+    logger.info("Engine comparison: {0}".format(os.path.abspath(args.output)))
+    return 1 if differences['missing'] or differences['extra'] or differences['confidence'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
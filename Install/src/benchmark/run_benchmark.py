@@ -0,0 +1,186 @@
+"""
+Scalability benchmark of the conflation engines on synthetic networks.
+
+    python -m src.benchmark.run_benchmark --sizes 10000 100000 1000000 --layouts grid radial
+
+Run from the Install folder. Without ArcGIS a stand-in of arcpy is registered, so only the in-memory engines behind the
+tools are measured (link/route matching and candidate filtering, HERE route building, link location, streaming XREF
+calibration and event segmentation), calling the same functions as the tools; the geoprocessing steps of the tools
+(CreateRoutes, MakeRouteEventLayer...) and the reads and writes of their cursors are not part of the benchmark.
+"""
+import os
+import json
+import logging
+import argparse
+import numpy as np
+
+from src.benchmark import arcpy_standin
+
+arcpy_standin.install()
+
+from src.tss.spatial_index import SegmentGridIndex
+from src.tss.calibration_util import calibrate_measures
+from src.tss.route_builder_util import build_routes
+from src.tss.locate_util import RouteLocator
+from src.tss.segmentation_util import RouteSegmenter
+from src.tss.xref_util import stream_xref_rows
+from src.tss.instrument_util import RunReport
+from src.tss.ags.route_metrics_util import RouteMetrics
+from src.here.match_util import build_link_route_rows, filter_candidate_rows, score_candidate_rows
+from src.benchmark.synthetic_data import generate_network
+
+logger = logging.getLogger(__name__)
+
+
+def route_metrics(routes):
+    """
+    :param routes: PolylineArray with m values
+    :return: RouteMetrics of the routes, the measure range being the first and last measure of every route
+    """
+    first, end = routes.feature_vertex_bounds()
+    return RouteMetrics(routes.ids, routes.feature_lengths(), routes.m[first], routes.m[end - 1])
+
+
+def run_size(link_count, layout, search_radius, angle_tolerance, event_count, seed, locate_tolerance=0.01):
+    """
+    Run every stage on a network of the given size
+    :return: RunReport
+    """
+    run_report = RunReport('benchmark_{0}_{1}'.format(layout, link_count))
+    run_report.parameters = {'link_count': link_count, 'layout': layout, 'search_radius': search_radius,
+                             'angle_tolerance': angle_tolerance, 'event_count': event_count, 'seed': seed,
+                             'locate_tolerance': locate_tolerance}
+
+    with run_report.stage('generate_network') as stage:
+        network = generate_network(link_count, layout, seed=seed)
+        stage.output_rows = len(network.links)
+    routes, links = network.routes, network.links
+    run_report.parameters['route_count'] = len(routes)
+
+    with run_report.stage('build_route_index') as stage:
+        stage.input_rows = len(routes)
+        route_index = SegmentGridIndex.build(routes, oids=range(len(routes)))
+        stage.output_rows = len(route_index)
+
+    with run_report.stage('match_links') as stage:
+        stage.input_rows = len(links)
+        matched_rows = build_link_route_rows(links, network.link_attributes, route_index, network.route_attributes,
+                                             search_radius)
+        stage.output_rows = len(matched_rows)
+
+    with run_report.stage('filter_candidates') as stage:
+        stage.input_rows = len(matched_rows)
+        candidate_rows = filter_candidate_rows(matched_rows, angle_tolerance)
+        stage.output_rows = len(candidate_rows)
+
+    with run_report.stage('score_candidates') as stage:
+        candidate_rows = score_candidate_rows(candidate_rows)
+        stage.input_rows = stage.output_rows = len(candidate_rows)
+    expected_pairs = set(zip(links.ids, network.link_route_ids))
+    run_report.parameters['expected_pairs_found'] = sum(1 for row in candidate_rows
+                                                        if (row[1], row[0]) in expected_pairs)
+    run_report.parameters['expected_pairs'] = len(expected_pairs)
+    del matched_rows, candidate_rows, route_index
+
+    with run_report.stage('build_here_routes') as stage:
+        stage.input_rows = len(links)
+        here_routes, route_build = build_routes(links, network.link_route_ids)
+        stage.output_rows = len(here_routes)
+    here_metrics, dot_metrics = route_metrics(here_routes), route_metrics(routes)
+
+    with run_report.stage('locate_links') as stage:
+        stage.input_rows = len(links)
+        locator = RouteLocator(here_routes)
+        line_index, route_index, from_measures, to_measures, distances = locator.locate_lines(
+            links.first_points(), links.last_points(), locate_tolerance)
+        # keep the location on the route of every link, ordered by route id like the link events read for streaming
+        on_own_route = np.array([network.link_route_ids[i] == here_routes.ids[r]
+                                 for i, r in zip(line_index.tolist(), route_index.tolist())], dtype=bool)
+        order = np.nonzero(on_own_route)[0]
+        order = order[np.argsort(route_index[order], kind='mergesort')]
+        link_rows = [(links.ids[i], here_routes.ids[r], from_measure, to_measure)
+                     for i, r, from_measure, to_measure in zip(line_index[order].tolist(), route_index[order].tolist(),
+                                                               from_measures[order].tolist(),
+                                                               to_measures[order].tolist())]
+        stage.output_rows = len(link_rows)
+    del locator, line_index, route_index, from_measures, to_measures, distances
+
+    with run_report.stage('generate_xref') as stage:
+        stage.input_rows = len(link_rows)
+        stage.output_rows = sum(len(xref_rows) for xref_rows in stream_xref_rows(link_rows, here_metrics,
+                                                                                 dot_metrics))
+    del link_rows
+
+    event_route_ids, event_measures = network.generate_events(event_count, random_state=np.random.RandomState(seed))
+    with run_report.stage('load_route_segmenter') as stage:
+        stage.input_rows = len(here_routes)
+        segmenter = RouteSegmenter(here_routes)
+        stage.output_rows = len(segmenter)
+
+    with run_report.stage('transfer_line_events') as stage:
+        stage.input_rows = len(event_route_ids)
+        here_event_measures, source_valid, target_valid = calibrate_measures(event_route_ids, event_measures,
+                                                                             dot_metrics, here_metrics)
+        events, located = segmenter.line_events(segmenter.route_indexes(event_route_ids), here_event_measures[:, 0],
+                                                here_event_measures[:, 1])
+        stage.output_rows = int(located.sum())
+
+    with run_report.stage('transfer_point_events') as stage:
+        stage.input_rows = len(event_route_ids)
+        here_event_measures, source_valid, target_valid = calibrate_measures(event_route_ids, event_measures[:, :1],
+                                                                             dot_metrics, here_metrics)
+        xy, m, located = segmenter.point_events(segmenter.route_indexes(event_route_ids), here_event_measures[:, 0])
+        stage.output_rows = int(located.sum())
+
+    run_report.status = 'success'
+    return run_report
+
+
+def summarize(report_dict):
+    """
+    Add the throughput (rows per second) of every stage, based on its input rows (output rows if no input)
+    """
+    for stage in report_dict['stages']:
+        rows = stage['input_rows'] if stage['input_rows'] is not None else stage['output_rows']
+        stage['rows_per_second'] = round(rows / stage['wall_seconds'], 1) \
+            if rows is not None and stage['wall_seconds'] else None
+    return report_dict
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scalability benchmark of the conflation engines')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='approximate numbers of links')
+    parser.add_argument('--layouts', nargs='+', default=['grid', 'radial'], choices=['grid', 'radial'])
+    parser.add_argument('--search-radius', type=float, default=50.0, help='in map units (feet)')
+    parser.add_argument('--angle-tolerance', type=float, default=45.0, help='in degrees')
+    parser.add_argument('--events', type=int, default=None, help='number of events, defaults to the number of links')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_report.json')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    reports = []
+    for layout in args.layouts:
+        for size in args.sizes:
+            logger.info("Benchmarking the {0} layout with {1} links...".format(layout, size))
+            run_report = run_size(size, layout, args.search_radius, args.angle_tolerance, args.events or size,
+                                  args.seed)
+            reports.append(summarize(run_report.to_dict()))
+
+    with open(args.output, 'w') as f:
+        json.dump(reports, f, indent=2, default=str)
+    logger.info("Benchmark report: {0}".format(os.path.abspath(args.output)))
+
+    print '{0:<28}{1:>10}{2:>22}{3:>12}{4:>14}{5:>12}{6:>16}'.format('run', 'links', 'stage', 'seconds', 'rows/s',
+                                                                    '+memory MB', 'process peak MB')
+    for report in reports:
+        for stage in report['stages']:
+            print '{0:<28}{1:>10}{2:>22}{3:>12}{4:>14}{5:>12}{6:>16}'.format(
+                report['tool'], report['parameters']['link_count'], stage['name'], stage['wall_seconds'],
+                stage['rows_per_second'], stage['memory_increase_mb'], stage['process_peak_memory_mb'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import math
+import numpy as np
+
+from src.config.schema import default_schemas
+from src.tss.polyline_util import PolylineArray
+from src.tss.spatial_index import expand_ranges
+
+
+def county_ids(points, county_size):
+    """
+    County id of every point, counties are the cells of a square grid
+    :param points: (n, 2) array
+    :param county_size: cell size of the county grid
+    :return: list of county ids
+    """
+    cells = np.floor(np.asarray(points, dtype=np.float64) / county_size).astype(np.int64)
+    return ['C{0}_{1}'.format(x, y) for x, y in cells.tolist()]
+
+
+def densify(points, vertex_spacing):
+    """
+    Insert vertices along a polyline so that no segment is longer than the vertex spacing
+    :param points: (n, 2) control points
+    :param vertex_spacing:
+    :return: (m, 2) array
+    """
+    points = np.asarray(points, dtype=np.float64)
+    lengths = np.sqrt(((points[1:] - points[:-1]) ** 2).sum(axis=1))
+    counts = np.maximum(np.ceil(lengths / vertex_spacing).astype(np.int64), 1)
+    owner, step = expand_ranges(np.zeros(len(counts), dtype=np.int64), counts)
+    t = (step / counts[owner].astype(np.float64))[:, np.newaxis]
+    return np.vstack((points[:-1][owner] + (points[1:] - points[:-1])[owner] * t, points[-1:]))
+
+
+def grid_routes(size, spacing, vertex_spacing):
+    """
+    Routes of a square street grid, one east-west route per row and one north-south route per column
+    :param size: number of rows (and columns)
+    :param spacing: distance between parallel routes
+    :param vertex_spacing:
+    :return: list of (route id, route name, (n, 2) vertices)
+    """
+    extent = (size - 1) * spacing
+    routes = []
+    for i in range(size):
+        routes.append(('H{0:05d}'.format(i), 'E {0} ST'.format(i + 1),
+                       densify([(0.0, i * spacing), (extent, i * spacing)], vertex_spacing)))
+    for i in range(size):
+        routes.append(('V{0:05d}'.format(i), 'N {0} AVE'.format(i + 1),
+                       densify([(i * spacing, 0.0), (i * spacing, extent)], vertex_spacing)))
+    return routes
+
+
+def radial_routes(rings, spokes, spacing, vertex_spacing):
+    """
+    Routes of a radial network: spokes from the first ring outwards and closed ring routes (loops) around the center
+    :param rings: number of rings
+    :param spokes: number of spokes
+    :param spacing: distance between the rings
+    :param vertex_spacing:
+    :return: list of (route id, route name, (n, 2) vertices)
+    """
+    center = rings * spacing
+    routes = []
+    for i in range(spokes):
+        angle = 2 * math.pi * i / spokes
+        direction = np.array([math.cos(angle), math.sin(angle)])
+        routes.append(('S{0:05d}'.format(i), 'RADIAL {0} RD'.format(i + 1),
+                       densify([center + spacing * direction, center + rings * spacing * direction], vertex_spacing)))
+    for i in range(1, rings + 1):
+        radius = i * spacing
+        count = max(int(math.ceil(2 * math.pi * radius / vertex_spacing)), 8)
+        angles = np.linspace(0, 2 * math.pi, count + 1)
+        vertices = center + radius * np.column_stack((np.cos(angles), np.sin(angles)))
+        vertices[-1] = vertices[0]
+        routes.append(('R{0:05d}'.format(i), 'RING {0} BLVD'.format(i), vertices))
+    return routes
+
+
+def build_route_array(routes, measure_factor, county_size):
+    """
+    :param routes: list of (route id, route name, vertices)
+    :param measure_factor: measure units per map unit, measures are the distance along the route
+    :param county_size:
+    :return: PolylineArray of the routes with M values and the (route name, county id) of every route
+    """
+    vertex_counts = np.array([len(vertices) for route_id, route_name, vertices in routes], dtype=np.int64)
+    xy = np.vstack([vertices for route_id, route_name, vertices in routes])
+    offsets = np.concatenate(([0], np.cumsum(vertex_counts)))
+
+    segment_lengths = np.sqrt(((xy[1:] - xy[:-1]) ** 2).sum(axis=1))
+    segment_lengths[offsets[1:-1] - 1] = 0.0  # no segment between the last and first vertex of consecutive routes
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+    m = (cumulative - np.repeat(cumulative[offsets[:-1]], vertex_counts)) * measure_factor
+
+    routes_array = PolylineArray([route_id for route_id, route_name, vertices in routes], xy, offsets,
+                                 np.arange(len(routes) + 1), m)
+    route_counties = county_ids(xy[offsets[:-1]], county_size)
+    route_attributes = [(route[1], county_id) for route, county_id in zip(routes, route_counties)]
+    return routes_array, route_attributes
+
+
+class SyntheticNetwork(object):
+    """
+    DOT routes and HERE-like links derived from them, with the route and measures each link was derived from (the
+    expected matches and XREF rows)
+    """
+
+    def __init__(self, routes, route_attributes, links, link_attributes, link_route_ids, link_measures):
+        """
+        :param routes: PolylineArray of the DOT routes with M values
+        :param route_attributes: (route name, county id) of every route
+        :param links: PolylineArray of the links
+        :param link_attributes: (street name, county id) of every link
+        :param link_route_ids: route id of every link, None for the loop links that are not on any route
+        :param link_measures: (n, 2) from and to measures of the links on their route, NaN for the loop links
+        """
+        self.routes = routes
+        self.route_attributes = route_attributes
+        self.links = links
+        self.link_attributes = link_attributes
+        self.link_route_ids = link_route_ids
+        self.link_measures = link_measures
+
+    def candidate_rows(self):
+        """
+        :return: the expected candidate rows as dicts keyed by the default candidate table field names
+        """
+        schema = default_schemas['candidate_table']
+        route_attributes_dict = dict(zip(self.routes.ids, self.route_attributes))
+        rows = []
+        for link_id, route_id, (st_name, county_id) in zip(self.links.ids, self.link_route_ids, self.link_attributes):
+            rt_name, rt_county_id = route_attributes_dict.get(route_id, (None, None))
+            rows.append({
+                schema['dot_rid_field']: route_id,
+                schema['here_lid_field']: link_id,
+                schema['dot_rt_name_field']: rt_name,
+                schema['dot_cnty_id_field']: rt_county_id,
+                schema['here_st_name_field']: st_name,
+                schema['here_cnty_id_field']: county_id,
+                schema['conf_lvl_field']: 'High' if route_id is not None else 'No Match',
+                schema['verified_match_field']: None,
+                schema['false_match_field']: None
+            })
+        return rows
+
+    def xref_rows(self):
+        """
+        :return: the expected XREF rows (links on a route only) as dicts keyed by the default XREF field names
+        """
+        schema = default_schemas['xref_table']
+        return [{schema['here_lid_field']: link_id, schema['dot_rid_field']: route_id,
+                 schema['fmeas_field']: from_measure, schema['tmeas_field']: to_measure}
+                for link_id, route_id, (from_measure, to_measure)
+                in zip(self.links.ids, self.link_route_ids, self.link_measures.tolist()) if route_id is not None]
+
+    def generate_events(self, count, mean_length=None, random_state=None):
+        """
+        Random linear events on the DOT routes
+        :param count:
+        :param mean_length: mean event length in measure units, defaults to a tenth of the mean route measure range
+        :param random_state: numpy RandomState
+        :return: route id of every event and (n, 2) from and to measures
+        """
+        random_state = random_state or np.random.RandomState(0)
+        first, end = self.routes.feature_vertex_bounds()
+        mmins, mmaxs = self.routes.m[first], self.routes.m[end - 1]
+        if mean_length is None:
+            mean_length = float((mmaxs - mmins).mean()) / 10
+        route_index = random_state.randint(0, len(self.routes), count)
+        from_measures = mmins[route_index] + random_state.random_sample(count) * (mmaxs - mmins)[route_index]
+        to_measures = np.minimum(from_measures + random_state.exponential(mean_length, count), mmaxs[route_index])
+        return [self.routes.ids[i] for i in route_index.tolist()], np.column_stack((from_measures, to_measures))
+
+
+def derive_links(routes, route_attributes, vertices_per_link=4, jitter=0.0, split_ratio=0.0, gap_ratio=0.0,
+                 loop_ratio=0.0, county_size=None, random_state=None):
+    """
+    Cut the routes into HERE-like links. Link vertices are moved by a random offset (jitter), some links are split in
+    two, some are dropped (gaps) and small loop links (e.g. cul-de-sacs) are attached to the end of some links.
+    :param routes: PolylineArray of the routes with M values, one part per route
+    :param route_attributes: (route name, county id) of every route
+    :param vertices_per_link: route segments per link
+    :param jitter: standard deviation of the vertex offset, in map units
+    :param split_ratio: ratio of the links split in two
+    :param gap_ratio: ratio of the links dropped
+    :param loop_ratio: ratio of the links with a loop link attached
+    :param county_size: county grid cell size of the link county ids, the route county ids are used if not specified
+    :param random_state: numpy RandomState
+    :return: SyntheticNetwork
+    """
+    random_state = random_state or np.random.RandomState(0)
+    first, end = routes.feature_vertex_bounds()
+    last = end - 1
+    link_counts = np.maximum((last - first) // vertices_per_link, 1)
+    owner, local = expand_ranges(np.zeros(len(routes), dtype=np.int64), link_counts)
+    starts = first[owner] + local * vertices_per_link
+    ends = np.where(local == link_counts[owner] - 1, last[owner], starts + vertices_per_link)
+
+    keep = random_state.random_sample(len(starts)) >= gap_ratio
+    owner, starts, ends = owner[keep], starts[keep], ends[keep]
+    split = (random_state.random_sample(len(starts)) < split_ratio) & (ends - starts >= 2)
+    middles = (starts + ends) // 2
+    owner = np.concatenate((owner[~split], owner[split], owner[split]))
+    starts, ends = np.concatenate((starts[~split], starts[split], middles[split])), \
+        np.concatenate((ends[~split], middles[split], ends[split]))
+    order = np.argsort(starts, kind='mergesort')
+    owner, starts, ends = owner[order], starts[order], ends[order]
+
+    vertex_owner, vertex_index = expand_ranges(starts, ends - starts + 1)
+    xy = routes.xy[vertex_index] + random_state.normal(0.0, jitter, (len(vertex_index), 2)) if jitter > 0 else \
+        routes.xy[vertex_index]
+    vertex_counts = ends - starts + 1
+    link_measures = np.column_stack((routes.m[starts], routes.m[ends]))
+    link_route_ids = [routes.ids[i] for i in owner.tolist()]
+    street_names = [route_attributes[i][0] for i in owner.tolist()]
+
+    # Loop links start and end at the last vertex of their link, on the left side of the link
+    loop_links = np.nonzero(random_state.random_sample(len(starts)) < loop_ratio)[0]
+    if len(loop_links):
+        loop_vertices = 9
+        end_xy = routes.xy[ends[loop_links]]
+        direction = routes.xy[ends[loop_links]] - routes.xy[ends[loop_links] - 1]
+        direction /= np.maximum(np.sqrt((direction ** 2).sum(axis=1)), 1e-12)[:, np.newaxis]
+        normal = np.column_stack((-direction[:, 1], direction[:, 0]))
+        radius = np.sqrt(((routes.xy[ends[loop_links]] - routes.xy[starts[loop_links]]) ** 2).sum(axis=1)) / 4
+        center = end_xy + normal * radius[:, np.newaxis]
+        angles = np.arctan2(-normal[:, 1], -normal[:, 0])[:, np.newaxis] + \
+            np.linspace(0, 2 * math.pi, loop_vertices)[np.newaxis]
+        loop_xy = center[:, np.newaxis] + radius[:, np.newaxis, np.newaxis] * np.dstack((np.cos(angles),
+                                                                                        np.sin(angles)))
+        loop_xy[:, -1] = loop_xy[:, 0]
+        xy = np.vstack((xy, loop_xy.reshape(-1, 2)))
+        vertex_counts = np.concatenate((vertex_counts, np.zeros(len(loop_links), dtype=np.int64) + loop_vertices))
+        link_measures = np.vstack((link_measures, np.zeros((len(loop_links), 2)) + np.nan))
+        link_route_ids += [None] * len(loop_links)
+        street_names += [street_names[i] for i in loop_links.tolist()]
+
+    offsets = np.concatenate(([0], np.cumsum(vertex_counts))).astype(np.int64)
+    links = PolylineArray(range(1, len(vertex_counts) + 1), xy, offsets, np.arange(len(vertex_counts) + 1))
+    if county_size:
+        link_counties = county_ids(links.xy[offsets[:-1]], county_size)
+    else:
+        link_counties = [route_attributes[i][1] for i in owner.tolist()] + \
+                        [route_attributes[owner[i]][1] for i in loop_links.tolist()]
+    return SyntheticNetwork(routes, route_attributes, links, zip(street_names, link_counties), link_route_ids,
+                            link_measures)
+
+
+def generate_network(link_count, layout='grid', spacing=1320.0, vertices_per_link=4, jitter=5.0, split_ratio=0.05,
+                     gap_ratio=0.02, loop_ratio=0.01, county_size=26400.0, measure_factor=1 / 5280.0, seed=0):
+    """
+    Generate a DOT network and its HERE-like links with about the requested number of links. Map units are feet and
+    measures are miles by default; links are half a block long.
+    :param link_count: approximate number of links
+    :param layout: 'grid' or 'radial'
+    :param spacing: distance between parallel routes (grid) or rings (radial)
+    :param vertices_per_link:
+    :param jitter: see derive_links
+    :param split_ratio: see derive_links
+    :param gap_ratio: see derive_links
+    :param loop_ratio: see derive_links
+    :param county_size: size of the square counties
+    :param measure_factor: measure units per map unit
+    :param seed: seed of the random generator
+    :return: SyntheticNetwork
+    """
+    vertex_spacing = spacing / 2 / vertices_per_link
+    if layout == 'grid':
+        # n rows and n columns of n - 1 blocks, two links per block
+        size = max(int(math.ceil((1 + math.sqrt(1 + link_count)) / 2)), 2)
+        routes = grid_routes(size, spacing, vertex_spacing)
+    elif layout == 'radial':
+        # 4k spokes of 2(k - 1) links and k rings of 4 pi i links
+        rings = max(int(math.ceil(math.sqrt(link_count / (8 + 2 * math.pi)))), 1)
+        routes = radial_routes(rings, 4 * rings, spacing, vertex_spacing)
+    else:
+        raise ValueError("Unknown layout '{0}'".format(layout))
+
+    routes_array, route_attributes = build_route_array(routes, measure_factor, county_size)
+    return derive_links(routes_array, route_attributes, vertices_per_link, jitter, split_ratio, gap_ratio, loop_ratio,
+                        county_size, np.random.RandomState(seed))
@@ -3,6 +3,7 @@ import os
 import logging
 
 from src.util.helper import get_default_parameters
+from src.here.route_id_util import RouteIdRule
 
 logger = logging.getLogger(__name__)
 
@@ -12,88 +13,31 @@ Config = get_default_parameters()
 def matching_route_by_id(candidate_table):
     arcpy.AddMessage("Matching routes by ID...")
 
-    here_route_id_delimiter = Config.get(SECTION,'here_route_id_delimiter')
-    here_route_type_pos = Config.get(SECTION,'here_route_type_pos')
-    here_route_number_pos = Config.get(SECTION,'here_route_number_pos')
-    here_route_direction_pos = Config.get(SECTION,'here_route_direction_pos')
-    target_route_id_delimiter = Config.get(SECTION,'target_route_id_delimiter')
-    target_route_type_start_pos = Config.get(SECTION,'target_route_type_start_pos')
-    target_route_type_end_pos = Config.get(SECTION,'target_route_type_end_pos')
-    target_route_number_start_pos = Config.get(SECTION,'target_route_number_start_pos')
-    target_route_number_end_pos = Config.get(SECTION,'target_route_number_end_pos')
-    route_type_naming_convention = Config.get(SECTION,'route_type_naming_convention')
-
-    rules = [here_route_id_delimiter,here_route_type_pos,here_route_number_pos,here_route_direction_pos,\
-             target_route_id_delimiter,target_route_type_start_pos,target_route_type_end_pos,\
-             target_route_number_start_pos,target_route_number_end_pos,route_type_naming_convention]
-
-    with arcpy.da.UpdateCursor(candidate_table, ['TargetRoute','SourceRoute','IsRouteIdMatching']) as uCur_candidate:
-        for candidate in uCur_candidate:
-            target_route = candidate[0]
-            source_route = candidate[1]
+    route_id_rule = RouteIdRule.from_config(Config, SECTION)
 
-            # arcpy.AddMessage(target_route+"-"+source_route)
-            if compare_route_id(rules,source_route,target_route):
-                candidate[2] = "YES"
-                uCur_candidate.updateRow(candidate)
-            else:
-                candidate[2] = "NO"
-                uCur_candidate.updateRow(candidate)
+    # Route ids of the whole table are matched at once, then written back by object id
+    with arcpy.da.SearchCursor(candidate_table, ['OID@', 'TargetRoute', 'SourceRoute']) as sCur_candidate:
+        candidates = [row for row in sCur_candidate]
+    matches = route_id_rule.match_columns([candidate[2] for candidate in candidates],
+                                          [candidate[1] for candidate in candidates])
+    oid_match_dict = dict((candidate[0], is_matching) for candidate, is_matching in zip(candidates, matches))
+
+    with arcpy.da.UpdateCursor(candidate_table, ['OID@', 'IsRouteIdMatching']) as uCur_candidate:
+        for candidate in uCur_candidate:
+            candidate[1] = "YES" if oid_match_dict.get(candidate[0]) else "NO"
+            uCur_candidate.updateRow(candidate)
 
     return True
 
 
 def compare_route_id(rules,source_rid,target_rid):
-    # ToDo: needs to be rewrite to handle different name structure. Current algorithm only fits for state routes
-
-    import re
-
-    here_route_id_delimiter = rules[0]
-    here_route_type_pos = rules[1]
-    here_route_number_pos = rules[2]
-    here_route_direction_pos = rules[3]
-    target_route_id_delimiter = rules[4]
-    target_route_type_start_pos = rules[5]
-    target_route_type_end_pos = rules[6]
-    target_route_number_start_pos = rules[7]
-    target_route_number_end_pos = rules[8]
-    route_type_naming_convention = rules[9]
-
-    src_route_delimiter = re.split(";",here_route_id_delimiter.replace("space"," "))
-    delimiters = "|".join(src_route_delimiter)
-
-    source_rid_list = re.split(delimiters,source_rid)
-
-    target_rid_type = target_rid[(target_route_type_start_pos-1):target_route_type_end_pos]
-    target_rid_number = str(int(target_rid[(target_route_number_start_pos-1):target_route_number_end_pos]))
-    target_rid_parsed = target_rid_type+"-"+target_rid_number
-
-    # Additional criterion.(Converntion: [HERE,DOT])
-    route_type_naming_convention_list = []
-    for item in re.split(";",route_type_naming_convention):
-        route_type_naming_convention_list.append(re.split(" ",item))
-
-    flg = False
-    isConstructID = False
-
-    for criterion in route_type_naming_convention_list:
-        if source_rid_list[here_route_type_pos-1] == criterion[0]:
-            source_rid_list[here_route_type_pos-1] = criterion[1]
-            isConstructID = True
-
-    # reconstruct source route name ignoring route direction
-    if isConstructID:
-        src_rid_parsed = source_rid_list[here_route_type_pos-1]+"-"+source_rid_list[here_route_number_pos-1]
-    else:
-        src_rid_parsed = source_rid
-
-    # arcpy.AddMessage(target_rid+"-"+source_rid)
-    # arcpy.AddMessage(target_rid_parsed+"-"+src_rid_parsed)
-
-    if src_rid_parsed == target_rid_parsed:
-        flg = True
-
-    return flg
+    """
+    Compare a HERE route id and a DOT route id with the rules listed in the order of the params.ini options
+    (here_route_id_delimiter ... route_type_naming_convention). The rules are compiled on every call, use RouteIdRule
+    directly when comparing many route ids.
+    """
+    route_id_rule = RouteIdRule(rules[0], rules[1], rules[2], rules[5], rules[6], rules[7], rules[8], rules[9])
+    return route_id_rule.is_matching(source_rid, target_rid)
 
 
 def calculate_confidence_level(candidate_table):
@@ -120,7 +64,87 @@ def calculate_confidence_level(candidate_table):
             uCur_candidate.updateRow(candidate)
 
 
-def matching_intersections_func(source_intersections,target_intersections,search_radius,source_intersections_LUT,target_intersections_LUT,candidate_table):
+def matching_intersections_func(source_intersections,target_intersections,search_radius,source_intersections_LUT,target_intersections_LUT,candidate_table,mode="indexed"):
+    """
+    Count the intersections of the source route that have a near intersection on the target route for every
+    candidate pair
+    :param mode: "indexed" (default) loads the near table and the LUTs into dictionaries once, "reference" runs the
+                 original cursor per candidate implementation, kept for result comparison
+    """
+    if mode == "reference":
+        return matching_intersections_reference(source_intersections, target_intersections, search_radius,
+                                                source_intersections_LUT, target_intersections_LUT, candidate_table)
+    logger.info("Matching intersections...")
+
+    # Intermediate Data
+    near_table = "NEAR_Table"
+
+    # generate near table
+    arcpy.GenerateNearTable_analysis(source_intersections, target_intersections, near_table, search_radius,\
+                                     'NO_LOCATION', 'NO_ANGLE', 'ALL', '0', 'PLANAR')
+
+    source_oid_intersection_dict = load_oid_intersection_dict(source_intersections)
+    target_oid_intersection_dict = load_oid_intersection_dict(target_intersections)
+
+    # near intersections of every source intersection
+    near_intersections_dict = {}
+    with arcpy.da.SearchCursor(near_table, ["IN_FID", "NEAR_FID"]) as sCur_near:
+        for in_fid, near_fid in sCur_near:
+            in_intersection_id = source_oid_intersection_dict.get(in_fid)
+            near_intersection_id = target_oid_intersection_dict.get(near_fid)
+            near_intersections_dict.setdefault(in_intersection_id, []).append(near_intersection_id)
+
+    source_route_intersections_dict = load_route_intersections_dict(source_intersections_LUT)
+    target_route_intersections_dict = load_route_intersections_dict(target_intersections_LUT)
+
+    with arcpy.da.UpdateCursor(candidate_table,["TargetRoute","SourceRoute","NumMatchingIntersection"]) as uCursor:
+        for candidate in uCursor:
+            target_route = candidate[0]
+            source_route = candidate[1]
+            candidate[2] = count_matching_intersections(source_route_intersections_dict.get(source_route, []),
+                                                        set(target_route_intersections_dict.get(target_route, [])),
+                                                        near_intersections_dict)
+            uCursor.updateRow(candidate)
+
+    arcpy.Delete_management(near_table)
+
+    return True
+
+
+def load_oid_intersection_dict(intersections):
+    oid_intersection_dict = {}
+    with arcpy.da.SearchCursor(intersections, ["OID@", "INTERSECTION_ID"]) as sCur:
+        for oid, intersection_id in sCur:
+            oid_intersection_dict[oid] = intersection_id
+    return oid_intersection_dict
+
+
+def load_route_intersections_dict(intersections_LUT):
+    route_intersections_dict = {}
+    with arcpy.da.SearchCursor(intersections_LUT, ["INTERSECTION_ID", "ON_ROUTE_ID"]) as sCur:
+        for intersection_id, route_id in sCur:
+            route_intersections_dict.setdefault(route_id, []).append(intersection_id)
+    return route_intersections_dict
+
+
+def count_matching_intersections(source_route_intersections, target_route_intersections, near_intersections_dict):
+    """
+    Count the near intersections of the source route intersections that are on the target route
+    :param source_route_intersections: list of intersection ids on the source route
+    :param target_route_intersections: set of intersection ids on the target route
+    :param near_intersections_dict: source intersection id -> list of near target intersection ids
+    :return:
+    """
+    count = 0
+    for intersection_id in source_route_intersections:
+        near_intersections = near_intersections_dict.get(intersection_id, [])
+        if target_route_intersections.isdisjoint(near_intersections):
+            continue
+        count += sum(1 for near_intersection_id in near_intersections if near_intersection_id in target_route_intersections)
+    return count
+
+
+def matching_intersections_reference(source_intersections,target_intersections,search_radius,source_intersections_LUT,target_intersections_LUT,candidate_table):
     logger.info("Matching intersections...")
 
     # Intermediate Data
@@ -189,7 +213,7 @@ def matching_intersections_func(source_intersections,target_intersections,search
 
             count = 0
             for intersection_id in intersections_source_route:
-                with arcpy.da.SearchCursor(near_table,["IN_INTERSECTIONID","NEAR_INTERSECTIONID"],where_clause = "IN_INTERSECTIONID = "+str(intersection_id)) as sCur_near:
+                with arcpy.da.SearchCursor(near_table,["IN_INTERSECTION_ID","NEAR_INTERSECTION_ID"],where_clause = "IN_INTERSECTION_ID = "+str(intersection_id)) as sCur_near:
                     try:
                         sCur_near.reset()
                         sCur_near.next()
@@ -0,0 +1,138 @@
+import arcpy
+import logging
+import numpy as np
+
+from src.tss.spatial_index import SegmentGridIndex
+from src.tss.ags.feature_array_util import load_polyline_array, linear_unit_to_map_unit
+from src.tss.ags.spatial_index_util import get_route_index
+from src.here.match_util import build_link_route_rows, read_route_attributes
+
+logger = logging.getLogger(__name__)
+
+
+def _text(value):
+    return None if value is None else u'{0}'.format(value)
+
+
+def compare_links(link_ids, fingerprints, previous_link_ids, previous_fingerprints):
+    """
+    Compare the links of two releases by link id and geometry fingerprint
+    :return: sets of the new, changed and removed link ids
+    """
+    fingerprint_dict = dict(zip(link_ids, fingerprints))
+    previous_fingerprint_dict = dict(zip(previous_link_ids, previous_fingerprints))
+    new_link_ids = set(fingerprint_dict.keys()) - set(previous_fingerprint_dict.keys())
+    removed_link_ids = set(previous_fingerprint_dict.keys()) - set(fingerprint_dict.keys())
+    changed_link_ids = set(link_id for link_id, fingerprint in fingerprint_dict.items()
+                           if link_id in previous_fingerprint_dict and previous_fingerprint_dict[link_id] != fingerprint)
+    return new_link_ids, changed_link_ids, removed_link_ids
+
+
+def find_links_near(links, geometries, radius):
+    """
+    :param links: PolylineArray of the links
+    :param geometries: PolylineArray of the geometries
+    :param radius: in map units
+    :return: set of the ids of the links within the radius of any of the geometries
+    """
+    if len(links) == 0 or len(geometries) == 0 or len(geometries.segment_start_index()) == 0:
+        return set()
+    index = SegmentGridIndex.build(geometries)
+    start_xy, end_xy, feature_index, start_index = links.segments()
+    query_index, segment_index = index.query_segments(start_xy, end_xy, radius)
+    return set(links.ids[i] for i in np.unique(feature_index[query_index]).tolist())
+
+
+def read_candidate_rows(candidate_table, fields):
+    """
+    Read the rows of a candidate table, ordered by link id
+    """
+    with arcpy.da.SearchCursor(candidate_table, fields, sql_clause=(None, 'ORDER BY {0}'.format(fields[1]))) as sCur:
+        rows = [row for row in sCur]
+    del sCur
+    return rows
+
+
+def match_link_route_incremental(**kwargs):
+    """
+    Re-match only the links that are new, changed (geometry, street name or county) or within the search radius of a
+    new, changed or removed link since the previous release. The DOT network is expected to be the one of the
+    previous run.
+    :param kwargs: same as match_link_route_in_memory, plus 'previous_here_link', 'previous_candidate_table' and
+                   'candidate_table_fields' (dot rid, here lid, ..., here street name, here county id, ...)
+    :return: link/route rows of the re-matched links (see build_link_route_rows), the set of the re-matched link ids,
+             the previous candidate rows of the links kept as they are and the reviewer decisions
+             {(here lid, dot rid): (verified match, rejected match)} of the re-matched links
+    """
+    here_link = kwargs.get('here_link', None)
+    here_link_id_field = kwargs.get('here_link_id_field', None)
+    here_st_name_field = kwargs.get('here_st_name_field', None)
+    here_county_id_field = kwargs.get('here_county_id_field', None)
+    dot_network = kwargs.get('dot_network', None)
+    dot_network_rid_field = kwargs.get('dot_network_rid_field', None)
+    dot_network_route_name_field = kwargs.get('dot_network_route_name_field', None)
+    dot_network_county_id_field = kwargs.get('dot_network_county_id_field', None)
+    dot_network_where_clause = kwargs.get('dot_network_where_clause', None)
+    search_radius = kwargs.get('search_radius', None)
+    route_index_folder = kwargs.get('route_index_folder', None)
+    lrs_version = kwargs.get('lrs_version', None)
+    previous_here_link = kwargs.get('previous_here_link', None)
+    previous_candidate_table = kwargs.get('previous_candidate_table', None)
+    candidate_table_fields = kwargs.get('candidate_table_fields', None)
+
+    spatial_reference = arcpy.Describe(here_link).spatialReference
+    radius = linear_unit_to_map_unit(search_radius, here_link)
+
+    links, link_attributes = load_polyline_array(here_link, here_link_id_field,
+                                                 [here_st_name_field, here_county_id_field])
+    # The previous release is projected on the fly only if it is in another coordinate system, the projection moves
+    # the vertices slightly. The fingerprints round the vertices to the XY tolerance so that such moves do not mark
+    # the links as changed.
+    previous_spatial_reference = arcpy.Describe(previous_here_link).spatialReference
+    same_spatial_reference = (previous_spatial_reference.factoryCode, previous_spatial_reference.name) == \
+        (spatial_reference.factoryCode, spatial_reference.name)
+    previous_links, _ = load_polyline_array(previous_here_link, here_link_id_field,
+                                            spatial_reference=None if same_spatial_reference else spatial_reference)
+    previous_rows = read_candidate_rows(previous_candidate_table, candidate_table_fields)
+
+    xy_tolerance = spatial_reference.XYTolerance
+    new_link_ids, changed_link_ids, removed_link_ids = compare_links(
+        links.ids, links.fingerprints(tolerance=xy_tolerance),
+        previous_links.ids, previous_links.fingerprints(tolerance=xy_tolerance))
+
+    # Street name or county changes are re-matched as well since they are part of the candidate rows
+    previous_attributes_dict = dict((row[1], (_text(row[4]), _text(row[5]))) for row in previous_rows)
+    for link_id, attributes in zip(links.ids, link_attributes):
+        if link_id in previous_attributes_dict and \
+                previous_attributes_dict[link_id] != tuple(_text(attribute) for attribute in attributes):
+            changed_link_ids.add(link_id)
+    # Links of the previous release without candidate rows are matched again
+    new_link_ids |= set(links.ids) - set(previous_attributes_dict.keys())
+
+    link_index_dict = dict((link_id, i) for i, link_id in enumerate(links.ids))
+    previous_link_index_dict = dict((link_id, i) for i, link_id in enumerate(previous_links.ids))
+    modified_geometries = links.subset(sorted(link_index_dict[link_id] for link_id in new_link_ids | changed_link_ids))
+    previous_geometries = previous_links.subset(sorted(previous_link_index_dict[link_id]
+                                                       for link_id in changed_link_ids | removed_link_ids))
+    affected_link_ids = find_links_near(links, modified_geometries, radius) | \
+        find_links_near(links, previous_geometries, radius)
+
+    rematch_link_ids = new_link_ids | changed_link_ids | affected_link_ids
+    logger.info("{0} new, {1} changed, {2} removed and {3} affected links, {4} of {5} links to be re-matched".format(
+        len(new_link_ids), len(changed_link_ids), len(removed_link_ids),
+        len(affected_link_ids - new_link_ids - changed_link_ids), len(rematch_link_ids), len(links)))
+
+    kept_rows = [row for row in previous_rows if row[1] not in rematch_link_ids and row[1] not in removed_link_ids]
+    reviewer_decisions = dict(((row[1], row[0]), (row[7], row[8])) for row in previous_rows
+                              if row[1] in rematch_link_ids and (row[7] or row[8]))
+    if not rematch_link_ids:
+        return [], rematch_link_ids, kept_rows, reviewer_decisions
+
+    rematch_indexes = sorted(link_index_dict[link_id] for link_id in rematch_link_ids)
+    route_index = get_route_index(dot_network, dot_network_rid_field, dot_network_where_clause, route_index_folder,
+                                  lrs_version, spatial_reference)
+    route_attributes = read_route_attributes(dot_network, dot_network_route_name_field, dot_network_county_id_field,
+                                             dot_network_where_clause, route_index.oids)
+    matched_rows = build_link_route_rows(links.subset(rematch_indexes), [link_attributes[i] for i in rematch_indexes],
+                                         route_index, route_attributes, radius)
+    return matched_rows, rematch_link_ids, kept_rows, reviewer_decisions
@@ -0,0 +1,276 @@
+import arcpy
+import numpy as np
+import logging
+
+from src.tss.polyline_util import segment_corridor_interval
+from src.tss.ags.geometry_util import line_angles
+from src.tss.ags.feature_array_util import load_polyline_array, linear_unit_to_map_unit
+from src.tss.ags.spatial_index_util import get_route_index
+
+logger = logging.getLogger(__name__)
+
+# A minimum six decimal places need to be used otherwise the angle return could be far from accurate
+round_decimal_places = 6
+
+
+def _group_extreme(keys, values, take_last):
+    """
+    Return the row index with the minimum (or maximum) value of every key group, along with the unique keys
+    """
+    order = np.lexsort((values, keys))
+    sorted_keys = keys[order]
+    boundaries = np.nonzero(np.diff(sorted_keys))[0] + 1
+    if take_last:
+        picked = np.append(boundaries - 1, len(order) - 1)
+    else:
+        picked = np.insert(boundaries, 0, 0)
+    return sorted_keys[picked], order[picked]
+
+
+def match_link_route(links, route_index, radius):
+    """
+    Find the link/route pairs within the search radius and clip each route to the corridor of the link it matches.
+    Same as buffering the link, splitting the route at the buffer boundary and dissolving the pieces within the buffer
+    on link id and route id, but done on coordinate arrays. The features of a route split into several features (same
+    route id) are dissolved into one pair as well.
+    :param links: PolylineArray of the links
+    :param route_index: SegmentGridIndex of the routes, in the same spatial reference as the links
+    :param radius: search radius in map units
+    :return: link index, route index (the route feature where the clipped route starts), and the first/last points of
+             the clipped route of every pair
+    """
+    routes = route_index.polylines
+    route_group_dict = {}
+    route_group = np.array([route_group_dict.setdefault(route_id, len(route_group_dict)) for route_id in routes.ids],
+                           dtype=np.int64)
+    group_count = max(len(route_group_dict), 1)
+    l0, l1, l_feature, l_start = links.segments()
+    r0, r1, r_feature, r_start = route_index.segment_start, route_index.segment_end, \
+        route_index.segment_feature, route_index.segment_vertex
+
+    pair_l, pair_r = route_index.query_segments(l0, l1, radius)
+
+    t_start, t_end = segment_corridor_interval(r0[pair_r], r1[pair_r], l0[pair_l], l1[pair_l], radius)
+    clipped = t_start <= t_end
+    pair_l, pair_r, t_start, t_end = pair_l[clipped], pair_r[clipped], t_start[clipped], t_end[clipped]
+
+    if len(pair_l) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros((0, 2)), np.zeros((0, 2))
+
+    # Position along the route in vertex order, used to pick the first and the last point of the clipped route
+    pair_keys = l_feature[pair_l] * group_count + route_group[r_feature[pair_r]]
+    keys, first_rows = _group_extreme(pair_keys, r_start[pair_r] + t_start, False)
+    keys, last_rows = _group_extreme(pair_keys, r_start[pair_r] + t_end, True)
+
+    first_points = r0[pair_r[first_rows]] + (r1 - r0)[pair_r[first_rows]] * t_start[first_rows, np.newaxis]
+    last_points = r0[pair_r[last_rows]] + (r1 - r0)[pair_r[last_rows]] * t_end[last_rows, np.newaxis]
+
+    return keys // group_count, r_feature[pair_r[first_rows]], first_points, last_points
+
+
+def calculate_link_route_angle(link_first_points, link_last_points, route_first_points, route_last_points):
+    """
+    Angle between the end-to-end direction of links and of the clipped routes. The angle between non-directional
+    lines (0 to 90 degree) is returned. None is returned if any of the vectors is a zero vector.
+    :return: list of angles
+    """
+    angles = line_angles(link_first_points - link_last_points, route_first_points - route_last_points,
+                         round_decimal_places)
+    return [None if np.isnan(angle) else angle for angle in angles.tolist()]
+
+
+def build_link_route_rows(links, link_attributes, route_index, route_attributes, radius):
+    """
+    Build the spatial join rows between links and routes, one row per link and route id (or one row with empty route
+    for links without any match), ordered by link id. The route name and county of a route split into several
+    features are those of the feature where the clipped route starts.
+    :param links: PolylineArray of the links, ids are the link ids
+    :param link_attributes: (street name, county id) of every link
+    :param route_index: SegmentGridIndex of the routes, ids are the route ids
+    :param route_attributes: (route name, county id) of every route
+    :param radius: search radius in map units
+    :return: list of (dot_rid, here_lid, dot_rt_name, dot_cnty_id, here_st_name, here_cnty_id, angle, frequency)
+    """
+    routes = route_index.polylines
+    link_index, route_feature_index, route_first_points, route_last_points = match_link_route(links, route_index,
+                                                                                              radius)
+
+    angles = calculate_link_route_angle(links.first_points()[link_index], links.last_points()[link_index],
+                                        route_first_points, route_last_points)
+
+    # One pair per link and route id, the frequency of a link is its number of routes
+    link_routes_dict = {}
+    for l, r, angle in zip(link_index.tolist(), route_feature_index.tolist(), angles):
+        link_routes_dict.setdefault(l, []).append((r, angle))
+
+    rows = []
+    for l in sorted(range(len(links)), key=lambda i: links.ids[i]):
+        here_lid = links.ids[l]
+        here_st_name, here_cnty_id = link_attributes[l]
+        if l not in link_routes_dict:
+            rows.append((None, here_lid, None, None, here_st_name, here_cnty_id, None, None))
+            continue
+        for r, angle in link_routes_dict[l]:
+            dot_rt_name, dot_cnty_id = route_attributes[r]
+            rows.append((routes.ids[r], here_lid, dot_rt_name, dot_cnty_id, here_st_name, here_cnty_id, angle,
+                         len(link_routes_dict[l])))
+    return rows
+
+
+def read_route_attributes(dot_network, route_name_field, county_id_field, where_clause, oids):
+    """
+    Read the (route name, county id) of the routes without geometry, aligned with the object ids of a route index
+    :return: list of attribute tuples
+    """
+    oid_attributes_dict = {}
+    with arcpy.da.SearchCursor(dot_network, ['OID@', route_name_field, county_id_field], where_clause) as sCur:
+        for row in sCur:
+            oid_attributes_dict[row[0]] = (row[1], row[2])
+    del sCur
+    return [oid_attributes_dict.get(oid, (None, None)) for oid in oids]
+
+
+def match_link_route_in_memory(**kwargs):
+    """
+    Load HERE links and DOT routes once and build the link/route spatial join rows in memory
+    :param kwargs:
+    :return: see build_link_route_rows
+    """
+    here_link = kwargs.get('here_link', None)
+    here_link_id_field = kwargs.get('here_link_id_field', None)
+    here_st_name_field = kwargs.get('here_st_name_field', None)
+    here_county_id_field = kwargs.get('here_county_id_field', None)
+    dot_network = kwargs.get('dot_network', None)
+    dot_network_rid_field = kwargs.get('dot_network_rid_field', None)
+    dot_network_route_name_field = kwargs.get('dot_network_route_name_field', None)
+    dot_network_county_id_field = kwargs.get('dot_network_county_id_field', None)
+    dot_network_where_clause = kwargs.get('dot_network_where_clause', None)
+    search_radius = kwargs.get('search_radius', None)
+    route_index_folder = kwargs.get('route_index_folder', None)
+    lrs_version = kwargs.get('lrs_version', None)
+
+    spatial_reference = arcpy.Describe(here_link).spatialReference
+
+    links, link_attributes = load_polyline_array(here_link, here_link_id_field,
+                                                 [here_st_name_field, here_county_id_field])
+    route_index = get_route_index(dot_network, dot_network_rid_field, dot_network_where_clause, route_index_folder,
+                                  lrs_version, spatial_reference)
+    logger.info("Loaded {0} links and {1} routes".format(len(links), len(route_index.polylines)))
+
+    route_attributes = read_route_attributes(dot_network, dot_network_route_name_field, dot_network_county_id_field,
+                                             dot_network_where_clause, route_index.oids)
+
+    radius = linear_unit_to_map_unit(search_radius, here_link)
+    return build_link_route_rows(links, link_attributes, route_index, route_attributes, radius)
+
+
+def filter_candidate_rows(matched_rows, angle_tolerance):
+    """
+    Turn the link/route rows into candidate rows: pairs over the angle tolerance (or without angle) are bad matches,
+    links without any route or with only bad matches get a 'No Match' row, the other pairs are 'High' if they are the
+    only match of their link, 'Low' otherwise
+    :param matched_rows: rows (dot rid, here lid, dot route name, dot county id, here street name, here county id,
+                         angle, frequency), e.g. see build_link_route_rows
+    :param angle_tolerance: in degrees
+    :return: list of candidate rows (dot rid, here lid, dot route name, dot county id, here street name,
+             here county id, confidence, verified match, rejected match)
+    """
+    bad_matches_dict = {}
+    candidate_rows = []
+    for row in matched_rows:
+        dot_route_id = row[0]
+        here_link_id = row[1]
+        dot_route_name = row[2]
+        dot_county_id = row[3]
+        here_st_name = row[4]
+        here_county_id = row[5]
+        angle = row[6]
+        frequency = row[7]
+
+        # No match
+        if dot_route_id is None or dot_route_id.strip() == "":
+            candidate_rows.append((None, here_link_id, None, None, here_st_name, here_county_id, 'No Match', None, None))
+            continue
+
+        # Bad matches-----------------------------------------------------------------------------------------------
+        # If the link and route match is found but their angle is None, it means either the link and route seg
+        # has bad geometry and their angle cannot be calculated. It is considered a bad match
+        if angle is None or angle > angle_tolerance:
+            # Bad and the only match
+            if frequency == 1:
+                candidate_rows.append((None, here_link_id, None, None, here_st_name, here_county_id, 'No Match', None, None))
+                continue
+
+            # Bad but not the only match
+            bad_matches_dict.setdefault(here_link_id, []).append(dot_route_id)
+
+            if len(bad_matches_dict[here_link_id]) == frequency:  # None of its matches is good
+                candidate_rows.append((None, here_link_id, None, None, here_st_name, here_county_id, 'No Match', None, None))
+
+            continue
+        # ----------------------------------------------------------------------------------------------------------
+
+        # Potential matches
+        confidence = 'High' if frequency == 1 else 'Low'
+        candidate_rows.append((dot_route_id, here_link_id, dot_route_name, dot_county_id, here_st_name, here_county_id, confidence, None, None))
+    return candidate_rows
+
+
+def score_candidate_rows(rows, fixed_link_ids=None):
+    """
+    Apply the one-to-one match knowledge to the candidate rows in memory. 'Low' rows of links with a single candidate
+    row become 'High', 'Low' rows whose DOT county/route name was matched to the same HERE county/street name by a
+    'High' row become 'Medium'.
+    :param rows: candidate rows (dot rid, here lid, dot route name, dot county id, here street name, here county id,
+                 confidence, verified match, rejected match)
+    :param fixed_link_ids: links whose rows are kept as they are, all the rows are scored if not specified
+    :return: list of the scored rows, in the same order
+    """
+    knowledge_dict = {}
+    link_frequency_dict = {}
+    for row in rows:
+        link_frequency_dict[row[1]] = link_frequency_dict.get(row[1], 0) + 1
+        if row[6] == 'High':
+            dot_knowledge = '{0}-{1}'.format(row[3], row[2])
+            knowledge_dict.setdefault(dot_knowledge, set()).add('{0}-{1}'.format(row[5], row[4]))
+
+    scored_rows = []
+    for row in rows:
+        if row[6] == 'Low' and (fixed_link_ids is None or row[1] not in fixed_link_ids):
+            # If this is the only match candidate for the link, bump the confidence level up to 'High'
+            if link_frequency_dict[row[1]] == 1:
+                row = tuple(row[:6]) + ('High',) + tuple(row[7:])
+            elif '{0}-{1}'.format(row[5], row[4]) in knowledge_dict.get('{0}-{1}'.format(row[3], row[2]), ()):
+                row = tuple(row[:6]) + ('Medium',) + tuple(row[7:])
+        scored_rows.append(row)
+    return scored_rows
+
+
+def compare_candidate_rows(reference_rows, rows):
+    """
+    Compare the candidate rows of two matching engines (e.g. arcpy and in_memory) by link id and route id
+    :param reference_rows: candidate rows (dot rid, here lid, ..., confidence, ...) of the reference engine
+    :param rows: candidate rows of the engine checked
+    :return: dict of the (here lid, dot rid) pairs only in the reference rows ('missing'), only in the rows ('extra'),
+             in both with another confidence ((here lid, dot rid, reference confidence, confidence) in 'confidence'),
+             and the pairs found more than once by either engine ('duplicates')
+    """
+    def confidence_dict(candidate_rows):
+        pairs, duplicates = {}, set()
+        for row in candidate_rows:
+            key = (row[1], row[0])
+            if key in pairs:
+                duplicates.add(key)
+            pairs[key] = row[6]
+        return pairs, duplicates
+
+    reference_pairs, reference_duplicates = confidence_dict(reference_rows)
+    pairs, duplicates = confidence_dict(rows)
+    return {
+        'missing': sorted(set(reference_pairs) - set(pairs)),
+        'extra': sorted(set(pairs) - set(reference_pairs)),
+        'confidence': sorted(key + (reference_pairs[key], pairs[key]) for key in set(reference_pairs) & set(pairs)
+                             if reference_pairs[key] != pairs[key]),
+        'duplicates': sorted(reference_duplicates | duplicates)
+    }
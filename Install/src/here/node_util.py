@@ -1,7 +1,18 @@
 import arcpy
+import os
 import logging
+
+from src.tss.ags import build_numeric_in_sql_expression
+from src.tss.ags.feature_array_util import linear_unit_to_map_unit, load_points
+from src.tss.ags.spatial_index_util import load_route_locator
+from src.tss.ags.table_join_util import FIELD_TYPES, get_transferable_fields
+from src.tss.ags.field_util import get_field_details
+
 logger = logging.getLogger(__name__)
 
+# Number of object ids in the IN clause of every selection
+selection_chunk_size = 1000
+
 # intermediate data ----------------------------------------------------------------------------------------------------
 here_links_endpoints_start = 'here_links_endpoints_start'
 here_links_endpoints_end = 'here_links_endpoints_end'
@@ -11,9 +22,39 @@ here_links_endpoints_missnodes_w_duplicates = 'here_links_endpoints_missnodes_w_
 here_links_endpoints_missnodes = 'here_links_endpoints_missnodes'
 
 locate_nodes_along_network_w_duplicates = 'LOCATE_NODES_ALONG_NETWORK_w_duplicates'
-locate_nodes_along_network_frequency = 'LOCATE_NODES_ALONG_NETWORK_FREQUENCY'
+nodes_near_network_layer = 'nodes_near_network_layer'
 # ----------------------------------------------------------------------------------------------------------------------
 
+def aggregate_located_node(rows, meas_index, distance_index, measure_aggregation='mean'):
+    """
+    Merge the locations of a node on the same route into one row
+    :param rows: located rows of the node on the route
+    :param meas_index: index of the measure in the rows
+    :param distance_index: index of the distance to the route in the rows
+    :param measure_aggregation: 'mean', 'min', 'max', 'median' or 'closest'
+    :return: the last row with the aggregated measure, or the closest row
+    """
+    if measure_aggregation == 'closest':
+        return min(rows, key=lambda row: row[distance_index])
+
+    measures = sorted(row[meas_index] for row in rows)
+    if measure_aggregation == 'mean':
+        meas = sum(measures) / float(len(measures))
+    elif measure_aggregation == 'min':
+        meas = measures[0]
+    elif measure_aggregation == 'max':
+        meas = measures[-1]
+    elif measure_aggregation == 'median':
+        middle = len(measures) // 2
+        meas = measures[middle] if len(measures) % 2 else (measures[middle - 1] + measures[middle]) / 2.0
+    else:
+        raise ValueError("Unknown measure aggregation '{0}'".format(measure_aggregation))
+
+    row = list(rows[-1])
+    row[meas_index] = meas
+    return row
+
+
 class Node:
     def __init__(self, **kwargs):
         self.link = kwargs.get('link', None)
@@ -31,6 +72,18 @@ class Node:
 
         self.search_radius = kwargs.get('search_radius', None)
 
+        # How to get the measure of a node located on the same route more than once: 'mean', 'min', 'max', 'median',
+        # or 'closest' (the location closest to the node)
+        self.measure_aggregation = kwargs.get('measure_aggregation', 'mean')
+
+        # Optional SegmentGridIndex of the network (in the spatial reference of the network)
+        self.route_index = kwargs.get('route_index', None)
+
+        # 'arcpy' runs LocateFeaturesAlongRoutes, 'in_memory' projects the nodes on the routes loaded in memory
+        self.locate_engine = kwargs.get('locate_engine', 'arcpy')
+        # Optional RouteLocator of the network (in the spatial reference of the network)
+        self.route_locator = kwargs.get('route_locator', None)
+
     def identify_node(self):
         # NOTE: node = all reference nodes + partial non-reference nodes(missing node)
         logger.info("Identifying HERE Link Nodes...")
@@ -84,54 +137,111 @@ class Node:
         # locate node along target route.
         logger.info("Locating nodes along target routes...")
 
-        # locate nodes to DOT LRS
-        arcpy.LocateFeaturesAlongRoutes_lr(self.node,self.network, self.network_route_id_field, self.search_radius,
-                                       locate_nodes_along_network_w_duplicates, 'RID POINT MEAS', 'ALL', 'DISTANCE', 'NO_ZERO', 'FIELDS')
+        if self.locate_engine == 'in_memory':
+            fields, located_rows = self.locate_nodes_in_memory()
+        else:
+            node_layer = self.node
+            if self.route_index is not None:
+                node_layer = self.select_nodes_near_network()
+
+            # locate nodes to DOT LRS
+            arcpy.LocateFeaturesAlongRoutes_lr(node_layer,self.network, self.network_route_id_field, self.search_radius,
+                                           locate_nodes_along_network_w_duplicates, 'RID POINT MEAS', 'ALL', 'DISTANCE', 'NO_ZERO', 'FIELDS')
+            arcpy.CreateTable_management(os.path.dirname(self.candidate_table) or arcpy.env.workspace,
+                                         os.path.basename(self.candidate_table), locate_nodes_along_network_w_duplicates)
+
+            fields = [field.name for field in arcpy.ListFields(locate_nodes_along_network_w_duplicates)
+                      if field.type not in ('OID', 'Geometry')]
+            with arcpy.da.SearchCursor(locate_nodes_along_network_w_duplicates, fields) as sCur:
+                located_rows = [row for row in sCur]
 
         # deal with cases that one node is located on the same route more than once
-        # TODO: we simply assign the mean measure values to nodes in these cases. Validate this.
-        arcpy.Frequency_analysis(locate_nodes_along_network_w_duplicates, locate_nodes_along_network_frequency,['RID',self.node_id_field])
-
-        arcpy.Copy_management(locate_nodes_along_network_w_duplicates,self.candidate_table)
-
-        with arcpy.da.SearchCursor(locate_nodes_along_network_frequency, ['FREQUENCY','RID',self.node_id_field], where_clause='FREQUENCY >1') as sCur:
-            # test whether cursor is empty
-            try:
-                sCur.next()
-                flg = True
-            except:
-                flg = False
-
-            if flg:
-                sCur.reset()
-                for row in sCur:
-                    frequency = row[0]
-                    rid = row[1]
-                    node_id = row[2]
-
-                    where_clause = "RID = '{0}' AND {2} = {1}".format(rid, node_id, self.node_id_field)
-
-                    with arcpy.da.UpdateCursor(self.candidate_table, ['RID','MEAS',self.node_id_field], where_clause=where_clause) as uCur:
-                        meas_sum = 0.0
-                        meas_average = 0.0
-                        for record in uCur:
-                            meas = record[1]
-                            meas_sum += meas
-                        meas_average = meas_sum / frequency
-
-                        uCur.reset()
-                        for record in uCur:
-                            record[1] = meas_average
-                            uCur.updateRow(record)
-
-                        uCur.reset()
-                        for i in range(1,frequency):
-                            uCur.next()
-                            uCur.deleteRow()
+        # TODO: by default we simply assign the mean measure values to nodes in these cases. Validate this.
+        upper_fields = [field.upper() for field in fields]
+        rid_index = upper_fields.index('RID')
+        meas_index = upper_fields.index('MEAS')
+        node_id_index = upper_fields.index(self.node_id_field.upper())
+        distance_index = upper_fields.index('DISTANCE')
+
+        # group the located nodes on route and node
+        group_rows_dict = {}
+        group_keys = []
+        for row in located_rows:
+            key = (row[rid_index], row[node_id_index])
+            if key not in group_rows_dict:
+                group_rows_dict[key] = []
+                group_keys.append(key)
+            group_rows_dict[key].append(row)
+
+        duplicate_count = 0
+        with arcpy.da.InsertCursor(self.candidate_table, fields) as iCur:
+            for key in group_keys:
+                rows = group_rows_dict[key]
+                if len(rows) == 1:
+                    iCur.insertRow(rows[0])
+                    continue
+                duplicate_count += 1
+                iCur.insertRow(aggregate_located_node(rows, meas_index, distance_index, self.measure_aggregation))
+        logger.info("Aggregated the measures of {0} nodes located more than once on a route".format(duplicate_count))
 
         # delete intermediate outputs
         # arcpy.Delete_management(locate_nodes_along_network_w_duplicates)
-        # arcpy.Delete_management(locate_nodes_along_network_frequency)
 
         return self.candidate_table
 
+    def locate_nodes_in_memory(self):
+        """
+        Locate the nodes on every route within the search radius with a RouteLocator, in place of
+        LocateFeaturesAlongRoutes ('ALL' locations, with the distance and the node fields). The candidate table is
+        created with the schema of the locate table.
+        :return: fields of the candidate table and the located rows (route id, measure, distance and node fields)
+        """
+        spatial_reference = arcpy.Describe(self.network).spatialReference
+        if self.route_locator is None:
+            self.route_locator = load_route_locator(self.network, self.network_route_id_field,
+                                                    spatial_reference=spatial_reference)
+        node_fields = get_transferable_fields(self.node)
+        points, attributes = load_points(self.node, [field.name for field in node_fields],
+                                         spatial_reference=spatial_reference)
+        node_index, route_index, measures, distances = self.route_locator.locate_points(
+            points, linear_unit_to_map_unit(self.search_radius, self.network))
+        route_ids = self.route_locator.route_ids
+        located_rows = [(route_ids[r], measure, distance) + attributes[i] for i, r, measure, distance
+                        in zip(node_index.tolist(), route_index.tolist(), measures.tolist(), distances.tolist())]
+        logger.info("{0} locations of {1} nodes found along the network".format(len(located_rows), len(points)))
+
+        arcpy.CreateTable_management(os.path.dirname(self.candidate_table) or arcpy.env.workspace,
+                                     os.path.basename(self.candidate_table))
+        rid_field_details = get_field_details(self.network, self.network_route_id_field)
+        arcpy.AddField_management(self.candidate_table, 'RID', rid_field_details['field_type'],
+                                  field_length=rid_field_details['field_length'])
+        arcpy.AddField_management(self.candidate_table, 'MEAS', 'DOUBLE')
+        arcpy.AddField_management(self.candidate_table, 'Distance', 'DOUBLE')
+        for field in node_fields:
+            arcpy.AddField_management(self.candidate_table, field.name, FIELD_TYPES[field.type], field.precision,
+                                      field.scale, field.length if field.type == 'String' else None, field.aliasName)
+        return ['RID', 'MEAS', 'Distance'] + [field.name for field in node_fields], located_rows
+
+    def select_nodes_near_network(self):
+        # only nodes within the search radius of any route can be located, query them from the route index
+        spatial_reference = arcpy.Describe(self.network).spatialReference
+        oids = []
+        points = []
+        with arcpy.da.SearchCursor(self.node, ['OID@', 'SHAPE@XY'], spatial_reference=spatial_reference) as sCur:
+            for row in sCur:
+                oids.append(row[0])
+                points.append(row[1])
+
+        radius = linear_unit_to_map_unit(self.search_radius, self.network)
+        node_index, route_index = self.route_index.query_point_features(points, radius)
+        near_oids = [oids[i] for i in sorted(set(node_index.tolist()))]
+        logger.info("{0} of {1} nodes are within the search radius of the network".format(len(near_oids), len(oids)))
+
+        # select the nodes by chunks of object ids, a single IN clause over a statewide node set is too long
+        oid_field = arcpy.Describe(self.node).OIDFieldName
+        arcpy.MakeFeatureLayer_management(self.node, nodes_near_network_layer, None if near_oids else "1=2")
+        for chunk_start in range(0, len(near_oids), selection_chunk_size):
+            arcpy.SelectLayerByAttribute_management(
+                nodes_near_network_layer, 'ADD_TO_SELECTION',
+                build_numeric_in_sql_expression(oid_field, near_oids[chunk_start:chunk_start + selection_chunk_size]))
+        return nodes_near_network_layer
@@ -0,0 +1,147 @@
+import arcpy
+import os
+import sys
+import logging
+import multiprocessing
+import numpy as np
+
+from src.util.helper import get_scratch_gdb
+from src.tss.spatial_index import SegmentGridIndex
+from src.tss.ags.feature_array_util import load_polyline_array, linear_unit_to_map_unit
+from src.tss.ags.spatial_index_util import get_route_index
+from src.here.match_util import build_link_route_rows, read_route_attributes
+
+logger = logging.getLogger(__name__)
+
+
+def build_partition_where_clause(field_name, value):
+    """
+    Build the where clause selecting one partition value
+    :param field_name:
+    :param value:
+    :return:
+    """
+    if value is None:
+        return "{0} IS NULL".format(field_name)
+    if isinstance(value, basestring):
+        return "{0} = '{1}'".format(field_name, value.replace("'", "''"))
+    return "{0} = {1}".format(field_name, value)
+
+
+def get_partition_values(dataset, field_name):
+    """
+    :return: the sorted distinct values of the partition field
+    """
+    values = set()
+    with arcpy.da.SearchCursor(dataset, [field_name]) as sCur:
+        for row in sCur:
+            values.add(row[0])
+    del sCur
+    return sorted(values)
+
+
+def select_halo_routes(route_index, links, radius):
+    """
+    Build the route index of a partition: the routes within the search radius of the extent of the partition links,
+    so that links on the county border still find the routes of the neighboring counties
+    :param route_index: SegmentGridIndex of the whole network
+    :param links: PolylineArray of the partition links
+    :param radius: search radius in map units
+    :return: SegmentGridIndex of the halo routes, with the object ids of the routes
+    """
+    box_min = links.xy.min(axis=0) - radius
+    box_max = links.xy.max(axis=0) + radius
+    query_index, segment_index = route_index.query_boxes(box_min[np.newaxis], box_max[np.newaxis])
+    feature_indexes = np.unique(route_index.segment_feature[segment_index]).tolist()
+    return SegmentGridIndex.build(route_index.polylines.subset(feature_indexes), route_index.cell_size,
+                                  [route_index.oids[i] for i in feature_indexes])
+
+
+def match_partition(task):
+    """
+    Worker of the partitioned matching, matches the links of one county in its own scratch workspace
+    :param task: dict of the matching parameters, with 'partition_value' and 'partition_folder'
+    :return: (partition value, link/route rows)
+    """
+    partition_value = task['partition_value']
+    partition_folder = task['partition_folder']
+    if not os.path.isdir(partition_folder):
+        os.makedirs(partition_folder)
+    arcpy.env.workspace = get_scratch_gdb(partition_folder)
+    arcpy.env.overwriteOutput = True
+
+    here_link = task['here_link']
+    spatial_reference = arcpy.Describe(here_link).spatialReference
+    links, link_attributes = load_polyline_array(here_link, task['here_link_id_field'],
+                                                 [task['here_st_name_field'], task['here_county_id_field']],
+                                                 build_partition_where_clause(task['here_county_id_field'],
+                                                                              partition_value))
+    if len(links) == 0:
+        return partition_value, []
+
+    radius = linear_unit_to_map_unit(task['search_radius'], here_link)
+    route_index = get_route_index(task['dot_network'], task['dot_network_rid_field'], task['dot_network_where_clause'],
+                                  task['route_index_folder'], task['lrs_version'], spatial_reference)
+    halo_index = select_halo_routes(route_index, links, radius)
+    route_attributes = read_route_attributes(task['dot_network'], task['dot_network_route_name_field'],
+                                             task['dot_network_county_id_field'], task['dot_network_where_clause'],
+                                             halo_index.oids)
+    return partition_value, build_link_route_rows(links, link_attributes, halo_index, route_attributes, radius)
+
+
+def merge_partition_rows(partition_rows):
+    """
+    Merge the rows of the partitions. Partitions are disjoint by link county, every link and its rows come from one
+    partition only, so the rows are concatenated in partition order as they are, one row per route feature like the
+    other matching engines.
+    :param partition_rows: list of (partition value, rows), rows as returned by build_link_route_rows
+    :return: merged rows
+    """
+    merged_rows = []
+    for partition_value, rows in sorted(partition_rows, key=lambda item: item[0]):
+        merged_rows.extend(rows)
+    return merged_rows
+
+
+def match_link_route_partitioned(**kwargs):
+    """
+    Match the links and routes county by county in a pool of worker processes, then merge the rows of every county
+    :param kwargs: same as match_link_route_in_memory, plus 'partition_folder' (scratch folder of the workers) and
+                   'processes' (number of worker processes, defaults to the number of cores)
+    :return: see build_link_route_rows
+    """
+    partition_folder = kwargs.get('partition_folder', None)
+    processes = kwargs.get('processes', None) or multiprocessing.cpu_count()
+    route_index_folder = kwargs.get('route_index_folder', None) or os.path.join(partition_folder, 'route_index')
+
+    task_keys = ['here_link', 'here_link_id_field', 'here_st_name_field', 'here_county_id_field', 'dot_network',
+                 'dot_network_rid_field', 'dot_network_route_name_field', 'dot_network_county_id_field',
+                 'dot_network_where_clause', 'search_radius', 'lrs_version']
+    base_task = dict((key, kwargs.get(key, None)) for key in task_keys)
+    base_task['route_index_folder'] = route_index_folder
+
+    # Build (or refresh) the cached route index once, the workers load it from the cache
+    get_route_index(base_task['dot_network'], base_task['dot_network_rid_field'],
+                    base_task['dot_network_where_clause'], route_index_folder, base_task['lrs_version'],
+                    arcpy.Describe(base_task['here_link']).spatialReference)
+
+    tasks = []
+    for i, partition_value in enumerate(get_partition_values(base_task['here_link'], base_task['here_county_id_field'])):
+        task = dict(base_task)
+        task['partition_value'] = partition_value
+        task['partition_folder'] = os.path.join(partition_folder, 'partition_{0}'.format(i))
+        tasks.append(task)
+    logger.info("Matching {0} county partitions with {1} processes...".format(len(tasks), processes))
+
+    # Script tools run inside ArcMap/ArcCatalog, workers need to be started with the python interpreter
+    if not os.path.basename(sys.executable).lower().startswith('python'):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'pythonw.exe'))
+
+    pool = multiprocessing.Pool(min(processes, max(len(tasks), 1)))
+    try:
+        partition_rows = pool.map(match_partition, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    return merge_partition_rows(partition_rows)
@@ -0,0 +1,116 @@
+import re
+
+
+class RouteIdRule(object):
+    """
+    Route id parsing rule compiled once from the Default section of params.ini. HERE and DOT route ids are normalized
+    to a canonical 'TYPE-NUMBER' key (route direction ignored), so that matching route ids becomes a key equality join.
+    Keys are memoized as the same route ids show up in many candidate rows.
+    """
+
+    def __init__(self, here_route_id_delimiter, here_route_type_pos, here_route_number_pos,
+                 target_route_type_start_pos, target_route_type_end_pos,
+                 target_route_number_start_pos, target_route_number_end_pos, route_type_naming_convention):
+        delimiters = here_route_id_delimiter.replace("space", " ").split(";")
+        self.here_route_id_pattern = re.compile("|".join(re.escape(delimiter) for delimiter in delimiters))
+        self.here_route_type_index = int(here_route_type_pos) - 1
+        self.here_route_number_index = int(here_route_number_pos) - 1
+        self.target_route_type_slice = slice(int(target_route_type_start_pos) - 1, int(target_route_type_end_pos))
+        self.target_route_number_slice = slice(int(target_route_number_start_pos) - 1, int(target_route_number_end_pos))
+        self.route_type_naming_convention_dict = self.compile_naming_convention(route_type_naming_convention)
+
+        self.source_key_dict = {}
+        self.target_key_dict = {}
+
+    @classmethod
+    def from_config(cls, config, section='Default'):
+        """
+        Build the rule from the route id options of a params.ini section
+        :param config: ConfigParser
+        :param section:
+        :return:
+        """
+        return cls(config.get(section, 'here_route_id_delimiter'),
+                   config.get(section, 'here_route_type_pos'),
+                   config.get(section, 'here_route_number_pos'),
+                   config.get(section, 'target_route_type_start_pos'),
+                   config.get(section, 'target_route_type_end_pos'),
+                   config.get(section, 'target_route_number_start_pos'),
+                   config.get(section, 'target_route_number_end_pos'),
+                   config.get(section, 'route_type_naming_convention'))
+
+    @staticmethod
+    def compile_naming_convention(route_type_naming_convention):
+        """
+        Convert the naming convention ('HERE DOT' pairs separated by ';') into a HERE type -> DOT type dict. The
+        pairs are applied in order, same as a chain of replacements.
+        :param route_type_naming_convention:
+        :return:
+        """
+        criteria = [item.split(" ") for item in route_type_naming_convention.split(";")]
+        naming_convention_dict = {}
+        for here_type in set(criterion[0] for criterion in criteria):
+            route_type = here_type
+            for criterion in criteria:
+                if route_type == criterion[0]:
+                    route_type = criterion[1]
+            naming_convention_dict[here_type] = route_type
+        return naming_convention_dict
+
+    def source_key(self, source_rid):
+        """
+        Canonical key of a HERE route id. Route ids with an unknown route type are kept as they are.
+        :param source_rid:
+        :return:
+        """
+        if source_rid in self.source_key_dict:
+            return self.source_key_dict[source_rid]
+
+        key = source_rid
+        if source_rid is not None:
+            source_rid_list = self.here_route_id_pattern.split(source_rid)
+            try:
+                route_type = source_rid_list[self.here_route_type_index]
+                if route_type in self.route_type_naming_convention_dict:
+                    key = self.route_type_naming_convention_dict[route_type] + "-" + \
+                        source_rid_list[self.here_route_number_index]
+            except IndexError:
+                pass
+        self.source_key_dict[source_rid] = key
+        return key
+
+    def target_key(self, target_rid):
+        """
+        Canonical key of a DOT route id, None if the route number cannot be parsed
+        :param target_rid:
+        :return:
+        """
+        if target_rid in self.target_key_dict:
+            return self.target_key_dict[target_rid]
+
+        key = None
+        if target_rid is not None:
+            try:
+                key = target_rid[self.target_route_type_slice] + "-" + \
+                    str(int(target_rid[self.target_route_number_slice]))
+            except ValueError:
+                pass
+        self.target_key_dict[target_rid] = key
+        return key
+
+    def is_matching(self, source_rid, target_rid):
+        target_key = self.target_key(target_rid)
+        return target_key is not None and self.source_key(source_rid) == target_key
+
+    def match_columns(self, source_rids, target_rids):
+        """
+        Match whole candidate columns: both columns are mapped to their canonical keys, then the keys are compared
+        row by row
+        :param source_rids: HERE route id column
+        :param target_rids: DOT route id column
+        :return: list of booleans
+        """
+        source_keys = map(self.source_key, source_rids)
+        target_keys = map(self.target_key, target_rids)
+        return [target_key is not None and source_key == target_key
+                for source_key, target_key in zip(source_keys, target_keys)]
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import src.tss.calibration_util as calibration_util
+
+
+class RouteMetrics(object):
+
+    def __init__(self, route_ids, lengths, mmins, mmaxs):
+        self.route_ids, self.lengths, self.mmins, self.mmaxs = route_ids, lengths, mmins, mmaxs
+
+
+class CalibrationUtilTestCase(unittest.TestCase):
+
+    def test_round_half_away_from_zero(self):
+        self.assertEqual(calibration_util.round_half_away_from_zero(np.array([0.0025, -0.0025, 1.2344]), 3).tolist(),
+                         [0.003, -0.003, 1.234])
+        self.assertEqual(calibration_util.round_half_away_from_zero(np.array([0.0045, -0.0045, 1.0005]), 3).tolist(),
+                         [0.004, -0.004, 1.0])
+
+    def test_round_half_away_from_zero_matches_round(self):
+        values = np.concatenate([np.arange(-200000, 200000) / 10000.0 + 0.00005, np.arange(-20000, 20000) / 2000.0])
+        self.assertEqual(calibration_util.round_half_away_from_zero(values, 3).tolist(),
+                         [round(value, 3) for value in values])
+
+    def test_route_index_lookup(self):
+        self.assertEqual(calibration_util.route_index_lookup(['b', 'a', 'c'], ['a', 'c', 'x', 'a']).tolist(),
+                         [1, 2, -1, 1])
+
+    def test_calibrate_measures(self):
+        source = RouteMetrics(['r1', 'r2', 'r3'], [10, 10, 10], [0, 5, 0], [10, 5, 10])
+        target = RouteMetrics(['r1', 'r2'], [20, 20], [100, 0], [120, 20])
+        adjusted, source_valid, target_valid = calibration_util.calibrate_measures(
+            ['r1', 'r2', 'r3', 'r4'], [[0, 5], [1, 2], [1, 2], [1, 2]], source, target)
+        self.assertEqual(adjusted[0].tolist(), [100, 110])
+        self.assertTrue(np.isnan(adjusted[1:]).all())
+        self.assertEqual(source_valid.tolist(), [True, False, True, False])
+        self.assertEqual(target_valid.tolist(), [True, True, False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
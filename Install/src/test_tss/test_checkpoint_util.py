@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+import src.tss.checkpoint_util as checkpoint_util
+
+
+class CheckpointUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.datasets = set(['sj', 'buffer'])
+        self.parameters = {'here_link': 'links', 'here_link_stamp': 1}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def new_store(self, parameters=None):
+        return checkpoint_util.CheckpointStore(self.folder, 'test_tool', parameters or self.parameters,
+                                               self.datasets.__contains__)
+
+    def test_resume(self):
+        checkpoints = self.new_store()
+        self.assertTrue(checkpoints.should_run('spatial_join'))
+        checkpoints.complete('spatial_join', ['sj'])
+        self.assertTrue(checkpoints.should_run('match_links'))
+        checkpoints.complete('match_links', rows=[(1, 'a'), (2, 'b')])
+
+        checkpoints = self.new_store()
+        self.assertFalse(checkpoints.should_run('spatial_join'))
+        self.assertFalse(checkpoints.should_run('match_links'))
+        self.assertEqual(checkpoints.load_rows('match_links'), [(1, 'a'), (2, 'b')])
+        self.assertTrue(checkpoints.should_run('write'))
+        self.assertEqual(checkpoints.resumed_stages, ['spatial_join', 'match_links'])
+
+        checkpoints.clear()
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_invalid_checkpoints(self):
+        checkpoints = self.new_store()
+        checkpoints.complete('spatial_join', ['sj'])
+        checkpoints.complete('filter', ['buffer'])
+
+        # other input fingerprints
+        self.assertTrue(self.new_store({'here_link': 'links', 'here_link_stamp': 2}).should_run('spatial_join'))
+
+        # missing output, the stages after it run again
+        checkpoints = self.new_store()
+        self.datasets.remove('sj')
+        self.assertTrue(checkpoints.should_run('spatial_join'))
+        self.assertTrue(checkpoints.should_run('filter'))
+        self.assertEqual(checkpoints.stages, [])
+
+    def test_disabled(self):
+        checkpoints = checkpoint_util.CheckpointStore(None, 'test_tool')
+        checkpoints.complete('spatial_join', ['sj'])
+        self.assertTrue(checkpoints.should_run('spatial_join'))
+        checkpoints.clear()
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
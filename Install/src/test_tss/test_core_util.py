@@ -19,6 +19,13 @@ class CoreUtilTestCase(unittest.TestCase):
         self.assertEqual(core_util.linear_units_to_mile("1 Nautical Miles"), 1.15078)
         self.assertRaises(Exception, core_util.linear_units_to_mile, "1 decimal")
 
+    def test_linear_units_to_meter(self):
+        self.assertEqual(core_util.linear_units_to_meter("1 Feet"), 0.3048)
+        self.assertEqual(core_util.linear_units_to_meter("2 Kilometers"), 2000)
+        self.assertEqual(core_util.linear_units_to_meter("10 Meters"), 10)
+        self.assertEqual(core_util.linear_units_to_meter("1 Miles"), 1609.344)
+        self.assertRaises(Exception, core_util.linear_units_to_meter, "1 decimal")
+
 
 if __name__ == '__main__':
     unittest.main()
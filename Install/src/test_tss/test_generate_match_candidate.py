@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import src.tss.ags.route_metrics_util as route_metrics_util
+from src.tss.checkpoint_util import CheckpointStore
+import generate_match_candidate
+
+
+class StubDescribe(object):
+
+    def __init__(self, catalog_path, dsid):
+        self.catalogPath = catalog_path
+        self.DSID = dsid
+
+
+class StubArcpy(object):
+    """
+    The arcpy functions of the run key on a file geodatabase folder, dataset name -> DSID
+    """
+
+    def __init__(self, gdb, table_ids):
+        self.gdb = gdb
+        self.table_ids = table_ids
+
+    def Describe(self, dataset):
+        return StubDescribe(os.path.join(self.gdb, dataset), self.table_ids[dataset])
+
+    def Exists(self, dataset):
+        return dataset in self.table_ids
+
+
+class CheckpointRunKeyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.gdb = os.path.join(self.folder, 'data.gdb')
+        os.mkdir(self.gdb)
+        self.write('a00000009.gdbtable', 'links')
+        self.write('a0000000a.gdbtable', 'routes')
+        stub = StubArcpy(self.gdb, {'here_link': 9, 'dot_network': 10})
+        self.modules = [generate_match_candidate, route_metrics_util]
+        self.arcpy = [module.arcpy for module in self.modules]
+        for module in self.modules:
+            module.arcpy = stub
+        self.parameters = {'here_link': 'here_link', 'dot_network': 'dot_network', 'search_radius': '10 Meters'}
+
+    def tearDown(self):
+        for module, arcpy in zip(self.modules, self.arcpy):
+            module.arcpy = arcpy
+        shutil.rmtree(self.folder)
+
+    def write(self, name, content, mtime=1000000000):
+        path = os.path.join(self.gdb, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def new_store(self):
+        parameters = generate_match_candidate.get_checkpoint_parameters(
+            self.parameters, {'here_link': 'here_link', 'dot_network': 'dot_network'})
+        return CheckpointStore(os.path.join(self.folder, 'checkpoints'), 'generate_match_candidate', parameters,
+                               lambda dataset: True)
+
+    def test_resume_after_failure(self):
+        checkpoints = self.new_store()
+        self.assertTrue(checkpoints.should_run('spatial_join'))
+        checkpoints.complete('spatial_join', ['here_link_sj'])
+        # the failed run wrote the output table next to the inputs, locked the workspace, then deleted the output
+        self.write('a0000000b.gdbtable', 'candidates', 2000000000)
+        self.write('a00000009.host.1234.sr.lock', '', 2000000000)
+        os.remove(os.path.join(self.gdb, 'a0000000b.gdbtable'))
+
+        checkpoints = self.new_store()
+        self.assertFalse(checkpoints.should_run('spatial_join'))
+        self.assertEqual(checkpoints.resumed_stages, ['spatial_join'])
+
+    def test_changed_input(self):
+        run_key = self.new_store().run_key
+        self.write('a0000000a.gdbtable', 'new routes', 2000000000)
+        self.assertNotEqual(self.new_store().run_key, run_key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import re
+import math
+import unittest
+import src.here.here_util as here_util
+
+
+class FakeCursor(object):
+    """
+    Search / update cursor on a FakeTables table, with the where clauses used by here_util ("FIELD = value")
+    """
+
+    def __init__(self, table, fields, where_clause=None):
+        self.table = table
+        self.indexes = [table['fields'].index('OBJECTID' if field == 'OID@' else field) for field in fields]
+        self.rows = table['rows']
+        if where_clause:
+            field, value = re.match(r"^(\w+) = '?([^']*)'?$", where_clause).groups()
+            index = table['fields'].index(field)
+            self.rows = [row for row in self.rows if str(row[index]) == value]
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        self.position += 1
+        if self.position >= len(self.rows):
+            raise StopIteration()
+        return [self.rows[self.position][index] for index in self.indexes]
+
+    def reset(self):
+        self.position = -1
+
+    def updateRow(self, values):
+        for index, value in zip(self.indexes, values):
+            self.rows[self.position][index] = value
+
+
+class FakeDa(object):
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def SearchCursor(self, table, fields, where_clause=None):
+        return FakeCursor(self.tables[table], fields, where_clause)
+
+    UpdateCursor = SearchCursor
+
+
+class FakeTables(object):
+    """
+    The arcpy functions of here_util on tables kept in a dict, name -> {'fields': [...], 'rows': [[...], ...]}
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.da = FakeDa(tables)
+
+    def GenerateNearTable_analysis(self, in_features, near_features, out_table, search_radius, *args):
+        rows = []
+        for in_row in self.tables[in_features]['rows']:
+            for near_row in self.tables[near_features]['rows']:
+                distance = math.hypot(in_row[2][0] - near_row[2][0], in_row[2][1] - near_row[2][1])
+                if distance <= search_radius:
+                    rows.append([len(rows) + 1, in_row[0], near_row[0], distance])
+        self.tables[out_table] = {'fields': ['OBJECTID', 'IN_FID', 'NEAR_FID', 'NEAR_DIST'], 'rows': rows}
+
+    def AddMessage(self, message):
+        pass
+
+    def AddField_management(self, table, field, *args):
+        self.tables[table]['fields'].append(field)
+        for row in self.tables[table]['rows']:
+            row.append(None)
+
+    def Delete_management(self, table):
+        del self.tables[table]
+
+
+class FakeConfig(object):
+
+    def __init__(self, options):
+        self.options = options
+
+    def get(self, section, option):
+        return self.options[option]
+
+
+class HereUtilTestCase(unittest.TestCase):
+    """
+    Swaps the arcpy and Config of here_util for the fakes of the test, restored after each test
+    """
+
+    def setUp(self):
+        self.here_util_arcpy = getattr(here_util, 'arcpy', None)
+        self.here_util_config = getattr(here_util, 'Config', None)
+
+    def tearDown(self):
+        here_util.arcpy = self.here_util_arcpy
+        here_util.Config = self.here_util_config
+
+
+class MatchingIntersectionsTestCase(HereUtilTestCase):
+
+    def setUp(self):
+        super(MatchingIntersectionsTestCase, self).setUp()
+        intersection_fields = ['OBJECTID', 'INTERSECTION_ID', 'SHAPE']
+        lut_fields = ['OBJECTID', 'INTERSECTION_ID', 'ON_ROUTE_ID']
+        self.tables = {
+            'source_intersections': {'fields': intersection_fields, 'rows': [
+                [1, 101, (0, 0)], [2, 102, (100, 0)], [3, 103, (200, 0)], [4, 104, (500, 500)]]},
+            'target_intersections': {'fields': intersection_fields, 'rows': [
+                [1, 201, (1, 1)], [2, 202, (99, 2)], [3, 203, (102, -2)], [4, 204, (203, 0)], [5, 205, (900, 0)]]},
+            'source_LUT': {'fields': lut_fields, 'rows': [
+                [1, 101, 'S1'], [2, 102, 'S1'], [3, 103, 'S1'], [4, 104, 'S1'],
+                [5, 101, 'S2'], [6, 103, 'S2'],
+                [7, 104, 'S3']]},
+            'target_LUT': {'fields': lut_fields, 'rows': [
+                [1, 201, 'T1'], [2, 202, 'T1'], [3, 203, 'T1'], [4, 204, 'T1'],
+                [5, 203, 'T2'], [6, 204, 'T2'],
+                [7, 205, 'T3']]}
+        }
+
+    def candidate_table(self):
+        return {'fields': ['OBJECTID', 'TargetRoute', 'SourceRoute', 'NumMatchingIntersection'], 'rows': [
+            [1, 'T1', 'S1', None], [2, 'T2', 'S1', None], [3, 'T1', 'S2', None], [4, 'T3', 'S1', None],
+            [5, 'T1', 'S3', None], [6, 'T1', 'S4', None], [7, 'T4', 'S1', None]]}
+
+    def match(self, mode):
+        tables = dict((name, {'fields': list(table['fields']), 'rows': [list(row) for row in table['rows']]})
+                      for name, table in self.tables.items())
+        tables['candidates'] = self.candidate_table()
+        here_util.arcpy = FakeTables(tables)
+        here_util.matching_intersections_func('source_intersections', 'target_intersections', 5,
+                                              'source_LUT', 'target_LUT', 'candidates', mode=mode)
+        self.assertFalse('NEAR_Table' in tables)
+        return [row[3] for row in tables['candidates']['rows']]
+
+    def test_indexed_same_as_reference(self):
+        counts = self.match('indexed')
+        self.assertEqual(counts, self.match('reference'))
+        # 102 is near both 202 and 203
+        self.assertEqual(counts, [4, 2, 2, 0, 0, 0, 0])
+
+    def test_load_dicts(self):
+        here_util.arcpy = FakeTables(self.tables)
+        self.assertEqual(here_util.load_oid_intersection_dict('source_intersections'),
+                         {1: 101, 2: 102, 3: 103, 4: 104})
+        self.assertEqual(here_util.load_route_intersections_dict('target_LUT'),
+                         {'T1': [201, 202, 203, 204], 'T2': [203, 204], 'T3': [205]})
+
+    def test_count_matching_intersections(self):
+        near_intersections_dict = {101: [201], 102: [202, 203], 103: [204]}
+        self.assertEqual(here_util.count_matching_intersections([101, 102, 103, 104], {201, 202, 203, 204},
+                                                                near_intersections_dict), 4)
+        self.assertEqual(here_util.count_matching_intersections([101, 102, 103], {203, 204},
+                                                                near_intersections_dict), 2)
+        self.assertEqual(here_util.count_matching_intersections([], {201}, near_intersections_dict), 0)
+        self.assertEqual(here_util.count_matching_intersections([101], set(), near_intersections_dict), 0)
+
+
+class MatchingRouteByIdTestCase(HereUtilTestCase):
+
+    def test_matching_route_by_id(self):
+        tables = {'candidates': {'fields': ['OBJECTID', 'TargetRoute', 'SourceRoute', 'IsRouteIdMatching'], 'rows': [
+            [1, 'FRA_IR00075**C', 'I-75-N', None], [2, 'FRA_SR00004**C', 'OH 4 E', None],
+            [3, 'FRA_CR00012**C', 'CR-12-N', None], [4, 'FRA_IRABCDE**C', 'I-75-S', None]]}}
+        here_util.arcpy = FakeTables(tables)
+        here_util.Config = FakeConfig({
+            'here_route_id_delimiter': '-;space', 'here_route_type_pos': '1', 'here_route_number_pos': '2',
+            'target_route_type_start_pos': '5', 'target_route_type_end_pos': '6',
+            'target_route_number_start_pos': '7', 'target_route_number_end_pos': '11',
+            'route_type_naming_convention': 'US US;I IR;OH SR'})
+        self.assertTrue(here_util.matching_route_by_id('candidates'))
+        self.assertEqual([row[3] for row in tables['candidates']['rows']], ['YES', 'YES', 'NO', 'NO'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from src.tss.polyline_util import PolylineArray
+import src.here.incremental_util as incremental_util
+
+
+class IncrementalUtilTestCase(unittest.TestCase):
+
+    def test_compare_links(self):
+        new_link_ids, changed_link_ids, removed_link_ids = incremental_util.compare_links(
+            ['L1', 'L2', 'L3', 'L5'], ['a', 'b', 'c', 'e'],
+            ['L1', 'L2', 'L3', 'L4'], ['a', 'x', 'c', 'd'])
+        self.assertEqual(new_link_ids, {'L5'})
+        self.assertEqual(changed_link_ids, {'L2'})
+        self.assertEqual(removed_link_ids, {'L4'})
+
+        self.assertEqual(incremental_util.compare_links(['L1'], ['a'], [], []), ({'L1'}, set(), set()))
+        self.assertEqual(incremental_util.compare_links([], [], ['L1'], ['a']), (set(), set(), {'L1'}))
+
+    def test_compare_links_projected(self):
+        # vertices moved by less than the XY tolerance keep their fingerprint
+        links = PolylineArray.from_features([
+            ('L1', [[(0, 0), (100.0002, 0)]]),
+            ('L2', [[(0, 50), (100, 50)]])
+        ])
+        previous_links = PolylineArray.from_features([
+            ('L1', [[(0.0003, -0.0001), (100, 0)]]),
+            ('L2', [[(0, 50), (100, 55)]])
+        ])
+        new_link_ids, changed_link_ids, removed_link_ids = incremental_util.compare_links(
+            links.ids, links.fingerprints(tolerance=0.001),
+            previous_links.ids, previous_links.fingerprints(tolerance=0.001))
+        self.assertEqual((new_link_ids, changed_link_ids, removed_link_ids), (set(), {'L2'}, set()))
+
+    def test_find_links_near(self):
+        links = PolylineArray.from_features([
+            ('L1', [[(0, 0), (100, 0)]]),
+            ('L2', [[(0, 30), (100, 30)]]),
+            ('L3', [[(0, 200), (100, 200)]]),
+            # crosses the geometry
+            ('L4', [[(150, -50), (150, 50)]])
+        ])
+        geometries = PolylineArray.from_features([
+            ('G1', [[(0, 10), (200, 10)]])
+        ])
+        self.assertEqual(incremental_util.find_links_near(links, geometries, 25.0), {'L1', 'L2', 'L4'})
+        self.assertEqual(incremental_util.find_links_near(links, geometries, 5.0), {'L4'})
+        self.assertEqual(incremental_util.find_links_near(links, PolylineArray.from_features([]), 25.0), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import src.tss.instrument_util as instrument_util
+
+
+class InstrumentUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.counts = {'links': 10, 'routes': 4}
+        self.report = instrument_util.RunReport('test_tool', self.counts.__getitem__)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_stage(self):
+        with self.report.stage('join', inputs=['links', 'routes'], outputs='links') as stage:
+            pass
+        with self.report.stage('score', inputs=[(1, 2), (3, 4)]) as stage:
+            stage.output_rows = 1
+        with self.report.stage('missing', inputs='unknown'):
+            pass
+        join, score, missing = self.report.stages
+        self.assertEqual((join.status, join.input_rows, join.output_rows), ('success', 14, 10))
+        self.assertEqual((score.input_rows, score.output_rows), (2, 1))
+        self.assertEqual(missing.input_rows, None)
+        self.assertTrue(join.wall_seconds >= 0 and join.cpu_seconds >= 0)
+
+    def test_stage_memory(self):
+        with self.report.stage('allocate') as stage:
+            pass
+        if instrument_util.current_memory_bytes() is None:
+            self.assertEqual(stage.memory_increase_mb, None)
+            return
+        self.assertTrue(stage.start_memory_mb > 0 and stage.end_memory_mb > 0)
+        self.assertAlmostEqual(stage.memory_increase_mb, stage.end_memory_mb - stage.start_memory_mb, places=1)
+
+    def test_failed_stage(self):
+        with self.assertRaises(ValueError):
+            with self.report.stage('fail', outputs='links'):
+                raise ValueError()
+        self.assertEqual(self.report.stages[0].status, 'failed')
+        self.assertEqual(self.report.stages[0].output_rows, None)
+
+    def test_save(self):
+        with self.report.stage('join'):
+            pass
+        self.report.status = 'success'
+        path = self.report.save(os.path.join(self.folder, 'report.json'))
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report['tool'], 'test_tool')
+        self.assertEqual([stage['name'] for stage in report['stages']], ['join'])
+        self.assertTrue('memory_increase_mb' in report['stages'][0])
+        self.assertTrue('process_peak_memory_mb' in report['stages'][0])
+
+    def test_get_report_path(self):
+        gdb = os.path.join(self.folder, 'data.gdb')
+        os.mkdir(gdb)
+        self.assertEqual(instrument_util.get_report_path(os.path.join(gdb, 'xref'), 'tool'),
+                         os.path.join(self.folder, 'xref_tool_report.json'))
+        self.assertEqual(instrument_util.get_report_path(os.path.join(self.folder, 'route.shp'), 'tool'),
+                         os.path.join(self.folder, 'route_tool_report.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from src.tss.polyline_util import PolylineArray
+import src.tss.intersection_snap_util as intersection_snap_util
+
+
+class IntersectionSnapUtilTestCase(unittest.TestCase):
+
+    def test_cluster_points(self):
+        points = [(0, 0), (0.05, 0), (0.1, 0), (5, 5), (5, 5.2)]
+        self.assertEqual(intersection_snap_util.cluster_points(points, 0.06).tolist(), [0, 0, 0, 3, 4])
+
+    def test_classify_route_ids(self):
+        self.assertIsNone(intersection_snap_util.classify_route_ids(['a']))
+        self.assertEqual(intersection_snap_util.classify_route_ids(['a', 'a']), intersection_snap_util.CIRCULAR_INTERSECTION)
+        self.assertEqual(intersection_snap_util.classify_route_ids(['a', 'b', 'c']), intersection_snap_util.TRUE_INTERSECTION)
+        self.assertEqual(intersection_snap_util.classify_route_ids(['a', 'a', 'b']),
+                         intersection_snap_util.CONCURRENT_INTERSECTION)
+
+    def test_detect_intersections(self):
+        routes = PolylineArray.from_features([
+            ('r1', [[(0, 0), (10, 0)]]),
+            ('r2', [[(10, 0), (10, 10)]]),
+            ('r3', [[(20, 0), (30, 0), (30, 10), (20, 0)]]),
+            ('r4', [[(5, -5), (5, 5)]])
+        ])
+        points, types, is_loop = intersection_snap_util.detect_intersections(routes, 0.001, 0.5, 4)
+        self.assertEqual(points.tolist(), [[10, 0], [20, 0], [5, 0]])
+        self.assertEqual(types, [intersection_snap_util.TRUE_INTERSECTION, intersection_snap_util.CIRCULAR_INTERSECTION,
+                                 None])
+        self.assertEqual(is_loop.tolist(), [False, True, False])
+
+    def test_detect_intersections_parallel_routes(self):
+        # divided highway (r1, r2) between two cross streets, r5 concurrent with r1
+        routes = PolylineArray.from_features([
+            ('r1', [[(0, 0), (50, 0), (100, 0)]]),
+            ('r2', [[(0, 5), (50, 5), (100, 5)]]),
+            ('r3', [[(0, -30), (0, 35)]]),
+            ('r4', [[(100, -30), (100, 35)]]),
+            ('r5', [[(0, 0), (50, 0), (100, 0)]])
+        ])
+        points, types, is_loop = intersection_snap_util.detect_intersections(routes, 0.001, 10, 4)
+        self.assertEqual(points.tolist(), [[0, 0], [100, 0], [0, 5], [100, 5]])
+        self.assertEqual(types, [intersection_snap_util.TRUE_INTERSECTION, intersection_snap_util.TRUE_INTERSECTION,
+                                 None, None])
+
+        # parallel routes without any other route, nothing ends on or crosses another route
+        routes = PolylineArray.from_features([
+            ('r1', [[(0, 0), (50, 0), (100, 0)]]),
+            ('r2', [[(-50, 5), (50, 5), (150, 5)]])
+        ])
+        points, types, is_loop = intersection_snap_util.detect_intersections(routes, 0.001, 3, 4)
+        self.assertEqual(points.tolist(), [])
+
+    def test_detect_intersections_end_point_filter(self):
+        routes = PolylineArray.from_features([
+            ('r1', [[(0, 0), (10, 0)]]),
+            ('r2', [[(10, 0), (10, 10)]]),
+            ('r4', [[(5, -5), (5, 5)]])
+        ])
+        points, types, is_loop = intersection_snap_util.detect_intersections(
+            routes, 0.001, 0.5, 4, lambda end_points: end_points[:, 0] < 10)
+        self.assertEqual(points.tolist(), [[5, 0]])
+        self.assertEqual(types, [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import src.tss.join_util as join_util
+
+
+class JoinUtilTestCase(unittest.TestCase):
+
+    def test_normalize_join_key(self):
+        self.assertEqual(join_util.normalize_join_key(1234), u'1234')
+        self.assertEqual(join_util.normalize_join_key(1234L), u'1234')
+        self.assertEqual(join_util.normalize_join_key(1234.0), u'1234')
+        self.assertEqual(join_util.normalize_join_key(u' 1234 '), u'1234')
+        self.assertEqual(join_util.normalize_join_key(12.5), u'12.5')
+        self.assertEqual(join_util.normalize_join_key(u''), None)
+        self.assertEqual(join_util.normalize_join_key(None), None)
+
+    def test_hash_join(self):
+        links = [(1, 'A'), (2, 'B'), (3, 'C'), (None, 'D')]
+        candidates = [(u'1', 'R1'), (u'1', 'R2'), (u'3', 'R3'), (u'4', 'R4'), (None, 'R5')]
+        expected = [((1, 'A'), (u'1', 'R1')), ((1, 'A'), (u'1', 'R2')), ((3, 'C'), (u'3', 'R3'))]
+        self.assertEqual(list(join_util.hash_join(links, candidates)), expected)
+        self.assertEqual(list(join_util.hash_join(iter(links), iter(candidates), build_left=True)), expected)
+        self.assertEqual(list(join_util.hash_join([], candidates)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from src.tss.polyline_util import PolylineArray
+from src.tss.locate_util import RouteLocator
+
+
+class LocateUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.routes = PolylineArray.from_features([
+            ('A', [[(0, 0, 0), (10, 0, 10), (20, 0, 20)]]),
+            # loop route starting and ending at (30, 0)
+            ('LOOP', [[(30, 0, 0), (40, 0, 10), (40, 10, 20), (30, 10, 30), (30, 0, 40)]]),
+            ('B', [[(10, -10, 100), (10, 10, 120)]]),
+            ('NO_M', [[(0, 1, np.nan), (20, 1, np.nan)]])
+        ], has_m=True)
+        self.locator = RouteLocator(self.routes)
+
+    def test_locate_points(self):
+        point_index, route_index, measure, distance = self.locator.locate_points(
+            [(10, 0), (30, 0), (35, 0.5), (100, 100)], 1.0)
+        self.assertEqual(point_index.tolist(), [0, 0, 1, 1, 2])
+        self.assertEqual([self.locator.route_ids[r] for r in route_index], ['A', 'B', 'LOOP', 'LOOP', 'LOOP'])
+        self.assertTrue(np.allclose(measure, [10, 110, 0, 40, 5]))
+        self.assertTrue(np.allclose(distance, [0, 0, 0, 0, 0.5]))
+
+        point_index, route_index, measure, distance = self.locator.locate_points([(10, 0.2), (5, 0.6)], 1.0,
+                                                                                 all_matches=False)
+        self.assertEqual(point_index.tolist(), [0, 1])
+        self.assertEqual([self.locator.route_ids[r] for r in route_index], ['B', 'A'])
+        self.assertTrue(np.allclose(measure, [110.2, 5]))
+
+    def test_locate_lines(self):
+        line_index, route_index, from_measure, to_measure, distance = self.locator.locate_lines(
+            [(0, 0), (40, 0), (38, 10), (50, 50)], [(10, 0), (40, 10), (30, 0), (60, 60)], 0.001)
+        self.assertEqual(line_index.tolist(), [0, 1, 2])
+        self.assertEqual([self.locator.route_ids[r] for r in route_index], ['A', 'LOOP', 'LOOP'])
+        self.assertTrue(np.allclose(from_measure, [0, 10, 22]))
+        # the end of the last line is at both ends of the loop, the location closest to its start is kept
+        self.assertTrue(np.allclose(to_measure, [10, 20, 40]))
+
+    def test_routes_without_m(self):
+        self.assertRaises(ValueError, RouteLocator, PolylineArray.from_features([('A', [[(0, 0), (1, 0)]])]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from src.tss.polyline_util import PolylineArray
+from src.tss.spatial_index import SegmentGridIndex
+from src.here.match_util import score_candidate_rows, match_link_route, build_link_route_rows, compare_candidate_rows
+
+
+class BuildLinkRouteRowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.links = PolylineArray.from_features([
+            ('L3', [[(0, 500), (10, 500)]]),
+            ('L1', [[(0, 0), (10, 0)]]),
+            # far from every route
+            ('L2', [[(1000, 0), (1010, 0)]])
+        ])
+        self.link_attributes = [('OAK ST', 'H2'), ('MAIN ST', 'H1'), ('PINE ST', 'H1')]
+        routes = PolylineArray.from_features([
+            ('R1', [[(-100, 1), (100, 1)]]),
+            # crosses L1 at 45 degrees
+            ('R2', [[(-45, -50), (55, 50)]]),
+            # one route in two features, split next to L3 at a county line
+            ('R3', [[(-100, 501), (5, 501)]]),
+            ('R3', [[(5, 501), (100, 501)]])
+        ])
+        self.route_index = SegmentGridIndex.build(routes, 50.0, oids=[1, 2, 3, 4])
+        self.route_attributes = [('SR 1', 'C1'), ('SR 2', 'C1'), ('SR 3', 'C1'), ('SR 3', 'C2')]
+
+    def test_match_link_route(self):
+        link_index, route_index, first_points, last_points = match_link_route(self.links, self.route_index, 2.0)
+        self.assertEqual(list(zip(link_index.tolist(), route_index.tolist())), [(0, 2), (1, 0), (1, 1)])
+        # the routes are clipped to the corridor of the link, the features of R3 are dissolved
+        self.assertAlmostEqual(first_points[0][0], -3 ** 0.5)
+        self.assertAlmostEqual(last_points[0][0], 10 + 3 ** 0.5)
+        self.assertEqual((first_points[0][1], last_points[0][1]), (501, 501))
+        self.assertAlmostEqual(first_points[1][0], -3 ** 0.5)
+        self.assertAlmostEqual(last_points[1][0], 10 + 3 ** 0.5)
+        # R2 is clipped on its own line, within the corridor
+        self.assertAlmostEqual(first_points[2][0] - first_points[2][1], 5)
+        self.assertAlmostEqual(last_points[2][0] - last_points[2][1], 5)
+        self.assertAlmostEqual(first_points[2][1], -2)
+        self.assertAlmostEqual(last_points[2][1], 2)
+
+    def test_build_link_route_rows(self):
+        rows = build_link_route_rows(self.links, self.link_attributes, self.route_index, self.route_attributes, 2.0)
+        self.assertEqual([row[:6] + (row[7],) for row in rows], [
+            ('R1', 'L1', 'SR 1', 'C1', 'MAIN ST', 'H1', 2),
+            ('R2', 'L1', 'SR 2', 'C1', 'MAIN ST', 'H1', 2),
+            (None, 'L2', None, None, 'PINE ST', 'H1', None),
+            # one row for the route split into two features, with the attributes of the feature where it starts
+            ('R3', 'L3', 'SR 3', 'C1', 'OAK ST', 'H2', 1)
+        ])
+        self.assertEqual([row[6] for row in rows[:1] + rows[2:]], [0, None, 0])
+        self.assertAlmostEqual(rows[1][6], 45)
+
+        # the corridor of a smaller radius misses R1
+        rows = build_link_route_rows(self.links, self.link_attributes, self.route_index, self.route_attributes, 0.5)
+        self.assertEqual([(row[0], row[1], row[7]) for row in rows], [('R2', 'L1', 1), (None, 'L2', None),
+                                                                      (None, 'L3', None)])
+
+    def test_compare_candidate_rows(self):
+        reference_rows = [('R1', 'L1', None, None, None, None, 'Low'), ('R2', 'L1', None, None, None, None, 'Low'),
+                          ('R3', 'L3', None, None, None, None, 'Low'), ('R3', 'L3', None, None, None, None, 'Low'),
+                          ('R4', 'L4', None, None, None, None, 'High')]
+        rows = [('R1', 'L1', None, None, None, None, 'Low'), ('R2', 'L1', None, None, None, None, 'Low'),
+                ('R3', 'L3', None, None, None, None, 'High'), ('R5', 'L5', None, None, None, None, 'High')]
+        self.assertEqual(compare_candidate_rows(reference_rows, rows), {
+            'missing': [('L4', 'R4')], 'extra': [('L5', 'R5')], 'confidence': [('L3', 'R3', 'Low', 'High')],
+            'duplicates': [('L3', 'R3')]})
+
+
+class ScoreCandidateRowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # (dot rid, here lid, dot route name, dot county id, here street name, here county id, confidence,
+        #  verified match, rejected match)
+        self.rows = [
+            # the only candidate of L1
+            ('R1', 'L1', 'SR 1', 'C1', 'MAIN ST', 'H1', 'Low', None, None),
+            # SR 1 in C1 is MAIN ST in H1 by the 'High' row of L2
+            ('R1', 'L2', 'SR 1', 'C1', 'MAIN ST', 'H1', 'High', None, None),
+            ('R2', 'L2', 'SR 2', 'C1', 'MAIN ST', 'H1', 'Low', None, None),
+            ('R1', 'L3', 'SR 1', 'C1', 'MAIN ST', 'H1', 'Low', None, None),
+            ('R2', 'L3', 'SR 2', 'C1', 'OAK ST', 'H1', 'Low', None, None),
+            # same route name in another county is not known
+            ('R3', 'L4', 'SR 1', 'C2', 'MAIN ST', 'H1', 'Low', 'Y', None),
+            ('R4', 'L4', 'SR 4', 'C2', 'ELM ST', 'H1', 'Low', None, 'Y')
+        ]
+
+    def test_score_candidate_rows(self):
+        scored_rows = score_candidate_rows(self.rows)
+        self.assertEqual([row[6] for row in scored_rows], ['High', 'High', 'Low', 'Medium', 'Low', 'Low', 'Low'])
+        # only the confidence changes
+        self.assertEqual(scored_rows[0], ('R1', 'L1', 'SR 1', 'C1', 'MAIN ST', 'H1', 'High', None, None))
+        self.assertEqual(scored_rows[3], ('R1', 'L3', 'SR 1', 'C1', 'MAIN ST', 'H1', 'Medium', None, None))
+        self.assertEqual(scored_rows[5], self.rows[5])
+        self.assertEqual(score_candidate_rows([]), [])
+
+    def test_fixed_link_ids(self):
+        scored_rows = score_candidate_rows(self.rows, fixed_link_ids={'L1', 'L3'})
+        self.assertEqual([row[6] for row in scored_rows], ['Low', 'High', 'Low', 'Low', 'Low', 'Low', 'Low'])
+        self.assertEqual(scored_rows[0], self.rows[0])
+        self.assertEqual(scored_rows[3], self.rows[3])
+
+        # the 'High' rows of fixed links are still match knowledge for the other links
+        scored_rows = score_candidate_rows(self.rows, fixed_link_ids={'L2'})
+        self.assertEqual([row[6] for row in scored_rows], ['High', 'High', 'Low', 'Medium', 'Low', 'Low', 'Low'])
+        self.assertEqual(score_candidate_rows(self.rows, fixed_link_ids=set()), score_candidate_rows(self.rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from src.here.node_util import aggregate_located_node
+
+
+class AggregateLocatedNodeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # (node id, route id, measure, distance, link id)
+        self.rows = [(1, 'R1', 4.0, 2.0, 'L1'),
+                     (1, 'R1', 1.0, 0.5, 'L2'),
+                     (1, 'R1', 10.0, 3.0, 'L3'),
+                     (1, 'R1', 3.0, 1.0, 'L4')]
+
+    def aggregate(self, rows, measure_aggregation):
+        return aggregate_located_node(rows, 2, 3, measure_aggregation)
+
+    def test_measure_aggregation(self):
+        # the measure is aggregated, the other fields are those of the last row
+        self.assertEqual(self.aggregate(self.rows, 'mean'), [1, 'R1', 4.5, 1.0, 'L4'])
+        self.assertEqual(self.aggregate(self.rows, 'min'), [1, 'R1', 1.0, 1.0, 'L4'])
+        self.assertEqual(self.aggregate(self.rows, 'max'), [1, 'R1', 10.0, 1.0, 'L4'])
+        self.assertEqual(self.aggregate(self.rows, 'median'), [1, 'R1', 3.5, 1.0, 'L4'])
+        self.assertEqual(self.aggregate(self.rows[:3], 'median'), [1, 'R1', 4.0, 3.0, 'L3'])
+        # the closest row as it is
+        self.assertEqual(self.aggregate(self.rows, 'closest'), (1, 'R1', 1.0, 0.5, 'L2'))
+
+    def test_ties(self):
+        rows = [(1, 'R1', 5.0, 1.0, 'L1'), (1, 'R1', 5.0, 1.0, 'L2'), (1, 'R1', 2.0, 1.0, 'L3')]
+        self.assertEqual(self.aggregate(rows, 'min'), [1, 'R1', 2.0, 1.0, 'L3'])
+        self.assertEqual(self.aggregate(rows, 'max'), [1, 'R1', 5.0, 1.0, 'L3'])
+        self.assertEqual(self.aggregate(rows, 'median'), [1, 'R1', 5.0, 1.0, 'L3'])
+        # the first of the rows at the same distance
+        self.assertEqual(self.aggregate(rows, 'closest'), (1, 'R1', 5.0, 1.0, 'L1'))
+
+    def test_single_row(self):
+        rows = [(1, 'R1', 7.0, 0.0, 'L1')]
+        for measure_aggregation in ['mean', 'min', 'max', 'median']:
+            self.assertEqual(self.aggregate(rows, measure_aggregation), [1, 'R1', 7.0, 0.0, 'L1'])
+        self.assertEqual(self.aggregate(rows, 'closest'), rows[0])
+
+    def test_unknown_aggregation(self):
+        self.assertRaises(ValueError, self.aggregate, self.rows, 'mode')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+from src.tss.polyline_util import PolylineArray
+import src.tss.overlap_util as overlap_util
+
+
+class OverlapUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.polylines = PolylineArray.from_features([
+            ('a', [[(0, 0), (10, 0), (20, 0)]]),
+            ('b', [[(5, 0.001), (15, 0)]]),
+            ('c', [[(5, -5), (5, 5)]]),
+            ('d', [[(100, 100), (110, 100)]])
+        ])
+
+    def test_sweep_envelope_pairs(self):
+        envelope_min, envelope_max = overlap_util.feature_envelopes(self.polylines)
+        first, second = overlap_util.sweep_envelope_pairs(envelope_min, envelope_max)
+        self.assertEqual(sorted(zip(first.tolist(), second.tolist())), [(0, 1), (0, 2), (1, 2)])
+
+    def test_collinear_overlap_intervals(self):
+        a0, a1 = np.array([[0., 0], [0, 0]]), np.array([[10., 0], [10, 0]])
+        b0, b1 = np.array([[12., 0], [5, -5]]), np.array([[4., 0], [5, 5]])
+        overlap, lower, upper = overlap_util.collinear_overlap_intervals(a0, a1, b0, b1, 0.01)
+        self.assertEqual(overlap.tolist(), [True, False])
+        self.assertEqual((lower[0], upper[0]), (4, 10))
+
+    def test_find_collinear_overlaps(self):
+        pairs, pair_parts, stats = overlap_util.find_collinear_overlaps(self.polylines, 0.01)
+        self.assertEqual(pairs, [(0, 1)])
+        self.assertEqual(len(pair_parts[0]), 1)
+        self.assertEqual(np.round(pair_parts[0][0], 2).tolist(), [[5, 0], [10, 0], [15, 0]])
+        self.assertEqual(stats['pairs_tested'], 3)
+        self.assertEqual(stats['pairs_pruned'], 3)
+        # the segments of 'c' (only second in its pairs) and 'd' (in no pair) are not queried
+        self.assertEqual(stats['segments_queried'], 3)
+        self.assertEqual(stats['segments_skipped'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from src.tss.polyline_util import PolylineArray
+from src.tss.spatial_index import SegmentGridIndex
+import src.here.partition_util as partition_util
+
+
+class PartitionUtilTestCase(unittest.TestCase):
+
+    def test_build_partition_where_clause(self):
+        self.assertEqual(partition_util.build_partition_where_clause('COUNTY', None), "COUNTY IS NULL")
+        self.assertEqual(partition_util.build_partition_where_clause('COUNTY', 'FULTON'), "COUNTY = 'FULTON'")
+        self.assertEqual(partition_util.build_partition_where_clause('COUNTY', "O'BRIEN"), "COUNTY = 'O''BRIEN'")
+        self.assertEqual(partition_util.build_partition_where_clause('COUNTY', 121), "COUNTY = 121")
+
+    def test_merge_partition_rows(self):
+        county_b = [('R1', 'L3', 'SR 1', 'B', 'MAIN ST', 'B', 5.0, 2),
+                    # a second feature of the same route, kept as its own row
+                    ('R1', 'L3', 'SR 1', 'B', 'MAIN ST', 'B', 7.0, 2)]
+        county_a = [(None, 'L1', None, None, 'OAK ST', 'A', None, None),
+                    ('R2', 'L2', 'SR 2', 'A', 'ELM ST', 'A', 1.0, 1)]
+        no_county = [('R3', 'L4', 'SR 3', None, 'PINE ST', None, 2.0, 1)]
+        self.assertEqual(partition_util.merge_partition_rows([('B', county_b), (None, no_county), ('A', county_a)]),
+                         no_county + county_a + county_b)
+        self.assertEqual(partition_util.merge_partition_rows([]), [])
+
+    def test_select_halo_routes(self):
+        routes = PolylineArray.from_features([
+            ('R1', [[(0, 0), (100, 0)]]),
+            # within the radius of the links extent
+            ('R2', [[(0, 25), (100, 25)]]),
+            ('R3', [[(0, 200), (100, 200)]]),
+            ('R4', [[(500, 0), (600, 0)]])
+        ])
+        route_index = SegmentGridIndex.build(routes, 50.0, oids=[11, 12, 13, 14])
+        links = PolylineArray.from_features([
+            ('L1', [[(10, 5), (40, 5)]]),
+            ('L2', [[(40, 5), (60, 10)]])
+        ])
+        halo_index = partition_util.select_halo_routes(route_index, links, 20.0)
+        self.assertEqual(halo_index.polylines.ids, ['R1', 'R2'])
+        self.assertEqual(halo_index.oids, [11, 12])
+        self.assertEqual(halo_index.cell_size, route_index.cell_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import src.tss.polyline_util as polyline_util
+
+
+class PolylineUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.polylines = polyline_util.PolylineArray.from_features([
+            ('a', [[(0, 0), (3, 4)]]),
+            ('b', [[(0, 0), (1, 0)], [(2, 0), (2, 2)]])
+        ])
+
+    def test_from_features(self):
+        self.assertEqual(len(self.polylines), 2)
+        self.assertEqual(self.polylines.part_count, 3)
+        self.assertEqual(self.polylines.first_points().tolist(), [[0, 0], [0, 0]])
+        self.assertEqual(self.polylines.last_points().tolist(), [[3, 4], [2, 2]])
+
+    def test_segments(self):
+        start_xy, end_xy, feature_index, start_index = self.polylines.segments()
+        self.assertEqual(feature_index.tolist(), [0, 1, 1])
+        self.assertEqual(start_index.tolist(), [0, 2, 4])
+        self.assertEqual(self.polylines.feature_lengths().tolist(), [5, 3])
+
+    def test_positions_along(self):
+        points = self.polylines.positions_along([2.5, 2])
+        self.assertEqual(points.tolist(), [[1.5, 2], [2, 1]])
+        self.assertEqual(self.polylines.positions_along([10, -1]).tolist(), [[3, 4], [0, 0]])
+
+    def test_subset(self):
+        subset = self.polylines.subset([1])
+        self.assertEqual(subset.ids, ['b'])
+        self.assertEqual(subset.part_count, 2)
+        self.assertEqual(subset.last_points().tolist(), [[2, 2]])
+
+    def test_fingerprints(self):
+        fingerprints = self.polylines.fingerprints()
+        self.assertNotEqual(fingerprints[0], fingerprints[1])
+        same = polyline_util.PolylineArray(['x'], self.polylines.xy + 1e-9, self.polylines.part_offsets,
+                                           self.polylines.feature_offsets)
+        self.assertEqual(same.fingerprints()[0], fingerprints[0])
+        self.assertEqual(self.polylines.subset([1]).fingerprints(), fingerprints[1:])
+
+        # rounded to the tolerance
+        fingerprints = self.polylines.fingerprints(tolerance=0.001)
+        moved = polyline_util.PolylineArray(['x', 'y'], self.polylines.xy + 0.0003, self.polylines.part_offsets,
+                                            self.polylines.feature_offsets)
+        self.assertEqual(moved.fingerprints(tolerance=0.001), fingerprints)
+        self.assertNotEqual(moved.fingerprints(), self.polylines.fingerprints())
+        moved = polyline_util.PolylineArray(['x', 'y'], self.polylines.xy + 0.002, self.polylines.part_offsets,
+                                            self.polylines.feature_offsets)
+        self.assertNotEqual(moved.fingerprints(tolerance=0.001)[0], fingerprints[0])
+
+    def test_segment_segment_distance(self):
+        a0, a1 = np.array([[0., 0], [0, 0]]), np.array([[2., 2], [1, 0]])
+        b0, b1 = np.array([[0., 2], [0, 3]]), np.array([[2., 0], [1, 3]])
+        self.assertEqual(polyline_util.segment_segment_distance(a0, a1, b0, b1).tolist(), [0, 3])
+
+    def test_segment_corridor_interval(self):
+        p0, p1 = np.array([[-5., 1], [0, 5]]), np.array([[15., 1], [10, 5]])
+        c0, c1 = np.array([[0., 0], [0, 0]]), np.array([[10., 0], [10, 0]])
+        t_start, t_end = polyline_util.segment_corridor_interval(p0, p1, c0, c1, 2)
+        self.assertAlmostEqual(t_start[0], (5 - 3 ** 0.5) / 20)
+        self.assertAlmostEqual(t_end[0], (15 + 3 ** 0.5) / 20)
+        self.assertTrue(t_start[1] > t_end[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+from src.tss.polyline_util import PolylineArray
+from src.tss.route_builder_util import build_routes
+
+
+class RouteBuilderUtilTestCase(unittest.TestCase):
+
+    def test_build_routes(self):
+        links = PolylineArray.from_features([
+            # route A, digitized in any order and direction
+            (1, [[(20, 0), (10, 0)]]),
+            (2, [[(0, 0), (5, 0), (10, 0)]]),
+            (3, [[(20, 0), (30, 0)]]),
+            # route B, with a gap
+            (4, [[(0, 10), (10, 10)]]),
+            (5, [[(20, 10), (30, 10)]]),
+            # route C, with a branch at (10, 20)
+            (6, [[(0, 20), (10, 20)]]),
+            (7, [[(10, 20), (20, 20)]]),
+            (8, [[(10, 20), (10, 30)]]),
+            # route D, a loop
+            (9, [[(50, 0), (60, 0), (60, 10)]]),
+            (10, [[(60, 10), (50, 10), (50, 0)]]),
+            # no route
+            (11, [[(0, 0), (1, 1)]])
+        ])
+        routes, build = build_routes(links, ['A', 'A', 'A', 'B', 'B', 'C', 'C', 'C', 'D', 'D', None])
+
+        self.assertEqual(routes.ids, ['A', 'B', 'C', 'D'])
+        self.assertEqual(build.link_counts.tolist(), [3, 2, 3, 2])
+        self.assertEqual(build.gap_counts.tolist(), [0, 1, 0, 0])
+        self.assertEqual(build.branch_counts.tolist(), [0, 0, 1, 0])
+        self.assertEqual(build.loop_counts.tolist(), [0, 0, 0, 1])
+        self.assertEqual(build.multi_part.tolist(), [False, True, True, False])
+        self.assertEqual(build.branched_route_ids(), ['C'])
+
+        route_a = routes.subset([0])
+        self.assertEqual(route_a.xy.tolist(), [[0, 0], [5, 0], [10, 0], [20, 0], [30, 0]])
+        self.assertEqual(route_a.m.tolist(), [0, 5, 10, 20, 30])
+
+        # gaps are not measured
+        route_b = routes.subset([1])
+        self.assertEqual(route_b.part_count, 2)
+        self.assertEqual(route_b.m.tolist(), [0, 10, 10, 20])
+
+        route_c = routes.subset([2])
+        self.assertEqual(route_c.part_count, 2)
+        self.assertEqual(route_c.m.tolist(), [0, 10, 20, 20, 30])
+
+        route_d = routes.subset([3])
+        self.assertEqual(route_d.part_count, 1)
+        self.assertTrue(np.allclose(route_d.first_points(), route_d.last_points()))
+        self.assertEqual(route_d.m[-1], 40)
+
+    def test_snap_tolerance(self):
+        links = PolylineArray.from_features([(1, [[(0, 0), (10, 0)]]), (2, [[(10.001, 0), (20, 0)]])])
+        routes, build = build_routes(links, ['A', 'A'])
+        self.assertEqual(build.gap_counts.tolist(), [1])
+        routes, build = build_routes(links, ['A', 'A'], snap_tolerance=0.01)
+        self.assertEqual(build.gap_counts.tolist(), [0])
+        self.assertEqual(routes.part_count, 1)
+        self.assertEqual(len(routes.xy), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import re
+import unittest
+from src.here.route_id_util import RouteIdRule
+
+
+def compare_route_id(rules, source_rid, target_rid):
+    """
+    The route id comparison RouteIdRule replaced, kept to check the rule gives the same answers
+    """
+    src_route_delimiter = re.split(";", rules[0].replace("space", " "))
+    source_rid_list = re.split("|".join(src_route_delimiter), source_rid)
+
+    target_rid_type = target_rid[(rules[5] - 1):rules[6]]
+    target_rid_number = str(int(target_rid[(rules[7] - 1):rules[8]]))
+    target_rid_parsed = target_rid_type + "-" + target_rid_number
+
+    route_type_naming_convention_list = [re.split(" ", item) for item in re.split(";", rules[9])]
+    is_construct_id = False
+    for criterion in route_type_naming_convention_list:
+        if source_rid_list[rules[1] - 1] == criterion[0]:
+            source_rid_list[rules[1] - 1] = criterion[1]
+            is_construct_id = True
+
+    if is_construct_id:
+        src_rid_parsed = source_rid_list[rules[1] - 1] + "-" + source_rid_list[rules[2] - 1]
+    else:
+        src_rid_parsed = source_rid
+    return src_rid_parsed == target_rid_parsed
+
+
+class RouteIdRuleTestCase(unittest.TestCase):
+
+    def assert_same_as_compare_route_id(self, rules, source_rids, target_rids):
+        rule = RouteIdRule(rules[0], rules[1], rules[2], rules[5], rules[6], rules[7], rules[8], rules[9])
+        for source_rid in source_rids:
+            for target_rid in target_rids:
+                self.assertEqual(rule.is_matching(source_rid, target_rid),
+                                 compare_route_id(rules, source_rid, target_rid), (source_rid, target_rid))
+
+    def test_default_rules(self):
+        # params.ini defaults: HERE 'TYPE-NUMBER-DIRECTION', DOT type at 5-6 and number at 7-11
+        rules = ['-;space', 1, 2, 3, '-;space', 5, 6, 7, 11, 'US US;I IR;OH SR']
+        source_rids = ['I-75-N', 'I 75 S', 'US-23-N', 'OH-4-E', 'OH 14', 'CR-12-N', 'I-71-N']
+        target_rids = ['FRA_IR00075**C', 'FRA_US00023**C', 'FRA_SR00004**C', 'FRA_SR00014**C', 'FRA_CR00012**C']
+        self.assert_same_as_compare_route_id(rules, source_rids, target_rids)
+
+        rule = RouteIdRule(rules[0], rules[1], rules[2], rules[5], rules[6], rules[7], rules[8], rules[9])
+        self.assertEqual(rule.source_key('I 75 S'), 'IR-75')
+        self.assertEqual(rule.source_key('CR-12-N'), 'CR-12-N')
+        self.assertEqual(rule.target_key('FRA_SR00004**C'), 'SR-4')
+        self.assertTrue(rule.is_matching('OH-4-E', 'FRA_SR00004**C'))
+        self.assertFalse(rule.is_matching('CR-12-N', 'FRA_CR00012**C'))
+
+    def test_match_columns(self):
+        rule = RouteIdRule('-;space', 1, 2, 5, 6, 7, 11, 'US US;I IR;OH SR')
+        source_rids = ['I-75-N', 'OH 4 E', 'CR-12-N', 'I-75-S', None, 'US-23-N']
+        target_rids = ['FRA_IR00075**C', 'FRA_SR00004**C', 'FRA_CR00012**C', 'FRA_IRABCDE**C', 'FRA_IR00075**C',
+                       None]
+        self.assertEqual(rule.match_columns(source_rids, target_rids), [True, True, False, False, False, False])
+        self.assertEqual(rule.match_columns(source_rids, target_rids),
+                         [rule.is_matching(source_rid, target_rid)
+                          for source_rid, target_rid in zip(source_rids, target_rids)])
+        self.assertEqual(rule.match_columns([], []), [])
+
+    def test_other_positions(self):
+        # route type after a prefix, number at 3, a chain of renamed route types
+        rules = ['_', 2, 3, 4, '_', 1, 2, 3, 6, 'A B;B C;S SR']
+        source_rids = ['X_A_7_N', 'X_B_7_N', 'X_C_7_N', 'X_S_120_E', 'X_SR_120_E']
+        target_rids = ['C0007', 'B0007', 'SR0120']
+        self.assert_same_as_compare_route_id(rules, source_rids, target_rids)
+
+        rule = RouteIdRule(rules[0], rules[1], rules[2], rules[5], rules[6], rules[7], rules[8], rules[9])
+        self.assertEqual(rule.source_key('X_A_7_N'), 'C-7')
+        self.assertEqual(rule.source_key('X_B_7_N'), 'C-7')
+
+    def test_unparsable_route_ids(self):
+        rule = RouteIdRule('-;space', 1, 2, 5, 6, 7, 11, 'US US;I IR;OH SR')
+        # compare_route_id raised a ValueError on a DOT route number that is not a number, now it is no match
+        self.assertRaises(ValueError, compare_route_id, ['-;space', 1, 2, 3, '-;space', 5, 6, 7, 11, 'I IR'],
+                          'I-75-N', 'FRA_IRABCDE**C')
+        self.assertEqual(rule.target_key('FRA_IRABCDE**C'), None)
+        self.assertFalse(rule.is_matching('I-75-N', 'FRA_IRABCDE**C'))
+        # compare_route_id raised an IndexError on a HERE route id without a route number, now it is kept as it is
+        self.assertRaises(IndexError, compare_route_id, ['-;space', 1, 2, 3, '-;space', 5, 6, 7, 11, 'I IR'],
+                          'I', 'FRA_IR00075**C')
+        self.assertEqual(rule.source_key('I'), 'I')
+        self.assertFalse(rule.is_matching(None, 'FRA_IR00075**C'))
+        self.assertFalse(rule.is_matching('I-75-N', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import src.tss.route_validation_util as route_validation_util
+from src.tss.polyline_util import PolylineArray
+
+
+class RouteValidationUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.routes = PolylineArray.from_features([
+            ('increasing', [[(0, 0, 0), (1, 0, 1), (2, 0, 1), (3, 0, 1), (4, 0, 4)]]),
+            ('decreasing', [[(0, 0, 9), (1, 0, 8)], [(1, 0, 8), (2, 0, 7)]]),
+            ('loop', [[(0, 0, 0), (1, 0, 1), (1, 1, 0.5), (0, 1, 2)]]),
+            ('gapped', [[(0, 0, 0), (1, 0, 1)], [(1, 0.5, 1), (2, 0, 2)], [(5, 0, 2), (6, 0, 3)]]),
+            ('constant', [[(0, 0, 5), (1, 0, 5)]]),
+            ('no_measure', [[(0, 0, np.nan), (1, 0, np.nan)]])
+        ], has_m=True)
+
+    def test_validate_routes(self):
+        validation = route_validation_util.validate_routes(self.routes, gap_tolerance=0.6)
+        self.assertEqual(validation.vertex_counts.tolist(), [5, 4, 4, 6, 2, 2])
+        self.assertEqual(validation.part_counts.tolist(), [1, 2, 1, 3, 1, 1])
+        self.assertEqual(validation.directions.tolist(), [1, -1, None, 1, 0, 0])
+        self.assertEqual(validation.reversal_counts.tolist(), [0, 0, 2, 0, 0, 0])
+        self.assertEqual(validation.level_run_counts.tolist(), [1, 1, 0, 2, 1, 0])
+        self.assertEqual(validation.gap_counts.tolist(), [0, 0, 0, 1, 0, 0])
+        self.assertEqual(validation.non_monotonic_route_ids(), ['loop', 'no_measure'])
+        self.assertEqual(validation.gapped_route_ids(), ['gapped'])
+        self.assertEqual(validation.max_gaps[3], 3)
+        self.assertEqual(validation.mmins.tolist()[:5], [0, 7, 0, 0, 5])
+        self.assertEqual(validation.mmaxs.tolist()[:5], [4, 9, 2, 3, 5])
+        self.assertTrue(np.isnan(validation.mmins[5]))
+
+        validation = route_validation_util.validate_routes(self.routes)
+        self.assertEqual(validation.gap_counts.tolist(), [0, 0, 0, 2, 0, 0])
+
+    def test_shared_vertex(self):
+        routes = PolylineArray.from_features([
+            # the second part starts on a middle vertex of the first one (overlapping links)
+            ('overlap', [[(0, 0, 0), (1, 0, 1), (2, 0, 2)], [(1, 0, 1), (1, 5, 6)]]),
+            ('touching', [[(0, 0, 0), (1, 0, 1)], [(1, 5, 6), (1, 0, 1)]]),
+            ('apart', [[(0, 0, 0), (1, 0, 1)], [(1, 0.1, 1), (2, 0, 2)]]),
+            # a vertex shared with a part that is not the next one
+            ('not_next', [[(0, 0, 0), (1, 0, 1)], [(3, 0, 3), (4, 0, 4)], [(1, 0, 1), (2, 0, 2)]])
+        ], has_m=True)
+        validation = route_validation_util.validate_routes(routes)
+        self.assertEqual(validation.gap_counts.tolist(), [0, 0, 1, 2])
+        self.assertEqual(validation.gapped_route_ids(), ['apart', 'not_next'])
+
+    def test_rows(self):
+        validation = route_validation_util.validate_routes(self.routes, gap_tolerance=0.6)
+        self.assertEqual(len(validation.rows()), 6)
+        self.assertEqual(validation.rows(only_invalid=True), [
+            ('loop', 4, 1, 'Both', 'No', 2, 0, 0, 0, None, 0.0, 2.0),
+            ('gapped', 6, 3, 'Increasing', 'Yes', 0, 2, 0, 1, 3.0, 0.0, 3.0),
+            ('no_measure', 2, 1, 'Constant', 'No', 0, 0, 2, 0, None, None, None)
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
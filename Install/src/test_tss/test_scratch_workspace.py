@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+import src.util.helper as helper
+
+
+class StubDescribe(object):
+
+    def __init__(self, data_type):
+        self.dataType = data_type
+
+
+class StubArcpy(object):
+    """
+    The arcpy functions used by ScratchWorkspace, on the folders of the test and a set of in-memory dataset names
+    """
+
+    def __init__(self):
+        self.in_memory = set()
+        self.created_gdbs = []
+
+    def Describe(self, path):
+        return StubDescribe('Folder')
+
+    def Exists(self, dataset):
+        return dataset in self.in_memory or os.path.exists(dataset)
+
+    def CreateFileGDB_management(self, folder, name):
+        self.created_gdbs.append(os.path.join(folder, name))
+        os.mkdir(os.path.join(folder, name))
+
+    def Delete_management(self, dataset):
+        if dataset in self.in_memory:
+            self.in_memory.remove(dataset)
+        else:
+            shutil.rmtree(dataset)
+
+
+class ScratchWorkspaceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch_folder = tempfile.mkdtemp()
+        self.arcpy = StubArcpy()
+        self.helper_arcpy = getattr(helper, 'arcpy', None)
+        helper.arcpy = self.arcpy
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        helper.arcpy = self.helper_arcpy
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.scratch_folder)
+
+    def test_path(self):
+        workspace = helper.ScratchWorkspace(self.scratch_folder, in_memory_max_rows=100)
+        self.assertEqual(workspace.path('small', estimated_rows=100),
+                         'in_memory/{0}_small'.format(workspace.prefix))
+        gdb = os.path.join(workspace.folder, 'scratch.gdb')
+        self.assertEqual(workspace.path('large', estimated_rows=101), os.path.join(gdb, 'large'))
+        self.assertEqual(workspace.path('unknown'), os.path.join(gdb, 'unknown'))
+        self.assertEqual(workspace.path('checkpoint', estimated_rows=1, persistent=True),
+                         os.path.join(gdb, 'checkpoint'))
+        self.assertEqual(workspace.in_memory_datasets, ['in_memory/{0}_small'.format(workspace.prefix)])
+        # the geodatabase is created once
+        self.assertTrue(os.path.isdir(gdb))
+        self.assertEqual(self.arcpy.created_gdbs, [gdb])
+
+        # everything on disk by default
+        workspace = helper.ScratchWorkspace(self.scratch_folder)
+        self.assertEqual(workspace.path('small', estimated_rows=0),
+                         os.path.join(workspace.folder, 'scratch.gdb', 'small'))
+        self.assertEqual(workspace.in_memory_datasets, [])
+
+    def test_run_name(self):
+        runs_folder = os.path.join(self.scratch_folder, 'runs')
+        first = helper.ScratchWorkspace(self.scratch_folder)
+        second = helper.ScratchWorkspace(self.scratch_folder)
+        self.assertNotEqual(first.folder, second.folder)
+        self.assertNotEqual(first.prefix, second.prefix)
+        self.assertEqual(os.path.dirname(first.folder), runs_folder)
+
+        named = helper.ScratchWorkspace(self.scratch_folder, run_name='county_1')
+        self.assertEqual(named.folder, os.path.join(runs_folder, 'county_1'))
+        self.assertTrue(os.path.isdir(named.folder))
+        # a resumed run finds the same folder
+        resumed = helper.ScratchWorkspace(self.scratch_folder, run_name='county_1')
+        self.assertEqual((resumed.folder, resumed.prefix), (named.folder, named.prefix))
+
+    def test_cleanup(self):
+        workspace = helper.ScratchWorkspace(self.scratch_folder, run_name='county_1', in_memory_max_rows=10)
+        other = helper.ScratchWorkspace(self.scratch_folder, run_name='county_2', in_memory_max_rows=10)
+        for run in [workspace, other]:
+            self.arcpy.in_memory.add(run.path('small', estimated_rows=1))
+            run.path('large', estimated_rows=100)
+
+        workspace.cleanup()
+        self.assertFalse(os.path.exists(workspace.folder))
+        self.assertEqual(workspace.in_memory_datasets, [])
+        # the other run keeps its datasets
+        self.assertTrue(os.path.isdir(os.path.join(other.folder, 'scratch.gdb')))
+        self.assertEqual(self.arcpy.in_memory, set(other.in_memory_datasets))
+
+    def test_with_scratch_workspace(self):
+        # the default scratch folder is under the home directory
+        os.environ['HOME'] = os.environ['USERPROFILE'] = self.scratch_folder
+        runs_folder = os.path.join(self.scratch_folder, '.HERELinearConflation', 'runs')
+        folders = []
+
+        @helper.with_scratch_workspace
+        def tool(**kwargs):
+            folders.append(kwargs['scratch_workspace'].path('large'))
+            self.assertTrue(os.path.isdir(kwargs['scratch_workspace'].folder))
+            if kwargs.get('fail'):
+                raise ValueError('failed')
+            return kwargs['value']
+
+        self.assertEqual(tool(value=1), 1)
+        self.assertEqual(tool(value=2, scratch_workspace=None), 2)
+        self.assertRaises(ValueError, tool, value=3, fail=True)
+        # the workspaces created for the calls are removed, even when the call fails
+        self.assertEqual(len(set(folders)), 3)
+        self.assertEqual(os.listdir(runs_folder), [])
+
+        # the workspace of the caller is used and kept
+        workspace = helper.ScratchWorkspace(self.scratch_folder)
+        self.assertEqual(tool(value=4, scratch_workspace=workspace), 4)
+        self.assertEqual(folders[-1], os.path.join(workspace.folder, 'scratch.gdb', 'large'))
+        self.assertTrue(os.path.isdir(workspace.folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from src.tss.polyline_util import PolylineArray
+from src.tss.segmentation_util import RouteSegmenter
+
+
+class SegmentationUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.routes = PolylineArray.from_features([
+            ('A', [[(0, 0, 0), (10, 0, 10), (10, 10, 20)]]),
+            # measures decreasing along the route
+            ('B', [[(0, 20, 30), (20, 20, 10)]]),
+            # gap between (10, 30) and (20, 30), not measured
+            ('C', [[(0, 30, 0), (10, 30, 10)], [(20, 30, 10), (30, 30, 20)]]),
+            ('NON_MONOTONIC', [[(0, 40, 0), (10, 40, 10), (20, 40, 5)]])
+        ], has_m=True)
+        self.segmenter = RouteSegmenter(self.routes)
+
+    def test_route_indexes(self):
+        self.assertEqual(self.segmenter.route_indexes(['C', u' A ', 'D', None]).tolist(), [2, 0, -1, -1])
+        self.assertEqual(self.segmenter.non_monotonic_route_ids(), ['NON_MONOTONIC'])
+
+    def test_point_events(self):
+        route_index = self.segmenter.route_indexes(['A', 'A', 'B', 'C', 'A', 'NON_MONOTONIC', 'D', 'A'])
+        xy, m, located = self.segmenter.point_events(route_index, [5, 15, 25, 15, 20.001, 5, 5, np.nan],
+                                                     tolerance=0.01)
+        self.assertEqual(located.tolist(), [True, True, True, True, True, False, False, False])
+        self.assertTrue(np.allclose(xy[:5], [[5, 0], [10, 5], [5, 20], [25, 30], [10, 10]]))
+        self.assertTrue(np.allclose(m[:5], [5, 15, 25, 15, 20]))
+        self.assertTrue(np.isnan(xy[5:]).all())
+
+        xy, m, located = self.segmenter.point_events(route_index[:1], [20.5])
+        self.assertEqual(located.tolist(), [False])
+
+    def test_line_events(self):
+        route_index = self.segmenter.route_indexes(['A', 'A', 'B', 'C', 'A', 'A', 'D'])
+        events, located = self.segmenter.line_events(route_index, [5, 15, 25, 5, 10, 18, 0],
+                                                     [15, 5, 15, 15, 30, 18, 10])
+        self.assertEqual(located.tolist(), [True, True, True, True, True, False, False])
+        self.assertEqual(len(events), 7)
+
+        event = events.subset([0])
+        self.assertEqual(event.xy.tolist(), [[5, 0], [10, 0], [10, 5]])
+        self.assertEqual(event.m.tolist(), [5, 10, 15])
+        # the measures of the event are swapped, the line still follows the route
+        self.assertEqual(events.subset([1]).xy.tolist(), event.xy.tolist())
+
+        event = events.subset([2])
+        self.assertEqual(event.xy.tolist(), [[5, 20], [15, 20]])
+        self.assertEqual(event.m.tolist(), [25, 15])
+
+        # one part on each side of the gap
+        event = events.subset([3])
+        self.assertEqual(event.part_count, 2)
+        self.assertEqual(event.xy.tolist(), [[5, 30], [10, 30], [20, 30], [25, 30]])
+
+        # clipped to the end of the route
+        event = events.subset([4])
+        self.assertEqual(event.xy.tolist(), [[10, 0], [10, 10]])
+
+        # zero length and unknown route
+        self.assertEqual(events.subset([5, 6]).part_count, 0)
+
+    def test_save_load(self):
+        folder = tempfile.mkdtemp()
+        try:
+            self.segmenter.save(folder)
+            segmenter = RouteSegmenter.load(folder)
+            self.assertEqual(segmenter.route_ids, ['A', 'B', 'C', 'NON_MONOTONIC'])
+            self.assertEqual(segmenter.non_monotonic_route_ids(), ['NON_MONOTONIC'])
+            xy, m, located = segmenter.point_events(segmenter.route_indexes(['B']), [25])
+            self.assertTrue(np.allclose(xy, [[5, 20]]))
+            del segmenter
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
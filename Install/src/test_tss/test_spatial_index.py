@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from src.tss.polyline_util import PolylineArray
+from src.tss.spatial_index import SegmentGridIndex, expand_ranges
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.routes = PolylineArray.from_features([
+            ('r1', [[(0, 0), (10, 0), (20, 0)]]),
+            ('r2', [[(5, -5), (5, 5)]]),
+            ('r3', [[(100, 100), (110, 100)]])
+        ])
+        self.index = SegmentGridIndex.build(self.routes, cell_size=4, oids=[11, 12, 13])
+        self.temp_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def test_expand_ranges(self):
+        owner, value = expand_ranges(np.array([3, 10, 7]), np.array([2, 0, 1]))
+        self.assertEqual(owner.tolist(), [0, 0, 2])
+        self.assertEqual(value.tolist(), [3, 4, 7])
+
+    def test_query_segments(self):
+        query_index, segment_index = self.index.query_segments([(0, 1), (50, 50)], [(20, 1), (60, 50)], 1.5)
+        self.assertEqual(query_index.tolist(), [0, 0, 0])
+        self.assertEqual(sorted(self.index.segment_feature[segment_index].tolist()), [0, 0, 1])
+
+    def test_query_point_features(self):
+        point_index, feature_index = self.index.query_point_features([(5, 0.5), (105, 101), (50, 50)], 1)
+        self.assertEqual(list(zip(point_index.tolist(), feature_index.tolist())), [(0, 0), (0, 1), (1, 2)])
+
+    def test_save_load(self):
+        path = os.path.join(self.temp_folder, 'routes.npz')
+        self.index.save(path)
+        index = SegmentGridIndex.load(path)
+        self.assertEqual(index.polylines.ids, ['r1', 'r2', 'r3'])
+        self.assertEqual(index.oids, [11, 12, 13])
+        self.assertEqual(index.cell_entries.tolist(), self.index.cell_entries.tolist())
+        point_index, feature_index = index.query_point_features([(105, 101)], 1)
+        self.assertEqual(feature_index.tolist(), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
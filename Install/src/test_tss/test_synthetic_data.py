@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+import src.benchmark.synthetic_data as synthetic_data
+
+
+class SyntheticDataTestCase(unittest.TestCase):
+
+    def test_densify(self):
+        points = synthetic_data.densify([(0, 0), (10, 0), (10, 5)], 4)
+        self.assertTrue(np.allclose(points, [[0, 0], [10 / 3.0, 0], [20 / 3.0, 0], [10, 0], [10, 2.5], [10, 5]]))
+
+    def test_build_route_array(self):
+        routes, route_attributes = synthetic_data.build_route_array(
+            [('a', 'A ST', np.array([(0.0, 0.0), (3.0, 4.0)])), ('b', 'B ST', np.array([(0.0, 0.0), (0.0, 10.0)]))],
+            0.1, 100)
+        self.assertEqual(routes.ids, ['a', 'b'])
+        self.assertEqual(routes.m.tolist(), [0, 0.5, 0, 1])
+        self.assertEqual(route_attributes, [('A ST', 'C0_0'), ('B ST', 'C0_0')])
+
+    def test_derive_links(self):
+        routes, route_attributes = synthetic_data.build_route_array(
+            [('a', 'A ST', synthetic_data.densify([(0, 0), (80, 0)], 10))], 1.0, 1000)
+        network = synthetic_data.derive_links(routes, route_attributes, vertices_per_link=2)
+        self.assertEqual(len(network.links), 4)
+        self.assertEqual(network.link_measures.tolist(), [[0, 20], [20, 40], [40, 60], [60, 80]])
+        self.assertEqual(network.xref_rows()[0], {'HERE_LID': 1, 'DOT_RID': 'a', 'FROM_MEASURE': 0, 'TO_MEASURE': 20})
+
+        network = synthetic_data.derive_links(routes, route_attributes, vertices_per_link=2, split_ratio=1.0,
+                                              loop_ratio=1.0)
+        self.assertEqual(len(network.links), 16)
+        self.assertEqual(network.link_route_ids.count(None), 8)
+        loops = network.links.subset(range(8, 16))
+        self.assertTrue(np.allclose(loops.first_points(), loops.last_points()))
+
+    def test_generate_network(self):
+        for layout in ('grid', 'radial'):
+            network = synthetic_data.generate_network(1000, layout, seed=1)
+            self.assertTrue(900 < len(network.links) < 1300)
+            self.assertEqual(len(network.link_attributes), len(network.links))
+            route_ids, measures = network.generate_events(10)
+            self.assertEqual(len(route_ids), 10)
+            self.assertTrue((measures[:, 1] >= measures[:, 0]).all())
+
+        self.assertRaises(ValueError, synthetic_data.generate_network, 1000, 'spiral')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from src.tss.instrument_util import RunReport
+import transfer_dot_event_attribute_to_here
+import transfer_dot_events_to_here_batch
+
+
+class LoadEventConfigsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'events.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, events):
+        with open(self.path, 'w') as f:
+            json.dump(events, f)
+
+    def test_load_event_configs(self):
+        events = [{'name': 'AADT', 'dot_event': 'dot.gdb/AADT', 'dot_event_rid_field': 'ROUTE_ID',
+                   'dot_event_fmeas_field': 'FROM_MEASURE', 'dot_event_tmeas_field': 'TO_MEASURE',
+                   'fields_to_transfer': ['AADT'], 'output_event_feature': 'here.gdb/HERE_AADT'}]
+        self.write(events)
+        self.assertEqual(transfer_dot_events_to_here_batch.load_event_configs(self.path), events)
+
+    def test_load_event_configs_missing_key(self):
+        self.write([{'dot_event': 'dot.gdb/AADT', 'dot_event_rid_field': 'ROUTE_ID',
+                     'dot_event_fmeas_field': 'FROM_MEASURE', 'output_event_feature': 'here.gdb/HERE_AADT'},
+                    {'dot_event': 'dot.gdb/SPEED', 'dot_event_rid_field': 'ROUTE_ID',
+                     'dot_event_fmeas_field': '', 'output_event_feature': 'here.gdb/HERE_SPEED'}])
+        self.assertRaises(ValueError, transfer_dot_events_to_here_batch.load_event_configs, self.path)
+
+
+class TransferDotEventsToHereTestCase(unittest.TestCase):
+    """
+    Runs transfer_dot_events_to_here with the counts, route metrics and transfer of each event layer swapped for
+    stubs recording their calls
+    """
+
+    def setUp(self):
+        self.module_functions = dict((name, getattr(transfer_dot_event_attribute_to_here, name)) for name in
+                                     ['get_count', 'read_transfer_route_metrics', 'transfer_dot_event_task'])
+        self.event_counts = {'dot.gdb/A': 10, 'dot.gdb/B': 300, 'dot.gdb/C': 20}
+        self.read_metrics_calls = 0
+        self.tasks = []
+        transfer_dot_event_attribute_to_here.get_count = lambda dataset: self.event_counts[dataset]
+        transfer_dot_event_attribute_to_here.read_transfer_route_metrics = self.read_transfer_route_metrics
+        transfer_dot_event_attribute_to_here.transfer_dot_event_task = self.transfer_dot_event_task
+
+    def tearDown(self):
+        for name, function in self.module_functions.items():
+            setattr(transfer_dot_event_attribute_to_here, name, function)
+
+    def read_transfer_route_metrics(self, *args, **kwargs):
+        self.read_metrics_calls += 1
+        return 'here metrics', 'dot metrics'
+
+    def transfer_dot_event_task(self, task):
+        self.tasks.append(task)
+        if task['name'] == 'B':
+            raise Exception("Cannot create the scratch workspace")
+        return {'name': task['name'], 'output_event_feature': task['output_event_feature'],
+                'event_count': task['event_count'], 'error': None, 'status': 'success',
+                'report': {'wall_seconds': 1.0}}
+
+    def test_transfer_dot_events_to_here(self):
+        events = [{'name': name, 'dot_event': 'dot.gdb/{0}'.format(name), 'dot_event_rid_field': 'ROUTE_ID',
+                   'dot_event_fmeas_field': 'FROM_MEASURE', 'output_event_feature': 'here.gdb/{0}'.format(name)}
+                  for name in ['A', 'B', 'C']]
+        results = transfer_dot_event_attribute_to_here.transfer_dot_events_to_here(
+            events=events, here_route='here.gdb/routes', dot_route='dot.gdb/routes', scratch_folder='scratch',
+            processes=1, run_report=RunReport('test'))
+
+        # largest event layers first
+        self.assertEqual([task['name'] for task in self.tasks], ['B', 'C', 'A'])
+        # the route metrics are read once and shared by the event layers
+        self.assertEqual(self.read_metrics_calls, 1)
+        self.assertTrue(all(task['here_route_metrics'] == 'here metrics' for task in self.tasks))
+        # results in the order of the events, the failed event layer does not stop the others
+        self.assertEqual([result['name'] for result in results], ['A', 'B', 'C'])
+        self.assertEqual([result['status'] for result in results], ['success', 'failed', 'success'])
+        self.assertEqual([result['event_count'] for result in results], [10, 300, 20])
+        self.assertEqual(results[1]['error'], "Cannot create the scratch workspace")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -29,6 +29,7 @@ class DaoUtilTestCase(unittest.TestCase):
     def test_build_string_in_sql_expression(self):
         self.assertEqual(dao_util.build_string_in_sql_expression("field", ["a", "b", "c", "d"]), "field in ('a','b','c','d')")
         self.assertEqual(dao_util.build_string_in_sql_expression("field", []), "1=2")
+        self.assertEqual(dao_util.build_string_in_sql_expression("field", ["O'BRIEN", "a"]), "field in ('O''BRIEN','a')")
 
     def test_subset_data_exist(self):
         self.assertEqual(dao_util.subset_data_exist(self.table, "1=1"), True)
@@ -1,5 +1,7 @@
 import unittest
+import numpy as np
 import src.tss.ags.geometry_util as geometry_util
+from src.tss.polyline_util import PolylineArray
 
 
 class GeometryUtilTestCase(unittest.TestCase):
@@ -10,6 +12,29 @@ class GeometryUtilTestCase(unittest.TestCase):
         self.assertAlmostEqual(geometry_util.angle_between_two_vectors([0, -1], [1, 1]), 135)
         self.assertAlmostEqual(geometry_util.angle_between_two_vectors([1, 1, 1], [1, 0, 1]), 35.2643896827)
 
+    def test_angles_between_vectors(self):
+        angles = geometry_util.angles_between_vectors([[1, 1], [1, 1], [0, 0]], [[1, 0], [0, -1], [1, 0]])
+        self.assertEqual(np.round(angles, 6).tolist(), [45, 135, -1])
+        self.assertEqual(geometry_util.angles_between_vectors([[2, 2]], [[1, 1]]).tolist(), [0])
+
+    def test_line_angles(self):
+        angles = geometry_util.line_angles([[1, 1], [1, 1], [0, 0]], [[1, 0], [0, -1], [1, 0]])
+        self.assertEqual(np.round(angles[:2], 6).tolist(), [45, 45])
+        self.assertTrue(np.isnan(angles[2]))
+
+    def test_calculate_approach_angles(self):
+        segments = PolylineArray.from_features([
+            ('s1', [[(0, 0), (0, 10)]]),
+            ('s2', [[(10, 10), (0, 0)]])
+        ])
+        angles = geometry_util.calculate_approach_angles(segments, [(0, 0), (0, 0)], 2, "N")
+        self.assertEqual(np.round(angles, 6).tolist(), [180, 135])
+
+    def test_angles_to_directions(self):
+        self.assertEqual(geometry_util.angles_to_directions([0, 22.5, 100, 200, 337.5], "N").tolist(),
+                         ["North", "NorthEast", "East", "South", "North"])
+        self.assertEqual(geometry_util.angles_to_directions([0, 280], "E").tolist(), ["East", "North"])
+
     def test_angle_larger_than_pi(self):
         self.assertFalse(geometry_util.angle_larger_than_pi([1, 1], [1, 0]))
         self.assertTrue(geometry_util.angle_larger_than_pi([0, -1], [1, 1]))
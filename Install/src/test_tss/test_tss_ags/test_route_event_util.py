@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+import src.tss.ags.route_event_util as route_event_util
+import src.tss.ags.route_metrics_util as route_metrics_util
+
+
+class StubDescribe(object):
+
+    def __init__(self, catalog_path):
+        self.catalogPath = catalog_path
+        self.spatialReference = 'sr'
+
+
+class StubArcpy(object):
+
+    def __init__(self, describe):
+        self.describe = describe
+
+    def Describe(self, dataset):
+        return self.describe
+
+
+class StubSegmenter(object):
+
+    def __init__(self):
+        self.folders = []
+
+    def save(self, folder):
+        self.folders.append(folder)
+
+
+class GetRouteSegmenterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.arcpy = route_event_util.arcpy, route_metrics_util.arcpy
+        self.load_route_segmenter = route_event_util.load_route_segmenter
+        self.network = os.path.join(self.temp_folder, u'routes.shp')
+        for extension in ['.shp', '.shx', '.dbf']:
+            with open(os.path.splitext(self.network)[0] + extension, 'w') as f:
+                f.write('routes')
+        describe = StubDescribe(self.network)
+        route_event_util.arcpy = route_metrics_util.arcpy = StubArcpy(describe)
+        self.segmenter = StubSegmenter()
+        route_event_util.load_route_segmenter = lambda network, route_id_field, where_clause: (self.segmenter, 'sr')
+
+    def tearDown(self):
+        route_event_util.arcpy, route_metrics_util.arcpy = self.arcpy
+        route_event_util.load_route_segmenter = self.load_route_segmenter
+        shutil.rmtree(self.temp_folder)
+
+    def test_cache_key(self):
+        cache_folder = os.path.join(self.temp_folder, 'cache')
+        self.assertEqual(route_event_util.get_route_segmenter(self.network, 'ROUTE_ID', cache_folder=cache_folder),
+                         (self.segmenter, 'sr'))
+        # non-ASCII text of the parameters
+        route_event_util.get_route_segmenter(self.network, 'ROUTE_ID', u"ROUTE_NAME = 'Stra\xdfe'",
+                                             cache_folder=cache_folder)
+        route_event_util.get_route_segmenter(self.network, u'ROUTE_\xd6ID', cache_folder=cache_folder)
+        # one folder per route id field and filter
+        self.assertEqual(len(set(self.segmenter.folders)), 3)
+        self.assertTrue(all(os.path.basename(folder).startswith('routes.shp_segmenter_')
+                            for folder in self.segmenter.folders))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import src.tss.ags.route_metrics_util as route_metrics_util
+from src.tss.ags.route_metrics_util import RouteMetrics
+
+
+class StubDescribe(object):
+
+    def __init__(self, catalog_path, dsid):
+        self.catalogPath = catalog_path
+        self.DSID = dsid
+
+
+class StubArcpy(object):
+
+    def __init__(self, describe):
+        self.describe = describe
+
+    def Describe(self, dataset):
+        return self.describe
+
+
+class RouteMetricsUtilTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.route_metrics = RouteMetrics(['r1', 'r2'], [10.5, 20], [0, np.nan], [10, np.nan])
+        self.temp_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def test_to_dict(self):
+        self.assertEqual(self.route_metrics.to_dict(), {
+            'r1': {'length': 10.5, 'mmin': 0, 'mmax': 10},
+            'r2': {'length': 20, 'mmin': None, 'mmax': None}
+        })
+        self.assertEqual(list(self.route_metrics.to_dict(['r2', 'r3']).keys()), ['r2'])
+
+    def test_save_load(self):
+        path = os.path.join(self.temp_folder, 'metrics.npz')
+        self.route_metrics.save(path)
+        route_metrics = RouteMetrics.load(path)
+        self.assertEqual(route_metrics.route_ids, ['r1', 'r2'])
+        self.assertEqual(route_metrics.to_dict(), self.route_metrics.to_dict())
+
+
+class DatasetStampTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.gdb = os.path.join(self.temp_folder, 'data.gdb')
+        os.mkdir(self.gdb)
+        for name in ['a00000001.gdbtable', 'a0000000a.gdbtable', 'a0000000a.gdbtablx', 'a0000000b.gdbtable']:
+            self.write(name, 'rows')
+        self.arcpy = route_metrics_util.arcpy
+        route_metrics_util.arcpy = StubArcpy(StubDescribe(os.path.join(self.gdb, 'routes'), 10))
+
+    def tearDown(self):
+        route_metrics_util.arcpy = self.arcpy
+        shutil.rmtree(self.temp_folder)
+
+    def write(self, name, content, mtime=1000000000):
+        path = os.path.join(self.gdb, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def test_get_dataset_stamp(self):
+        stamp = route_metrics_util.get_dataset_stamp('routes')
+        # writes to other datasets and locks of the workspace do not change the stamp
+        self.write('a0000000b.gdbtable', 'other rows', 2000000000)
+        self.write('a0000000a.host.1234.sr.lock', '', 2000000000)
+        self.write('_gdb.host.1234.sr.lock', '', 2000000000)
+        self.assertEqual(route_metrics_util.get_dataset_stamp('routes'), stamp)
+        key = route_metrics_util.get_dataset_key('routes', ['ROUTE_ID'])
+
+        self.write('a0000000a.gdbtable', 'new rows', 2000000000)
+        self.assertNotEqual(route_metrics_util.get_dataset_stamp('routes'), stamp)
+        self.assertNotEqual(route_metrics_util.get_dataset_key('routes', ['ROUTE_ID']), key)
+
+    def test_get_dataset_key(self):
+        route_metrics_util.arcpy.describe.catalogPath = os.path.join(self.gdb, u'r\xf6utes')
+        key = route_metrics_util.get_dataset_key('routes', ['ROUTE_ID'])
+        self.assertNotEqual(route_metrics_util.get_dataset_key('routes', ['ROUTE_ID'], "ACTIVE = 1"), key)
+        self.assertNotEqual(route_metrics_util.get_dataset_key('routes', ['ROUTE_ID'], version='v2'), key)
+        self.assertEqual(route_metrics_util.get_dataset_key('routes', ['ROUTE_ID']), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+from src.tss.ags.spatial_index_util import build_active_where_clause
+
+
+class SpatialIndexUtilTestCase(unittest.TestCase):
+
+    def test_build_active_where_clause(self):
+        self.assertEqual(build_active_where_clause('FROM_DATE', 'TO_DATE'),
+                         "(FROM_DATE is null or FROM_DATE <= CURRENT_TIMESTAMP) and "
+                         "(TO_DATE is null or TO_DATE > CURRENT_TIMESTAMP)")
+        self.assertEqual(build_active_where_clause('FROM_DATE', ''), "1=1")
+        self.assertEqual(build_active_where_clause(None, 'TO_DATE'), "1=1")
+
+
+if __name__ == '__main__':
+    unittest.main()
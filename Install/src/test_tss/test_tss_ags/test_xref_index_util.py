@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+import src.tss.ags.xref_index_util as xref_index_util
+import src.tss.ags.route_metrics_util as route_metrics_util
+
+
+class StubDescribe(object):
+
+    def __init__(self, catalog_path):
+        self.catalogPath = catalog_path
+
+
+class StubCursor(list):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class StubDa(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def SearchCursor(self, table, fields):
+        self.reads += 1
+        return StubCursor(self.rows)
+
+
+class StubArcpy(object):
+
+    def __init__(self, catalog_path, rows):
+        self.describe = StubDescribe(catalog_path)
+        self.da = StubDa(rows)
+
+    def Describe(self, dataset):
+        return self.describe
+
+
+class GetXrefIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_folder = tempfile.mkdtemp()
+        self.arcpy = xref_index_util.arcpy, route_metrics_util.arcpy
+        self.get_dataset_stamp = route_metrics_util.get_dataset_stamp
+        # XREF table of an enterprise geodatabase with a non-ASCII name
+        stub = StubArcpy(u'C:\\connections\\d\xf6t.sde\\XREF', [(101, 'R1', 0, 10), (102, 'R1', 10, 25)])
+        xref_index_util.arcpy = route_metrics_util.arcpy = stub
+        route_metrics_util.get_dataset_stamp = lambda dataset: '2|0|0|1|1'
+
+    def tearDown(self):
+        xref_index_util.arcpy, route_metrics_util.arcpy = self.arcpy
+        route_metrics_util.get_dataset_stamp = self.get_dataset_stamp
+        shutil.rmtree(self.cache_folder)
+
+    def test_cache(self):
+        index = xref_index_util.get_xref_index('XREF', self.cache_folder)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(len(os.listdir(self.cache_folder)), 1)
+        # the second call loads the saved index
+        index = xref_index_util.get_xref_index('XREF', self.cache_folder, mmap_mode=None)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(xref_index_util.arcpy.da.reads, 1)
+
+        # another version of the table
+        route_metrics_util.get_dataset_stamp = lambda dataset: '3|0|0|1|1'
+        xref_index_util.get_xref_index('XREF', self.cache_folder)
+        self.assertEqual(xref_index_util.arcpy.da.reads, 2)
+        self.assertEqual(len(os.listdir(self.cache_folder)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
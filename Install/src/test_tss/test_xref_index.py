@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from src.tss.xref_index import XrefIndex, bounded_searchsorted
+
+
+class XrefIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = XrefIndex.build([
+            (101, 'R1', 0, 10),
+            (102, 'R1', 10, 25),
+            # against the direction of the route
+            (103, 'R1', 40, 30),
+            # overlapping link
+            (104, 'R1', 20, 22),
+            (101, 'R2', 5, 15),
+            (105, 'R2', None, 3),
+            (None, 'R2', 0, 1)
+        ])
+
+    def test_bounded_searchsorted(self):
+        values = np.array([1, 3, 3, 5, 0, 2])
+        self.assertEqual(bounded_searchsorted(values, [0, 0, 4], [4, 4, 6], [3, 3, 1], 'left').tolist(), [1, 1, 5])
+        self.assertEqual(bounded_searchsorted(values, [0, 0, 4], [4, 4, 6], [3, 6, 1], 'right').tolist(), [3, 4, 5])
+
+    def test_build(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.route_keys.tolist(), [u'R1', u'R2'])
+        self.assertEqual(self.index.route_max_lengths.tolist(), [15, 10])
+
+    def test_locate_measures(self):
+        query_index, link_ids, ratios, distances = self.index.locate_measures(
+            ['R1', 'R1', 'R1', 'R1', 'R2', 'R3', None], [5, 21, 35, 27, 10, 5, 5])
+        self.assertEqual(query_index.tolist(), [0, 1, 2, 4])
+        self.assertEqual(link_ids.tolist(), [u'101', u'102', u'103', u'101'])
+        self.assertTrue(np.allclose(ratios, [0.5, 11 / 15.0, 0.5, 0.5]))
+
+        query_index, link_ids, ratios, distances = self.index.locate_measures(['R1', 'R1'], [21, 10], all_matches=True)
+        self.assertEqual(query_index.tolist(), [0, 0, 1, 1])
+        self.assertEqual(link_ids.tolist(), [u'102', u'104', u'101', u'102'])
+        self.assertTrue(np.allclose(ratios, [11 / 15.0, 0.5, 1, 0]))
+
+        # in the gap between 25 and 30
+        query_index, link_ids, ratios, distances = self.index.locate_measures(['R1'], [29], gap_tolerance=2)
+        self.assertEqual(link_ids.tolist(), [u'103'])
+        self.assertEqual(ratios.tolist(), [1.0])
+        self.assertEqual(distances.tolist(), [1.0])
+
+    def test_locate_links(self):
+        query_index, route_ids, measures = self.index.locate_links([101, '103', 999], [0.5, 0.25, 0.5])
+        self.assertEqual(query_index.tolist(), [0, 0, 1])
+        self.assertEqual(route_ids.tolist(), [u'R1', u'R2', u'R1'])
+        self.assertTrue(np.allclose(measures, [5, 10, 37.5]))
+
+    def test_save_load(self):
+        folder = tempfile.mkdtemp()
+        try:
+            self.index.save(folder)
+            index = XrefIndex.load(folder)
+            self.assertEqual(index.locate_measures(['R1'], [5])[1].tolist(), [u'101'])
+            del index
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
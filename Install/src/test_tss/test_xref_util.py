@@ -0,0 +1,48 @@
+import unittest
+import src.tss.xref_util as xref_util
+
+
+class RouteMetrics(object):
+
+    def __init__(self, route_ids, lengths, mmins, mmaxs):
+        self.route_ids, self.lengths, self.mmins, self.mmaxs = route_ids, lengths, mmins, mmaxs
+
+
+class XrefUtilTestCase(unittest.TestCase):
+
+    def test_iter_route_blocks(self):
+        rows = [(1, 'a'), (2, 'a'), (3, 'b'), (4, 'a')]
+        self.assertEqual(list(xref_util.iter_route_blocks(rows)),
+                         [('a', [(1, 'a'), (2, 'a')]), ('b', [(3, 'b')]), ('a', [(4, 'a')])])
+        self.assertEqual(list(xref_util.iter_route_blocks([])), [])
+
+    def test_route_metrics_cursor(self):
+        cursor = xref_util.RouteMetricsCursor(RouteMetrics(['c', 'a', 'b'], [30, 10, 0], [0, 0, 0], [30, 10, 0]))
+        length, mmin, mmax, valid = cursor.parameters('a', 2)
+        self.assertEqual(length.tolist(), [10, 10])
+        self.assertEqual(valid.tolist(), [True, True])
+        # zero length route
+        self.assertEqual(cursor.parameters('b', 1)[3].tolist(), [False])
+        self.assertEqual(cursor.parameters('bb', 1)[3].tolist(), [False])
+        self.assertEqual(cursor.parameters('c', 1)[0].tolist(), [30])
+        # out of order lookup
+        self.assertEqual(cursor.parameters('a', 1)[0].tolist(), [10])
+
+    def test_stream_xref_rows(self):
+        here = RouteMetrics(['r1', 'r2', 'r3'], [10, 10, 10], [0, 0, 5], [10, 10, 5])
+        dot = RouteMetrics(['r1', 'r3'], [20, 20], [100, 0], [120, 20])
+        link_rows = [('L1', 'r1', 0, 5), ('L2', 'r1', 5, 10), ('L1', 'r1', 1, 5), ('L3', 'r2', 0, 10),
+                     ('L4', 'r3', 5, 5), ('L5', 'r4', 0, 1)]
+        summary = xref_util.XrefSummary()
+        blocks = list(xref_util.stream_xref_rows(link_rows, here, dot, summary=summary))
+        self.assertEqual(blocks, [[('L2', 'r1', 110, 120), ('L1', 'r1', 102, 110)]])
+        self.assertEqual(summary.link_rows, 6)
+        self.assertEqual(summary.duplicate_rows, 1)
+        self.assertEqual(summary.xref_rows, 2)
+        self.assertEqual(summary.invalid_source_routes, {'r3': 1, 'r4': 1})
+        self.assertEqual(summary.invalid_target_routes, {'r2': 1})
+        self.assertEqual(summary.unordered_routes, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
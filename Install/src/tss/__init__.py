@@ -1,5 +1,5 @@
 from path_util import get_parent_directory, get_user_directory, get_scratch_folder
 from log_util import setup_logger
-from core_util import extract_number_from_string, linear_units_to_mile
+from core_util import extract_number_from_string, linear_units_to_mile, linear_units_to_meter
 from helper import first_or_default
 from datetime_util import format_sql_date, truncate_datetime, get_datetime_stamp, get_maximum_date
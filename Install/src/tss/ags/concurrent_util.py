@@ -1,7 +1,11 @@
 import arcpy
 import os
-from itertools import combinations
+import logging
 from dao_util import build_string_in_sql_expression
+from feature_array_util import load_polyline_array
+from src.tss.overlap_util import find_collinear_overlaps
+
+logger = logging.getLogger(__name__)
 
 overlap_segments = "in_memory\\overlap_segments"
 active_centerline_sequence_view = "active_centerline_sequence_view"
@@ -67,22 +71,36 @@ def find_overlap_segments_from_centerline(centerline, centerline_sequence, netwo
             arcpy.Append_management(unsplit_centerline, overlap_segments)
 
 
-def find_overlap_segments(network, overlap_segments):
+def find_overlap_segments(network, overlap_segments, tolerance=None, batch_size=1000):
     """
-    Find overlap segments using pure geometry
+    Find overlap segments using pure geometry. Feature pairs are pruned with an envelope sweep line and segment pairs
+    with a grid index, only the remaining pairs are tested for collinear shared sub-segments.
     :param network:
     :param overlap_segments:
+    :param tolerance: collinear tolerance in map units, defaults to the XY tolerance of the network
+    :param batch_size: number of overlap polylines built and inserted at a time
+    :return: statistics (pairs tested, pairs pruned, elapsed time...)
     """
+    spatial_reference = arcpy.Describe(network).spatialReference
+    if tolerance is None:
+        tolerance = spatial_reference.XYTolerance
+    polylines, attributes = load_polyline_array(network, 'OID@')
+    pairs, pair_parts, stats = find_collinear_overlaps(polylines, tolerance)
+    logger.info("{overlap_pairs} overlapping pairs found among {feature_count} features, {pairs_tested} pairs tested, "
+                "{pairs_pruned} pairs pruned, {segments_skipped} segments not queried in {elapsed_seconds:.2f} seconds"
+                .format(**stats))
+
     arcpy.CreateFeatureclass_management(os.path.dirname(overlap_segments), os.path.basename(overlap_segments), "POLYLINE", "", "ENABLED", "DISABLED", network)
     with arcpy.da.InsertCursor(overlap_segments, ['SHAPE@']) as iCursor:
-        with arcpy.da.SearchCursor(network, ['SHAPE@', 'OID@']) as sCursor:
-            for line1, line2 in combinations(sCursor, 2):
-                shape1 = line1[0]
-                shape2 = line2[0]
-                if shape1.overlaps(shape2):
-                    print line1[1], line2[1]
-                    overlap_shape = shape1.intersect(shape2, 2)
-                    iCursor.insertRow([overlap_shape])
+        for batch_start in range(0, len(pair_parts), batch_size):
+            overlap_shapes = []
+            for parts in pair_parts[batch_start:batch_start + batch_size]:
+                overlap_shapes.append(arcpy.Polyline(arcpy.Array([arcpy.Array([arcpy.Point(x, y) for x, y in part])
+                                                                  for part in parts]), spatial_reference))
+            for overlap_shape in overlap_shapes:
+                iCursor.insertRow([overlap_shape])
+            logger.debug("{0} of {1} overlap segments inserted".format(batch_start + len(overlap_shapes), len(pair_parts)))
+    return stats
 
 
 def overlap_segments_to_concurrent_end_points(overlap_segments, concurrent_end_points):
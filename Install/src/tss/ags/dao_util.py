@@ -22,12 +22,12 @@ def build_numeric_in_sql_expression(field_name, value_list):
 
 def build_string_in_sql_expression(field_name, value_list):
     """
-    Build a "in" sql string based on the input field name and value list
+    Build a "in" sql string based on the input field name and value list, single quotes in the values are doubled
     :param field_name:
     :param value_list:
     :return:
     """
-    return "%s in (%s)" % (field_name, ",".join("'" + value + "'" for value in value_list)) if len(value_list) > 0 else "1=2"
+    return "%s in (%s)" % (field_name, ",".join("'" + value.replace("'", "''") + "'" for value in value_list)) if len(value_list) > 0 else "1=2"
 
 def subset_data_exist(data, where_clause):
     """
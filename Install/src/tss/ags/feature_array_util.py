@@ -0,0 +1,91 @@
+import arcpy
+import logging
+import numpy as np
+
+from src.tss.core_util import linear_units_to_meter
+from src.tss.polyline_util import PolylineArray
+
+logger = logging.getLogger(__name__)
+
+
+def read_polyline_parts(shape, has_m=False):
+    """
+    Read the vertices of an arcpy polyline into a list of parts
+    :param shape:
+    :param has_m:
+    :return:
+    """
+    parts = []
+    for part in shape:
+        if has_m:
+            parts.append([(pnt.X, pnt.Y, pnt.M) for pnt in part if pnt])
+        else:
+            parts.append([(pnt.X, pnt.Y) for pnt in part if pnt])
+    return parts
+
+
+def load_polyline_array(dataset, id_field, attribute_fields=None, where_clause=None, has_m=False, spatial_reference=None):
+    """
+    Read a polyline feature class (or layer) into a PolylineArray in one cursor pass. Features with empty geometry are
+    skipped and reported.
+    :param dataset:
+    :param id_field:
+    :param attribute_fields: additional fields to be read along with the geometry
+    :param where_clause:
+    :param has_m: read the m values of the vertices as well
+    :param spatial_reference: project the geometries on the fly if specified
+    :return: PolylineArray and a list of attribute tuples aligned with its features
+    """
+    attribute_fields = attribute_fields or []
+    attributes = []
+
+    def features():
+        with arcpy.da.SearchCursor(dataset, [id_field, 'SHAPE@'] + attribute_fields, where_clause,
+                                   spatial_reference) as sCur:
+            for row in sCur:
+                feature_id, shape = row[0], row[1]
+                if shape is None:
+                    logger.warning("Invalid geometry! Geometry of feature '{0}' is NoneType!".format(feature_id))
+                    continue
+                attributes.append(tuple(row[2:]))
+                yield feature_id, read_polyline_parts(shape, has_m)
+
+    polylines = PolylineArray.from_features(features(), has_m)
+    return polylines, attributes
+
+
+def load_points(dataset, fields=None, where_clause=None, spatial_reference=None):
+    """
+    Read the coordinates of a point feature class (or layer) into an array in one cursor pass. Features with empty
+    geometry are skipped.
+    :param dataset:
+    :param fields: fields to be read along with the coordinates
+    :param where_clause:
+    :param spatial_reference: project the points on the fly if specified
+    :return: (n, 2) array of coordinates and a list of attribute tuples aligned with it
+    """
+    fields = fields or []
+    points = []
+    attributes = []
+    with arcpy.da.SearchCursor(dataset, ['SHAPE@XY'] + fields, where_clause, spatial_reference) as sCur:
+        for row in sCur:
+            if row[0] is None or row[0][0] is None:
+                continue
+            points.append(row[0])
+            attributes.append(tuple(row[1:]))
+    return np.array(points, dtype=np.float64).reshape(-1, 2), attributes
+
+
+def linear_unit_to_map_unit(linear_unit_string, dataset):
+    """
+    Convert a linear unit string such as '10 Meters' to a numeric distance in the unit of the dataset's spatial
+    reference. A plain number or 'Unknown' unit is considered to be in map units already.
+    :param linear_unit_string:
+    :param dataset:
+    :return:
+    """
+    tokens = str(linear_unit_string).split(None, 1)
+    if len(tokens) == 1 or tokens[1] == 'Unknown':
+        return float(tokens[0])
+    meters_per_unit = arcpy.Describe(dataset).spatialReference.metersPerUnit
+    return linear_units_to_meter(linear_unit_string) / meters_per_unit
@@ -1,4 +1,9 @@
 import math
+import numpy as np
+
+# Directions of the 45 degree sectors clockwise from 22.5 degree
+direction_sectors = np.array(["NorthEast", "East", "SouthEast", "South", "SouthWest", "West", "NorthWest"])
+
 
 def calculate_approach_angle(segment, intersection, influence_distance, azimuth_zero_direction):
     """
@@ -45,6 +50,61 @@ def angle_between_two_vectors(vector1, vector2):
     return angle
 
 
+def angles_between_vectors(vectors1, vectors2):
+    """
+    Calculate the angles between two arrays of 2D vectors, row by row. Same as angle_between_two_vectors, -1 is
+    returned for the rows with a zero vector.
+    :param vectors1: (n, 2) array
+    :param vectors2: (n, 2) array
+    :return: angles in degree
+    """
+    vectors1 = np.asarray(vectors1, dtype=np.float64).reshape(-1, 2)
+    vectors2 = np.asarray(vectors2, dtype=np.float64).reshape(-1, 2)
+    norm_product = np.sqrt((vectors1 ** 2).sum(axis=1) * (vectors2 ** 2).sum(axis=1))
+    zero_vector = norm_product == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = np.clip((vectors1 * vectors2).sum(axis=1) / norm_product, -1, 1)
+    angles = np.degrees(np.arccos(cosine))
+    angles[zero_vector] = -1
+    return angles
+
+
+def line_angles(vectors1, vectors2, decimal_places=6):
+    """
+    Calculate the angles between two arrays of non-directional lines (0 to 90 degree), row by row. The vectors are
+    rounded first, a minimum six decimal places need to be used otherwise the angle return could be far from accurate.
+    NaN is returned for the rows with a zero vector.
+    :param vectors1: (n, 2) array
+    :param vectors2: (n, 2) array
+    :param decimal_places:
+    :return: angles in degree
+    """
+    angles = angles_between_vectors(np.round(vectors1, decimal_places), np.round(vectors2, decimal_places))
+    angles = np.where(angles > 90, 180 - angles, angles)
+    angles[angles == -1] = np.nan
+    return angles
+
+
+def calculate_approach_angles(segments, intersection_points, influence_distance, azimuth_zero_direction):
+    """
+    Calculate the approach angles of a set of segments, same as calculate_approach_angle
+    :param segments: PolylineArray of the segments
+    :param intersection_points: (n, 2) intersection point of every segment
+    :param influence_distance:
+    :param azimuth_zero_direction:
+    :return: angles in degree, -1 for the rows with a zero vector
+    """
+    intersection_points = np.asarray(intersection_points, dtype=np.float64).reshape(-1, 2)
+    first_distance = np.sqrt(((segments.first_points() - intersection_points) ** 2).sum(axis=1))
+    last_distance = np.sqrt(((segments.last_points() - intersection_points) ** 2).sum(axis=1))
+    distances = np.where(first_distance < last_distance, influence_distance,
+                         segments.feature_lengths() - influence_distance)
+    next_points = segments.positions_along(distances)
+
+    zero_direction = (0, 1) if azimuth_zero_direction == "N" else (1, 0)
+    return angles_between_vectors(np.tile(zero_direction, (len(next_points), 1)), intersection_points - next_points)
+
+
 def angle_larger_than_pi(vector1, vector2):
     # clockwise angle from vector1 to vector2
     """
@@ -83,6 +143,22 @@ def angle_to_direction(angle, azimuth_zero_direction):
     else:
         return "NorthWest"
 
+def angles_to_directions(angles, azimuth_zero_direction):
+    """
+    Convert an array of angles to directions, same as angle_to_direction
+    :param angles:
+    :param azimuth_zero_direction:
+    :return: array of direction descriptors
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    if azimuth_zero_direction == "E":
+        angles = np.where(angles <= 270, angles + 90, angles + 90 - 360)
+    result = np.empty(angles.shape, dtype=direction_sectors.dtype)
+    result.fill("North")
+    sector = (angles >= 22.5) & (angles < 337.5)
+    result[sector] = direction_sectors[np.floor((angles[sector] - 22.5) / 45).astype(np.int64)]
+    return result
+
 def geodesic_angle_to_circular_angle(angle, azimuth_zero_direction="N"):
     """
     Geodesic angle to circular angle
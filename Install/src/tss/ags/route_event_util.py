@@ -0,0 +1,141 @@
+import os
+import arcpy
+import logging
+
+from src.tss.segmentation_util import RouteSegmenter
+from src.tss.ags.feature_array_util import load_polyline_array
+from src.tss.ags.route_metrics_util import get_dataset_key
+from src.tss.ags.table_join_util import get_transferable_fields, get_output_fields, check_output_fields, \
+    add_output_fields
+
+logger = logging.getLogger(__name__)
+
+
+def load_route_segmenter(network, route_id_field, where_clause=None):
+    """
+    Load the routes (with their m values) into a RouteSegmenter in one cursor pass
+    :param network: route feature class (or layer)
+    :param route_id_field:
+    :param where_clause: e.g. the active date filter of the network
+    :return: RouteSegmenter, and the spatial reference of the routes
+    """
+    spatial_reference = arcpy.Describe(network).spatialReference
+    routes, attributes = load_polyline_array(network, route_id_field, where_clause=where_clause, has_m=True)
+    segmenter = RouteSegmenter(routes)
+    non_monotonic_route_ids = segmenter.non_monotonic_route_ids()
+    if non_monotonic_route_ids:
+        logger.warning("{0} route(s) are non-monotonic or have missing measures, no event is located on them"
+                       .format(len(non_monotonic_route_ids)))
+    return segmenter, spatial_reference
+
+
+def get_route_segmenter(network, route_id_field, where_clause=None, cache_folder=None, mmap_mode='r'):
+    """
+    Get the RouteSegmenter of the routes. The routes are loaded from the cache folder if they have been read from the
+    same version of the network (same key, see get_dataset_key), otherwise they are read in one cursor pass and saved
+    into the cache folder, so that the worker processes of a batch memory-map them instead of reading the network
+    again.
+    :param network: route feature class (or layer)
+    :param route_id_field:
+    :param where_clause: e.g. the active date filter of the network
+    :param cache_folder: folder to keep the route files, no caching if not specified
+    :param mmap_mode: memory-map the cached route files (see numpy.load)
+    :return: RouteSegmenter, and the spatial reference of the routes
+    """
+    if not cache_folder:
+        return load_route_segmenter(network, route_id_field, where_clause)
+
+    desc = arcpy.Describe(network)
+    key = get_dataset_key(network, [route_id_field], where_clause)
+    routes_folder = os.path.join(cache_folder, '{0}_segmenter_{1}'.format(os.path.basename(network), key))
+    if os.path.isdir(routes_folder):
+        logger.info("Loading routes '{0}'...".format(routes_folder))
+        return RouteSegmenter.load(routes_folder, mmap_mode), desc.spatialReference
+
+    segmenter, spatial_reference = load_route_segmenter(network, route_id_field, where_clause)
+    segmenter.save(routes_folder)
+    logger.info("Routes saved to '{0}'".format(routes_folder))
+    return segmenter, spatial_reference
+
+
+def _line_shape(events, i, spatial_reference):
+    parts = arcpy.Array()
+    for p in range(events.feature_offsets[i], events.feature_offsets[i + 1]):
+        start, end = events.part_offsets[p], events.part_offsets[p + 1]
+        parts.add(arcpy.Array([arcpy.Point(x, y, None, m) for (x, y), m in
+                               zip(events.xy[start:end].tolist(), events.m[start:end].tolist())]))
+    return arcpy.Polyline(parts, spatial_reference, False, True)
+
+
+def write_route_events(segmenter, spatial_reference, event_table, route_id_field, from_measure_field,
+                       to_measure_field, output, fields=None, field_names=None, where_clause=None,
+                       batch_size=100000):
+    """
+    Locate the events of a table on the routes and stream them to a new feature class with their fields, in place of
+    copying the events, making a route event layer and copying it with field mappings. Events are read and written in
+    batches, only one batch is held in memory at a time. Events that cannot be located are written without geometry,
+    as they would be by a route event layer.
+    :param segmenter: RouteSegmenter of the routes (see load_route_segmenter)
+    :param spatial_reference: spatial reference of the routes, given to the output
+    :param event_table:
+    :param route_id_field: route id field of the events
+    :param from_measure_field: measure field of point events, or from measure field of line events
+    :param to_measure_field: to measure field of line events, None for point events
+    :param output: output feature class, polyline (point for point events) with m values
+    :param fields: fields of the events copied to the output, all the transferable fields by default
+    :param field_names: dict of input field name to output field name, for the fields to be renamed
+    :param where_clause:
+    :param batch_size: number of events located at once
+    :return: number of events written and number of events located
+    """
+    fields = fields if fields is not None else [field.name for field in get_transferable_fields(event_table)]
+    output_fields = get_output_fields(event_table, fields, field_names)
+    check_output_fields(output_fields)
+
+    is_line = bool(to_measure_field)
+    if arcpy.Exists(output):
+        arcpy.Delete_management(output)
+    arcpy.CreateFeatureclass_management(os.path.dirname(output) or arcpy.env.workspace, os.path.basename(output),
+                                        'POLYLINE' if is_line else 'POINT', has_m='ENABLED',
+                                        spatial_reference=spatial_reference)
+    add_output_fields(output, output_fields)
+
+    measure_fields = [from_measure_field, to_measure_field] if is_line else [from_measure_field]
+    measure_tolerance = spatial_reference.MTolerance or 0.0
+    count = located_count = 0
+
+    def flush(rows):
+        route_index = segmenter.route_indexes([row[0] for row in rows])
+        measures = [[row[i + 1] for row in rows] for i in range(len(measure_fields))]
+        # null measures become NaN, which are never located
+        measures = [[float('nan') if value is None else value for value in values] for values in measures]
+        if is_line:
+            events, located = segmenter.line_events(route_index, measures[0], measures[1], measure_tolerance)
+            shapes = [_line_shape(events, i, spatial_reference) if located[i] else None for i in range(len(rows))]
+        else:
+            xy, m, located = segmenter.point_events(route_index, measures[0], measure_tolerance)
+            shapes = [arcpy.PointGeometry(arcpy.Point(x, y, None, point_m), spatial_reference, False, True)
+                      if is_located else None
+                      for (x, y), point_m, is_located in zip(xy.tolist(), m.tolist(), located.tolist())]
+        for row, shape in zip(rows, shapes):
+            iCur.insertRow((shape,) + tuple(row[len(measure_fields) + 1:]))
+        return int(located.sum())
+
+    with arcpy.da.SearchCursor(event_table, [route_id_field] + measure_fields + list(fields), where_clause) as sCur, \
+            arcpy.da.InsertCursor(output, ['SHAPE@'] + [name for name, field in output_fields]) as iCur:
+        rows = []
+        for row in sCur:
+            rows.append(row)
+            if len(rows) == batch_size:
+                located_count += flush(rows)
+                count += len(rows)
+                rows = []
+        if rows:
+            located_count += flush(rows)
+            count += len(rows)
+
+    if located_count < count:
+        logger.warning("{0} of {1} events cannot be located on the routes, they are written without geometry"
+                       .format(count - located_count, count))
+    logger.info("{0} event(s) written to '{1}'".format(count, output))
+    return count, located_count
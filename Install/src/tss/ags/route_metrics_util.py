@@ -0,0 +1,173 @@
+import arcpy
+import os
+import hashlib
+import logging
+from datetime import date
+import numpy as np
+
+from src.tss.ags.dao_util import get_count
+
+logger = logging.getLogger(__name__)
+
+
+class RouteMetrics(object):
+    """
+    Length, minimum and maximum measure of every route, kept as numpy arrays aligned with the route ids
+    """
+
+    def __init__(self, route_ids, lengths, mmins, mmaxs):
+        self.route_ids = list(route_ids)
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+        self.mmins = np.asarray(mmins, dtype=np.float64)
+        self.mmaxs = np.asarray(mmaxs, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    def to_dict(self, route_ids=None):
+        """
+        Convert the metrics to the route id -> {'length', 'mmax', 'mmin'} dict used by the tools. Missing measures are
+        returned as None.
+        :param route_ids: only keep these route ids if specified
+        :return:
+        """
+        route_ids = set(route_ids) if route_ids is not None else None
+        route_dict = {}
+        for route_id, length, mmin, mmax in zip(self.route_ids, self.lengths.tolist(), self.mmins.tolist(),
+                                                self.mmaxs.tolist()):
+            if route_ids is not None and route_id not in route_ids:
+                continue
+            route_dict[route_id] = {
+                'length': length,
+                'mmax': None if np.isnan(mmax) else mmax,
+                'mmin': None if np.isnan(mmin) else mmin
+            }
+        return route_dict
+
+    def save(self, path):
+        np.savez(path, route_ids=np.array(self.route_ids), lengths=self.lengths, mmins=self.mmins, mmaxs=self.mmaxs)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        try:
+            return cls(data['route_ids'].tolist(), data['lengths'], data['mmins'], data['mmaxs'])
+        finally:
+            data.close()
+
+
+def _get_gdb_table_files(workspace, desc):
+    """
+    :return: paths of the files of a file geodatabase table (a<table id in hex>.*), lock files left out, None if the
+             table id is unknown
+    """
+    table_id = getattr(desc, 'DSID', None)
+    if not table_id or table_id < 0:
+        return None
+    prefix = 'a{0:08x}.'.format(table_id)
+    return [os.path.join(workspace, f) for f in os.listdir(workspace)
+            if f.lower().startswith(prefix) and not f.lower().endswith('.lock')]
+
+
+def get_dataset_stamp(dataset):
+    """
+    Modification stamp of a dataset. The latest modification time and the total size of the files of the dataset are
+    used for a file geodatabase table (other datasets and lock files of the workspace are left out) or a shapefile,
+    the feature count and extent otherwise (e.g. enterprise geodatabases).
+    :param dataset:
+    :return:
+    """
+    desc = arcpy.Describe(dataset)
+    catalog_path = desc.catalogPath
+    workspace = os.path.dirname(catalog_path)
+    while workspace and not os.path.isdir(workspace):
+        workspace = os.path.dirname(workspace)
+
+    files = None
+    if workspace.lower().endswith('.gdb'):
+        files = _get_gdb_table_files(workspace, desc)
+    else:
+        shape_file = os.path.splitext(catalog_path)[0]
+        if os.path.exists(shape_file + '.shp'):
+            files = [shape_file + ext for ext in ['.shp', '.shx', '.dbf'] if os.path.exists(shape_file + ext)]
+    if files:
+        return '{0}|{1}'.format(max(os.path.getmtime(f) for f in files), sum(os.path.getsize(f) for f in files))
+    extent = desc.extent
+    return '{0}|{1}|{2}|{3}|{4}'.format(get_count(dataset), extent.XMin, extent.YMin, extent.XMax, extent.YMax)
+
+
+def _key_text(item):
+    return item.encode('utf-8') if isinstance(item, unicode) else str(item)
+
+
+def get_dataset_key(dataset, key_items=None, where_clause=None, version=None):
+    """
+    Cache key of data derived from a dataset (route metrics, route index...): the catalog path of the dataset, the
+    key items (e.g. field names), the where clause and the version of the dataset. Without a version, the modification
+    stamp of the dataset (see get_dataset_stamp) and, for a filtered dataset, the current date (active date filters
+    select other rows every day) are used.
+    :param dataset:
+    :param key_items: other items the data depends on
+    :param where_clause:
+    :param version: e.g. the LRS version of the network
+    :return: hex digest
+    """
+    key_items = [arcpy.Describe(dataset).catalogPath] + list(key_items or []) + [where_clause or '1=1']
+    if version:
+        key_items.append(version)
+    else:
+        key_items.append(get_dataset_stamp(dataset))
+        if where_clause and where_clause != '1=1':
+            key_items.append(date.today().isoformat())
+    return hashlib.md5('|'.join(_key_text(item) for item in key_items)).hexdigest()
+
+
+def read_route_metrics(dataset, route_id_field, where_clause=None):
+    """
+    Read the route metrics in one cursor pass. Routes with empty geometry are skipped, the last one is kept for
+    duplicated route ids.
+    :return: RouteMetrics
+    """
+    metrics_dict = {}
+    with arcpy.da.SearchCursor(dataset, [route_id_field, 'SHAPE@'], where_clause) as sCur:
+        for row in sCur:
+            route_id, shape = row[0], row[1]
+            if shape is None or route_id is None:
+                continue
+            extent = shape.extent
+            metrics_dict[route_id] = (shape.length, extent.MMin, extent.MMax)
+    del sCur
+
+    route_ids = sorted(metrics_dict.keys())
+    metrics = [metrics_dict[route_id] for route_id in route_ids]
+    return RouteMetrics(route_ids,
+                        [metric[0] for metric in metrics],
+                        [np.nan if metric[1] is None else metric[1] for metric in metrics],
+                        [np.nan if metric[2] is None else metric[2] for metric in metrics])
+
+
+def get_route_metrics(dataset, route_id_field, where_clause=None, cache_folder=None):
+    """
+    Get the route metrics of a dataset. The metrics are loaded from the cache folder if they have been read from the
+    same version of the dataset (same modification stamp), otherwise they are read and saved into the cache folder.
+    :param dataset:
+    :param route_id_field:
+    :param where_clause: e.g. the active date filter of the routes
+    :param cache_folder: folder to keep the metrics files, no caching if not specified
+    :return: RouteMetrics
+    """
+    if not cache_folder:
+        return read_route_metrics(dataset, route_id_field, where_clause)
+
+    key = get_dataset_key(dataset, [route_id_field], where_clause)
+    metrics_path = os.path.join(cache_folder, '{0}_metrics_{1}.npz'.format(os.path.basename(dataset), key))
+    if os.path.exists(metrics_path):
+        logger.info("Loading route metrics '{0}'...".format(metrics_path))
+        return RouteMetrics.load(metrics_path)
+
+    logger.info("Reading route metrics of '{0}'...".format(dataset))
+    route_metrics = read_route_metrics(dataset, route_id_field, where_clause)
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    route_metrics.save(metrics_path)
+    return route_metrics
@@ -1,24 +1,35 @@
 __author__ = 'yluo'
 
+import os
 import arcpy
+import logging
+
+from src.tss.polyline_util import PolylineArray
+from src.tss.route_validation_util import validate_routes
+from src.tss.ags.feature_array_util import read_polyline_parts, load_polyline_array
+
+logger = logging.getLogger(__name__)
 
 arcpy.env.overwriteOutput = True
 
-def is_gapped_polyline(shape):
+ROUTE_VALIDATION_FIELDS = [('VERTEX_COUNT', 'LONG'), ('PART_COUNT', 'LONG'), ('DIRECTION', 'TEXT'),
+                           ('MONOTONIC', 'TEXT'), ('REVERSAL_COUNT', 'LONG'), ('LEVEL_RUN_COUNT', 'LONG'),
+                           ('NAN_MEASURE_COUNT', 'LONG'), ('GAP_COUNT', 'LONG'), ('MAX_GAP', 'DOUBLE'),
+                           ('M_MIN', 'DOUBLE'), ('M_MAX', 'DOUBLE')]
+ROUTE_BUILD_FIELDS = [('LINK_COUNT', 'LONG'), ('BRANCH_COUNT', 'LONG'), ('LOOP_COUNT', 'LONG')]
+
+def is_gapped_polyline(shape, tolerance=0.0):
     """
-    As long as two parts has common points, then they are considered to be continuous,
+    As long as two consecutive parts have a common vertex, or their end points touch (within the tolerance), they
+    are considered to be continuous
     @param shape: input geometry
+    @param tolerance: in map units
     @return:
     """
     if not shape.isMultipart:
         return False
-    for i in range(shape.partCount - 1):
-        curr_part_set = set([(point.X, point.Y) for point in shape.getPart(i)])
-        next_part_set = set([(point.X, point.Y) for point in shape.getPart(i+1)])
-        # It is done this way to take overlap into account
-        if not curr_part_set & next_part_set:
-            return True
-    return False
+    polylines = PolylineArray.from_features([(None, read_polyline_parts(shape))])
+    return bool(validate_routes(polylines, tolerance).gapped[0])
 
 def is_gapped_polyline_strict(shape):
     """
@@ -35,5 +46,96 @@ def is_gapped_polyline_strict(shape):
             return True
     return False
 
+def validate_route_dataset(route, route_id_field, gap_tolerance=0.0, where_clause=None):
+    """
+    Check the measures and the gaps of every route of a route feature class in one cursor pass
+    :param route: route feature class (with m values)
+    :param route_id_field:
+    :param gap_tolerance: in map units
+    :param where_clause:
+    :return: RouteValidation
+    """
+    routes, attributes = load_polyline_array(route, route_id_field, where_clause=where_clause, has_m=True)
+    return validate_routes(routes, gap_tolerance)
+
+def write_routes(routes, output, route_id_field, route_id_field_details=None, spatial_reference=None,
+                 route_indexes=None):
+    """
+    Write M-aware routes to a new polyline feature class in a single insert cursor pass
+    :param routes: PolylineArray with m values
+    :param output: output feature class
+    :param route_id_field: name of the route id field of the output
+    :param route_id_field_details: type and length of the route id field (see get_field_details), text by default
+    :param spatial_reference: spatial reference of the coordinates of the routes
+    :param route_indexes: indexes of the routes to write, all of them if not specified
+    :return: number of routes written
+    """
+    route_id_field_details = route_id_field_details or {'field_type': 'TEXT', 'field_length': 255}
+    if arcpy.Exists(output):
+        arcpy.Delete_management(output)
+    arcpy.CreateFeatureclass_management(os.path.dirname(output) or arcpy.env.workspace, os.path.basename(output),
+                                        'POLYLINE', has_m='ENABLED', spatial_reference=spatial_reference)
+    arcpy.AddField_management(output, route_id_field, route_id_field_details['field_type'],
+                              field_length=route_id_field_details['field_length'])
+
+    route_indexes = range(len(routes)) if route_indexes is None else route_indexes
+    part_start, part_end = routes.part_offsets[:-1], routes.part_offsets[1:]
+    count = 0
+    with arcpy.da.InsertCursor(output, ['SHAPE@', route_id_field]) as iCur:
+        for i in route_indexes:
+            parts = arcpy.Array()
+            for p in range(routes.feature_offsets[i], routes.feature_offsets[i + 1]):
+                parts.add(arcpy.Array([arcpy.Point(x, y, None, m) for (x, y), m in
+                                       zip(routes.xy[part_start[p]:part_end[p]].tolist(),
+                                           routes.m[part_start[p]:part_end[p]].tolist())]))
+            iCur.insertRow((arcpy.Polyline(parts, spatial_reference, False, True), routes.ids[i]))
+            count += 1
+    logger.info("{0} route(s) written to '{1}'".format(count, output))
+    return count
+
+def get_validation_table_path(output):
+    """
+    Path of the validation table of an output route feature class, in the same workspace
+    :param output:
+    :return:
+    """
+    workspace, name = os.path.dirname(output), os.path.basename(output)
+    if name.lower().endswith('.shp'):
+        return os.path.join(workspace, '{0}_validation.dbf'.format(name[:-4]))
+    return os.path.join(workspace, '{0}_validation'.format(name))
+
+def write_route_validation_table(validation, output_table, route_id_field, route_id_field_details=None,
+                                 only_invalid=False, build=None):
+    """
+    Write the diagnostics of the routes to a table, one row per route
+    :param validation: RouteValidation
+    :param output_table:
+    :param route_id_field: name of the route id field in the table
+    :param route_id_field_details: type and length of the route id field (see get_field_details), text by default
+    :param only_invalid: only write the gapped or non-monotonic routes
+    :param build: RouteBuild of the routes if they were assembled by build_routes, adds the link, branch and loop
+                  counts to the table
+    :return: number of rows written
+    """
+    route_id_field_details = route_id_field_details or {'field_type': 'TEXT', 'field_length': 255}
+    if arcpy.Exists(output_table):
+        arcpy.Delete_management(output_table)
+    arcpy.CreateTable_management(os.path.dirname(output_table) or arcpy.env.workspace, os.path.basename(output_table))
+    arcpy.AddField_management(output_table, route_id_field, route_id_field_details['field_type'],
+                              field_length=route_id_field_details['field_length'])
+    fields = ROUTE_VALIDATION_FIELDS + (ROUTE_BUILD_FIELDS if build is not None else [])
+    for field_name, field_type in fields:
+        arcpy.AddField_management(output_table, field_name, field_type)
+
+    rows = validation.rows(only_invalid)
+    if build is not None:
+        build_rows = build.row_dict()
+        rows = [row + build_rows.get(row[0], (None, None, None)) for row in rows]
+    with arcpy.da.InsertCursor(output_table, [route_id_field] + [field[0] for field in fields]) as iCur:
+        for row in rows:
+            iCur.insertRow(row)
+    logger.info("{0} route(s) written to the validation table '{1}'".format(len(rows), output_table))
+    return len(rows)
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,85 @@
+import arcpy
+import os
+import logging
+
+from src.tss.spatial_index import SegmentGridIndex
+from src.tss.locate_util import RouteLocator
+from src.tss.ags.feature_array_util import load_polyline_array
+from src.tss.ags.route_metrics_util import get_dataset_key
+
+logger = logging.getLogger(__name__)
+
+
+def build_active_where_clause(fdate_field, tdate_field):
+    """
+    Build the where clause to select records active as of today
+    :param fdate_field:
+    :param tdate_field:
+    :return:
+    """
+    if not fdate_field or not tdate_field:
+        return "1=1"
+    return "({start_date_field} is null or {start_date_field} <= CURRENT_TIMESTAMP) and " \
+           "({end_date_field} is null or {end_date_field} > CURRENT_TIMESTAMP)".format(start_date_field=fdate_field,
+                                                                                    end_date_field=tdate_field)
+
+
+def get_route_index_key(network, route_id_field, where_clause=None, version=None, spatial_reference=None):
+    """
+    Key of a route index (see get_dataset_key), the LRS version identifies the version of the network if specified
+    :return:
+    """
+    sr = spatial_reference or arcpy.Describe(network).spatialReference
+    return get_dataset_key(network, [route_id_field, sr.name], where_clause, version)
+
+
+def get_route_index(network, route_id_field, where_clause=None, cache_folder=None, version=None, spatial_reference=None):
+    """
+    Get the segment grid index of the routes. The index is loaded from the cache folder if it has been built for the
+    same network version, otherwise it is built in one cursor pass and saved into the cache folder.
+    :param network:
+    :param route_id_field:
+    :param where_clause: e.g. the active date filter of the network
+    :param cache_folder: folder to keep the index files, no caching if not specified
+    :param version: LRS version of the network
+    :param spatial_reference: spatial reference of the index, defaults to the one of the network
+    :return: SegmentGridIndex, with route ids as feature ids and object ids kept in 'oids'
+    """
+    index_path = None
+    if cache_folder:
+        key = get_route_index_key(network, route_id_field, where_clause, version, spatial_reference)
+        index_path = os.path.join(cache_folder, '{0}_{1}.npz'.format(os.path.basename(network), key))
+        if os.path.exists(index_path):
+            logger.info("Loading route index '{0}'...".format(index_path))
+            return SegmentGridIndex.load(index_path)
+
+    logger.info("Building route index of '{0}'...".format(network))
+    not_null_clause = "{0} IS NOT NULL".format(route_id_field)
+    where_clause = "({0}) AND {1}".format(where_clause, not_null_clause) if where_clause else not_null_clause
+    routes, attributes = load_polyline_array(network, route_id_field, ['OID@'], where_clause,
+                                             spatial_reference=spatial_reference)
+    index = SegmentGridIndex.build(routes, oids=[attribute[0] for attribute in attributes])
+
+    if index_path:
+        if not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+        index.save(index_path)
+        logger.info("Route index saved to '{0}'".format(index_path))
+    return index
+
+
+def load_route_locator(network, route_id_field, where_clause=None, spatial_reference=None):
+    """
+    Load the M-aware routes into a RouteLocator in one cursor pass, routes without an id are skipped
+    :param network:
+    :param route_id_field:
+    :param where_clause: e.g. the active date filter of the network
+    :param spatial_reference: spatial reference of the locator, defaults to the one of the network
+    :return: RouteLocator, with route ids as feature ids
+    """
+    logger.info("Loading routes of '{0}' for linear referencing...".format(network))
+    not_null_clause = "{0} IS NOT NULL".format(route_id_field)
+    where_clause = "({0}) AND {1}".format(where_clause, not_null_clause) if where_clause else not_null_clause
+    routes, attributes = load_polyline_array(network, route_id_field, where_clause=where_clause, has_m=True,
+                                             spatial_reference=spatial_reference)
+    return RouteLocator(routes)
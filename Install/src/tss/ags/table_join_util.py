@@ -0,0 +1,123 @@
+import os
+import arcpy
+import logging
+
+from src.tss.join_util import hash_join
+from src.tss.ags.dao_util import get_count
+
+logger = logging.getLogger(__name__)
+
+FIELD_TYPES = {'String': 'TEXT', 'Integer': 'LONG', 'SmallInteger': 'SHORT', 'Double': 'DOUBLE', 'Single': 'FLOAT',
+               'Date': 'DATE', 'Guid': 'GUID', 'GlobalID': 'GUID'}
+
+
+def get_transferable_fields(dataset):
+    """
+    Attribute fields of a dataset that can be copied to another dataset (no object id, geometry, read-only fields such
+    as Shape_Length, blob or raster)
+    :param dataset:
+    :return: list of arcpy Field objects
+    """
+    return [field for field in arcpy.ListFields(dataset) if field.type in FIELD_TYPES and field.editable]
+
+
+def get_output_fields(dataset, fields, field_names=None):
+    """
+    Definitions of the fields of a dataset to be copied to an output
+    :param dataset:
+    :param fields: names of the fields to copy
+    :param field_names: dict of input field name to output field name, for the fields to be renamed
+    :return: list of (output field name, arcpy Field)
+    """
+    field_names = field_names or {}
+    field_dict = dict((field.name.lower(), field) for field in get_transferable_fields(dataset))
+    output_fields = []
+    for field_name in fields:
+        if field_name.lower() not in field_dict:
+            raise ValueError("Field '{0}' cannot be found (or copied) in '{1}'!".format(field_name, dataset))
+        output_fields.append((field_names.get(field_name, field_name), field_dict[field_name.lower()]))
+    return output_fields
+
+
+def check_output_fields(output_fields):
+    """
+    :param output_fields: list of (output field name, arcpy Field)
+    :return:
+    """
+    output_field_names = [name.lower() for name, field in output_fields]
+    duplicates = sorted(set(name for name in output_field_names if output_field_names.count(name) > 1))
+    if duplicates:
+        raise ValueError("Duplicate output field(s) {0}, rename them with field_names!".format(', '.join(duplicates)))
+
+
+def add_output_fields(output, output_fields):
+    """
+    Add the fields to the output, with the type, length and alias of their input field
+    :param output:
+    :param output_fields: list of (output field name, arcpy Field)
+    :return:
+    """
+    for name, field in output_fields:
+        arcpy.AddField_management(output, name, FIELD_TYPES[field.type], field.precision, field.scale,
+                                  field.length if field.type == 'String' else None, field.aliasName)
+
+
+def join_to_dataset(target, target_key_field, join_table, join_key_field, output, target_fields=None, join_fields=None,
+                    target_where_clause=None, join_where_clause=None, field_names=None):
+    """
+    One-to-many join of a table to a feature class (or table) written to a new dataset with a single insert cursor, in
+    place of copying both inputs to the same workspace, MakeQueryTable, copying the query table and mapping its fields.
+    The smaller input is loaded into a dict keyed by the type-normalized key (see normalize_join_key, so e.g. a LONG
+    link id matches a TEXT one), the larger one is streamed once. Only the rows with a match are written.
+    :param target: feature class (or table) giving the geometry of the output
+    :param target_key_field:
+    :param join_table:
+    :param join_key_field:
+    :param output: output feature class (table if the target has no geometry)
+    :param target_fields: fields of the target copied to the output, all the transferable fields by default
+    :param join_fields: fields of the join table copied to the output
+    :param target_where_clause:
+    :param join_where_clause:
+    :param field_names: dict of input field name to output field name, for the fields to be renamed
+    :return: number of rows written
+    """
+    target_fields = target_fields if target_fields is not None else \
+        [field.name for field in get_transferable_fields(target)]
+    join_fields = join_fields or []
+    output_fields = get_output_fields(target, target_fields, field_names) + \
+        get_output_fields(join_table, join_fields, field_names)
+    check_output_fields(output_fields)
+
+    # Create the output with the schema of the selected fields
+    desc = arcpy.Describe(target)
+    has_shape = hasattr(desc, 'shapeType')
+    output_workspace, output_name = os.path.dirname(output) or arcpy.env.workspace, os.path.basename(output)
+    if arcpy.Exists(output):
+        arcpy.Delete_management(output)
+    if has_shape:
+        arcpy.CreateFeatureclass_management(output_workspace, output_name, desc.shapeType.upper(),
+                                            has_m='ENABLED' if desc.hasM else 'DISABLED',
+                                            has_z='ENABLED' if desc.hasZ else 'DISABLED',
+                                            spatial_reference=desc.spatialReference)
+    else:
+        arcpy.CreateTable_management(output_workspace, output_name)
+    add_output_fields(output, output_fields)
+
+    # Load the smaller side, stream the larger one
+    build_target = get_count(target) < get_count(join_table)
+    logger.info("Joining '{0}' to '{1}' (loading the {2} side)...".format(
+        join_table, target, 'target' if build_target else 'join table'))
+    target_cursor_fields = [target_key_field] + list(target_fields) + (['SHAPE@'] if has_shape else [])
+    join_cursor_fields = [join_key_field] + list(join_fields)
+    insert_fields = [name for name, field in output_fields] + (['SHAPE@'] if has_shape else [])
+    target_value_count = len(target_fields)
+
+    count = 0
+    with arcpy.da.SearchCursor(target, target_cursor_fields, target_where_clause) as target_cursor, \
+            arcpy.da.SearchCursor(join_table, join_cursor_fields, join_where_clause) as join_cursor, \
+            arcpy.da.InsertCursor(output, insert_fields) as iCur:
+        for target_row, join_row in hash_join(target_cursor, join_cursor, build_left=build_target):
+            iCur.insertRow(target_row[1:target_value_count + 1] + join_row[1:] + target_row[target_value_count + 1:])
+            count += 1
+    logger.info("{0} joined row(s) written to '{1}'".format(count, output))
+    return count
@@ -0,0 +1,103 @@
+import arcpy
+import os
+import logging
+
+from src.config.schema import default_schemas
+from src.tss.xref_index import XrefIndex
+from src.tss.ags.route_metrics_util import get_dataset_key
+from src.tss.ags.table_join_util import get_transferable_fields, get_output_fields, check_output_fields, \
+    add_output_fields
+
+logger = logging.getLogger(__name__)
+
+
+def get_xref_index(xref_table, cache_folder=None, mmap_mode='r'):
+    """
+    Get the lookup index of an XREF table. The index is loaded from the cache folder if it has been built from the
+    same version of the table (same key, see get_dataset_key), otherwise it is built in one cursor pass and saved into
+    the cache folder.
+    :param xref_table: table with the HERE link id, DOT route id, from and to measure fields of the XREF schema
+    :param cache_folder: folder to keep the index files, no caching if not specified
+    :param mmap_mode: memory-map the cached index files (see numpy.load)
+    :return: XrefIndex
+    """
+    index_folder = None
+    if cache_folder:
+        index_folder = os.path.join(cache_folder, '{0}_index_{1}'.format(os.path.basename(xref_table),
+                                                                      get_dataset_key(xref_table)))
+        if os.path.isdir(index_folder):
+            logger.info("Loading XREF index '{0}'...".format(index_folder))
+            return XrefIndex.load(index_folder, mmap_mode)
+
+    logger.info("Building XREF index of '{0}'...".format(xref_table))
+    schemas = default_schemas.get('xref_table')
+    fields = [schemas.get('here_lid_field'), schemas.get('dot_rid_field'), schemas.get('fmeas_field'),
+              schemas.get('tmeas_field')]
+    with arcpy.da.SearchCursor(xref_table, fields) as sCur:
+        index = XrefIndex.build(sCur)
+
+    if index_folder:
+        index.save(index_folder)
+        logger.info("XREF index saved to '{0}'".format(index_folder))
+    return index
+
+
+def write_link_locations(xref_index, event_table, route_id_field, measure_field, output_table, fields=None,
+                         field_names=None, where_clause=None, gap_tolerance=0.0, batch_size=100000):
+    """
+    Find the HERE link of DOT point events (e.g. crash records) and write them to a new table with the link id and
+    the offset ratio along the link. Events are read and written in batches; events without a link are written with
+    an empty link id.
+    :param xref_index: XrefIndex (see get_xref_index)
+    :param event_table:
+    :param route_id_field: DOT route id field of the events
+    :param measure_field: measure field of the events
+    :param output_table:
+    :param fields: fields of the events copied to the output, all the transferable fields by default
+    :param field_names: dict of input field name to output field name, for the fields to be renamed
+    :param where_clause:
+    :param gap_tolerance: events in a gap between links are given to the closest link within the tolerance
+    :param batch_size: number of events looked up at once
+    :return: number of events written and number of events with a link
+    """
+    fields = fields if fields is not None else [field.name for field in get_transferable_fields(event_table)]
+    output_fields = get_output_fields(event_table, fields, field_names)
+    here_lid_field = default_schemas.get('xref_table').get('here_lid_field')
+    check_output_fields(output_fields + [(here_lid_field, None), ('OFFSET_RATIO', None)])
+
+    if arcpy.Exists(output_table):
+        arcpy.Delete_management(output_table)
+    arcpy.CreateTable_management(os.path.dirname(output_table) or arcpy.env.workspace, os.path.basename(output_table))
+    add_output_fields(output_table, output_fields)
+    arcpy.AddField_management(output_table, here_lid_field, 'TEXT', field_length=255)
+    arcpy.AddField_management(output_table, 'OFFSET_RATIO', 'DOUBLE')
+
+    count = located_count = 0
+
+    def flush(rows):
+        query_index, link_ids, ratios, distances = xref_index.locate_measures(
+            [row[0] for row in rows], [float('nan') if row[1] is None else row[1] for row in rows],
+            gap_tolerance=gap_tolerance)
+        locations = dict(zip(query_index.tolist(), zip(link_ids.tolist(), ratios.tolist())))
+        for i, row in enumerate(rows):
+            iCur.insertRow(tuple(row[2:]) + locations.get(i, (None, None)))
+        return len(locations)
+
+    with arcpy.da.SearchCursor(event_table, [route_id_field, measure_field] + list(fields), where_clause) as sCur, \
+            arcpy.da.InsertCursor(output_table, [name for name, field in output_fields] +
+                                  [here_lid_field, 'OFFSET_RATIO']) as iCur:
+        rows = []
+        for row in sCur:
+            rows.append(row)
+            if len(rows) == batch_size:
+                located_count += flush(rows)
+                count += len(rows)
+                rows = []
+        if rows:
+            located_count += flush(rows)
+            count += len(rows)
+
+    if located_count < count:
+        logger.warning("{0} of {1} events are not on any HERE link".format(count - located_count, count))
+    logger.info("{0} event(s) written to '{1}'".format(count, output_table))
+    return count, located_count
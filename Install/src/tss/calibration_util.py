@@ -0,0 +1,109 @@
+import numpy as np
+
+
+def round_half_away_from_zero(values, decimal_places):
+    """
+    Round the values the same way as the built-in round of Python 2: half away from zero, on the exact value of the
+    floats (0.0045 is stored slightly below the tie and rounds to 0.004). numpy.round rounds half to even. The values
+    close to a tie, where scaling by 10 ** decimal_places may cross it, are rounded one by one with round.
+    :param values:
+    :param decimal_places:
+    :return:
+    """
+    values = np.asarray(values, dtype=np.float64)
+    factor = 10.0 ** decimal_places
+    scaled = np.abs(values) * factor
+    rounded = np.sign(values) * np.floor(scaled + 0.5) / factor
+    with np.errstate(invalid='ignore'):
+        near_tie = np.abs(scaled - np.floor(scaled) - 0.5) <= 1e-12 * np.maximum(scaled, 1.0)
+    for i in np.flatnonzero(near_tie):
+        rounded.flat[i] = round(values.flat[i], decimal_places)
+    return rounded
+
+
+def route_index_lookup(route_ids, lookup_ids):
+    """
+    Map every lookup id to the position of the same id in route_ids
+    :param route_ids: ids of the routes
+    :param lookup_ids: ids to look up
+    :return: int array of positions, -1 for the ids not found
+    """
+    route_ids = np.array(list(route_ids), dtype=object)
+    lookup_ids = np.array(list(lookup_ids), dtype=object)
+    if len(route_ids) == 0 or len(lookup_ids) == 0:
+        return np.zeros(len(lookup_ids), dtype=np.int64) - 1
+    order = np.argsort(route_ids, kind='mergesort')
+    sorted_ids = route_ids[order]
+    position = np.minimum(np.searchsorted(sorted_ids, lookup_ids), len(sorted_ids) - 1)
+    found = sorted_ids[position] == lookup_ids
+    return np.where(found, order[position], -1).astype(np.int64)
+
+
+def route_parameters(route_metrics, lookup_ids):
+    """
+    Gather the length, minimum and maximum measure of the route of every row
+    :param route_metrics: object with route_ids, lengths, mmins and mmaxs arrays (e.g. RouteMetrics)
+    :param lookup_ids: route id of every row
+    :return: length, mmin, mmax arrays (NaN for missing routes) and the mask of the rows with a valid route, that is
+             a route found with a non-zero length and measures
+    """
+    index = route_index_lookup(route_metrics.route_ids, lookup_ids)
+    found = index >= 0
+    lengths, mmins, mmaxs = [np.where(found, np.asarray(values, dtype=np.float64)[np.maximum(index, 0)], np.nan)
+                             if len(values) else np.zeros(len(index)) + np.nan
+                             for values in (route_metrics.lengths, route_metrics.mmins, route_metrics.mmaxs)]
+    with np.errstate(invalid='ignore'):
+        valid = found & (lengths > 0) & ~np.isnan(mmins) & ~np.isnan(mmaxs)
+    return lengths, mmins, mmaxs, valid
+
+
+def calibrate_with_parameters(measures, source_parameters, target_parameters, decimal_places=3):
+    """
+    Transfer measures from the source routes to the target routes of the rows, by the ratios of their lengths and
+    measure ranges
+    :param measures: (n,) or (n, k) array of measures on the source routes (e.g. from and to measures)
+    :param source_parameters: length, mmin, mmax and valid arrays of the source route of every row (see
+                              route_parameters)
+    :param target_parameters: length, mmin, mmax and valid arrays of the target route of every row
+    :param decimal_places:
+    :return: adjusted measures (NaN for invalid rows), mask of the rows with a valid source route and mask of the rows
+             with a valid target route
+    """
+    measures = np.array(measures, dtype=np.float64)
+    source_length, source_mmin, source_mmax, source_valid = source_parameters
+    target_length, target_mmin, target_mmax, target_valid = target_parameters
+    # the measure range of the source route is a divisor
+    source_valid = source_valid & (source_mmax != source_mmin)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length_ratio = source_length / target_length
+        source_measure_length_ratio = np.abs(source_mmax - source_mmin) / source_length
+        target_measure_length_ratio = np.abs(target_mmax - target_mmin) / target_length
+
+        if measures.ndim == 2:
+            source_mmin, target_mmin = source_mmin[:, np.newaxis], target_mmin[:, np.newaxis]
+            length_ratio = length_ratio[:, np.newaxis]
+            source_measure_length_ratio = source_measure_length_ratio[:, np.newaxis]
+            target_measure_length_ratio = target_measure_length_ratio[:, np.newaxis]
+        adjusted = (measures - source_mmin) / source_measure_length_ratio / length_ratio * \
+            target_measure_length_ratio + target_mmin
+        adjusted = round_half_away_from_zero(adjusted, decimal_places)
+
+    adjusted[~(source_valid & target_valid)] = np.nan
+    return adjusted, source_valid, target_valid
+
+
+def calibrate_measures(route_ids, measures, source_metrics, target_metrics, decimal_places=3):
+    """
+    Transfer measures from the source routes to the target routes with the same route ids, by the ratios of their
+    lengths and measure ranges
+    :param route_ids: route id of every row
+    :param measures: (n,) or (n, k) array of measures on the source routes (e.g. from and to measures)
+    :param source_metrics: RouteMetrics of the source routes
+    :param target_metrics: RouteMetrics of the target routes
+    :param decimal_places:
+    :return: adjusted measures (NaN for invalid rows), mask of the rows with a valid source route and mask of the rows
+             with a valid target route
+    """
+    return calibrate_with_parameters(measures, route_parameters(source_metrics, route_ids),
+                                     route_parameters(target_metrics, route_ids), decimal_places)
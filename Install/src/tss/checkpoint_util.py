@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import logging
+import cPickle as pickle
+from datetime import datetime
+
+from helper import first_or_default
+
+logger = logging.getLogger(__name__)
+
+
+def get_run_key(tool_name, parameters):
+    """
+    Key of a run, two runs with the same tool, parameters and input fingerprints have the same key
+    :param tool_name:
+    :param parameters: dict of the parameters and input dataset fingerprints
+    :return:
+    """
+    return hashlib.md5(json.dumps([tool_name, parameters], sort_keys=True, default=str)).hexdigest()
+
+
+class CheckpointStore(object):
+    """
+    Named checkpoints of the stages of a tool run, kept in a JSON manifest in the checkpoint folder. A stage is
+    completed with its output datasets (and optionally the in-memory rows it produced); a rerun with the same
+    parameters and input fingerprints skips the completed stages as long as their outputs still exist, and runs every
+    stage from the first one that is not completed.
+
+    if checkpoints.should_run('spatial_join'):
+        arcpy.SpatialJoin_analysis(here_link, dot_network, here_link_sj)
+        checkpoints.complete('spatial_join', [here_link_sj])
+    """
+
+    def __init__(self, folder, tool_name, parameters=None, exists=os.path.exists):
+        """
+        :param folder: checkpoint folder, checkpoints are disabled (every stage runs) if not specified
+        :param tool_name:
+        :param parameters: dict of the parameters and input dataset fingerprints of the run
+        :param exists: function checking if an output dataset exists (e.g. arcpy.Exists)
+        """
+        self.folder = folder
+        self.tool_name = tool_name
+        self.parameters = parameters or {}
+        self.exists = exists
+        self.run_key = get_run_key(tool_name, self.parameters)
+        self.manifest_path = os.path.join(folder, '{0}_checkpoints.json'.format(tool_name)) if folder else None
+        self.stages = self._load()
+        self.resumed_stages = []
+        self._resuming = True
+
+    @property
+    def enabled(self):
+        return self.manifest_path is not None
+
+    def _load(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return []
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError), err:
+            logger.warning("Checkpoints '{0}' cannot be read: {1}".format(self.manifest_path, err))
+            return []
+        if manifest.get('run_key') != self.run_key:
+            logger.info("Checkpoints of a previous run with other parameters or inputs are ignored")
+            return []
+        return manifest.get('stages', [])
+
+    def _save(self):
+        if not self.enabled:
+            return
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'tool': self.tool_name, 'run_key': self.run_key, 'parameters': self.parameters,
+                       'stages': self.stages}, f, indent=2, default=str)
+
+    def _rows_path(self, name):
+        return os.path.join(self.folder, '{0}_{1}.pkl'.format(self.tool_name, name))
+
+    def _discard(self, records):
+        names = set(record['name'] for record in records)
+        for name in names:
+            if os.path.exists(self._rows_path(name)):
+                os.remove(self._rows_path(name))
+        self.stages = [record for record in self.stages if record['name'] not in names]
+
+    def _is_valid(self, record):
+        if not all(self.exists(output) for output in record['outputs']):
+            return False
+        return not record['has_rows'] or os.path.exists(self._rows_path(record['name']))
+
+    def should_run(self, name):
+        """
+        Check if a stage has to run. Once a stage runs, the checkpoints of the stages after it are discarded and every
+        following stage runs as well.
+        :param name:
+        :return: False if the stage has been completed by a previous run of the same inputs and parameters
+        """
+        if self._resuming:
+            record = first_or_default(self.stages, lambda r: r['name'] == name)
+            if record is not None and self._is_valid(record):
+                logger.info("Stage '{0}' completed at {1}, resuming after it".format(name, record['completed']))
+                self.resumed_stages.append(name)
+                return False
+            self._resuming = False
+            self._discard([record for record in self.stages if record['name'] not in self.resumed_stages])
+            self._save()
+        return True
+
+    def complete(self, name, outputs=None, rows=None):
+        """
+        Record a completed stage
+        :param name:
+        :param outputs: output datasets of the stage that the next stages read
+        :param rows: in-memory result of the stage, kept with the checkpoint (must be picklable)
+        :return:
+        """
+        if not self.enabled:
+            return
+        self._resuming = False
+        self._discard([record for record in self.stages if record['name'] == name])
+        if rows is not None:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            with open(self._rows_path(name), 'wb') as f:
+                pickle.dump(rows, f, pickle.HIGHEST_PROTOCOL)
+        self.stages.append({'name': name, 'outputs': list(outputs or []), 'has_rows': rows is not None,
+                            'completed': datetime.now().isoformat()})
+        self._save()
+
+    def load_rows(self, name):
+        """
+        :return: the in-memory result kept with the checkpoint of the stage
+        """
+        with open(self._rows_path(name), 'rb') as f:
+            return pickle.load(f)
+
+    def clear(self):
+        """
+        Delete the checkpoints once the run succeeded
+        """
+        if not self.enabled:
+            return
+        self._discard(self.stages)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
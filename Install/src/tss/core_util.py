@@ -27,4 +27,27 @@ def linear_units_to_mile(linear_unit_string):
     }
     if unit not in conversion_dict:
         raise Exception("unhandled unit {0}".format(unit))
-    return float(val) * conversion_dict[unit]
\ No newline at end of file
+    return float(val) * conversion_dict[unit]
+
+def linear_units_to_meter(linear_unit_string):
+    """
+    Convert a linear unit length to a numeric in meter as the unit
+    :param linear_unit_string:
+    """
+    val, unit = linear_unit_string.split(None, 1)
+    conversion_dict = {
+        "Centimeters": 0.01,
+        "Decimeters": 0.1,
+        "Feet": 0.3048,
+        "Inches": 0.0254,
+        "Kilometers": 1000.0,
+        "Meters": 1.0,
+        "Miles": 1609.344,
+        "Millimeters": 0.001,
+        "Nautical Miles": 1852.0,
+        "NauticalMiles": 1852.0,
+        "Yards": 0.9144
+    }
+    if unit not in conversion_dict:
+        raise Exception("unhandled unit {0}".format(unit))
+    return float(val) * conversion_dict[unit]
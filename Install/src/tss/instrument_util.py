@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_time():
+    """
+    :return: user + system CPU time of the current process in seconds
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _windows_memory_counters():
+    """
+    :return: PROCESS_MEMORY_COUNTERS of the current process on Windows, None if they cannot be read
+    """
+    if os.name != 'nt':
+        return None
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD),
+                        ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        if get_process_memory_info(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def peak_memory_bytes():
+    """
+    :return: peak memory (resident set / working set) of the current process since it started in bytes, None if it
+             cannot be read. This is the all-time peak of the process, not the peak of a stage.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS, in kilobytes on Linux
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+
+    counters = _windows_memory_counters()
+    return counters.PeakWorkingSetSize if counters is not None else None
+
+
+def current_memory_bytes():
+    """
+    :return: current memory (resident set / working set) of the current process in bytes, None if it cannot be read
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    counters = _windows_memory_counters()
+    return counters.WorkingSetSize if counters is not None else None
+
+
+def _to_mb(value):
+    return None if value is None else round(value / 1048576.0, 1)
+
+
+def get_report_path(output, tool_name):
+    """
+    Path of the run report of a tool, next to its output. Outputs inside a geodatabase get the report in the folder
+    containing the geodatabase.
+    :param output: output dataset of the tool
+    :param tool_name:
+    :return: None if no folder can be found for the output
+    """
+    if not output:
+        return None
+    folder = os.path.dirname(output)
+    while folder and (not os.path.isdir(folder) or os.path.splitext(folder)[1].lower() in ('.gdb', '.mdb', '.sde')):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+    if not folder:
+        return None
+    return os.path.join(folder, '{0}_{1}_report.json'.format(os.path.splitext(os.path.basename(output))[0],
+                                                             tool_name))
+
+
+class StageRecord(object):
+    """
+    Measurements of one stage of a run
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.status = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.input_rows = None
+        self.output_rows = None
+        # memory of the process at the start and at the end of the stage, and the increase during the stage
+        self.start_memory_mb = None
+        self.end_memory_mb = None
+        self.memory_increase_mb = None
+        # all-time peak memory of the process at the end of the stage, includes the stages before it
+        self.process_peak_memory_mb = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'input_rows': self.input_rows,
+            'output_rows': self.output_rows,
+            'start_memory_mb': self.start_memory_mb,
+            'end_memory_mb': self.end_memory_mb,
+            'memory_increase_mb': self.memory_increase_mb,
+            'process_peak_memory_mb': self.process_peak_memory_mb
+        }
+
+
+class RunReport(object):
+    """
+    Stage level timing and row count instrumentation of a tool run. Every stage records its wall time, CPU time,
+    input/output row counts, the memory of the process at its start and end (and the increase between them) and the
+    peak memory of the process so far; the report is written as JSON.
+
+    with run_report.stage('spatial_join', inputs=[here_link], outputs=[here_link_sj]):
+        arcpy.SpatialJoin_analysis(here_link, dot_network, here_link_sj)
+    """
+
+    def __init__(self, tool_name, row_counter=None):
+        """
+        :param tool_name:
+        :param row_counter: function returning the row count of a dataset (e.g. dao_util.get_count), the datasets of
+                            the stages are not counted if not specified
+        """
+        self.tool_name = tool_name
+        self.row_counter = row_counter
+        self.parameters = {}
+        self.stages = []
+        self.status = None
+        self.started = datetime.now()
+        self._start_wall = time.time()
+        self._start_cpu = cpu_time()
+
+    def count_rows(self, datasets):
+        """
+        :param datasets: a dataset, a list of datasets or an in-memory collection of rows
+        :return: total row count, None if any of them cannot be counted
+        """
+        if isinstance(datasets, (list, tuple, set, dict)) and not all(isinstance(d, basestring) for d in datasets):
+            return len(datasets)
+        if isinstance(datasets, basestring):
+            datasets = [datasets]
+        if self.row_counter is None:
+            return None
+        try:
+            return sum(self.row_counter(dataset) for dataset in datasets)
+        except Exception, err:
+            logger.debug("Rows of {0} cannot be counted: {1}".format(datasets, err))
+            return None
+
+    @contextmanager
+    def stage(self, name, inputs=None, outputs=None):
+        """
+        Measure the block as a stage. The input and output row counts are read from the input datasets before the
+        stage and the output datasets after it, or can be set on the yielded record (input_rows, output_rows).
+        :param name:
+        :param inputs: dataset(s) or rows read by the stage
+        :param outputs: dataset(s) written by the stage
+        """
+        record = StageRecord(name)
+        if inputs is not None:
+            record.input_rows = self.count_rows(inputs)
+        record.start_memory_mb = _to_mb(current_memory_bytes())
+        start_wall, start_cpu = time.time(), cpu_time()
+        try:
+            yield record
+            record.status = 'success'
+        except BaseException:
+            record.status = 'failed'
+            raise
+        finally:
+            record.wall_seconds = round(time.time() - start_wall, 3)
+            record.cpu_seconds = round(cpu_time() - start_cpu, 3)
+            record.end_memory_mb = _to_mb(current_memory_bytes())
+            if record.start_memory_mb is not None and record.end_memory_mb is not None:
+                record.memory_increase_mb = round(record.end_memory_mb - record.start_memory_mb, 1)
+            record.process_peak_memory_mb = _to_mb(peak_memory_bytes())
+            if record.status == 'success' and outputs is not None and record.output_rows is None:
+                record.output_rows = self.count_rows(outputs)
+            self.stages.append(record)
+            logger.info("[{0}] {1}: {2}s wall, {3}s CPU, {4} -> {5} rows".format(
+                self.tool_name, name, record.wall_seconds, record.cpu_seconds, record.input_rows, record.output_rows))
+
+    def to_dict(self):
+        return {
+            'tool': self.tool_name,
+            'started': self.started.isoformat(),
+            'status': self.status,
+            'wall_seconds': round(time.time() - self._start_wall, 3),
+            'cpu_seconds': round(cpu_time() - self._start_cpu, 3),
+            'process_peak_memory_mb': _to_mb(peak_memory_bytes()),
+            'parameters': self.parameters,
+            'stages': [record.to_dict() for record in self.stages]
+        }
+
+    def save(self, path):
+        """
+        Write the report as JSON
+        :param path:
+        :return: the path, None if the report could not be written
+        """
+        if not path:
+            return None
+        try:
+            with open(path, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2, default=str)
+        except (IOError, OSError), err:
+            logger.warning("Run report '{0}' cannot be written: {1}".format(path, err))
+            return None
+        logger.info("Run report: {0}".format(path))
+        return path
@@ -1,6 +1,8 @@
 import arcpy
 import os
 from itertools import permutations
+from ags.feature_array_util import linear_unit_to_map_unit, load_points
+from ags.spatial_index_util import load_route_locator
 import logging
 logger = logging.getLogger(__name__)
 
@@ -30,6 +32,14 @@ class IntersectionRouteEvent(object):
         self.measure_scale = kwargs.get("measure_scale", 3)
         self.search_radius = kwargs.get("search_radius", "0.5 Meters")
 
+        # Optional SegmentGridIndex of the network (in the spatial reference of the network)
+        self.route_index = kwargs.get("route_index", None)
+
+        # "arcpy" runs LocateFeaturesAlongRoutes, "in_memory" projects the intersections on the routes loaded in memory
+        self.locate_engine = kwargs.get("locate_engine", "arcpy")
+        # Optional RouteLocator of the network (in the spatial reference of the network)
+        self.route_locator = kwargs.get("route_locator", None)
+
     def create_intersection_route_event(self):
         self.create_intersection_route_event_table()
         logger.info("Finished creating intersection route event table")
@@ -48,32 +58,31 @@ class IntersectionRouteEvent(object):
         arcpy.AddField_management(self.intersection_route_event, self.intersection_route_at_rid_field, "TEXT", "", "", 20)
 
     def populate_intersection_route_event_table(self):
-        arcpy.LocateFeaturesAlongRoutes_lr(self.intersection_event, self.network, self.network_route_id_field, self.search_radius,
-                                           intersections_along_route, "%s Point %s" % (intersection_rid_field, intersection_meas_field),
-                                           "ALL", "NO_DISTANCE")
-        logger.info("Finished locating features along routes")
         inter__route__measure_dict = {}
-        with arcpy.da.SearchCursor(intersections_along_route, (self.intersection_id_field, intersection_rid_field, intersection_meas_field)) as sCursor:
-            for sRow in sCursor:
-                intersection_id, route_id, measure = sRow[0], sRow[1], round(sRow[2], int(self.measure_scale))
-                if intersection_id not in inter__route__measure_dict:
-                    inter__route__measure_dict[intersection_id] = {}
-                if route_id not in inter__route__measure_dict[intersection_id]:
-                    inter__route__measure_dict[intersection_id][route_id] = []
-                # Note: it is set to a list to handle cases that intersection locating on a route twice, like loop
-                inter__route__measure_dict[intersection_id][route_id].append(measure)
+        for intersection_id, route_id, measure in self.locate_intersections_along_routes():
+            measure = round(measure, int(self.measure_scale))
+            if intersection_id not in inter__route__measure_dict:
+                inter__route__measure_dict[intersection_id] = {}
+            if route_id not in inter__route__measure_dict[intersection_id]:
+                inter__route__measure_dict[intersection_id][route_id] = []
+            # Note: it is set to a list to handle cases that intersection locating on a route twice, like loop
+            inter__route__measure_dict[intersection_id][route_id].append(measure)
 
         # Heads up! Here is a workaround code. Some routes do not have measures.
         # The locate feature along route won't create any records for that route
         # In order to get all the route id pairs, we will have to do another spatial join
-        arcpy.SpatialJoin_analysis(self.intersection_event, self.network, inter_route_join, "JOIN_ONE_TO_MANY", "KEEP_ALL", "" , "INTERSECT", self.search_radius)
-        inter__route_list_dict = {}
-        with arcpy.da.SearchCursor(inter_route_join, [self.intersection_id_field, self.network_route_id_field]) as sCursor:
-            for sRow in sCursor:
-                intersection_id, route_id = sRow[0], sRow[1]
-                if intersection_id not in inter__route_list_dict:
-                    inter__route_list_dict[intersection_id] = []
-                inter__route_list_dict[intersection_id].append(route_id)
+        # The route index answers the same question without scanning the network again
+        if self.route_index is not None:
+            inter__route_list_dict = self.find_routes_near_intersections()
+        else:
+            arcpy.SpatialJoin_analysis(self.intersection_event, self.network, inter_route_join, "JOIN_ONE_TO_MANY", "KEEP_ALL", "" , "INTERSECT", self.search_radius)
+            inter__route_list_dict = {}
+            with arcpy.da.SearchCursor(inter_route_join, [self.intersection_id_field, self.network_route_id_field]) as sCursor:
+                for sRow in sCursor:
+                    intersection_id, route_id = sRow[0], sRow[1]
+                    if intersection_id not in inter__route_list_dict:
+                        inter__route_list_dict[intersection_id] = []
+                    inter__route_list_dict[intersection_id].append(route_id)
 
         with arcpy.da.InsertCursor(self.intersection_route_event, (self.intersection_id_field, self.intersection_route_on_rid_field, self.intersection_route_at_rid_field, self.intersection_route_on_measure_field)) as iCursor:
             for intersection_id, route_list in inter__route_list_dict.items():
@@ -91,7 +100,55 @@ class IntersectionRouteEvent(object):
                             iCursor.insertRow((intersection_id, on_route_id, at_route_id, None))
         return self.intersection_route_event
 
+    def locate_intersections_along_routes(self):
+        """
+        Locate the intersections on every route within the search radius (all the locations of a loop route)
+        :return: list of (intersection id, route id, measure)
+        """
+        if self.locate_engine == "in_memory":
+            spatial_reference = arcpy.Describe(self.network).spatialReference
+            if self.route_locator is None:
+                self.route_locator = load_route_locator(self.network, self.network_route_id_field,
+                                                        spatial_reference=spatial_reference)
+            points, attributes = load_points(self.intersection_event, [self.intersection_id_field],
+                                             spatial_reference=spatial_reference)
+            radius = linear_unit_to_map_unit(self.search_radius, self.network)
+            point_index, route_index, measures, distances = self.route_locator.locate_points(points, radius)
+            route_ids = self.route_locator.route_ids
+            logger.info("Finished locating features along routes")
+            return [(attributes[i][0], route_ids[r], measure)
+                    for i, r, measure in zip(point_index.tolist(), route_index.tolist(), measures.tolist())]
+
+        arcpy.LocateFeaturesAlongRoutes_lr(self.intersection_event, self.network, self.network_route_id_field, self.search_radius,
+                                           intersections_along_route, "%s Point %s" % (intersection_rid_field, intersection_meas_field),
+                                           "ALL", "NO_DISTANCE")
+        logger.info("Finished locating features along routes")
+        with arcpy.da.SearchCursor(intersections_along_route, (self.intersection_id_field, intersection_rid_field, intersection_meas_field)) as sCursor:
+            return [tuple(sRow) for sRow in sCursor]
+
+    def find_routes_near_intersections(self):
+        spatial_reference = arcpy.Describe(self.network).spatialReference
+        intersection_ids = []
+        points = []
+        with arcpy.da.SearchCursor(self.intersection_event, [self.intersection_id_field, "SHAPE@XY"],
+                                   spatial_reference=spatial_reference) as sCursor:
+            for sRow in sCursor:
+                intersection_ids.append(sRow[0])
+                points.append(sRow[1])
+
+        radius = linear_unit_to_map_unit(self.search_radius, self.network)
+        intersection_index, route_index = self.route_index.query_point_features(points, radius)
+        route_ids = self.route_index.polylines.ids
+        inter__route_list_dict = {}
+        for i, r in zip(intersection_index.tolist(), route_index.tolist()):
+            intersection_id = intersection_ids[i]
+            if intersection_id not in inter__route_list_dict:
+                inter__route_list_dict[intersection_id] = []
+            inter__route_list_dict[intersection_id].append(route_ids[r])
+        return inter__route_list_dict
+
     def clear_intermediate_data(self):
         to_be_deleted_items = [intersections_along_route, inter_route_join]
         for item in to_be_deleted_items:
-            arcpy.Delete_management(item)
\ No newline at end of file
+            if arcpy.Exists(item):
+                arcpy.Delete_management(item)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import numpy as np
+
+from polyline_util import segments_intersect, point_segment_distance
+from spatial_index import SegmentGridIndex, expand_ranges
+
+TRUE_INTERSECTION = "TRUE INTERSECTIONS"
+CIRCULAR_INTERSECTION = "CIRCULAR INTERSECTIONS"
+CONCURRENT_INTERSECTION = "CONCURRENT INTERSECTIONS OR OTHERS"
+
+
+def point_pairs_within(points, distance):
+    """
+    Find the pairs of points within the distance of each other with a hash grid of the distance as cell size
+    :param points: (n, 2) array
+    :param distance:
+    :return: (first, second) point index of every pair, first < second
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(points) < 2:
+        return empty, empty
+    cell_size = distance if distance > 0 else 1.0
+    cells = np.floor((points - points.min(axis=0)) / cell_size).astype(np.int64)
+    ny = cells[:, 1].max() + 3
+    keys = (cells[:, 0] + 1) * ny + cells[:, 1] + 1
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+
+    first_chunks, second_chunks = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbor_keys = keys + dx * ny + dy
+            lower = np.searchsorted(sorted_keys, neighbor_keys, 'left')
+            upper = np.searchsorted(sorted_keys, neighbor_keys, 'right')
+            owner, position = expand_ranges(lower, upper - lower)
+            first_chunks.append(owner)
+            second_chunks.append(order[position])
+    first, second = np.concatenate(first_chunks), np.concatenate(second_chunks)
+    near = (first < second) & (np.sqrt(((points[first] - points[second]) ** 2).sum(axis=1)) <= distance)
+    return first[near], second[near]
+
+
+def cluster_points(points, tolerance):
+    """
+    Snap the points within the tolerance of each other (transitively) into clusters
+    :param points: (n, 2) array
+    :param tolerance:
+    :return: cluster label of every point, the smallest point index of its cluster
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    labels = np.arange(len(points), dtype=np.int64)
+    first, second = point_pairs_within(points, tolerance)
+    while len(first):
+        previous = labels.copy()
+        pair_labels = np.minimum(labels[first], labels[second])
+        np.minimum.at(labels, first, pair_labels)
+        np.minimum.at(labels, second, pair_labels)
+        labels = labels[labels]
+        if (labels == previous).all():
+            break
+    return labels
+
+
+def classify_route_ids(route_ids):
+    """
+    Classify a snapped route end point by the route ids of the end points snapped to it
+    :param route_ids:
+    :return: intersection type, None for dangle points or loop skeletons which are not real intersections
+    """
+    length = len(route_ids)
+    if length == 1:
+        return None
+    unique_length = len(set(route_ids))
+    if unique_length == 1:
+        return CIRCULAR_INTERSECTION
+    if unique_length == length:
+        return TRUE_INTERSECTION
+    return CONCURRENT_INTERSECTION
+
+
+def count_route_contacts(index, points, distance):
+    """
+    Count how many times the routes pass within the distance of every point. Consecutive segments of the same route
+    within the distance are counted as one pass, the same as the locations found by locating the point along routes.
+    :param index: SegmentGridIndex of the routes
+    :param points:
+    :param distance:
+    :return:
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    query_index, segment_index = index.query_points(points, distance)
+    order = np.lexsort((segment_index, query_index))
+    query_index, segment_index = query_index[order], segment_index[order]
+    continued = np.zeros(len(query_index), dtype=bool)
+    continued[1:] = (query_index[1:] == query_index[:-1]) & \
+                    (index.segment_feature[segment_index[1:]] == index.segment_feature[segment_index[:-1]]) & \
+                    (index.segment_vertex[segment_index[1:]] == index.segment_vertex[segment_index[:-1]] + 1)
+    return np.bincount(query_index[~continued], minlength=len(points))
+
+
+def segment_crossing_points(index):
+    """
+    Points where segments of different routes cross each other. Segments only touching or overlapping each other are
+    left out, their meeting points are route end points.
+    :param index: SegmentGridIndex of the routes
+    :return: (n, 2) points
+    """
+    first, second = index.query_segments(index.segment_start, index.segment_end, 0.0)
+    other_feature = index.segment_feature[first] < index.segment_feature[second]
+    first, second = first[other_feature], second[other_feature]
+    a0, a1 = index.segment_start[first], index.segment_end[first]
+    b0, b1 = index.segment_start[second], index.segment_end[second]
+
+    crossing = segments_intersect(a0, a1, b0, b1)
+    a0, a1, b0, b1 = a0[crossing], a1[crossing], b0[crossing], b1[crossing]
+    da, db = a1 - a0, b1 - b0
+    denominator = da[:, 0] * db[:, 1] - da[:, 1] * db[:, 0]
+    offset = b0 - a0
+    t = (offset[:, 0] * db[:, 1] - offset[:, 1] * db[:, 0]) / denominator
+    return (a0 + da * t[:, np.newaxis]).reshape(-1, 2)
+
+
+def dangle_end_points(index, end_points, end_point_feature, labels, search_radius):
+    """
+    Route end points which are not snapped to the end point of another route, but lie within the search radius of
+    another route (e.g. a route ending on the middle of another one, or short of it)
+    :param index: SegmentGridIndex of the routes
+    :param end_points: (n, 2) end points of the route parts
+    :param end_point_feature: route index of every end point
+    :param labels: cluster label of every end point (see cluster_points)
+    :param search_radius:
+    :return: (n, 2) points
+    """
+    cluster_routes = np.unique(labels * len(index.polylines) + end_point_feature)
+    cluster_route_counts = np.bincount(cluster_routes // len(index.polylines), minlength=len(labels))
+    unsnapped = np.nonzero(cluster_route_counts[labels] == 1)[0]
+    query_index, segment_index = index.query_points(end_points[unsnapped], search_radius)
+    near_other = index.segment_feature[segment_index] != end_point_feature[unsnapped][query_index]
+    return end_points[unsnapped[np.unique(query_index[near_other])]].reshape(-1, 2)
+
+
+def detect_intersections(routes, snap_tolerance, search_radius, dangle_exclusion_distance, end_point_filter=None):
+    """
+    Detect the intersections of a route network in one pass over its geometries. The end points of every route part
+    are snapped together with a hash grid and classified by the route ids meeting there. Circular intersections are
+    only kept where the route passes twice. Dangle intersections (routes crossing, or ending within the search radius
+    of another route without being snapped to it) are added through the same grid, unless they are within the dangle
+    exclusion distance of an intersection already found.
+    :param routes: PolylineArray of the routes, ids are the route ids
+    :param snap_tolerance: distance under which route end points are considered the same point
+    :param search_radius:
+    :param dangle_exclusion_distance:
+    :param end_point_filter: function taking the (n, 2) route end points and returning whether to keep every one of
+                             them before they are classified, the dangle intersections are not filtered
+    :return: (n, 2) intersection points, intersection type of every point (None for dangle intersections) and
+             whether every point is a loop intersection
+    """
+    part_feature = np.repeat(np.arange(len(routes), dtype=np.int64), np.diff(routes.feature_offsets))
+    part_start, part_end = routes.part_offsets[:-1], routes.part_offsets[1:]
+    non_empty = part_end > part_start
+    end_points = np.concatenate((routes.xy[part_start[non_empty]], routes.xy[part_end[non_empty] - 1]))
+    end_point_feature = np.concatenate((part_feature[non_empty], part_feature[non_empty]))
+    index = SegmentGridIndex.build(routes)
+
+    # dangles are found among all the end points, only the end points classified below are filtered
+    labels = cluster_points(end_points, snap_tolerance)
+    dangle_points = dangle_end_points(index, end_points, end_point_feature, labels, search_radius)
+    if end_point_filter is not None:
+        keep = np.asarray(end_point_filter(end_points), dtype=bool)
+        end_points, end_point_feature = end_points[keep], end_point_feature[keep]
+        labels = cluster_points(end_points, snap_tolerance)
+
+    cluster_route_ids_dict = {}
+    for label, feature in zip(labels.tolist(), end_point_feature.tolist()):
+        cluster_route_ids_dict.setdefault(label, []).append(routes.ids[feature])
+
+    points, types = [], []
+    for label in sorted(cluster_route_ids_dict):
+        intersection_type = classify_route_ids(cluster_route_ids_dict[label])
+        if intersection_type is not None:
+            points.append(end_points[label])
+            types.append(intersection_type)
+    points = np.array(points, dtype=np.float64).reshape(-1, 2)
+
+    # Filter out cases that a circle is simplified as a line, a point is falsely generated
+    is_loop = np.array([intersection_type == CIRCULAR_INTERSECTION for intersection_type in types], dtype=bool)
+    if is_loop.any():
+        right_loop = count_route_contacts(index, points[is_loop], search_radius) == 2
+        keep = np.ones(len(points), dtype=bool)
+        keep[np.nonzero(is_loop)[0][~right_loop]] = False
+        points, types, is_loop = points[keep], [types[i] for i in np.nonzero(keep)[0]], is_loop[keep]
+
+    # Append dangle intersections, this is handle cases that some DOTs might not have network snapping very well
+    dangle_points = np.concatenate((dangle_points, segment_crossing_points(index)))
+    if len(dangle_points):
+        dangle_labels = cluster_points(dangle_points, snap_tolerance)
+        dangle_points = dangle_points[np.unique(dangle_labels)]
+        combined = np.concatenate((points, dangle_points))
+        first, second = point_pairs_within(combined, dangle_exclusion_distance)
+        excluded = np.unique(second[(first < len(points)) & (second >= len(points))])
+        keep = np.ones(len(dangle_points), dtype=bool)
+        keep[excluded - len(points)] = False
+        dangle_points = dangle_points[keep]
+
+    points = np.concatenate((points, dangle_points))
+    types = types + [None] * len(dangle_points)
+    is_loop = np.concatenate((is_loop, np.zeros(len(dangle_points), dtype=bool)))
+    return points, types, is_loop
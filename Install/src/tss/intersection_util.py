@@ -1,5 +1,10 @@
 import arcpy
+import os
+import numpy as np
 from ags import transform_dataset_keep_fields, build_string_in_sql_expression, build_numeric_in_sql_expression, delete_subset_data
+from ags.feature_array_util import load_polyline_array, load_points, linear_unit_to_map_unit
+from ags.spatial_index_util import load_route_locator
+from intersection_snap_util import detect_intersections
 
 # Intermediate data
 two_d_network = "two_d_network"
@@ -19,6 +24,16 @@ class IntersectionEvent(object):
         self.network_route_id_field = kwargs.get("network_route_id_field", None)
         self.loop_intersection = kwargs.get("loop_intersection", None)
         self.search_radius = kwargs.get("search_radius", None)
+
+        # "arcpy" runs the geoprocessing tools, "in_memory" detects the intersections from the route geometries directly
+        self.engine = kwargs.get("engine", "arcpy")
+        # Distance under which route end points are snapped together, defaults to the XY tolerance of the network
+        self.snap_tolerance = kwargs.get("snap_tolerance", None)
+        self.dangle_exclusion_distance = kwargs.get("dangle_exclusion_distance", "4 Meters")
+        # "arcpy" runs LocateFeaturesAlongRoutes, "in_memory" projects the points on the routes loaded in memory once
+        self.locate_engine = kwargs.get("locate_engine", "arcpy")
+        self.route_locator = None
+        self.loop_intersection_oids = None
         logger.info("Finished init")
 
     def create_intersection_event(self):
@@ -37,6 +52,9 @@ class IntersectionEvent(object):
         return self.intersection_event
 
     def detect_intersections(self):
+        if self.engine == "in_memory":
+            return self.detect_intersections_in_memory()
+
         outputZFlag = arcpy.env.outputZFlag
         outputMFlag = arcpy.env.outputMFlag
         arcpy.env.outputZFlag = "Disabled"
@@ -102,10 +120,14 @@ class IntersectionEvent(object):
         potential_loop_intersections_locate = "potential_loop_intersections_locate"
         potential_loop_intersections_locate_fq = "potential_loop_intersections_locate_fq"
         arcpy.Select_analysis(self.intersection_event, potential_loop_intersections, "INTER_SHAPE_TYPE='CIRCULAR INTERSECTIONS'")
-        arcpy.LocateFeaturesAlongRoutes_lr(potential_loop_intersections, self.network, self.network_route_id_field, self.search_radius, potential_loop_intersections_locate, "RID POINT MEAS", "ALL")
-        arcpy.Frequency_analysis(potential_loop_intersections_locate, potential_loop_intersections_locate_fq, ["TSS_ID"])
-        with arcpy.da.SearchCursor(potential_loop_intersections_locate_fq, "TSS_ID", "FREQUENCY = 2") as sCursor:
-            right_loop_tssids = [sRow[0] for sRow in sCursor]
+        if self.locate_engine == "in_memory":
+            location_counts = self.count_route_locations(potential_loop_intersections, "TSS_ID")
+            right_loop_tssids = [tssid for tssid, count in location_counts.items() if count == 2]
+        else:
+            arcpy.LocateFeaturesAlongRoutes_lr(potential_loop_intersections, self.network, self.network_route_id_field, self.search_radius, potential_loop_intersections_locate, "RID POINT MEAS", "ALL")
+            arcpy.Frequency_analysis(potential_loop_intersections_locate, potential_loop_intersections_locate_fq, ["TSS_ID"])
+            with arcpy.da.SearchCursor(potential_loop_intersections_locate_fq, "TSS_ID", "FREQUENCY = 2") as sCursor:
+                right_loop_tssids = [sRow[0] for sRow in sCursor]
         with arcpy.da.SearchCursor(potential_loop_intersections, "TSS_ID") as sCursor:
             wrong_loop_tssids = [sRow[0] for sRow in sCursor if sRow[0] not in right_loop_tssids]
         delete_subset_data(self.intersection_event, build_numeric_in_sql_expression("TSS_ID", wrong_loop_tssids))
@@ -126,11 +148,14 @@ class IntersectionEvent(object):
         # arcpy.Delete_management(filter_intersection_layer)
         # Note: simply select by location won't work because it creates different output as locate feature along route, which just sucks
         # Have to do one more locate feature along route here to make sure every thing is good
-        filter_locate_route = "filter_locate_route"
-        arcpy.LocateFeaturesAlongRoutes_lr(self.intersection_event, self.network, self.network_route_id_field, self.search_radius,
-                                           filter_locate_route, "RID POINT MEAS", "#", "NO_DISTANCE", "#", "NO_FIELDS")
-        with arcpy.da.SearchCursor(filter_locate_route, "INPUTOID") as sCursor:
-            located_oids = [sRow[0] for sRow in sCursor]
+        if self.locate_engine == "in_memory":
+            located_oids = set(self.count_route_locations(self.intersection_event, "OID@", all_matches=False))
+        else:
+            filter_locate_route = "filter_locate_route"
+            arcpy.LocateFeaturesAlongRoutes_lr(self.intersection_event, self.network, self.network_route_id_field, self.search_radius,
+                                               filter_locate_route, "RID POINT MEAS", "#", "NO_DISTANCE", "#", "NO_FIELDS")
+            with arcpy.da.SearchCursor(filter_locate_route, "INPUTOID") as sCursor:
+                located_oids = [sRow[0] for sRow in sCursor]
         with arcpy.da.UpdateCursor(self.intersection_event, "OID@") as uCursor:
             for uRow in uCursor:
                 if uRow[0] not in located_oids:
@@ -149,6 +174,76 @@ class IntersectionEvent(object):
 
         return self.intersection_event
 
+    def count_route_locations(self, points, id_field, all_matches=True):
+        """
+        Locate the points on the routes within the search radius in memory, the routes are loaded once per instance
+        :param points: point feature class
+        :param id_field: field identifying the points
+        :param all_matches: every location on every route (a point where a loop route touches itself is located twice),
+                            otherwise only the closest location
+        :return: dict of point id to the number of locations, points not located on any route are left out
+        """
+        spatial_reference = arcpy.Describe(self.network).spatialReference
+        if self.route_locator is None:
+            self.route_locator = load_route_locator(self.network, self.network_route_id_field,
+                                                    spatial_reference=spatial_reference)
+        xy, attributes = load_points(points, [id_field], spatial_reference=spatial_reference)
+        point_index, route_index, measures, distances = self.route_locator.locate_points(
+            xy, linear_unit_to_map_unit(self.search_radius, self.network), all_matches)
+        location_counts = {}
+        for i in point_index.tolist():
+            location_counts[attributes[i][0]] = location_counts.get(attributes[i][0], 0) + 1
+        return location_counts
+
+    def detect_intersections_in_memory(self):
+        spatial_reference = arcpy.Describe(self.network).spatialReference
+        snap_tolerance = self.snap_tolerance if self.snap_tolerance is not None else spatial_reference.XYTolerance
+        routes, attributes = load_polyline_array(self.network, self.network_route_id_field)
+        # the route end points are filtered before they are classified, the same as the arcpy path
+        end_point_filter = self.select_points_near_filter_layer if self.intersection_filter_layer else None
+        points, types, is_loop = detect_intersections(routes, snap_tolerance,
+                                                      linear_unit_to_map_unit(self.search_radius, self.network),
+                                                      linear_unit_to_map_unit(self.dangle_exclusion_distance, self.network),
+                                                      end_point_filter)
+        logger.info("Detected {0} intersections from {1} routes".format(len(points), len(routes)))
+
+        arcpy.CreateFeatureclass_management(os.path.dirname(self.intersection_event) or arcpy.env.workspace,
+                                            os.path.basename(self.intersection_event), "POINT", "", "DISABLED",
+                                            "DISABLED", spatial_reference)
+        arcpy.AddField_management(self.intersection_event, "INTER_SHAPE_TYPE", "TEXT")
+        self.loop_intersection_oids = []
+        with arcpy.da.InsertCursor(self.intersection_event, ["SHAPE@XY", "INTER_SHAPE_TYPE"]) as iCursor:
+            for xy, intersection_type, loop in zip(points.tolist(), types, is_loop.tolist()):
+                oid = iCursor.insertRow((tuple(xy), intersection_type))
+                if loop:
+                    self.loop_intersection_oids.append(oid)
+        return self.intersection_event
+
+    def select_points_near_filter_layer(self, points):
+        """
+        Select the points intersecting the intersection filter layer within the search radius, the same selection as
+        filter_out_none_intersections
+        :param points: (n, 2) array in the spatial reference of the network
+        :return: boolean array, whether every point is selected
+        """
+        end_points = "in_memory\\intersection_end_points"
+        end_points_layer = "intersection_end_points_layer"
+        arcpy.CreateFeatureclass_management("in_memory", "intersection_end_points", "POINT", "", "DISABLED",
+                                            "DISABLED", arcpy.Describe(self.network).spatialReference)
+        arcpy.AddField_management(end_points, "POINT_INDEX", "LONG")
+        with arcpy.da.InsertCursor(end_points, ["SHAPE@XY", "POINT_INDEX"]) as iCursor:
+            for i, xy in enumerate(points.tolist()):
+                iCursor.insertRow((tuple(xy), i))
+        arcpy.MakeFeatureLayer_management(end_points, end_points_layer)
+        arcpy.SelectLayerByLocation_management(end_points_layer, "INTERSECT", self.intersection_filter_layer, self.search_radius)
+        selected = np.zeros(len(points), dtype=bool)
+        with arcpy.da.SearchCursor(end_points_layer, "POINT_INDEX") as sCursor:
+            for sRow in sCursor:
+                selected[sRow[0]] = True
+        arcpy.Delete_management(end_points_layer)
+        arcpy.Delete_management(end_points)
+        return selected
+
     def detect_dangle_intersections(self, network, simplify_intersection):
         # This is a custom codes for GDOT because not all routes snap very well
         intersect_intersections = "intersect_intersections"
@@ -191,6 +286,11 @@ class IntersectionEvent(object):
     def detect_loop_intersection(self):
         if self.loop_intersection is None:
             return
+        if self.loop_intersection_oids is not None:
+            oid_field = arcpy.Describe(self.intersection_event).OIDFieldName
+            arcpy.Select_analysis(self.intersection_event, self.loop_intersection,
+                                  build_numeric_in_sql_expression(oid_field, self.loop_intersection_oids))
+            return
         intersection_event_layer = "intersection_event_layer"
         arcpy.MakeFeatureLayer_management(self.intersection_event, intersection_event_layer, "")
         arcpy.SelectLayerByLocation_management(intersection_event_layer, "INTERSECT", generated_loop_intersections, self.search_radius)
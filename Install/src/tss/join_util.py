@@ -0,0 +1,57 @@
+import numbers
+
+
+def normalize_join_key(value):
+    """
+    Normalize a join key so that the same id stored in fields of different types matches, e.g. 1234 (LONG), 1234.0
+    (DOUBLE) and u'1234' (TEXT) all give u'1234'
+    :param value:
+    :return: None for null or blank keys, which never match
+    """
+    if value is None:
+        return None
+    if isinstance(value, numbers.Integral):
+        return unicode(value)
+    if isinstance(value, float):
+        return unicode(int(value)) if value.is_integer() else repr(value)
+    value = unicode(value).strip()
+    return value or None
+
+
+def build_join_index(rows, key_index=0):
+    """
+    Load rows into a dict keyed by their normalized key
+    :param rows: iterable of tuples (e.g. a search cursor)
+    :param key_index: position of the key in the rows
+    :return: dict of normalized key to the list of rows with that key
+    """
+    index = {}
+    for row in rows:
+        key = normalize_join_key(row[key_index])
+        if key is None:
+            continue
+        index.setdefault(key, []).append(row)
+    return index
+
+
+def hash_join(left_rows, right_rows, left_key_index=0, right_key_index=0, build_left=False):
+    """
+    Inner one-to-many (or many-to-many) join of two row streams on their normalized keys. One side (the smaller one)
+    is loaded into a dict, the other side is streamed once; the pairs come in the order of the streamed side.
+    :param left_rows: iterable of tuples
+    :param right_rows: iterable of tuples
+    :param left_key_index: position of the key in the left rows
+    :param right_key_index: position of the key in the right rows
+    :param build_left: load the left rows into the dict and stream the right rows, the other way around by default
+    :return: generator of (left row, right row)
+    """
+    if build_left:
+        index = build_join_index(left_rows, left_key_index)
+        for right_row in right_rows:
+            for left_row in index.get(normalize_join_key(right_row[right_key_index]), ()):
+                yield left_row, right_row
+    else:
+        index = build_join_index(right_rows, right_key_index)
+        for left_row in left_rows:
+            for right_row in index.get(normalize_join_key(left_row[left_key_index]), ()):
+                yield left_row, right_row
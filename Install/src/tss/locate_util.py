@@ -0,0 +1,130 @@
+import numpy as np
+
+from polyline_util import project_point_segment
+from spatial_index import SegmentGridIndex, expand_ranges
+
+
+def _first_per_group(groups, *sort_keys):
+    """
+    Index of the first row of every group once the rows of each group are sorted on the keys
+    :param groups: group key of every row
+    :param sort_keys: keys to sort the rows of a group on, most significant first
+    :return:
+    """
+    if len(groups) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort(tuple(reversed(sort_keys)) + (groups,))
+    sorted_groups = groups[order]
+    first = np.concatenate(([True], sorted_groups[1:] != sorted_groups[:-1]))
+    return order[first]
+
+
+class RouteLocator(object):
+    """
+    Linear referencing of points and lines on a set of M-aware routes. The routes are loaded into flat coordinate
+    arrays and a segment grid index once, then any number of features can be located in bulk, without writing a locate
+    table for every call.
+
+    Like LocateFeaturesAlongRoutes with the 'ALL' option, a point gets one location every time a route passes within
+    the tolerance, so a point where a loop route touches itself is located twice on that route. Consecutive segments
+    of a route within the tolerance count as one pass (the closest of them gives the location). Routes without
+    measures do not give any location.
+    """
+
+    def __init__(self, routes, index=None):
+        """
+        :param routes: PolylineArray with m values
+        :param index: SegmentGridIndex of the routes, built if not specified
+        """
+        if routes.m is None:
+            raise ValueError("The routes must have m values to be located on")
+        self.routes = routes
+        self.index = index if index is not None else SegmentGridIndex.build(routes)
+
+    def __len__(self):
+        return len(self.routes)
+
+    @property
+    def route_ids(self):
+        return self.routes.ids
+
+    def _project(self, points, tolerance):
+        """
+        Project the points on every segment within the tolerance
+        :return: (point index, segment index, measure, distance)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        point_index, segment_index = self.index.query_points(points, tolerance)
+        t, distance = project_point_segment(points[point_index], self.index.segment_start[segment_index],
+                                            self.index.segment_end[segment_index])
+        vertex = self.index.segment_vertex[segment_index]
+        m0, m1 = self.routes.m[vertex], self.routes.m[vertex + 1]
+        measure = m0 + t * (m1 - m0)
+        valid = (distance <= tolerance) & ~np.isnan(measure)
+        return point_index[valid], segment_index[valid], measure[valid], distance[valid]
+
+    def locate_points(self, points, tolerance, all_matches=True):
+        """
+        Locate points on the routes
+        :param points: (n, 2) coordinates, in the spatial reference of the routes
+        :param tolerance: search radius, in map units
+        :param all_matches: every pass of every route within the tolerance, otherwise only the closest location of
+                            every point
+        :return: (point index, route index, measure, distance) of every location, ordered by point, route and measure
+        """
+        point_index, segment_index, measure, distance = self._project(points, tolerance)
+        route_index = self.index.segment_feature[segment_index]
+        vertex = self.index.segment_vertex[segment_index]
+
+        if all_matches:
+            # split the segments of every (point, route) into runs of connected segments, one location per run
+            order = np.lexsort((vertex, route_index, point_index))
+            point_index, route_index, vertex = point_index[order], route_index[order], vertex[order]
+            measure, distance = measure[order], distance[order]
+            run_start = np.ones(len(order), dtype=bool)
+            run_start[1:] = (point_index[1:] != point_index[:-1]) | (route_index[1:] != route_index[:-1]) | \
+                            (vertex[1:] != vertex[:-1] + 1)
+            keep = _first_per_group(np.cumsum(run_start), distance)
+        else:
+            keep = _first_per_group(point_index, distance, route_index)
+
+        keep = keep[np.lexsort((measure[keep], route_index[keep], point_index[keep]))]
+        return point_index[keep], route_index[keep], measure[keep], distance[keep]
+
+    def locate_lines(self, start_points, end_points, tolerance, all_matches=True):
+        """
+        Locate lines on the routes from their end points. A line is located on a route if both of its end points are,
+        the from and to measures are those of its start and end points. If an end point is located more than once on
+        the route (loop routes), the pair of locations closest to each other along the route is kept.
+        :param start_points: (n, 2) first points of the lines
+        :param end_points: (n, 2) last points of the lines
+        :param tolerance: search radius, in map units
+        :param all_matches: every route the line is located on, otherwise only the closest one
+        :return: (line index, route index, from measure, to measure, distance) of every location, the distance being
+                 the largest distance of the two end points
+        """
+        start_line, start_route, start_measure, start_distance = self.locate_points(start_points, tolerance)
+        end_line, end_route, end_measure, end_distance = self.locate_points(end_points, tolerance)
+
+        # pair the locations of the start and end points on the same route
+        route_count = max(len(self), 1)
+        start_key = start_line * route_count + start_route
+        end_key = end_line * route_count + end_route
+        end_order = np.argsort(end_key, kind='mergesort')
+        end_key = end_key[end_order]
+        lower = np.searchsorted(end_key, start_key, 'left')
+        counts = np.searchsorted(end_key, start_key, 'right') - lower
+        start_pair, end_position = expand_ranges(lower, counts)
+        end_pair = end_order[end_position]
+
+        line_index, route_index = start_line[start_pair], start_route[start_pair]
+        from_measure, to_measure = start_measure[start_pair], end_measure[end_pair]
+        distance = np.maximum(start_distance[start_pair], end_distance[end_pair])
+        span = np.abs(to_measure - from_measure)
+
+        if all_matches:
+            keep = _first_per_group(start_key[start_pair], span)
+        else:
+            keep = _first_per_group(line_index, distance, span)
+        keep = keep[np.lexsort((route_index[keep], line_index[keep]))]
+        return line_index[keep], route_index[keep], from_measure[keep], to_measure[keep], distance[keep]
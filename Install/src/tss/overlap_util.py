@@ -0,0 +1,148 @@
+import time
+import numpy as np
+
+from spatial_index import SegmentGridIndex, expand_ranges
+
+
+def feature_envelopes(polylines):
+    """
+    :param polylines: PolylineArray
+    :return: (n, 2) lower left and (n, 2) upper right corners of every feature, NaN for features without vertices
+    """
+    start, end = polylines.feature_vertex_bounds()
+    envelope_min = np.empty((len(polylines), 2))
+    envelope_max = np.empty((len(polylines), 2))
+    envelope_min.fill(np.nan)
+    envelope_max.fill(np.nan)
+    non_empty = np.nonzero(end > start)[0]
+    if len(non_empty):
+        envelope_min[non_empty] = np.minimum.reduceat(polylines.xy, start[non_empty], axis=0)
+        envelope_max[non_empty] = np.maximum.reduceat(polylines.xy, start[non_empty], axis=0)
+    return envelope_min, envelope_max
+
+
+def sweep_envelope_pairs(envelope_min, envelope_max, tolerance=0.0):
+    """
+    Find the pairs of envelopes overlapping each other (within the tolerance) with a sweep line along x
+    :return: (first, second) envelope index of every overlapping pair, first < second
+    """
+    valid = np.nonzero(~np.isnan(envelope_min).any(axis=1))[0]
+    order = valid[np.argsort(envelope_min[valid, 0], kind='mergesort')]
+    x_min = envelope_min[order, 0]
+    x_max = envelope_max[order, 0] + tolerance
+
+    # every envelope is paired with the following ones starting before its end along x
+    upper = np.searchsorted(x_min, x_max, 'right')
+    first, second = expand_ranges(np.arange(1, len(order) + 1, dtype=np.int64), upper - np.arange(1, len(order) + 1))
+    first, second = order[first], order[second]
+
+    y_overlap = (envelope_min[first, 1] <= envelope_max[second, 1] + tolerance) & \
+                (envelope_min[second, 1] <= envelope_max[first, 1] + tolerance)
+    first, second = first[y_overlap], second[y_overlap]
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+def collinear_overlap_intervals(a0, a1, b0, b1, tolerance):
+    """
+    Shared sub-segments of two sets of segments, row by row. Segment b shares a sub-segment with segment a if both of
+    its end points are within the tolerance of the line of a and their projections on a overlap it by more than the
+    tolerance.
+    :return: boolean array of the overlapping rows, and the (lower, upper) distances of the shared part along a
+    """
+    a_length = np.sqrt(((a1 - a0) ** 2).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = (a1 - a0) / a_length[:, np.newaxis]
+    b0_offset, b1_offset = b0 - a0, b1 - a0
+    b0_along = (b0_offset * u).sum(axis=1)
+    b1_along = (b1_offset * u).sum(axis=1)
+    b0_across = np.abs(u[:, 0] * b0_offset[:, 1] - u[:, 1] * b0_offset[:, 0])
+    b1_across = np.abs(u[:, 0] * b1_offset[:, 1] - u[:, 1] * b1_offset[:, 0])
+
+    lower = np.maximum(0, np.minimum(b0_along, b1_along))
+    upper = np.minimum(a_length, np.maximum(b0_along, b1_along))
+    with np.errstate(invalid='ignore'):
+        overlap = (a_length > 0) & (b0_across <= tolerance) & (b1_across <= tolerance) & (upper - lower > tolerance)
+    return overlap, lower, upper
+
+
+def find_collinear_overlaps(polylines, tolerance):
+    """
+    Find the shared sub-segments between every pair of features. Feature pairs are pruned with a sweep line over the
+    feature envelopes, only the segments of the features left in a pair are queried against a segment grid index, and
+    only the segment pairs of candidate feature pairs get the exact test.
+    :param polylines: PolylineArray
+    :param tolerance: distance under which two segments are considered collinear, in map units
+    :return: list of (first feature index, second feature index), list of the overlap parts (list of vertex lists) of
+             every pair, and the statistics
+    """
+    start_time = time.time()
+    feature_count = len(polylines)
+
+    envelope_min, envelope_max = feature_envelopes(polylines)
+    first_features, second_features = sweep_envelope_pairs(envelope_min, envelope_max, tolerance)
+    candidate_pair_keys = np.unique(first_features * feature_count + second_features)
+
+    # only the segments of the first feature of a candidate pair are queried, against the segments of any feature
+    index = SegmentGridIndex.build(polylines)
+    query_features = np.zeros(feature_count, dtype=bool)
+    query_features[first_features] = True
+    query_segments = np.nonzero(query_features[index.segment_feature])[0]
+    query_index, segment_index = index.query_segments(index.segment_start[query_segments],
+                                                      index.segment_end[query_segments], tolerance)
+    query_index = query_segments[query_index]
+    feature_a, feature_b = index.segment_feature[query_index], index.segment_feature[segment_index]
+    other_feature = feature_a < feature_b
+    segment_a, segment_b = query_index[other_feature], segment_index[other_feature]
+
+    pair_keys = index.segment_feature[segment_a] * feature_count + index.segment_feature[segment_b]
+    position = np.minimum(np.searchsorted(candidate_pair_keys, pair_keys), max(len(candidate_pair_keys) - 1, 0))
+    in_candidates = candidate_pair_keys[position] == pair_keys if len(candidate_pair_keys) else \
+        np.zeros(len(pair_keys), dtype=bool)
+    segment_a, segment_b, pair_keys = segment_a[in_candidates], segment_b[in_candidates], pair_keys[in_candidates]
+    segment_pair_count = len(segment_a)
+
+    a0, a1 = index.segment_start[segment_a], index.segment_end[segment_a]
+    overlap, lower, upper = collinear_overlap_intervals(a0, a1, index.segment_start[segment_b],
+                                                        index.segment_end[segment_b], tolerance)
+    segment_a, pair_keys, lower, upper, a0, a1 = segment_a[overlap], pair_keys[overlap], lower[overlap], \
+        upper[overlap], a0[overlap], a1[overlap]
+    u = (a1 - a0) / np.sqrt(((a1 - a0) ** 2).sum(axis=1))[:, np.newaxis]
+    piece_start = a0 + u * lower[:, np.newaxis]
+    piece_end = a0 + u * upper[:, np.newaxis]
+
+    # chain the shared pieces along the first feature of every pair
+    order = np.lexsort((lower, segment_a, pair_keys))
+    pairs = []
+    pair_parts = []
+    previous_key, previous_segment, previous_upper = None, None, None
+    for k in order.tolist():
+        key, segment = int(pair_keys[k]), int(segment_a[k])
+        start_xy, end_xy = tuple(piece_start[k]), tuple(piece_end[k])
+        if key != previous_key:
+            pairs.append((key // feature_count, key % feature_count))
+            pair_parts.append([[start_xy, end_xy]])
+        else:
+            last_part = pair_parts[-1][-1]
+            if segment == previous_segment and lower[k] <= previous_upper + tolerance:
+                # pieces of the same segment overlapping each other
+                if upper[k] > previous_upper:
+                    last_part[-1] = end_xy
+                else:
+                    continue
+            elif np.hypot(last_part[-1][0] - start_xy[0], last_part[-1][1] - start_xy[1]) <= tolerance:
+                last_part.append(end_xy)
+            else:
+                pair_parts[-1].append([start_xy, end_xy])
+        previous_key, previous_segment, previous_upper = key, segment, upper[k]
+
+    stats = {
+        'feature_count': feature_count,
+        'pairs_tested': len(candidate_pair_keys),
+        'pairs_pruned': feature_count * (feature_count - 1) // 2 - len(candidate_pair_keys),
+        'segments_queried': len(query_segments),
+        'segments_skipped': len(index) - len(query_segments),
+        'segment_pairs_tested': segment_pair_count,
+        'overlap_pairs': len(pairs),
+        'elapsed_seconds': time.time() - start_time
+    }
+    return pairs, pair_parts, stats
@@ -0,0 +1,323 @@
+import hashlib
+import numpy as np
+
+
+class PolylineArray(object):
+    """
+    Columnar storage of a set of polyline features. All vertices are kept in one flat (n, 2) coordinate array, parts
+    are described by vertex offsets and features by part offsets, so the whole network can be processed with numpy
+    without touching arcpy geometry objects again.
+    """
+
+    def __init__(self, ids, xy, part_offsets, feature_offsets, m=None):
+        self.ids = list(ids)
+        self.xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.part_offsets = np.asarray(part_offsets, dtype=np.int64)
+        self.feature_offsets = np.asarray(feature_offsets, dtype=np.int64)
+        self.m = None if m is None else np.asarray(m, dtype=np.float64)
+
+    @classmethod
+    def from_features(cls, features, has_m=False):
+        """
+        Build the array from an iterable of (id, parts), where parts is a list of vertex lists and each vertex is a
+        (x, y) or (x, y, m) tuple
+        :param features:
+        :param has_m:
+        :return:
+        """
+        ids = []
+        coords = []
+        part_offsets = [0]
+        feature_offsets = [0]
+        for feature_id, parts in features:
+            for part in parts:
+                coords.extend(part)
+                part_offsets.append(len(coords))
+            ids.append(feature_id)
+            feature_offsets.append(len(part_offsets) - 1)
+
+        width = 3 if has_m else 2
+        vertices = np.array(coords, dtype=np.float64).reshape(-1, width)
+        m = vertices[:, 2] if has_m else None
+        return cls(ids, vertices[:, :2], part_offsets, feature_offsets, m)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def part_count(self):
+        return len(self.part_offsets) - 1
+
+    def vertex_feature_index(self):
+        """
+        :return: the feature index of every vertex
+        """
+        part_sizes = np.diff(self.part_offsets)
+        part_feature = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.feature_offsets))
+        return np.repeat(part_feature, part_sizes)
+
+    def feature_vertex_bounds(self):
+        """
+        :return: (start, end) vertex offsets of every feature
+        """
+        return self.part_offsets[self.feature_offsets[:-1]], self.part_offsets[self.feature_offsets[1:]]
+
+    def first_points(self):
+        """
+        :return: the first vertex of the first part of every feature
+        """
+        start, end = self.feature_vertex_bounds()
+        return self.xy[start]
+
+    def last_points(self):
+        """
+        :return: the last vertex of the last part of every feature
+        """
+        start, end = self.feature_vertex_bounds()
+        return self.xy[end - 1]
+
+    def segment_start_index(self):
+        """
+        Vertex index of the start point of every segment. Segments never cross a part boundary.
+        :return:
+        """
+        if len(self.xy) < 2:
+            return np.zeros(0, dtype=np.int64)
+        valid = np.ones(len(self.xy) - 1, dtype=bool)
+        part_ends = self.part_offsets[1:-1] - 1
+        valid[part_ends[(part_ends >= 0) & (part_ends < len(valid))]] = False
+        return np.nonzero(valid)[0]
+
+    def segments(self):
+        """
+        :return: (start_xy, end_xy, feature_index, start_vertex_index) of every segment
+        """
+        start_index = self.segment_start_index()
+        return self.xy[start_index], self.xy[start_index + 1], self.vertex_feature_index()[start_index], start_index
+
+    def feature_lengths(self):
+        """
+        :return: the planar length of every feature
+        """
+        start_xy, end_xy, feature_index, start_index = self.segments()
+        segment_lengths = np.sqrt(((end_xy - start_xy) ** 2).sum(axis=1))
+        return np.bincount(feature_index, weights=segment_lengths, minlength=len(self))
+
+    def positions_along(self, distances):
+        """
+        Point at the distance along every feature, measured from its first vertex (parts are walked in order). The
+        distance is clamped to the feature length, NaN is returned for features without any segment.
+        :param distances: one distance per feature
+        :return: (n, 2) points
+        """
+        start_xy, end_xy, feature_index, start_index = self.segments()
+        points = np.empty((len(self), 2))
+        points.fill(np.nan)
+        if len(start_xy) == 0:
+            return points
+
+        segment_lengths = np.sqrt(((end_xy - start_xy) ** 2).sum(axis=1))
+        cumulative = np.cumsum(segment_lengths)
+        first_segment = np.searchsorted(feature_index, np.arange(len(self)), 'left')
+        last_segment = np.searchsorted(feature_index, np.arange(len(self)), 'right') - 1
+        has_segment = last_segment >= first_segment
+        features = np.nonzero(has_segment)[0]
+        first_segment, last_segment = first_segment[features], last_segment[features]
+
+        feature_start = cumulative[first_segment] - segment_lengths[first_segment]
+        target = feature_start + np.clip(np.asarray(distances, dtype=np.float64)[features], 0,
+                                         cumulative[last_segment] - feature_start)
+        segment = np.clip(np.searchsorted(cumulative, target, 'left'), first_segment, last_segment)
+        offset = target - (cumulative[segment] - segment_lengths[segment])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(segment_lengths[segment] > 0, offset / segment_lengths[segment], 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        points[features] = start_xy[segment] + (end_xy[segment] - start_xy[segment]) * t[:, np.newaxis]
+        return points
+
+    def fingerprints(self, decimal_places=6, tolerance=None):
+        """
+        Hash of the geometry of every feature (part sizes and vertex coordinates rounded to the decimal places), two
+        features have the same fingerprint if their geometries are the same
+        :param decimal_places:
+        :param tolerance: round the vertex coordinates to multiples of the tolerance (e.g. the XY tolerance) instead of
+                          the decimal places, so that coordinates moved by less than the tolerance (e.g. projected on
+                          the fly) keep the same fingerprint unless they cross a rounding boundary
+        :return: list of hex digests
+        """
+        if tolerance:
+            xy = np.round(self.xy / tolerance).astype(np.int64)
+        else:
+            # adding 0.0 turns -0.0 into 0.0 after rounding
+            xy = np.round(self.xy, decimal_places) + 0.0
+        part_sizes = np.diff(self.part_offsets)
+        fingerprints = []
+        for i in range(len(self)):
+            first_part, last_part = self.feature_offsets[i], self.feature_offsets[i + 1]
+            start, end = self.part_offsets[first_part], self.part_offsets[last_part]
+            digest = hashlib.md5(part_sizes[first_part:last_part].tostring())
+            digest.update(xy[start:end].tostring())
+            fingerprints.append(digest.hexdigest())
+        return fingerprints
+
+    def subset(self, feature_indexes):
+        """
+        Build a new PolylineArray with only the features of the input indexes (in that order)
+        :param feature_indexes:
+        :return:
+        """
+        ids = []
+        xy_chunks = []
+        m_chunks = []
+        part_offsets = [0]
+        feature_offsets = [0]
+        vertex_count = 0
+        for i in feature_indexes:
+            first_part, last_part = self.feature_offsets[i], self.feature_offsets[i + 1]
+            for p in range(first_part, last_part):
+                start, end = self.part_offsets[p], self.part_offsets[p + 1]
+                xy_chunks.append(self.xy[start:end])
+                if self.m is not None:
+                    m_chunks.append(self.m[start:end])
+                vertex_count += end - start
+                part_offsets.append(vertex_count)
+            ids.append(self.ids[i])
+            feature_offsets.append(len(part_offsets) - 1)
+
+        xy = np.concatenate(xy_chunks) if xy_chunks else np.zeros((0, 2))
+        m = None if self.m is None else (np.concatenate(m_chunks) if m_chunks else np.zeros(0))
+        return PolylineArray(ids, xy, part_offsets, feature_offsets, m)
+
+
+def project_point_segment(p, a, b):
+    """
+    Project points onto segments, row by row
+    :param p: (n, 2) points
+    :param a: (n, 2) segment start points
+    :param b: (n, 2) segment end points
+    :return: position of the closest point along every segment (0 at the start point, 1 at the end point) and the
+             planar distance to it
+    """
+    ab = b - a
+    ap = p - a
+    ab_length_sq = (ab ** 2).sum(axis=1)
+    t = np.zeros(len(p))
+    non_degenerate = ab_length_sq > 0
+    t[non_degenerate] = (ap[non_degenerate] * ab[non_degenerate]).sum(axis=1) / ab_length_sq[non_degenerate]
+    t = np.clip(t, 0.0, 1.0)
+    closest = a + ab * t[:, np.newaxis]
+    return t, np.sqrt(((p - closest) ** 2).sum(axis=1))
+
+
+def point_segment_distance(p, a, b):
+    """
+    Planar distance between points and segments, row by row
+    :param p: (n, 2) points
+    :param a: (n, 2) segment start points
+    :param b: (n, 2) segment end points
+    :return:
+    """
+    return project_point_segment(p, a, b)[1]
+
+
+def _cross(u, v):
+    return u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+
+
+def segments_intersect(a0, a1, b0, b1):
+    """
+    Check if segments cross or touch each other, row by row
+    :return: boolean array
+    """
+    d1 = _cross(b1 - b0, a0 - b0)
+    d2 = _cross(b1 - b0, a1 - b0)
+    d3 = _cross(a1 - a0, b0 - a0)
+    d4 = _cross(a1 - a0, b1 - a0)
+    return (((d1 > 0) & (d2 < 0)) | ((d1 < 0) & (d2 > 0))) & (((d3 > 0) & (d4 < 0)) | ((d3 < 0) & (d4 > 0)))
+
+
+def segment_segment_distance(a0, a1, b0, b1):
+    """
+    Minimum planar distance between two sets of segments, row by row
+    :return:
+    """
+    distance = np.minimum(np.minimum(point_segment_distance(a0, b0, b1), point_segment_distance(a1, b0, b1)),
+                          np.minimum(point_segment_distance(b0, a0, a1), point_segment_distance(b1, a0, a1)))
+    distance[segments_intersect(a0, a1, b0, b1)] = 0.0
+    return distance
+
+
+def _clip_slab(t_min, t_max, s0, ds, lo, hi):
+    """
+    Liang-Barsky clipping of the parameter range [t_min, t_max] of a line against lo <= s0 + t * ds <= hi
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_lo = (lo - s0) / ds
+        t_hi = (hi - s0) / ds
+    parallel = ds == 0
+    t_enter = np.where(parallel, -np.inf, np.minimum(t_lo, t_hi))
+    t_exit = np.where(parallel, np.inf, np.maximum(t_lo, t_hi))
+    outside = parallel & ((s0 < lo) | (s0 > hi))
+    t_min = np.maximum(t_min, t_enter)
+    t_max = np.minimum(t_max, t_exit)
+    t_max[outside] = -np.inf
+    return t_min, t_max
+
+
+def _clip_disk(p0, d, center, radius):
+    a = (d ** 2).sum(axis=1)
+    pc = p0 - center
+    b = 2 * (d * pc).sum(axis=1)
+    c = (pc ** 2).sum(axis=1) - radius ** 2
+    discriminant = b ** 2 - 4 * a * c
+    t_min = np.full(len(p0), np.inf)
+    t_max = np.full(len(p0), -np.inf)
+    hit = (a > 0) & (discriminant >= 0)
+    root = np.sqrt(discriminant[hit])
+    t_min[hit] = (-b[hit] - root) / (2 * a[hit])
+    t_max[hit] = (-b[hit] + root) / (2 * a[hit])
+    # A degenerate segment is either entirely inside the disk or entirely outside
+    inside = (a == 0) & (c <= 0)
+    t_min[inside] = 0.0
+    t_max[inside] = 1.0
+    return t_min, t_max
+
+
+def segment_corridor_interval(p0, p1, c0, c1, radius):
+    """
+    Clip segments p0-p1 to the corridor (buffer) of segments c0-c1, row by row. The buffer of a segment is a convex
+    capsule, so the clipped part is always one interval along p0-p1.
+    :param p0: (n, 2) start points of the segments to be clipped
+    :param p1: (n, 2) end points of the segments to be clipped
+    :param c0: (n, 2) start points of the corridor segments
+    :param c1: (n, 2) end points of the corridor segments
+    :param radius: buffer distance
+    :return: (t_start, t_end) ratios along p0-p1. t_start > t_end means the segment does not enter the corridor.
+    """
+    d = p1 - p0
+    axis = c1 - c0
+    axis_length = np.sqrt((axis ** 2).sum(axis=1))
+    unit = np.zeros_like(axis)
+    non_degenerate = axis_length > 0
+    unit[non_degenerate] = axis[non_degenerate] / axis_length[non_degenerate, np.newaxis]
+    normal = np.column_stack((-unit[:, 1], unit[:, 0]))
+
+    # body of the capsule, a rectangle in the local frame of the corridor segment
+    rel = p0 - c0
+    t_min = np.zeros(len(p0))
+    t_max = np.ones(len(p0))
+    t_min, t_max = _clip_slab(t_min, t_max, (rel * unit).sum(axis=1), (d * unit).sum(axis=1), 0.0, axis_length)
+    t_min, t_max = _clip_slab(t_min, t_max, (rel * normal).sum(axis=1), (d * normal).sum(axis=1), -radius, radius)
+    t_max[~non_degenerate] = -np.inf
+
+    # caps of the capsule
+    for center in (c0, c1):
+        disk_min, disk_max = _clip_disk(p0, d, center, radius)
+        disk_min = np.maximum(disk_min, 0.0)
+        disk_max = np.minimum(disk_max, 1.0)
+        disk_hit = disk_min <= disk_max
+        body_hit = t_min <= t_max
+        t_min = np.where(disk_hit, np.where(body_hit, np.minimum(t_min, disk_min), disk_min), t_min)
+        t_max = np.where(disk_hit, np.where(body_hit, np.maximum(t_max, disk_max), disk_max), t_max)
+
+    return t_min, t_max
@@ -0,0 +1,211 @@
+import numpy as np
+
+from polyline_util import PolylineArray
+from spatial_index import expand_ranges
+
+
+class RouteBuild(object):
+    """
+    Diagnostics of the routes assembled by build_routes, one value per route in every array
+    """
+
+    def __init__(self, route_ids, link_counts, component_counts, branch_counts, loop_counts):
+        self.route_ids = list(route_ids)
+        self.link_counts = link_counts
+        # groups of connected links, every group after the first one is behind a gap
+        self.component_counts = component_counts
+        # parts starting from a node already traversed, i.e. links forking from the route
+        self.branch_counts = branch_counts
+        # groups of connected links closing on themselves
+        self.loop_counts = loop_counts
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    @property
+    def gap_counts(self):
+        return self.component_counts - 1
+
+    @property
+    def multi_part(self):
+        return (self.component_counts > 1) | (self.branch_counts > 0)
+
+    def branched_route_ids(self):
+        return [self.route_ids[i] for i in np.nonzero(self.branch_counts > 0)[0]]
+
+    def row_dict(self):
+        """
+        :return: dict of route id to (link count, branch count, loop count)
+        """
+        return dict((route_id, (int(link_count), int(branch_count), int(loop_count)))
+                    for route_id, link_count, branch_count, loop_count in
+                    zip(self.route_ids, self.link_counts, self.branch_counts, self.loop_counts))
+
+
+def _assign_nodes(xy, groups, snap_tolerance):
+    """
+    Number the distinct end points of every group, end points of the same group within the same cell of a grid of the
+    snap tolerance share a node
+    :return: node index of every end point
+    """
+    keys = np.floor(xy / snap_tolerance + 0.5) if snap_tolerance > 0 else xy
+    order = np.lexsort((keys[:, 1], keys[:, 0], groups))
+    change = np.ones(len(order), dtype=bool)
+    change[1:] = (np.diff(groups[order]) != 0) | (np.diff(keys[order, 0]) != 0) | (np.diff(keys[order, 1]) != 0)
+    nodes = np.empty(len(order), dtype=np.int64)
+    nodes[order] = np.cumsum(change) - 1
+    return nodes
+
+
+def _traverse(route_links, from_node, to_node, node_distance):
+    """
+    Order the links of one route by walking its end point graph. Every group of connected links is walked from its
+    dangling node closest to the lower left corner of the route (any node for a loop), taking an unused link at every
+    node until none is left; links left behind at a fork are walked as new parts from the node they fork from.
+    :param route_links: link indexes of the route
+    :param from_node: start node of every link
+    :param to_node: end node of every link
+    :param node_distance: dict of node to its distance to the lower left corner of the route
+    :return: parts as lists of (link index, walked forward), number of groups of connected links, number of branches
+             and number of loops
+    """
+    adjacency = {}
+    for link in route_links:
+        adjacency.setdefault(from_node[link], []).append(link)
+        if to_node[link] != from_node[link]:
+            adjacency.setdefault(to_node[link], []).append(link)
+
+    unused = set(route_links)
+    visited_nodes = set()
+    parts = []
+    component_count = branch_count = loop_count = 0
+    while unused:
+        # start a new group of connected links
+        remaining_nodes = set(node for link in unused for node in (from_node[link], to_node[link]))
+        component_nodes, stack = set(), [min(remaining_nodes, key=lambda node: node_distance[node])]
+        while stack:
+            node = stack.pop()
+            if node in component_nodes:
+                continue
+            component_nodes.add(node)
+            for link in adjacency[node]:
+                stack.extend((from_node[link], to_node[link]))
+        dangles = [node for node in component_nodes if len(adjacency[node]) % 2]
+        if not dangles and all(len(adjacency[node]) == 2 for node in component_nodes):
+            loop_count += 1
+        start = min(dangles or component_nodes, key=lambda node: node_distance[node])
+        component_count += 1
+
+        first_walk = True
+        while start is not None:
+            part, node = [], start
+            visited_nodes.add(node)
+            while True:
+                link = next((link for link in adjacency[node] if link in unused), None)
+                if link is None:
+                    break
+                unused.remove(link)
+                forward = from_node[link] == node
+                part.append((link, forward))
+                node = to_node[link] if forward else from_node[link]
+                visited_nodes.add(node)
+            parts.append(part)
+            branch_count += 0 if first_walk else 1
+            first_walk = False
+
+            fork_nodes = [node for node in component_nodes & visited_nodes
+                          if any(link in unused for link in adjacency[node])]
+            start = min(fork_nodes, key=lambda node: node_distance[node]) if fork_nodes else None
+    return parts, component_count, branch_count, loop_count
+
+
+def build_routes(links, link_route_ids, snap_tolerance=0.0):
+    """
+    Assemble the links of every route into an M-aware route, like CreateRoutes with the LENGTH measure source, the
+    LOWER_LEFT coordinate priority and gaps ignored: links are ordered by walking the end point graph of the route,
+    measures are the cumulative length from the start of the route. Gaps, branches and loops are counted on the way.
+    :param links: PolylineArray of the links, the parts of a multi-part link are taken as one vertex sequence
+    :param link_route_ids: route id of every link, links with a None route id are left out
+    :param snap_tolerance: end points closer than the tolerance (on a grid of the tolerance) are connected
+    :return: PolylineArray of the routes (sorted by route id) with m values, and the RouteBuild diagnostics
+    """
+    start, end = links.feature_vertex_bounds()
+    route_ids = sorted(set(route_id for route_id, size in zip(link_route_ids, (end - start).tolist())
+                           if route_id is not None and size > 0))
+    route_code_dict = dict((route_id, i) for i, route_id in enumerate(route_ids))
+    codes = np.array([route_code_dict.get(route_id, -1) if size > 0 else -1
+                      for route_id, size in zip(link_route_ids, (end - start).tolist())], dtype=np.int64)
+    valid = np.nonzero(codes >= 0)[0]
+    route_count = len(route_ids)
+
+    # nodes of the links, per route
+    endpoint_xy = np.concatenate((links.xy[start[valid]], links.xy[end[valid] - 1]))
+    nodes = _assign_nodes(endpoint_xy, np.concatenate((codes[valid], codes[valid])), snap_tolerance)
+    from_node = dict(zip(valid.tolist(), nodes[:len(valid)].tolist()))
+    to_node = dict(zip(valid.tolist(), nodes[len(valid):].tolist()))
+    node_xy = np.zeros((nodes.max() + 1 if len(nodes) else 0, 2))
+    node_xy[nodes] = endpoint_xy
+
+    # lower left corner of the envelope of every route
+    corner = np.zeros((route_count, 2))
+    vertex_codes = codes[links.vertex_feature_index()]
+    on_route = np.nonzero(vertex_codes >= 0)[0]
+    for axis in (0, 1):
+        values, groups = links.xy[on_route, axis], vertex_codes[on_route]
+        order = np.lexsort((values, groups))
+        first = np.concatenate(([True], np.diff(groups[order]) != 0)) if len(order) else np.zeros(0, dtype=bool)
+        corner[groups[order][first], axis] = values[order][first]
+
+    link_order = []
+    link_forward = []
+    part_link_counts = []
+    route_part_counts = np.zeros(route_count, dtype=np.int64)
+    link_counts = np.bincount(codes[valid], minlength=route_count)
+    component_counts = np.zeros(route_count, dtype=np.int64)
+    branch_counts = np.zeros(route_count, dtype=np.int64)
+    loop_counts = np.zeros(route_count, dtype=np.int64)
+    sorted_links = valid[np.argsort(codes[valid], kind='mergesort')]
+    boundaries = np.searchsorted(codes[sorted_links], np.arange(route_count + 1))
+    for r in range(route_count):
+        route_links = sorted_links[boundaries[r]:boundaries[r + 1]].tolist()
+        route_nodes = set(from_node[link] for link in route_links) | set(to_node[link] for link in route_links)
+        node_distance = dict((node, float(np.hypot(*(node_xy[node] - corner[r])))) for node in route_nodes)
+        parts, component_counts[r], branch_counts[r], loop_counts[r] = _traverse(route_links, from_node, to_node,
+                                                                                  node_distance)
+        route_part_counts[r] = len(parts)
+        for part in parts:
+            part_link_counts.append(len(part))
+            for link, forward in part:
+                link_order.append(link)
+                link_forward.append(forward)
+
+    # vertices of the links in walking order, the first vertex of every link but the first one of a part is dropped
+    link_order = np.array(link_order, dtype=np.int64)
+    link_forward = np.array(link_forward, dtype=bool)
+    part_link_counts = np.array(part_link_counts, dtype=np.int64)
+    first_in_part = np.zeros(len(link_order), dtype=bool)
+    first_in_part[np.cumsum(part_link_counts) - part_link_counts] = True
+    sizes = end[link_order] - start[link_order] - np.where(first_in_part, 0, 1)
+    owner, local = expand_ranges(np.zeros(len(link_order), dtype=np.int64), sizes)
+    skip = np.where(first_in_part, 0, 1)[owner]
+    vertex_index = np.where(link_forward[owner], start[link_order][owner] + skip + local,
+                            end[link_order][owner] - 1 - skip - local)
+    xy = links.xy[vertex_index]
+
+    part_vertex_counts = np.bincount(np.repeat(np.arange(len(part_link_counts)), part_link_counts), weights=sizes,
+                                     minlength=len(part_link_counts)).astype(np.int64)
+    part_offsets = np.concatenate(([0], np.cumsum(part_vertex_counts)))
+    feature_offsets = np.concatenate(([0], np.cumsum(route_part_counts)))
+
+    # cumulative length along every route, gaps between parts are not measured
+    step = np.zeros(len(xy))
+    if len(xy) > 1:
+        step[1:] = np.sqrt((np.diff(xy, axis=0) ** 2).sum(axis=1))
+    step[part_offsets[:-1]] = 0.0
+    cumulative = np.cumsum(step)
+    route_start_vertex = part_offsets[feature_offsets[:-1]]
+    route_vertex_counts = part_offsets[feature_offsets[1:]] - route_start_vertex
+    m = cumulative - np.repeat(cumulative[route_start_vertex], route_vertex_counts)
+
+    routes = PolylineArray(route_ids, xy, part_offsets, feature_offsets, m)
+    return routes, RouteBuild(route_ids, link_counts, component_counts, branch_counts, loop_counts)
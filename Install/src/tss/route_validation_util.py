@@ -0,0 +1,178 @@
+import numpy as np
+
+INCREASING = 1
+DECREASING = -1
+CONSTANT = 0
+DIRECTION_NAMES = {INCREASING: 'Increasing', DECREASING: 'Decreasing', CONSTANT: 'Constant', None: 'Both'}
+
+
+def _group_extreme(values, groups, group_count, largest=True):
+    """
+    Largest (or smallest) value of every group, NaN for the groups without any value
+    :param values:
+    :param groups: group index of every value
+    :param group_count:
+    :param largest:
+    :return:
+    """
+    result = np.empty(group_count)
+    result.fill(np.nan)
+    if len(values) == 0:
+        return result
+    order = np.lexsort((values if largest else -values, groups))
+    sorted_groups = groups[order]
+    last = np.searchsorted(sorted_groups, np.arange(group_count), 'right') - 1
+    has_value = (last >= 0) & (sorted_groups[np.maximum(last, 0)] == np.arange(group_count))
+    result[has_value] = values[order[last[has_value]]]
+    return result
+
+
+class RouteValidation(object):
+    """
+    Diagnostics of a set of routes, one value per route in every array
+    """
+
+    def __init__(self, route_ids, vertex_counts, part_counts, directions, reversal_counts, level_run_counts,
+                 nan_measure_counts, gap_counts, max_gaps, mmins, mmaxs):
+        self.route_ids = list(route_ids)
+        self.vertex_counts = vertex_counts
+        self.part_counts = part_counts
+        # INCREASING, DECREASING, CONSTANT, or None if the measures go both ways
+        self.directions = directions
+        self.reversal_counts = reversal_counts
+        self.level_run_counts = level_run_counts
+        self.nan_measure_counts = nan_measure_counts
+        self.gap_counts = gap_counts
+        self.max_gaps = max_gaps
+        self.mmins = mmins
+        self.mmaxs = mmaxs
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    @property
+    def monotonic(self):
+        """
+        :return: boolean array, routes with levels (consecutive vertices with the same measure) are monotonic
+        """
+        return (self.reversal_counts == 0) & (self.nan_measure_counts == 0)
+
+    @property
+    def gapped(self):
+        return self.gap_counts > 0
+
+    def non_monotonic_route_ids(self):
+        return [self.route_ids[i] for i in np.nonzero(~self.monotonic)[0]]
+
+    def gapped_route_ids(self):
+        return [self.route_ids[i] for i in np.nonzero(self.gapped)[0]]
+
+    def rows(self, only_invalid=False):
+        """
+        :param only_invalid: only the gapped or non-monotonic routes
+        :return: (route id, vertex count, part count, direction, monotonic, reversal count, level run count,
+                 NaN measure count, gap count, max gap, m min, m max) of every route
+        """
+        monotonic = self.monotonic
+        indexes = np.nonzero(~monotonic | self.gapped)[0] if only_invalid else np.arange(len(self))
+        rows = []
+        for i in indexes.tolist():
+            rows.append((self.route_ids[i], int(self.vertex_counts[i]), int(self.part_counts[i]),
+                         DIRECTION_NAMES[self.directions[i]], 'Yes' if monotonic[i] else 'No',
+                         int(self.reversal_counts[i]), int(self.level_run_counts[i]), int(self.nan_measure_counts[i]),
+                         int(self.gap_counts[i]),
+                         None if np.isnan(self.max_gaps[i]) else float(self.max_gaps[i]),
+                         None if np.isnan(self.mmins[i]) else float(self.mmins[i]),
+                         None if np.isnan(self.mmaxs[i]) else float(self.mmaxs[i])))
+        return rows
+
+
+def validate_routes(routes, gap_tolerance=0.0):
+    """
+    Check the measures and the continuity of every route in one pass over the flat vertex arrays.
+
+    Measures are compared between consecutive vertices of a route (across its parts, in part order). A route is
+    monotonic if its measures never go back, consecutive vertices with the same measure (levels) are allowed. Two
+    consecutive parts are continuous if they share any vertex (e.g. overlapping links), or if the closest of their end
+    points are within the gap tolerance.
+    :param routes: PolylineArray with m values
+    :param gap_tolerance: in map units
+    :return: RouteValidation
+    """
+    route_count = len(routes)
+    part_sizes = np.diff(routes.part_offsets)
+    part_feature = np.repeat(np.arange(route_count, dtype=np.int64), np.diff(routes.feature_offsets))
+    vertex_feature = np.repeat(part_feature, part_sizes)
+    vertex_counts = np.bincount(vertex_feature, minlength=route_count)
+    part_counts = np.bincount(part_feature, minlength=route_count)
+
+    m = routes.m if routes.m is not None else np.zeros(len(routes.xy)) + np.nan
+    is_nan = np.isnan(m)
+    nan_measure_counts = np.bincount(vertex_feature[is_nan], minlength=route_count)
+
+    # measure steps between consecutive vertices of the same route
+    same_route = vertex_feature[1:] == vertex_feature[:-1]
+    step_feature = vertex_feature[:-1][same_route]
+    with np.errstate(invalid='ignore'):
+        steps = np.diff(m)[same_route]
+        step_signs = np.sign(steps)
+    step_signs[np.isnan(steps)] = 0
+
+    has_increase = np.bincount(step_feature[step_signs > 0], minlength=route_count) > 0
+    has_decrease = np.bincount(step_feature[step_signs < 0], minlength=route_count) > 0
+    directions = np.empty(route_count, dtype=object)
+    directions[:] = CONSTANT
+    directions[has_increase & ~has_decrease] = INCREASING
+    directions[has_decrease & ~has_increase] = DECREASING
+    directions[has_increase & has_decrease] = None
+
+    moving = np.nonzero(step_signs != 0)[0]
+    moving_signs, moving_feature = step_signs[moving], step_feature[moving]
+    reversed_step = (moving_signs[1:] != moving_signs[:-1]) & (moving_feature[1:] == moving_feature[:-1])
+    reversal_counts = np.bincount(moving_feature[1:][reversed_step], minlength=route_count)
+
+    # runs of consecutive steps without any measure change
+    level = np.zeros(len(steps) + 1, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        level[1:] = steps == 0
+    level_start = level[1:] & ~(level[:-1] & np.concatenate(([False], step_feature[1:] == step_feature[:-1])))
+    level_run_counts = np.bincount(step_feature[level_start], minlength=route_count)
+
+    # distance between the closest end points of consecutive parts of the same route
+    first_xy = routes.xy[routes.part_offsets[:-1]] if len(routes.xy) else np.zeros((0, 2))
+    last_xy = routes.xy[routes.part_offsets[1:] - 1] if len(routes.xy) else np.zeros((0, 2))
+    same_route_parts = np.nonzero(part_feature[1:] == part_feature[:-1])[0]
+    distances = np.zeros(len(same_route_parts))
+    distances.fill(np.inf)
+    for ends, next_ends in ((last_xy, first_xy), (last_xy, last_xy), (first_xy, first_xy), (first_xy, last_xy)):
+        offsets = next_ends[same_route_parts + 1] - ends[same_route_parts]
+        distances = np.minimum(distances, np.sqrt((offsets ** 2).sum(axis=1)))
+    # consecutive parts sharing a vertex, found by sorting the vertices of both parts of every pair by coordinates
+    pair_parts = np.zeros(len(part_sizes), dtype=bool)
+    pair_parts[same_route_parts] = True
+    vertex_part = np.repeat(np.arange(len(part_sizes), dtype=np.int64), part_sizes)
+    first_vertices = np.nonzero(pair_parts[vertex_part])[0]
+    second_vertices = np.nonzero((vertex_part > 0) & pair_parts[np.maximum(vertex_part - 1, 0)])[0]
+    vertex_pair = np.concatenate((vertex_part[first_vertices], vertex_part[second_vertices] - 1))
+    vertex_side = np.concatenate((np.zeros(len(first_vertices), dtype=np.int64),
+                                  np.ones(len(second_vertices), dtype=np.int64)))
+    vertex_xy = routes.xy[np.concatenate((first_vertices, second_vertices))] if len(routes.xy) else np.zeros((0, 2))
+    order = np.lexsort((vertex_side, vertex_xy[:, 1], vertex_xy[:, 0], vertex_pair))
+    vertex_pair, vertex_side, vertex_xy = vertex_pair[order], vertex_side[order], vertex_xy[order]
+    shared = (vertex_pair[1:] == vertex_pair[:-1]) & (vertex_xy[1:] == vertex_xy[:-1]).all(axis=1) & \
+        (vertex_side[1:] != vertex_side[:-1])
+    shared_vertex_parts = np.zeros(len(part_sizes), dtype=bool)
+    shared_vertex_parts[vertex_pair[1:][shared]] = True
+    distances[shared_vertex_parts[same_route_parts]] = 0.0
+
+    is_gap = distances > gap_tolerance
+    gap_feature = part_feature[same_route_parts][is_gap]
+    gap_counts = np.bincount(gap_feature, minlength=route_count)
+    max_gaps = _group_extreme(distances[is_gap], gap_feature, route_count)
+
+    valid_m = np.nonzero(~is_nan)[0]
+    mmins = _group_extreme(m[valid_m], vertex_feature[valid_m], route_count, largest=False)
+    mmaxs = _group_extreme(m[valid_m], vertex_feature[valid_m], route_count)
+
+    return RouteValidation(routes.ids, vertex_counts, part_counts, directions, reversal_counts, level_run_counts,
+                           nan_measure_counts, gap_counts, max_gaps, mmins, mmaxs)
@@ -0,0 +1,233 @@
+import os
+import numpy as np
+
+from join_util import normalize_join_key
+from polyline_util import PolylineArray
+from spatial_index import expand_ranges
+
+
+class RouteSegmenter(object):
+    """
+    Dynamic segmentation of point and line events on a set of M-aware routes. The vertices and measures of the routes
+    are loaded once, the events are then placed in bulk by a vectorized binary search over the measures of their
+    route, in place of a route event layer.
+
+    Measures may increase or decrease along a route (levels are allowed), events on a non-monotonic route or on a
+    route with missing measures are not located. The measures across a gap of a multi-part route are taken as they
+    are, an event spanning a gap gets one part on each side of it.
+    """
+
+    ARRAYS = ['ids', 'xy', 'part_offsets', 'feature_offsets', 'm']
+
+    def __init__(self, routes):
+        """
+        :param routes: PolylineArray with m values
+        """
+        if routes.m is None:
+            raise ValueError("The routes must have m values to locate events on them")
+        self.routes = routes
+        self.start, self.end = routes.feature_vertex_bounds()
+        self.route_code_dict = {}
+        for i, route_id in enumerate(routes.ids):
+            self.route_code_dict.setdefault(normalize_join_key(route_id), i)
+
+        # direction of the measures of every route: 1 increasing, -1 decreasing, 0 non-monotonic or missing measures
+        vertex_route = routes.vertex_feature_index()
+        same_route = vertex_route[1:] == vertex_route[:-1]
+        with np.errstate(invalid='ignore'):
+            step = np.diff(routes.m)
+            increasing = np.bincount(vertex_route[1:][same_route & (step > 0)], minlength=len(routes))
+            decreasing = np.bincount(vertex_route[1:][same_route & (step < 0)], minlength=len(routes))
+        nan_counts = np.bincount(vertex_route[np.isnan(routes.m)], minlength=len(routes))
+        self.directions = np.where(decreasing == 0, 1, np.where(increasing == 0, -1, 0))
+        self.directions[(nan_counts > 0) | (self.end - self.start < 2)] = 0
+
+        # measures times the direction never decrease along a route, which is what the binary search works on
+        self.keys = routes.m * self.directions[vertex_route] if len(vertex_route) else np.zeros(0)
+        self.is_part_start = np.zeros(len(routes.xy), dtype=bool)
+        self.is_part_start[routes.part_offsets[:-1][np.diff(routes.part_offsets) > 0]] = True
+
+    def __len__(self):
+        return len(self.routes)
+
+    def save(self, folder):
+        """
+        Save the routes as one .npy file per array, so that they can be memory-mapped by several processes
+        :param folder:
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        routes = self.routes
+        arrays = {'ids': np.array(routes.ids), 'xy': routes.xy, 'part_offsets': routes.part_offsets,
+                  'feature_offsets': routes.feature_offsets, 'm': routes.m}
+        for name in self.ARRAYS:
+            np.save(os.path.join(folder, '{0}.npy'.format(name)), arrays[name])
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Load the routes saved by save()
+        :param folder:
+        :param mmap_mode: memory-map the arrays (see numpy.load), None to read them into memory
+        :return:
+        """
+        arrays = dict((name, np.load(os.path.join(folder, '{0}.npy'.format(name)), mmap_mode=mmap_mode))
+                      for name in cls.ARRAYS)
+        return cls(PolylineArray(arrays['ids'].tolist(), arrays['xy'], arrays['part_offsets'],
+                                 arrays['feature_offsets'], arrays['m']))
+
+    @property
+    def route_ids(self):
+        return self.routes.ids
+
+    def non_monotonic_route_ids(self):
+        return [self.routes.ids[i] for i in np.nonzero(self.directions == 0)[0]]
+
+    def route_indexes(self, route_ids):
+        """
+        :param route_ids: route id of every event, matched on their normalized values (see normalize_join_key)
+        :return: route index of every event, -1 if the route cannot be found
+        """
+        return np.array([self.route_code_dict.get(normalize_join_key(route_id), -1) for route_id in route_ids],
+                        dtype=np.int64)
+
+    def _prepare(self, route_index, measures, tolerance=None):
+        """
+        Turn the measures into search keys of their route
+        :param tolerance: the keys must be within the measure range of the route extended by the tolerance, not
+                          checked if None
+        :return: (route index, keys, located, key of the route start, key of the route end), the route index of the
+                 events that cannot be located is set to 0
+        """
+        route_index = np.asarray(route_index, dtype=np.int64).reshape(-1)
+        measures = [np.asarray(measure, dtype=np.float64).reshape(-1) for measure in measures]
+        located = route_index >= 0
+        route_index = np.where(located, route_index, 0)
+        direction = self.directions[route_index] if len(self) else np.zeros(len(route_index), dtype=np.int64)
+        located &= direction != 0
+        keys = [measure * direction for measure in measures]
+        for key in keys:
+            located &= ~np.isnan(key)
+        if not len(self):
+            return route_index, keys, located, np.zeros(len(route_index)), np.zeros(len(route_index))
+
+        key_min = self.keys[self.start[route_index]]
+        key_max = self.keys[self.end[route_index] - 1]
+        if tolerance is None:
+            return route_index, keys, located, key_min, key_max
+        with np.errstate(invalid='ignore'):
+            for key in keys:
+                located &= (key >= key_min - tolerance) & (key <= key_max + tolerance)
+        return route_index, keys, located, key_min, key_max
+
+    def _search(self, route_index, keys):
+        """
+        Binary search of the keys on the vertices of their route
+        :return: (k, t) the segment (k, k + 1) holding every key and the ratio along it
+        """
+        lower, upper = self.start[route_index].copy(), self.end[route_index].copy()
+        # first vertex of the route with a key above the search key
+        while True:
+            active = lower < upper
+            if not active.any():
+                break
+            middle = np.where(active, (lower + upper) // 2, lower)
+            go_right = active & (self.keys[np.minimum(middle, len(self.keys) - 1)] <= keys)
+            lower = np.where(go_right, middle + 1, lower)
+            upper = np.where(active & ~go_right, middle, upper)
+
+        k = np.clip(lower - 1, self.start[route_index], self.end[route_index] - 2)
+        key0, key1 = self.keys[k], self.keys[k + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(key1 > key0, (keys - key0) / (key1 - key0), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        # the jump between two parts is not a segment, the key stays at the end of the previous part
+        t[self.is_part_start[k + 1]] = 0.0
+        return k, t
+
+    def _interpolate(self, k, t):
+        """
+        :return: xy and m of the points at the ratio t of the segments (k, k + 1)
+        """
+        xy = self.routes.xy[k] * (1.0 - t)[:, np.newaxis] + self.routes.xy[k + 1] * t[:, np.newaxis]
+        m = self.routes.m[k] * (1.0 - t) + self.routes.m[k + 1] * t
+        return xy, m
+
+    def point_events(self, route_index, measures, tolerance=0.0):
+        """
+        Place point events at their measure
+        :param route_index: route index of every event (see route_indexes)
+        :param measures: measure of every event
+        :param tolerance: measures beyond the ends of the route by less than the tolerance are placed at the ends
+        :return: (xy, m, located), xy and m are NaN for the events not located
+        """
+        route_index, (keys,), located, key_min, key_max = self._prepare(route_index, [measures], tolerance)
+        xy = np.empty((len(route_index), 2))
+        xy.fill(np.nan)
+        m = np.empty(len(route_index))
+        m.fill(np.nan)
+        events = np.nonzero(located)[0]
+        if len(events):
+            k, t = self._search(route_index[events], np.clip(keys[events], key_min[events], key_max[events]))
+            xy[events], m[events] = self._interpolate(k, t)
+        return xy, m, located
+
+    def line_events(self, route_index, from_measures, to_measures, tolerance=0.0):
+        """
+        Cut line events out of their route between their from and to measures. The line follows the direction of the
+        route whatever the order of the measures, the part of an event beyond the ends of its route is left out.
+        :param route_index: route index of every event (see route_indexes)
+        :param from_measures:
+        :param to_measures:
+        :param tolerance: events overlapping their route by less than the tolerance are not located
+        :return: (PolylineArray with one feature per event and the event indexes as ids, located), the events not
+                 located have no part
+        """
+        route_index, (from_keys, to_keys), located, key_min, key_max = self._prepare(
+            route_index, [from_measures, to_measures])
+        event_count = len(route_index)
+        events = np.nonzero(located)[0]
+        route_index = route_index[events]
+        lower = np.maximum(np.minimum(from_keys[events], to_keys[events]), key_min[events])
+        upper = np.minimum(np.maximum(from_keys[events], to_keys[events]), key_max[events])
+        overlap = upper - lower > tolerance
+        located[events[~overlap]] = False
+        events, route_index, lower, upper = events[overlap], route_index[overlap], lower[overlap], upper[overlap]
+        if not len(events):
+            return PolylineArray(range(event_count), np.zeros((0, 2)), [0], np.zeros(event_count + 1, dtype=np.int64),
+                                 np.zeros(0)), located
+
+        k0, t0 = self._search(route_index, lower)
+        k1, t1 = self._search(route_index, upper)
+        start_xy, start_m = self._interpolate(k0, t0)
+        end_xy, end_m = self._interpolate(k1, t1)
+
+        # start point, route vertices in between and end point of every event
+        inner_counts = np.maximum(k1 - k0, 0)
+        sizes = inner_counts + 2
+        offsets = np.cumsum(sizes) - sizes
+        xy = np.empty((sizes.sum(), 2))
+        m = np.empty(sizes.sum())
+        new_part = np.zeros(sizes.sum(), dtype=bool)
+        xy[offsets], m[offsets], new_part[offsets] = start_xy, start_m, True
+        xy[offsets + sizes - 1], m[offsets + sizes - 1] = end_xy, end_m
+        owner, vertex = expand_ranges(k0 + 1, inner_counts)
+        position = offsets[owner] + 1 + vertex - (k0 + 1)[owner]
+        xy[position], m[position] = self.routes.xy[vertex], self.routes.m[vertex]
+        new_part[position] = self.is_part_start[vertex]
+        vertex_event = np.repeat(events, sizes)
+
+        # drop the repeated points (events starting or ending on a vertex), then the parts left with a single point
+        keep = np.ones(len(xy), dtype=bool)
+        keep[1:] = new_part[1:] | (xy[1:] != xy[:-1]).any(axis=1)
+        xy, m, new_part, vertex_event = xy[keep], m[keep], new_part[keep], vertex_event[keep]
+        part_index = np.cumsum(new_part) - 1
+        part_sizes = np.bincount(part_index)
+        valid_part = part_sizes >= 2
+        keep = valid_part[part_index]
+        xy, m = xy[keep], m[keep]
+        part_events = vertex_event[new_part][valid_part]
+        part_offsets = np.concatenate(([0], np.cumsum(part_sizes[valid_part])))
+        feature_offsets = np.concatenate(([0], np.cumsum(np.bincount(part_events, minlength=event_count))))
+        located[events] = np.bincount(part_events, minlength=event_count)[events] > 0
+        return PolylineArray(range(event_count), xy, part_offsets, feature_offsets, m), located
@@ -0,0 +1,194 @@
+import numpy as np
+
+from polyline_util import PolylineArray, point_segment_distance, segment_segment_distance
+
+
+def expand_ranges(lower, counts):
+    """
+    Expand (lower, count) ranges into (owner, value) records, one per value of every range
+    :param lower:
+    :param counts:
+    :return:
+    """
+    counts = np.maximum(counts, 0)
+    owner = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    local = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, lower[owner] + local
+
+
+class SegmentGridIndex(object):
+    """
+    Uniform grid index over the segment bounding boxes of a PolylineArray. Cells are stored in a compressed layout
+    (sorted cell keys with offsets into one entry array), so the index can be saved to and loaded from a single .npz
+    file and queried in bulk.
+    """
+
+    def __init__(self, polylines, origin, cell_size, shape, cell_keys, cell_offsets, cell_entries, oids=None):
+        self.polylines = polylines
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.cell_size = float(cell_size)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.cell_keys = cell_keys
+        self.cell_offsets = cell_offsets
+        self.cell_entries = cell_entries
+        self.oids = oids
+
+        self.segment_start, self.segment_end, self.segment_feature, self.segment_vertex = polylines.segments()
+        self.segment_min = np.minimum(self.segment_start, self.segment_end)
+        self.segment_max = np.maximum(self.segment_start, self.segment_end)
+
+    @classmethod
+    def build(cls, polylines, cell_size=None, oids=None):
+        """
+        Build the grid over every segment of the polylines
+        :param polylines: PolylineArray
+        :param cell_size: defaults to twice the median segment extent
+        :param oids: optional object ids aligned with the features, kept with the index
+        :return:
+        """
+        start_xy, end_xy, feature_index, vertex_index = polylines.segments()
+        segment_min = np.minimum(start_xy, end_xy)
+        segment_max = np.maximum(start_xy, end_xy)
+
+        if len(start_xy) == 0:
+            origin = np.zeros(2)
+            cell_size = cell_size or 1.0
+            shape = (0, 0)
+        else:
+            origin = segment_min.min(axis=0)
+            if cell_size is None:
+                cell_size = 2.0 * float(np.median((segment_max - segment_min).max(axis=1)))
+            cell_size = max(cell_size, 1e-9)
+            shape = tuple((np.floor((segment_max.max(axis=0) - origin) / cell_size)).astype(np.int64) + 1)
+
+        index = cls(polylines, origin, cell_size, shape, np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64), oids)
+        owner, keys = index._box_cells(segment_min, segment_max)
+        order = np.lexsort((owner, keys))
+        keys, owner = keys[order], owner[order]
+        boundaries = np.nonzero(np.diff(keys))[0] + 1
+        index.cell_keys = keys[np.insert(boundaries, 0, 0)] if len(keys) else keys
+        index.cell_offsets = np.concatenate(([0], boundaries, [len(keys)])).astype(np.int64) if len(keys) else \
+            np.zeros(1, dtype=np.int64)
+        index.cell_entries = owner
+        return index
+
+    def __len__(self):
+        return len(self.segment_start)
+
+    def _box_cells(self, box_min, box_max):
+        """
+        Cells covered by every box, as (box index, cell key) records. Cells outside of the grid are dropped.
+        """
+        nx, ny = self.shape
+        lower = np.floor((box_min - self.origin) / self.cell_size).astype(np.int64)
+        upper = np.floor((box_max - self.origin) / self.cell_size).astype(np.int64)
+        ix0, iy0 = np.maximum(lower[:, 0], 0), np.maximum(lower[:, 1], 0)
+        ix1, iy1 = np.minimum(upper[:, 0], nx - 1), np.minimum(upper[:, 1], ny - 1)
+        width = np.maximum(ix1 - ix0 + 1, 0)
+        height = np.maximum(iy1 - iy0 + 1, 0)
+        owner, local = expand_ranges(np.zeros(len(width), dtype=np.int64), width * height)
+        cx = ix0[owner] + local % np.maximum(width[owner], 1)
+        cy = iy0[owner] + local // np.maximum(width[owner], 1)
+        return owner, cx * ny + cy
+
+    def query_boxes(self, box_min, box_max):
+        """
+        Find the segments whose bounding box overlaps the query boxes
+        :param box_min: (n, 2) lower left corners
+        :param box_max: (n, 2) upper right corners
+        :return: (query index, segment index) of every overlapping pair
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        if len(box_min) == 0 or len(self.cell_keys) == 0:
+            return empty, empty
+        box_min = np.asarray(box_min, dtype=np.float64)
+        box_max = np.asarray(box_max, dtype=np.float64)
+
+        owner, keys = self._box_cells(box_min, box_max)
+        position = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[position] == keys
+        owner, position = owner[found], position[found]
+
+        lower = self.cell_offsets[position]
+        pair_owner, entry_position = expand_ranges(lower, self.cell_offsets[position + 1] - lower)
+        pair_keys = np.unique(owner[pair_owner] * len(self) + self.cell_entries[entry_position])
+        query_index, segment_index = pair_keys // len(self), pair_keys % len(self)
+
+        overlap = (box_min[query_index] <= self.segment_max[segment_index]).all(axis=1) & \
+                  (box_max[query_index] >= self.segment_min[segment_index]).all(axis=1)
+        return query_index[overlap], segment_index[overlap]
+
+    def query_segments(self, start_xy, end_xy, distance):
+        """
+        Find the indexed segments within the distance of the query segments
+        :return: (query index, segment index) of every pair within the distance
+        """
+        start_xy = np.asarray(start_xy, dtype=np.float64).reshape(-1, 2)
+        end_xy = np.asarray(end_xy, dtype=np.float64).reshape(-1, 2)
+        query_index, segment_index = self.query_boxes(np.minimum(start_xy, end_xy) - distance,
+                                                      np.maximum(start_xy, end_xy) + distance)
+        near = segment_segment_distance(start_xy[query_index], end_xy[query_index],
+                                        self.segment_start[segment_index], self.segment_end[segment_index]) <= distance
+        return query_index[near], segment_index[near]
+
+    def query_points(self, points, distance):
+        """
+        Find the indexed segments within the distance of the query points
+        :return: (query index, segment index) of every pair within the distance
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        query_index, segment_index = self.query_boxes(points - distance, points + distance)
+        near = point_segment_distance(points[query_index], self.segment_start[segment_index],
+                                      self.segment_end[segment_index]) <= distance
+        return query_index[near], segment_index[near]
+
+    def query_point_features(self, points, distance):
+        """
+        Find the features within the distance of the query points
+        :return: (query index, feature index) of every unique pair
+        """
+        query_index, segment_index = self.query_points(points, distance)
+        pair_keys = np.unique(query_index * len(self.polylines) + self.segment_feature[segment_index])
+        return pair_keys // len(self.polylines), pair_keys % len(self.polylines)
+
+    def save(self, path):
+        """
+        Save the index (along with the indexed polylines) to a .npz file
+        :param path:
+        """
+        polylines = self.polylines
+        arrays = {
+            'ids': np.array(polylines.ids),
+            'xy': polylines.xy,
+            'part_offsets': polylines.part_offsets,
+            'feature_offsets': polylines.feature_offsets,
+            'origin': self.origin,
+            'cell_size': np.array([self.cell_size]),
+            'shape': np.array(self.shape, dtype=np.int64),
+            'cell_keys': self.cell_keys,
+            'cell_offsets': self.cell_offsets,
+            'cell_entries': self.cell_entries
+        }
+        if polylines.m is not None:
+            arrays['m'] = polylines.m
+        if self.oids is not None:
+            arrays['oids'] = np.asarray(self.oids, dtype=np.int64)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the index saved by save()
+        :param path:
+        :return:
+        """
+        data = np.load(path)
+        try:
+            polylines = PolylineArray(data['ids'].tolist(), data['xy'], data['part_offsets'], data['feature_offsets'],
+                                      data['m'] if 'm' in data.files else None)
+            return cls(polylines, data['origin'], data['cell_size'][0], data['shape'], data['cell_keys'],
+                       data['cell_offsets'], data['cell_entries'],
+                       data['oids'].tolist() if 'oids' in data.files else None)
+        finally:
+            data.close()
@@ -0,0 +1,216 @@
+import os
+import numpy as np
+
+from join_util import normalize_join_key
+from spatial_index import expand_ranges
+
+
+def bounded_searchsorted(values, start, end, keys, side='left'):
+    """
+    Vectorized binary search of every key within its own sorted slice of the values
+    :param values: array sorted within every slice
+    :param start: first index of the slice of every key
+    :param end: end (exclusive) of the slice of every key
+    :param keys:
+    :param side: 'left' for the first index with a value >= key, 'right' for the first index with a value > key
+    :return: index of every key within [start, end]
+    """
+    lower, upper = np.array(start, dtype=np.int64), np.array(end, dtype=np.int64)
+    while True:
+        active = lower < upper
+        if not active.any():
+            return lower
+        middle = np.where(active, (lower + upper) // 2, 0)
+        middle_values = values[np.minimum(middle, max(len(values) - 1, 0))] if len(values) else middle
+        go_right = active & ((middle_values <= keys) if side == 'right' else (middle_values < keys))
+        lower = np.where(go_right, middle + 1, lower)
+        upper = np.where(active & ~go_right, middle, upper)
+
+
+def _keys(ids):
+    """
+    :return: unicode array of the normalized ids, None ids become an empty string that is never indexed
+    """
+    return np.array([normalize_join_key(value) or u'' for value in ids], dtype=np.unicode_)
+
+
+class XrefIndex(object):
+    """
+    Lookup index of the XREF table, between DOT route measures and HERE link offsets. The measure intervals of the
+    links are kept per route in flat arrays sorted by route and start measure, along with the longest interval of
+    every route, so the intervals holding a measure are found by binary search. The links of a route may overlap or
+    leave gaps between them.
+
+    The index is saved as a folder of .npy files, which can be memory-mapped when loaded so that several processes
+    share the pages of a large index instead of each loading a copy.
+    """
+
+    ARRAYS = ['route_keys', 'route_offsets', 'route_max_lengths', 'lows', 'highs', 'from_measures', 'to_measures',
+              'interval_links', 'link_keys', 'link_offsets', 'link_intervals']
+
+    def __init__(self, route_keys, route_offsets, route_max_lengths, lows, highs, from_measures, to_measures,
+                 interval_links, link_keys, link_offsets, link_intervals):
+        # sorted normalized route ids, the intervals of route r are [route_offsets[r], route_offsets[r + 1])
+        self.route_keys = route_keys
+        self.route_offsets = route_offsets
+        self.route_max_lengths = route_max_lengths
+        # lowest and highest measure of every interval, sorted by lows within every route
+        self.lows = lows
+        self.highs = highs
+        # measures at the start and the end of the link, the from measure is above the to measure if the link runs
+        # against the route
+        self.from_measures = from_measures
+        self.to_measures = to_measures
+        # index of the link of every interval in the sorted normalized link ids
+        self.interval_links = interval_links
+        self.link_keys = link_keys
+        # the intervals of link l are link_intervals[link_offsets[l]:link_offsets[l + 1]]
+        self.link_offsets = link_offsets
+        self.link_intervals = link_intervals
+
+    def __len__(self):
+        return len(self.lows)
+
+    @classmethod
+    def build(cls, rows):
+        """
+        :param rows: iterable of (link id, route id, from measure, to measure), e.g. a search cursor on the XREF table.
+                     Rows without ids or measures are skipped.
+        :return:
+        """
+        link_ids, route_ids, from_measures, to_measures = [], [], [], []
+        for link_id, route_id, from_measure, to_measure in rows:
+            if from_measure is None or to_measure is None:
+                continue
+            link_ids.append(normalize_join_key(link_id))
+            route_ids.append(normalize_join_key(route_id))
+            from_measures.append(from_measure)
+            to_measures.append(to_measure)
+        valid = [i for i in range(len(link_ids)) if link_ids[i] is not None and route_ids[i] is not None]
+        link_ids = np.array([link_ids[i] for i in valid], dtype=np.unicode_)
+        route_ids = np.array([route_ids[i] for i in valid], dtype=np.unicode_)
+        from_measures = np.array([from_measures[i] for i in valid], dtype=np.float64)
+        to_measures = np.array([to_measures[i] for i in valid], dtype=np.float64)
+        lows, highs = np.minimum(from_measures, to_measures), np.maximum(from_measures, to_measures)
+
+        order = np.lexsort((highs, lows, route_ids))
+        link_ids, route_ids = link_ids[order], route_ids[order]
+        from_measures, to_measures, lows, highs = from_measures[order], to_measures[order], lows[order], highs[order]
+
+        route_start = np.ones(len(route_ids), dtype=bool)
+        route_start[1:] = route_ids[1:] != route_ids[:-1]
+        route_keys = route_ids[route_start]
+        route_offsets = np.concatenate((np.nonzero(route_start)[0], [len(route_ids)])).astype(np.int64)
+        route_max_lengths = np.maximum.reduceat(highs - lows, route_offsets[:-1]) if len(route_keys) else \
+            np.zeros(0)
+
+        link_keys = np.unique(link_ids)
+        interval_links = np.searchsorted(link_keys, link_ids).astype(np.int64)
+        link_intervals = np.argsort(interval_links, kind='mergesort').astype(np.int64)
+        link_offsets = np.searchsorted(interval_links[link_intervals], np.arange(len(link_keys) + 1)).astype(np.int64)
+        return cls(route_keys, route_offsets, route_max_lengths, lows, highs, from_measures, to_measures,
+                   interval_links, link_keys, link_offsets, link_intervals)
+
+    def save(self, folder):
+        """
+        Save the index as one .npy file per array
+        :param folder:
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        for name in self.ARRAYS:
+            np.save(os.path.join(folder, '{0}.npy'.format(name)), getattr(self, name))
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """
+        Load the index saved by save()
+        :param folder:
+        :param mmap_mode: memory-map the arrays (see numpy.load), None to read them into memory
+        :return:
+        """
+        return cls(*[np.load(os.path.join(folder, '{0}.npy'.format(name)), mmap_mode=mmap_mode)
+                     for name in cls.ARRAYS])
+
+    def locate_measures(self, route_ids, measures, all_matches=False, gap_tolerance=0.0):
+        """
+        Find the links holding DOT route measures, e.g. crash records located by route id and measure
+        :param route_ids: route id of every query
+        :param measures: measure of every query
+        :param all_matches: every link holding the measure (overlapping links, or the two links meeting at the
+                            measure), otherwise only the closest one (the first one along the route for a tie)
+        :param gap_tolerance: a measure in a gap between two links, or beyond the ends of the links of the route, is
+                              given to the closest link within the tolerance (at its end)
+        :return: (query index, link id, offset ratio, distance) of every match ordered by query, the offset ratio is
+                 0 at the start of the link and 1 at its end, the distance is the gap between the measure and the
+                 interval of the link
+        """
+        keys = _keys(route_ids)
+        measures = np.asarray(measures, dtype=np.float64).reshape(-1)
+        route_index = np.searchsorted(self.route_keys, keys) if len(self.route_keys) else \
+            np.zeros(len(keys), dtype=np.int64)
+        route_index = np.minimum(route_index, max(len(self.route_keys) - 1, 0))
+        found = (keys != u'') & ~np.isnan(measures)
+        if len(self.route_keys):
+            found &= self.route_keys[route_index] == keys
+        else:
+            found[:] = False
+        queries = np.nonzero(found)[0]
+        route_index, query_measures = route_index[queries], measures[queries]
+
+        # the intervals starting before the measure (plus tolerance), at most the longest interval of the route away
+        start, end = self.route_offsets[route_index], self.route_offsets[route_index + 1]
+        lower = bounded_searchsorted(self.lows, start, end,
+                                     query_measures - gap_tolerance - self.route_max_lengths[route_index], 'left')
+        upper = bounded_searchsorted(self.lows, start, end, query_measures + gap_tolerance, 'right')
+        owner, interval = expand_ranges(lower, upper - lower)
+        query_index, query_measures = queries[owner], query_measures[owner]
+        distance = np.maximum(np.maximum(self.lows[interval] - query_measures,
+                                         query_measures - self.highs[interval]), 0.0)
+        keep = distance <= gap_tolerance
+        query_index, query_measures, interval, distance = \
+            query_index[keep], query_measures[keep], interval[keep], distance[keep]
+
+        if not all_matches:
+            order = np.lexsort((interval, distance, query_index))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = query_index[order][1:] != query_index[order][:-1]
+            keep = order[first]
+            query_index, query_measures, interval, distance = \
+                query_index[keep], query_measures[keep], interval[keep], distance[keep]
+
+        from_measures, to_measures = self.from_measures[interval], self.to_measures[interval]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(to_measures != from_measures,
+                             (query_measures - from_measures) / (to_measures - from_measures), 0.0)
+        ratio = np.clip(ratio, 0.0, 1.0)
+        return query_index, self.link_keys[self.interval_links[interval]], ratio, distance
+
+    def locate_links(self, link_ids, ratios):
+        """
+        Find the DOT route measures of offsets along HERE links, a link on more than one route (e.g. concurrent
+        routes) gives one match per route
+        :param link_ids: link id of every query
+        :param ratios: offset ratio of every query, 0 at the start of the link and 1 at its end
+        :return: (query index, route id, measure) of every match ordered by query
+        """
+        keys = _keys(link_ids)
+        ratios = np.asarray(ratios, dtype=np.float64).reshape(-1)
+        link_index = np.searchsorted(self.link_keys, keys) if len(self.link_keys) else \
+            np.zeros(len(keys), dtype=np.int64)
+        link_index = np.minimum(link_index, max(len(self.link_keys) - 1, 0))
+        found = (keys != u'') & ~np.isnan(ratios)
+        if len(self.link_keys):
+            found &= self.link_keys[link_index] == keys
+        else:
+            found[:] = False
+        queries = np.nonzero(found)[0]
+        link_index = link_index[queries]
+
+        owner, position = expand_ranges(self.link_offsets[link_index],
+                                        self.link_offsets[link_index + 1] - self.link_offsets[link_index])
+        interval = self.link_intervals[position]
+        query_index, ratio = queries[owner], np.clip(ratios[queries][owner], 0.0, 1.0)
+        measures = self.from_measures[interval] + ratio * (self.to_measures[interval] - self.from_measures[interval])
+        route_index = np.searchsorted(self.route_offsets, interval, 'right') - 1
+        return query_index, self.route_keys[route_index], measures
@@ -0,0 +1,122 @@
+import bisect
+import numpy as np
+
+from calibration_util import calibrate_with_parameters
+
+
+class RouteMetricsCursor(object):
+    """
+    Route metrics sorted by route id and looked up route after route. As long as the routes are looked up in route id
+    order, every lookup searches forward from the previous one, like a merge of two sorted inputs.
+    """
+
+    def __init__(self, route_metrics):
+        """
+        :param route_metrics: object with route_ids, lengths, mmins and mmaxs arrays (e.g. RouteMetrics)
+        """
+        route_ids = np.array(list(route_metrics.route_ids), dtype=object)
+        order = np.argsort(route_ids, kind='mergesort')
+        self.route_ids = route_ids[order].tolist()
+        self.lengths = np.asarray(route_metrics.lengths, dtype=np.float64)[order]
+        self.mmins = np.asarray(route_metrics.mmins, dtype=np.float64)[order]
+        self.mmaxs = np.asarray(route_metrics.mmaxs, dtype=np.float64)[order]
+        self.position = 0
+
+    def parameters(self, route_id, row_count):
+        """
+        :param route_id:
+        :param row_count: number of rows on the route
+        :return: length, mmin, mmax and valid arrays of the route repeated for every row (see route_parameters)
+        """
+        lower = self.position if self.position and self.route_ids[self.position - 1] < route_id else 0
+        position = bisect.bisect_left(self.route_ids, route_id, lower)
+        found = position < len(self.route_ids) and self.route_ids[position] == route_id
+        if found:
+            self.position = position + 1
+            length, mmin, mmax = self.lengths[position], self.mmins[position], self.mmaxs[position]
+        else:
+            length = mmin = mmax = np.nan
+        valid = found and length > 0 and not np.isnan(mmin) and not np.isnan(mmax)
+        return tuple(np.repeat(value, row_count) for value in (length, mmin, mmax, valid))
+
+
+def iter_route_blocks(rows, route_index=1):
+    """
+    Group rows ordered by route id into blocks
+    :param rows: iterable of tuples (e.g. a search cursor)
+    :param route_index: position of the route id in the rows
+    :return: generator of (route id, list of the consecutive rows with that route id)
+    """
+    block_route_id, block = None, []
+    for row in rows:
+        if block and row[route_index] != block_route_id:
+            yield block_route_id, block
+            block = []
+        block_route_id = row[route_index]
+        block.append(row)
+    if block:
+        yield block_route_id, block
+
+
+class XrefSummary(object):
+    """
+    Counts of a streaming XREF run, with the link count of every route left out
+    """
+
+    def __init__(self):
+        self.link_rows = 0
+        self.duplicate_rows = 0
+        self.xref_rows = 0
+        self.route_count = 0
+        # route id -> number of links
+        self.invalid_source_routes = {}
+        self.invalid_target_routes = {}
+        # routes whose links did not come in one block, duplicate links across the blocks are not removed
+        self.unordered_routes = set()
+
+
+def stream_xref_rows(link_rows, source_metrics, target_metrics, decimal_places=3, summary=None):
+    """
+    Calibrate the measures of link events on the source routes to the target routes, one route at a time. The link
+    rows must be ordered by route id, only the links of one route are held in memory. A link located more than once
+    on the same route keeps its last location.
+    :param link_rows: iterable of (link id, route id, from measure, to measure) ordered by route id
+    :param source_metrics: RouteMetrics of the source (HERE) routes
+    :param target_metrics: RouteMetrics of the target (DOT) routes
+    :param decimal_places:
+    :param summary: XrefSummary to be filled in
+    :return: generator of lists of (link id, route id, from measure, to measure) XREF rows, one list per route
+    """
+    summary = summary if summary is not None else XrefSummary()
+    source_cursor = RouteMetricsCursor(source_metrics)
+    target_cursor = RouteMetricsCursor(target_metrics)
+    seen_routes = set()
+    for route_id, rows in iter_route_blocks(link_rows):
+        summary.link_rows += len(rows)
+        summary.route_count += 1
+        if route_id in seen_routes:
+            summary.unordered_routes.add(route_id)
+        seen_routes.add(route_id)
+
+        # the last location of every link
+        link_position_dict = {}
+        for i, row in enumerate(rows):
+            link_position_dict[row[0]] = i
+        if len(link_position_dict) < len(rows):
+            summary.duplicate_rows += len(rows) - len(link_position_dict)
+            rows = [rows[i] for i in sorted(link_position_dict.values())]
+
+        adjusted, source_valid, target_valid = calibrate_with_parameters(
+            [(row[2], row[3]) for row in rows], source_cursor.parameters(route_id, len(rows)),
+            target_cursor.parameters(route_id, len(rows)), decimal_places)
+        if not source_valid[0]:
+            summary.invalid_source_routes[route_id] = summary.invalid_source_routes.get(route_id, 0) + len(rows)
+            continue
+        if not target_valid[0]:
+            summary.invalid_target_routes[route_id] = summary.invalid_target_routes.get(route_id, 0) + len(rows)
+            continue
+
+        xref_rows = [(row[0], route_id) + tuple(None if np.isnan(value) else value for value in values)
+                     for row, values in zip(rows, adjusted.tolist())]
+        summary.xref_rows += len(xref_rows)
+        yield xref_rows
@@ -1,8 +1,11 @@
 import os
 import sys
 import uuid
+import shutil
+import hashlib
+import functools
 
-from src.tss import get_parent_directory
+from src.tss import get_parent_directory, get_scratch_folder
 
 def get_default_parameters():
     try:
@@ -61,6 +64,87 @@ def clear_scratch_gdb(scratch_gdb):
     for item in arcpy.ListTables():
         arcpy.Delete_management(item)
 
+class ScratchWorkspace(object):
+    """
+    Scratch workspace of one tool run: its own folder (and file geodatabase, created when first needed) under
+    '<scratch folder>/runs', plus the in_memory workspace for the intermediates small enough to be kept in memory.
+    Runs never share intermediates, so several runs (e.g. county jobs) can execute at the same time, and the cleanup
+    only removes the datasets of the run.
+    """
+
+    def __init__(self, scratch_folder, run_name=None, in_memory_max_rows=0):
+        """
+        :param scratch_folder:
+        :param run_name: name of the run folder, a unique name is used if not specified. Runs resumed from checkpoints
+                         use the same name to find the intermediates of the failed run.
+        :param in_memory_max_rows: intermediates with up to this estimated row count are kept in memory, 0 to keep
+                                   all of them on disk
+        """
+        runs_folder = os.path.join(scratch_folder, 'runs')
+        if not os.path.isdir(runs_folder):
+            os.makedirs(runs_folder)
+        self.folder = os.path.join(runs_folder, run_name) if run_name else get_scratch_folder(runs_folder)
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        self.in_memory_max_rows = in_memory_max_rows or 0
+        # in_memory is shared by the runs of the same process (e.g. ArcMap), names are prefixed by the run
+        self.prefix = 'r{0}'.format(hashlib.md5(self.folder).hexdigest()[:8])
+        self.in_memory_datasets = []
+        self._gdb = None
+
+    @property
+    def gdb(self):
+        if self._gdb is None:
+            self._gdb = get_scratch_gdb(self.folder)
+        return self._gdb
+
+    def path(self, name, estimated_rows=None, persistent=False):
+        """
+        Path of an intermediate dataset of the run
+        :param name:
+        :param estimated_rows: estimated row count, the dataset is kept in memory if it does not exceed the limit
+        :param persistent: keep the dataset in the run geodatabase anyway, e.g. outputs of checkpointed stages or
+                           datasets joined by MakeQueryTable (which must all be in the same workspace)
+        :return:
+        """
+        if not persistent and self.in_memory_max_rows and estimated_rows is not None and \
+                estimated_rows <= self.in_memory_max_rows:
+            path = 'in_memory/{0}_{1}'.format(self.prefix, name)
+            self.in_memory_datasets.append(path)
+            return path
+        return os.path.join(self.gdb, name)
+
+    def cleanup(self):
+        """
+        Delete the in-memory datasets and the folder of the run
+        """
+        for dataset in self.in_memory_datasets:
+            if arcpy.Exists(dataset):
+                arcpy.Delete_management(dataset)
+        self.in_memory_datasets = []
+        gdb = os.path.join(self.folder, "scratch.gdb")
+        if arcpy.Exists(gdb):
+            arcpy.Delete_management(gdb)
+        shutil.rmtree(self.folder, ignore_errors=True)
+        self._gdb = None
+
+def with_scratch_workspace(function):
+    """
+    Decorator of the tool functions taking a 'scratch_workspace' keyword argument: if the caller does not pass one, the
+    function runs with a ScratchWorkspace under the default scratch folder, which is cleaned up when it returns or
+    fails, so library calls leave no run folder behind.
+    """
+    @functools.wraps(function)
+    def wrapper(**kwargs):
+        if kwargs.get('scratch_workspace', None) is not None:
+            return function(**kwargs)
+        scratch_workspace = ScratchWorkspace(os.path.join(os.path.expanduser("~"), ".HERELinearConflation"))
+        try:
+            return function(**dict(kwargs, scratch_workspace=scratch_workspace))
+        finally:
+            scratch_workspace.cleanup()
+    return wrapper
+
 # enable local imports
 local_path = os.path.dirname(__file__)
 sys.path.insert(0, local_path)
@@ -1,10 +1,19 @@
 import arcpy
 import os
+import sys
+import math
 import traceback
+import multiprocessing
 
 from src.tss.ags.field_util import get_field_details
 from src.tss.ags import build_numeric_in_sql_expression, build_string_in_sql_expression
-from src.util.helper import get_scratch_gdb, clear_scratch_gdb
+from src.util.helper import ScratchWorkspace, get_default_parameters, with_scratch_workspace
+from src.tss.ags.route_metrics_util import get_route_metrics
+from src.tss.ags.spatial_index_util import build_active_where_clause
+from src.tss.calibration_util import calibrate_measures
+from src.tss.instrument_util import RunReport, get_report_path
+from src.tss.ags.dao_util import get_count
+from src.tss.ags.route_event_util import get_route_segmenter, write_route_events
 from src.config.schema import default_schemas
 
 import logging
@@ -12,6 +21,50 @@ logger = logging.getLogger(__name__)
 
 measure_decimal_places = 3
 
+def calibrate_event_measures(event_table, rid_field, measure_fields, adjusted_measure_fields, source_route_metrics,
+                             target_route_metrics):
+    """
+    Calibrate the event measures from the source routes to the target routes and write them to the adjusted measure
+    fields. Events on routes with invalid geometry are left with empty adjusted measures.
+    """
+    oids = []
+    rids = []
+    measures = []
+    with arcpy.da.SearchCursor(event_table, ['OID@', rid_field] + measure_fields) as sCur:
+        for row in sCur:
+            oids.append(row[0])
+            rids.append(row[1])
+            measures.append(row[2:])
+    del sCur
+
+    adjusted_measures, source_valid, target_valid = calibrate_measures(rids, measures, source_route_metrics,
+                                                                       target_route_metrics, measure_decimal_places)
+    invalid_count = len(oids) - int((source_valid & target_valid).sum())
+    if invalid_count:
+        logger.warning("{0} events are on routes with invalid geometry, their measures are not transferred".format(invalid_count))
+
+    oid_adjusted_measures_dict = dict(zip(oids, adjusted_measures.tolist()))
+    with arcpy.da.UpdateCursor(event_table, ['OID@'] + adjusted_measure_fields) as uCur:
+        for row in uCur:
+            uCur.updateRow([row[0]] + [None if math.isnan(meas) else meas for meas in oid_adjusted_measures_dict[row[0]]])
+    del uCur
+
+
+def read_transfer_route_metrics(here_route, here_route_rid_field, dot_route, dot_route_rid_field, dot_route_fd_field,
+                                dot_route_td_field, route_metrics_folder=None):
+    """
+    Read the metrics of the HERE routes and of the active DOT routes, used to calibrate the event measures
+    :return: (HERE route metrics, DOT route metrics)
+    """
+    here_route_metrics = get_route_metrics(here_route, here_route_rid_field, cache_folder=route_metrics_folder)
+
+    # get DOT route info (only those match HERE routes)
+    active_where_clause = build_active_where_clause(dot_route_fd_field, dot_route_td_field)
+    dot_route_metrics = get_route_metrics(dot_route, dot_route_rid_field, active_where_clause, route_metrics_folder)
+    return here_route_metrics, dot_route_metrics
+
+
+@with_scratch_workspace
 def transfer_dot_event_attribute_to_here(**kwargs):
     logger.info("Start transferring DOT event attributes to HERE...")
 
@@ -29,189 +82,283 @@ def transfer_dot_event_attribute_to_here(**kwargs):
     dot_route_fd_field = kwargs.get('dot_route_fd_field', None)
     dot_route_td_field = kwargs.get('dot_route_td_field', None)
     output_event_feature = kwargs.get('output_event_feature', None)
+    route_metrics_folder = kwargs.get('route_metrics_folder', None)
+    segmentation_engine = kwargs.get('segmentation_engine', 'arcpy')
+    # folder of the HERE routes saved for the in_memory segmentation engine, they are read from the network if None
+    route_segmenter_folder = kwargs.get('route_segmenter_folder', None)
+    here_route_metrics = kwargs.get('here_route_metrics', None)
+    dot_route_metrics = kwargs.get('dot_route_metrics', None)
+    run_report = kwargs.get('run_report', None) or RunReport('transfer_dot_event_attribute_to_here', get_count)
 
-    scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    scratch_workspace = kwargs['scratch_workspace']
 
     # intermediate outputs
-    active_dot_network_layer = 'active_{0}'.format(os.path.basename(dot_route))
-    active_dot_event = os.path.join(scratch_gdb, 'active_dot_event')
-    dot_event_tbt = os.path.join(scratch_gdb, 'dot_event_tbt')
-    dot_event_tbl = os.path.join(scratch_gdb, 'dot_event_tbl')
-    here_event_lyr = os.path.join(scratch_gdb, 'here_event_lyr')
-
-    # get HERE route info
-    here_route_info_dict = {}
-    with arcpy.da.SearchCursor(here_route, [here_route_rid_field, 'SHAPE@']) as sCur:
-        for row in sCur:
-            here_rid = row[0]
-            shape = row[1]
-
-            if shape is None:
-                continue
-
-            if here_rid not in here_route_info_dict.keys():
-                here_route_info_dict[here_rid] = {}
-
-            here_route_info_dict[here_rid]['length'] = shape.length
-            here_route_info_dict[here_rid]['mmax'] = shape.extent.MMax
-            here_route_info_dict[here_rid]['mmin'] = shape.extent.MMin
-    del sCur
-
-    # get DOT route info (only those match HERE routes)
-    active_where_clause = "1=1" if not dot_route_fd_field or not dot_route_td_field else \
-        "({start_date_field} is null or {start_date_field} <= CURRENT_TIMESTAMP) and " \
-        "({end_date_field} is null or {end_date_field} > CURRENT_TIMESTAMP)".format(
-            start_date_field=dot_route_fd_field,
-            end_date_field=dot_route_td_field)
-    arcpy.MakeFeatureLayer_management(dot_route, active_dot_network_layer, active_where_clause)
-
-    dot_route_info_dict = {}
-    with arcpy.da.SearchCursor(active_dot_network_layer, [dot_route_rid_field, 'SHAPE@']) as sCur:
-        for row in sCur:
-            dot_rid = row[0]
-            shape = row[1]
-
-            if shape is None:
-                continue
-
-            if dot_rid not in here_route_info_dict.keys():
-                continue
-
-            if dot_rid not in dot_route_info_dict.keys():
-                dot_route_info_dict[dot_rid] = {}
-
-            dot_route_info_dict[dot_rid]['length'] = shape.length
-            dot_route_info_dict[dot_rid]['mmax'] = shape.extent.MMax
-            dot_route_info_dict[dot_rid]['mmin'] = shape.extent.MMin
-    del sCur
+    event_count = get_count(dot_event)
+    active_dot_event = 'active_dot_event'
+    dot_event_tbt = scratch_workspace.path('dot_event_tbt', event_count)
+    dot_event_tbl = scratch_workspace.path('dot_event_tbl', event_count)
+    here_event_lyr = 'here_event_lyr'
+
+    # get HERE and DOT route info, unless they are shared by a batch of event layers
+    if here_route_metrics is None or dot_route_metrics is None:
+        with run_report.stage('read_route_metrics', inputs=[here_route, dot_route]):
+            here_route_metrics, dot_route_metrics = read_transfer_route_metrics(
+                here_route, here_route_rid_field, dot_route, dot_route_rid_field, dot_route_fd_field,
+                dot_route_td_field, route_metrics_folder)
+    dot_route_rids = sorted(set(dot_route_metrics.route_ids) & set(here_route_metrics.route_ids))
 
     # translate dot event into HERE event layer
-    active_where_clause = "1=1" if not dot_route_fd_field or not dot_route_td_field else \
-        "({start_date_field} is null or {start_date_field} <= CURRENT_TIMESTAMP) and " \
-        "({end_date_field} is null or {end_date_field} > CURRENT_TIMESTAMP)".format(
-            start_date_field=dot_event_fd_field,
-            end_date_field=dot_event_td_field)
-    arcpy.MakeFeatureLayer_management(dot_event, active_dot_event, active_where_clause)
+    with run_report.stage('select_events', inputs=dot_event, outputs=dot_event_tbt):
+        active_where_clause = build_active_where_clause(dot_event_fd_field, dot_event_td_field)
+        arcpy.MakeFeatureLayer_management(dot_event, active_dot_event, active_where_clause)
 
-    dot_event_rid_field_details = get_field_details(active_dot_event, dot_event_rid_field)
-    where_clause = build_string_in_sql_expression(dot_event_rid_field, dot_route_info_dict.keys()) \
-        if dot_event_rid_field_details['field_type'] == 'TEXT' else build_numeric_in_sql_expression(dot_event_rid_field, dot_route_info_dict.keys())
+        dot_event_rid_field_details = get_field_details(active_dot_event, dot_event_rid_field)
+        where_clause = build_string_in_sql_expression(dot_event_rid_field, dot_route_rids) \
+            if dot_event_rid_field_details['field_type'] == 'TEXT' else build_numeric_in_sql_expression(dot_event_rid_field, dot_route_rids)
 
-    arcpy.FeatureClassToFeatureClass_conversion(active_dot_event, scratch_gdb, os.path.basename(dot_event_tbt), where_clause)
+        arcpy.FeatureClassToFeatureClass_conversion(active_dot_event, os.path.dirname(dot_event_tbt),
+                                                    os.path.basename(dot_event_tbt), where_clause)
 
-    dot_event_fmeas_field_details = get_field_details(dot_event_tbt, dot_event_fmeas_field)
-    dot_event_fmeas_field_adjusted = 'ADJUSTED_{0}'.format(dot_event_fmeas_field)
-    arcpy.AddField_management(dot_event_tbt, dot_event_fmeas_field_adjusted, dot_event_fmeas_field_details['field_type'])
+        dot_event_fmeas_field_details = get_field_details(dot_event_tbt, dot_event_fmeas_field)
+        dot_event_fmeas_field_adjusted = 'ADJUSTED_{0}'.format(dot_event_fmeas_field)
+        arcpy.AddField_management(dot_event_tbt, dot_event_fmeas_field_adjusted, dot_event_fmeas_field_details['field_type'])
 
     if dot_event_tmeas_field:
         dot_event_tmeas_field_details = get_field_details(dot_event_tbt, dot_event_tmeas_field)
         dot_event_tmeas_field_adjusted = 'ADJUSTED_{0}'.format(dot_event_tmeas_field)
         arcpy.AddField_management(dot_event_tbt, dot_event_tmeas_field_adjusted, dot_event_tmeas_field_details['field_type'])
 
-        fields = [dot_event_rid_field, dot_event_fmeas_field, dot_event_tmeas_field, dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted]
-        with arcpy.da.UpdateCursor(dot_event_tbt, fields) as uCur:
-            for row in uCur:
-                rid = row[0]
-                fmeas = row[1]
-                tmeas = row[2]
-
-                dot_route_length = dot_route_info_dict[rid]['length']
-                dot_route_mmax = dot_route_info_dict[rid]['mmax']
-                dot_route_mmin = dot_route_info_dict[rid]['mmin']
-                here_route_length = here_route_info_dict[rid]['length']
-                here_route_mmax = here_route_info_dict[rid]['mmax']
-                here_route_mmin = here_route_info_dict[rid]['mmin']
-
-                dot_here_length_ratio = dot_route_length / here_route_length
-                here_measure_length_ratio = abs(here_route_mmax - here_route_mmin) / here_route_length
-                dot_measure_length_ratio = abs(dot_route_mmax - dot_route_mmin) / dot_route_length
-
-                row[3] = round((fmeas - dot_route_mmin) / dot_measure_length_ratio / dot_here_length_ratio * here_measure_length_ratio + here_route_mmin, measure_decimal_places)
-                row[4] = round((tmeas - dot_route_mmin) / dot_measure_length_ratio / dot_here_length_ratio * here_measure_length_ratio + here_route_mmin, measure_decimal_places)
-
-                uCur.updateRow(row)
-        del uCur
-
-        props = '{0} {1} {2} {3}'.format(dot_event_rid_field, 'LINE', dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted)
-        arcpy.CopyRows_management(dot_event_tbt, dot_event_tbl)
-        arcpy.MakeRouteEventLayer_lr(here_route, here_route_rid_field, dot_event_tbl, props, here_event_lyr)
-
-        field_mappings = arcpy.FieldMappings()
-        for field in [dot_event_rid_field, dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted] + fields_to_transfer:
-            field_map = arcpy.FieldMap()
-            field_map.addInputField(here_event_lyr, field)
-            field_name = field_map.outputField
-            if field == dot_event_fmeas_field_adjusted:
-                field_name.name = dot_event_fmeas_field
-                field_name.aliasName = dot_event_fmeas_field
-            elif field == dot_event_tmeas_field_adjusted:
-                field_name.name = dot_event_tmeas_field
-                field_name.aliasName = dot_event_tmeas_field
-            elif field == dot_event_fmeas_field:
-                field_name.name = 'DOT_{0}'.format(dot_event_fmeas_field)
-                field_name.aliasName = 'DOT_{0}'.format(dot_event_fmeas_field)
-            elif field == dot_event_tmeas_field:
-                field_name.name = 'DOT_{0}'.format(dot_event_tmeas_field)
-                field_name.aliasName = 'DOT_{0}'.format(dot_event_tmeas_field)
+        with run_report.stage('calibrate_measures', inputs=dot_event_tbt):
+            calibrate_event_measures(dot_event_tbt, dot_event_rid_field, [dot_event_fmeas_field, dot_event_tmeas_field],
+                                     [dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted],
+                                     dot_route_metrics, here_route_metrics)
+
+        with run_report.stage('locate_events', outputs=output_event_feature):
+            if segmentation_engine == 'in_memory':
+                field_names = {dot_event_fmeas_field_adjusted: dot_event_fmeas_field,
+                               dot_event_tmeas_field_adjusted: dot_event_tmeas_field,
+                               dot_event_fmeas_field: 'DOT_{0}'.format(dot_event_fmeas_field),
+                               dot_event_tmeas_field: 'DOT_{0}'.format(dot_event_tmeas_field)}
+                segmenter, spatial_reference = get_route_segmenter(here_route, here_route_rid_field,
+                                                                   cache_folder=route_segmenter_folder)
+                write_route_events(segmenter, spatial_reference, dot_event_tbt, dot_event_rid_field,
+                                   dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted, output_event_feature,
+                                   [dot_event_rid_field, dot_event_fmeas_field_adjusted,
+                                    dot_event_tmeas_field_adjusted] + fields_to_transfer, field_names)
             else:
-                field_name.name = field
-                field_name.aliasName = field
-            field_map.outputField = field_name
-            field_mappings.addFieldMap(field_map)
-
-        arcpy.FeatureClassToFeatureClass_conversion(here_event_lyr, os.path.dirname(output_event_feature),
-                                                    os.path.basename(output_event_feature), field_mapping=field_mappings)
+                props = '{0} {1} {2} {3}'.format(dot_event_rid_field, 'LINE', dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted)
+                arcpy.CopyRows_management(dot_event_tbt, dot_event_tbl)
+                arcpy.MakeRouteEventLayer_lr(here_route, here_route_rid_field, dot_event_tbl, props, here_event_lyr)
+
+                field_mappings = arcpy.FieldMappings()
+                for field in [dot_event_rid_field, dot_event_fmeas_field_adjusted, dot_event_tmeas_field_adjusted] + fields_to_transfer:
+                    field_map = arcpy.FieldMap()
+                    field_map.addInputField(here_event_lyr, field)
+                    field_name = field_map.outputField
+                    if field == dot_event_fmeas_field_adjusted:
+                        field_name.name = dot_event_fmeas_field
+                        field_name.aliasName = dot_event_fmeas_field
+                    elif field == dot_event_tmeas_field_adjusted:
+                        field_name.name = dot_event_tmeas_field
+                        field_name.aliasName = dot_event_tmeas_field
+                    elif field == dot_event_fmeas_field:
+                        field_name.name = 'DOT_{0}'.format(dot_event_fmeas_field)
+                        field_name.aliasName = 'DOT_{0}'.format(dot_event_fmeas_field)
+                    elif field == dot_event_tmeas_field:
+                        field_name.name = 'DOT_{0}'.format(dot_event_tmeas_field)
+                        field_name.aliasName = 'DOT_{0}'.format(dot_event_tmeas_field)
+                    else:
+                        field_name.name = field
+                        field_name.aliasName = field
+                    field_map.outputField = field_name
+                    field_mappings.addFieldMap(field_map)
+
+                arcpy.FeatureClassToFeatureClass_conversion(here_event_lyr, os.path.dirname(output_event_feature),
+                                                            os.path.basename(output_event_feature), field_mapping=field_mappings)
 
     else:
-        fields = [dot_event_rid_field, dot_event_fmeas_field, dot_event_fmeas_field_adjusted]
-        with arcpy.da.UpdateCursor(dot_event_tbt, fields) as uCur:
-            for row in uCur:
-                rid = row[0]
-                fmeas = row[1]
-
-                dot_route_length = dot_route_info_dict[rid]['length']
-                dot_route_mmax = dot_route_info_dict[rid]['mmax']
-                dot_route_mmin = dot_route_info_dict[rid]['mmin']
-                here_route_length = here_route_info_dict[rid]['length']
-                here_route_mmax = here_route_info_dict[rid]['mmax']
-                here_route_mmin = here_route_info_dict[rid]['mmin']
-
-                dot_here_length_ratio = dot_route_length / here_route_length
-                here_measure_length_ratio = abs(here_route_mmax - here_route_mmin) / here_route_length
-                dot_measure_length_ratio = abs(dot_route_mmax - dot_route_mmin) / dot_route_length
-                row[2] = round((fmeas + dot_route_mmin) / dot_measure_length_ratio / dot_here_length_ratio * here_measure_length_ratio + here_route_mmin, measure_decimal_places)
-
-                uCur.updateRow(row)
-        del uCur
-
-        props = '{0} {1} {2}'.format(dot_event_rid_field, 'POINT', dot_event_fmeas_field_adjusted)
-        arcpy.CopyRows_management(dot_event_tbt, dot_event_tbl)
-        arcpy.MakeRouteEventLayer_lr(here_route, here_route_rid_field, dot_event_tbl, props, here_event_lyr)
-
-        field_mappings = arcpy.FieldMappings()
-        for field in [dot_event_rid_field, dot_event_fmeas_field_adjusted] + fields_to_transfer:
-            field_map = arcpy.FieldMap()
-            field_map.addInputField(here_event_lyr, field)
-            field_name = field_map.outputField
-            if field == dot_event_fmeas_field_adjusted:
-                field_name.name = dot_event_fmeas_field
-                field_name.aliasName = dot_event_fmeas_field
-            elif field == dot_event_fmeas_field:
-                field_name.name = 'DOT_{0}'.format(dot_event_fmeas_field)
-                field_name.aliasName = 'DOT_{0}'.format(dot_event_fmeas_field)
+        with run_report.stage('calibrate_measures', inputs=dot_event_tbt):
+            calibrate_event_measures(dot_event_tbt, dot_event_rid_field, [dot_event_fmeas_field],
+                                     [dot_event_fmeas_field_adjusted], dot_route_metrics, here_route_metrics)
+
+        with run_report.stage('locate_events', outputs=output_event_feature):
+            if segmentation_engine == 'in_memory':
+                field_names = {dot_event_fmeas_field_adjusted: dot_event_fmeas_field,
+                               dot_event_fmeas_field: 'DOT_{0}'.format(dot_event_fmeas_field)}
+                segmenter, spatial_reference = get_route_segmenter(here_route, here_route_rid_field,
+                                                                   cache_folder=route_segmenter_folder)
+                write_route_events(segmenter, spatial_reference, dot_event_tbt, dot_event_rid_field,
+                                   dot_event_fmeas_field_adjusted, None, output_event_feature,
+                                   [dot_event_rid_field, dot_event_fmeas_field_adjusted] + fields_to_transfer,
+                                   field_names)
             else:
-                field_name.name = field
-                field_name.aliasName = field
-            field_map.outputField = field_name
-            field_mappings.addFieldMap(field_map)
-
-        arcpy.FeatureClassToFeatureClass_conversion(here_event_lyr, os.path.dirname(output_event_feature),
-                                                    os.path.basename(output_event_feature), field_mapping=field_mappings)
+                props = '{0} {1} {2}'.format(dot_event_rid_field, 'POINT', dot_event_fmeas_field_adjusted)
+                arcpy.CopyRows_management(dot_event_tbt, dot_event_tbl)
+                arcpy.MakeRouteEventLayer_lr(here_route, here_route_rid_field, dot_event_tbl, props, here_event_lyr)
+
+                field_mappings = arcpy.FieldMappings()
+                for field in [dot_event_rid_field, dot_event_fmeas_field_adjusted] + fields_to_transfer:
+                    field_map = arcpy.FieldMap()
+                    field_map.addInputField(here_event_lyr, field)
+                    field_name = field_map.outputField
+                    if field == dot_event_fmeas_field_adjusted:
+                        field_name.name = dot_event_fmeas_field
+                        field_name.aliasName = dot_event_fmeas_field
+                    elif field == dot_event_fmeas_field:
+                        field_name.name = 'DOT_{0}'.format(dot_event_fmeas_field)
+                        field_name.aliasName = 'DOT_{0}'.format(dot_event_fmeas_field)
+                    else:
+                        field_name.name = field
+                        field_name.aliasName = field
+                    field_map.outputField = field_name
+                    field_mappings.addFieldMap(field_map)
+
+                arcpy.FeatureClassToFeatureClass_conversion(here_event_lyr, os.path.dirname(output_event_feature),
+                                                            os.path.basename(output_event_feature), field_mapping=field_mappings)
 
     logger.info("Finish transferring DOT event attributes to HERE...")
 
 
+def transfer_dot_event_task(task):
+    """
+    Worker of the batch transfer, transfers one event layer in its own scratch workspace
+    :param task: dict of the parameters of transfer_dot_event_attribute_to_here, with 'name', 'scratch_folder' and
+                 'in_memory_max_rows'
+    :return: dict of the name, output, status, error message, event count and run report of the event layer
+    """
+    scratch_workspace = ScratchWorkspace(task['scratch_folder'], in_memory_max_rows=task.get('in_memory_max_rows', 0))
+    arcpy.env.workspace = scratch_workspace.gdb
+    arcpy.env.overwriteOutput = True
+
+    run_report = RunReport('transfer_dot_event_attribute_to_here', get_count)
+    run_report.parameters = {'dot_event': task['dot_event'], 'here_route': task['here_route'],
+                             'dot_route': task['dot_route'], 'output_event_feature': task['output_event_feature']}
+    result = {'name': task['name'], 'output_event_feature': task['output_event_feature'],
+              'event_count': task.get('event_count', None), 'error': None}
+    transfer_kwargs = dict((key, value) for key, value in task.items()
+                           if key not in ('name', 'scratch_folder', 'in_memory_max_rows', 'event_count'))
+    try:
+        transfer_dot_event_attribute_to_here(run_report=run_report, scratch_workspace=scratch_workspace,
+                                             **transfer_kwargs)
+        run_report.status = 'success'
+    except Exception, err:
+        run_report.status = 'failed'
+        result['error'] = str(err.args[0]) if err.args else str(err)
+        logger.error("Error transferring '{0}': {1}".format(task['name'], result['error']))
+        logger.error(traceback.format_exc())
+    finally:
+        run_report.save(get_report_path(task['output_event_feature'], 'transfer_dot_event_attribute_to_here'))
+        scratch_workspace.cleanup()
+
+    result['status'] = run_report.status
+    result['report'] = run_report.to_dict()
+    return result
+
+
+def run_transfer_task(task):
+    """
+    Run transfer_dot_event_task, an error raised outside of the transfer itself (e.g. creating the scratch workspace)
+    gives a failed result instead of stopping the batch
+    :param task:
+    :return: see transfer_dot_event_task, the report is None if the transfer did not start
+    """
+    try:
+        return transfer_dot_event_task(task)
+    except Exception, err:
+        logger.error("Error transferring '{0}': {1}".format(task['name'], err))
+        logger.error(traceback.format_exc())
+        return {'name': task['name'], 'output_event_feature': task['output_event_feature'],
+                'event_count': task.get('event_count', None), 'error': str(err), 'status': 'failed', 'report': None}
+
+
+def transfer_dot_events_to_here(**kwargs):
+    """
+    Transfer several DOT event layers to HERE. The HERE and DOT route metrics (and the HERE routes for the in_memory
+    segmentation engine, saved to be memory-mapped by the workers) are read once for all of them, then the event layers
+    are transferred by a pool of worker processes, the largest ones first, each in its own scratch workspace. A failed
+    event layer does not stop the others.
+    :param kwargs: 'events': list of dicts of the event parameters of transfer_dot_event_attribute_to_here
+                   (dot_event, dot_event_rid_field, dot_event_fmeas_field, dot_event_tmeas_field, dot_event_fd_field,
+                   dot_event_td_field, fields_to_transfer, output_event_feature and an optional name), the route
+                   parameters shared by all of them (here_route, here_route_rid_field, dot_route, dot_route_rid_field,
+                   dot_route_fd_field, dot_route_td_field), 'scratch_folder', 'route_metrics_folder',
+                   'route_segmenter_folder', 'segmentation_engine', 'in_memory_max_rows' and 'processes' (number of
+                   worker processes, defaults to the number of cores, 1 to transfer the event layers one after the other
+                   in this process)
+    :return: list of the results of the event layers (see transfer_dot_event_task), in the order of the events
+    """
+    events = kwargs.get('events', [])
+    scratch_folder = kwargs.get('scratch_folder', None) or os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
+    route_metrics_folder = kwargs.get('route_metrics_folder', None) or os.path.join(scratch_folder, 'route_metrics')
+    route_segmenter_folder = kwargs.get('route_segmenter_folder', None) or os.path.join(scratch_folder, 'routes')
+    processes = kwargs.get('processes', None) or multiprocessing.cpu_count()
+    run_report = kwargs.get('run_report', None) or RunReport('transfer_dot_events_to_here', get_count)
+
+    route_keys = ['here_route', 'here_route_rid_field', 'dot_route', 'dot_route_rid_field', 'dot_route_fd_field',
+                  'dot_route_td_field']
+    base_task = dict((key, kwargs.get(key, None)) for key in route_keys)
+    base_task['segmentation_engine'] = kwargs.get('segmentation_engine', 'arcpy')
+    base_task['in_memory_max_rows'] = kwargs.get('in_memory_max_rows', 0)
+    base_task['scratch_folder'] = scratch_folder
+    base_task['route_metrics_folder'] = route_metrics_folder
+
+    # the route metrics are shared by all the event layers
+    with run_report.stage('read_route_metrics', inputs=[base_task['here_route'], base_task['dot_route']]):
+        base_task['here_route_metrics'], base_task['dot_route_metrics'] = read_transfer_route_metrics(
+            base_task['here_route'], base_task['here_route_rid_field'], base_task['dot_route'],
+            base_task['dot_route_rid_field'], base_task['dot_route_fd_field'], base_task['dot_route_td_field'],
+            route_metrics_folder)
+
+    # the HERE routes are read once and saved, the workers memory-map them instead of reading the network again
+    if base_task['segmentation_engine'] == 'in_memory':
+        with run_report.stage('load_route_segmenter', inputs=base_task['here_route']):
+            get_route_segmenter(base_task['here_route'], base_task['here_route_rid_field'],
+                                cache_folder=route_segmenter_folder)
+        base_task['route_segmenter_folder'] = route_segmenter_folder
+
+    tasks = []
+    for i, event in enumerate(events):
+        task = dict(base_task)
+        task.update(event)
+        task['name'] = event.get('name', None) or os.path.basename(event['dot_event'])
+        task['event_count'] = get_count(event['dot_event'])
+        task['fields_to_transfer'] = list(event.get('fields_to_transfer', None) or [])
+        tasks.append((i, task))
+    # the largest event layers are started first, so that the run is not left waiting for one of them at the end
+    tasks.sort(key=lambda item: -item[1]['event_count'])
+
+    results = [None] * len(tasks)
+    with run_report.stage('transfer_events', inputs=[task['dot_event'] for i, task in tasks],
+                          outputs=[task['output_event_feature'] for i, task in tasks]):
+        if processes == 1 or len(tasks) <= 1:
+            for i, task in tasks:
+                results[i] = run_transfer_task(task)
+        else:
+            logger.info("Transferring {0} event layers with {1} processes...".format(len(tasks), processes))
+            # Script tools run inside ArcMap/ArcCatalog, workers need to be started with the python interpreter
+            if not os.path.basename(sys.executable).lower().startswith('python'):
+                multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'pythonw.exe'))
+
+            pool = multiprocessing.Pool(min(processes, len(tasks)))
+            try:
+                order = [i for i, task in tasks]
+                for position, result in enumerate(pool.imap(run_transfer_task, [task for i, task in tasks])):
+                    results[order[position]] = result
+            finally:
+                pool.close()
+                pool.join()
+
+    for result in results:
+        wall_seconds = result['report']['wall_seconds'] if result['report'] else None
+        rate = result['event_count'] / wall_seconds if result['event_count'] and wall_seconds else 0.0
+        logger.info("{0}: {1} in {2}s, {3} events ({4:.0f} events/s)".format(
+            result['name'], result['status'], wall_seconds, result['event_count'], rate))
+    failed = [result['name'] for result in results if result['status'] != 'success']
+    if failed:
+        logger.warning("{0} of {1} event layers failed: {2}".format(len(failed), len(results), ', '.join(failed)))
+    return results
+
+
 if __name__ == '__main__':
     # Get parameters
     dot_event = arcpy.GetParameterAsText(0)
@@ -229,15 +376,23 @@ if __name__ == '__main__':
     dot_route_td_field = arcpy.GetParameterAsText(12)
     output_event_feature = arcpy.GetParameterAsText(13)
 
+    Config = get_default_parameters()
+    in_memory_max_rows = Config.get('Default', 'in_memory_max_rows') if Config.has_option('Default', 'in_memory_max_rows') else None
+    segmentation_engine = Config.get('Default', 'segmentation_engine') if Config.has_option('Default', 'segmentation_engine') else 'arcpy'
+
     scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    scratch_workspace = ScratchWorkspace(scratch_folder, in_memory_max_rows=int(in_memory_max_rows) if in_memory_max_rows else 0)
 
     output_schema_name = 'xref_table'
     schemas = default_schemas.get(output_schema_name)
 
-    arcpy.env.workspace = scratch_gdb
+    arcpy.env.workspace = scratch_workspace.gdb
     arcpy.env.overwriteOutput = True
 
+    run_report = RunReport('transfer_dot_event_attribute_to_here', get_count)
+    run_report.parameters = {'dot_event': dot_event, 'here_route': here_route, 'dot_route': dot_route,
+                             'output_event_feature': output_event_feature}
+
     try:
         transfer_dot_event_attribute_to_here(
             dot_event=dot_event,
@@ -253,13 +408,20 @@ if __name__ == '__main__':
             dot_route_rid_field=dot_route_rid_field,
             dot_route_fd_field=dot_route_fd_field,
             dot_route_td_field=dot_route_td_field,
-            output_event_feature=output_event_feature
+            output_event_feature=output_event_feature,
+            route_metrics_folder=os.path.join(scratch_folder, 'route_metrics'),
+            segmentation_engine=segmentation_engine,
+            run_report=run_report,
+            scratch_workspace=scratch_workspace
         )
+        run_report.status = 'success'
 
     except Exception, err:
+        run_report.status = 'failed'
         logger.error("Error: {0}".format(err.args[0]))
         logger.error(traceback.format_exc())
 
     finally:
-        # clear_scratch_gdb(scratch_gdb)
+        run_report.save(get_report_path(output_event_feature, 'transfer_dot_event_attribute_to_here'))
+        scratch_workspace.cleanup()
         pass
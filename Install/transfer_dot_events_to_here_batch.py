@@ -0,0 +1,95 @@
+"""
+Batch transfer of several DOT event layers to the HERE routes, with the route metrics read once and the event layers
+transferred in parallel worker processes. LinearConflation.tbx has no tool for it, run it from the command line with
+the Python of ArcGIS (arcpy.GetParameterAsText reads the command-line arguments outside of a tool):
+
+    C:\Python27\ArcGIS10.x\python.exe transfer_dot_events_to_here_batch.py events.json here.gdb/here_route ROUTE_ID
+        dot.gdb/dot_route ROUTE_ID FROM_DATE TO_DATE 4
+
+The arguments are the JSON file of the event layers (see load_event_configs), the HERE routes and their route id
+field, the DOT routes with their route id, from date and to date fields, and the number of processes. Pass "" for
+the date fields of a network without dates, and for the processes to use one per CPU. The run report is written
+next to the JSON file.
+"""
+import arcpy
+import os
+import json
+import traceback
+
+from src.util.helper import get_default_parameters
+from src.tss.ags.dao_util import get_count
+from src.tss.instrument_util import RunReport, get_report_path
+from transfer_dot_event_attribute_to_here import transfer_dot_events_to_here
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def load_event_configs(path):
+    """
+    Read the event layers of a batch transfer from a JSON file, a list of objects with the event parameters of
+    transfer_dot_event_attribute_to_here, e.g.
+    [{"name": "AADT", "dot_event": "C:/data/dot.gdb/AADT", "dot_event_rid_field": "ROUTE_ID",
+      "dot_event_fmeas_field": "FROM_MEASURE", "dot_event_tmeas_field": "TO_MEASURE", "dot_event_fd_field": "FROM_DATE",
+      "dot_event_td_field": "TO_DATE", "fields_to_transfer": ["AADT"],
+      "output_event_feature": "C:/data/here.gdb/HERE_AADT"}]
+    :param path:
+    :return: list of dicts
+    """
+    with open(path) as f:
+        events = json.load(f)
+    for event in events:
+        for key in ['dot_event', 'dot_event_rid_field', 'dot_event_fmeas_field', 'output_event_feature']:
+            if not event.get(key, None):
+                raise ValueError("'{0}' is missing from the event layer {1} of '{2}'!".format(key, event, path))
+    return events
+
+
+if __name__ == '__main__':
+    # Get parameters
+    event_config_file = arcpy.GetParameterAsText(0)
+    here_route = arcpy.GetParameterAsText(1)
+    here_route_rid_field = arcpy.GetParameterAsText(2)
+    dot_route = arcpy.GetParameterAsText(3)
+    dot_route_rid_field = arcpy.GetParameterAsText(4)
+    dot_route_fd_field = arcpy.GetParameterAsText(5)
+    dot_route_td_field = arcpy.GetParameterAsText(6)
+    processes = arcpy.GetParameterAsText(7)
+
+    Config = get_default_parameters()
+    in_memory_max_rows = Config.get('Default', 'in_memory_max_rows') if Config.has_option('Default', 'in_memory_max_rows') else None
+    segmentation_engine = Config.get('Default', 'segmentation_engine') if Config.has_option('Default', 'segmentation_engine') else 'arcpy'
+
+    scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
+    arcpy.env.overwriteOutput = True
+
+    run_report = RunReport('transfer_dot_events_to_here', get_count)
+    run_report.parameters = {'event_config_file': event_config_file, 'here_route': here_route,
+                             'dot_route': dot_route, 'processes': processes}
+
+    try:
+        transfer_dot_events_to_here(
+            events=load_event_configs(event_config_file),
+            here_route=here_route,
+            here_route_rid_field=here_route_rid_field,
+            dot_route=dot_route,
+            dot_route_rid_field=dot_route_rid_field,
+            dot_route_fd_field=dot_route_fd_field,
+            dot_route_td_field=dot_route_td_field,
+            scratch_folder=scratch_folder,
+            route_metrics_folder=os.path.join(scratch_folder, 'route_metrics'),
+            segmentation_engine=segmentation_engine,
+            in_memory_max_rows=int(in_memory_max_rows) if in_memory_max_rows else 0,
+            processes=int(processes) if processes else None,
+            run_report=run_report
+        )
+        run_report.status = 'success'
+
+    except Exception, err:
+        run_report.status = 'failed'
+        logger.error("Error: {0}".format(err.args[0]))
+        logger.error(traceback.format_exc())
+
+    finally:
+        run_report.save(get_report_path(event_config_file, 'transfer_dot_events_to_here'))
+        pass
@@ -2,14 +2,19 @@ import arcpy
 import os
 import traceback
 
-from src.util.helper import get_scratch_gdb, clear_scratch_gdb
+from src.util.helper import ScratchWorkspace, get_default_parameters, with_scratch_workspace
 from src.config.schema import default_schemas
-from src.tss.ags.field_util import get_field_details
+from src.tss.ags.table_join_util import join_to_dataset
+from src.tss.ags.dao_util import get_count
+from src.tss.ags.route_event_util import load_route_segmenter, write_route_events
+from src.tss.ags.spatial_index_util import build_active_where_clause
+from src.tss.instrument_util import RunReport, get_report_path
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+@with_scratch_workspace
 def transfer_here_event_attribute_to_dot(**kwargs):
     logger.info("Start transferring HERE event attributes to DOT...")
 
@@ -22,9 +27,10 @@ def transfer_here_event_attribute_to_dot(**kwargs):
     dot_route_fd_field = kwargs.get('dot_route_fd_field', None)
     dot_route_td_field = kwargs.get('dot_route_td_field', None)
     output_event_feature = kwargs.get('output_event_feature', None)
+    segmentation_engine = kwargs.get('segmentation_engine', 'arcpy')
+    run_report = kwargs.get('run_report', None) or RunReport('transfer_here_event_attribute_to_dot', get_count)
 
-    scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    scratch_workspace = kwargs['scratch_workspace']
 
     output_schema_name = 'xref_table'
     schemas = default_schemas.get(output_schema_name)
@@ -35,68 +41,35 @@ def transfer_here_event_attribute_to_dot(**kwargs):
     xref_tmeas_field = schemas.get('tmeas_field')
 
     # intermediate outputs
-    here_event_copy = os.path.join(scratch_gdb, 'here_event_copy')
-    xref_table_copy = os.path.join(scratch_gdb, 'xref_table_copy')
-    here_event_w_rid_meas_raw = os.path.join(scratch_gdb, 'here_event_w_rid_meas_raw')
-    here_event_w_rid_meas = os.path.join(scratch_gdb, 'here_event_w_rid_meas')
+    here_event_w_rid_meas = scratch_workspace.path('here_event_w_rid_meas', get_count(here_event))
     active_dot_network_layer = 'active_{0}'.format(os.path.basename(dot_route))
-    here_event_lyr = os.path.join(scratch_gdb, 'here_event_lyr')
-
-    # prepare here event for join. Need to convert the link id field in the input HERE event to the same type of the one
-    # in the xref table to make sure they can be joined together correctly
-    arcpy.Copy_management(xref_table, xref_table_copy)
-    arcpy.CopyFeatures_management(here_event, here_event_copy)
-    xref_here_lid_field_details = get_field_details(xref_table_copy, xref_here_lid_field)
-    tss_here_lid_field = 'TSS_{0}'.format(here_event_lid_field)
-    arcpy.AddField_management(here_event_copy, tss_here_lid_field, xref_here_lid_field_details['field_type'], field_length=255)
-    arcpy.CalculateField_management(here_event_copy, tss_here_lid_field, "!{0}!".format(here_event_lid_field), "PYTHON_9.3")
-
-    here_event_w_rid_meas_lyr = 'here_event_w_rid_meas_lyr'
-    arcpy.MakeQueryTable_management([here_event_copy, xref_table_copy],
-                                    here_event_w_rid_meas_lyr, 'ADD_VIRTUAL_KEY_FIELD',
-                                    where_clause='{0}.{1} = {2}.{3}'.format(os.path.basename(here_event_copy), tss_here_lid_field,
-                                                                            os.path.basename(xref_table_copy), xref_here_lid_field))
-
-    arcpy.CopyFeatures_management(here_event_w_rid_meas_lyr, here_event_w_rid_meas_raw)
-
-    field_mappings = arcpy.FieldMappings()
-
-    if here_event_lid_field not in fields_to_transfer:
-        fields_to_transfer.append(here_event_lid_field)
-
-    for field in fields_to_transfer:
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(here_event_w_rid_meas_raw, '{0}_{1}'.format(os.path.basename(here_event_copy), field))
-        field_name = field_map.outputField
-        field_name.name = field
-        field_name.aliasName = field
-        field_map.outputField = field_name
-        field_mappings.addFieldMap(field_map)
-
-    for field in [xref_dot_rid_field, xref_fmeas_field, xref_tmeas_field]:
-        field_map = arcpy.FieldMap()
-        field_map.addInputField(here_event_w_rid_meas_raw, '{0}_{1}'.format(os.path.basename(xref_table_copy), field))
-        field_name = field_map.outputField
-        field_name.name = field
-        field_name.aliasName = field
-        field_map.outputField = field_name
-        field_mappings.addFieldMap(field_map)
-
-    arcpy.FeatureClassToFeatureClass_conversion(here_event_w_rid_meas_raw, scratch_gdb, os.path.basename(here_event_w_rid_meas), field_mapping=field_mappings)
+    here_event_lyr = 'here_event_lyr'
+
+    # join the XREF route id and measures to the HERE events. Link ids are matched on their normalized values, so the
+    # link id fields of the events and the XREF table do not need to be of the same type
+    with run_report.stage('join_xref_table', inputs=[here_event, xref_table], outputs=here_event_w_rid_meas):
+        if here_event_lid_field not in fields_to_transfer:
+            fields_to_transfer.append(here_event_lid_field)
+
+        join_to_dataset(here_event, here_event_lid_field, xref_table, xref_here_lid_field, here_event_w_rid_meas,
+                        target_fields=fields_to_transfer,
+                        join_fields=[xref_dot_rid_field, xref_fmeas_field, xref_tmeas_field])
 
     # translate here event into DOT event layer
-    active_where_clause = "1=1" if not dot_route_fd_field or not dot_route_td_field else \
-        "({start_date_field} is null or {start_date_field} <= CURRENT_TIMESTAMP) and " \
-        "({end_date_field} is null or {end_date_field} > CURRENT_TIMESTAMP)".format(
-            start_date_field=dot_route_fd_field,
-            end_date_field=dot_route_td_field)
-    arcpy.MakeFeatureLayer_management(dot_route, active_dot_network_layer, active_where_clause)
+    with run_report.stage('locate_events', inputs=here_event_w_rid_meas, outputs=output_event_feature):
+        active_where_clause = build_active_where_clause(dot_route_fd_field, dot_route_td_field)
+        if segmentation_engine == 'in_memory':
+            segmenter, spatial_reference = load_route_segmenter(dot_route, dot_route_rid_field, active_where_clause)
+            write_route_events(segmenter, spatial_reference, here_event_w_rid_meas, xref_dot_rid_field,
+                               xref_fmeas_field, xref_tmeas_field, output_event_feature)
+        else:
+            arcpy.MakeFeatureLayer_management(dot_route, active_dot_network_layer, active_where_clause)
 
-    props = '{0} {1} {2} {3}'.format(xref_dot_rid_field, 'LINE', xref_fmeas_field, xref_tmeas_field)
-    arcpy.MakeRouteEventLayer_lr(active_dot_network_layer, dot_route_rid_field, here_event_w_rid_meas, props, here_event_lyr)
+            props = '{0} {1} {2} {3}'.format(xref_dot_rid_field, 'LINE', xref_fmeas_field, xref_tmeas_field)
+            arcpy.MakeRouteEventLayer_lr(active_dot_network_layer, dot_route_rid_field, here_event_w_rid_meas, props, here_event_lyr)
 
-    arcpy.FeatureClassToFeatureClass_conversion(here_event_lyr, os.path.dirname(output_event_feature),
-                                                os.path.basename(output_event_feature))
+            arcpy.FeatureClassToFeatureClass_conversion(here_event_lyr, os.path.dirname(output_event_feature),
+                                                        os.path.basename(output_event_feature))
 
     logger.info("Finish transferring HERE event attributes to DOT...")
 
@@ -113,12 +86,20 @@ if __name__ == '__main__':
     dot_route_td_field = arcpy.GetParameterAsText(7)
     output_event_feature = arcpy.GetParameterAsText(8)
 
+    Config = get_default_parameters()
+    in_memory_max_rows = Config.get('Default', 'in_memory_max_rows') if Config.has_option('Default', 'in_memory_max_rows') else None
+    segmentation_engine = Config.get('Default', 'segmentation_engine') if Config.has_option('Default', 'segmentation_engine') else 'arcpy'
+
     scratch_folder = os.path.join(os.path.expanduser("~"), ".HERELinearConflation")
-    scratch_gdb = get_scratch_gdb(scratch_folder)
+    scratch_workspace = ScratchWorkspace(scratch_folder, in_memory_max_rows=int(in_memory_max_rows) if in_memory_max_rows else 0)
 
-    arcpy.env.workspace = scratch_gdb
+    arcpy.env.workspace = scratch_workspace.gdb
     arcpy.env.overwriteOutput = True
 
+    run_report = RunReport('transfer_here_event_attribute_to_dot', get_count)
+    run_report.parameters = {'here_event': here_event, 'xref_table': xref_table, 'dot_route': dot_route,
+                             'output_event_feature': output_event_feature}
+
     try:
         transfer_here_event_attribute_to_dot(
             here_event=here_event,
@@ -129,13 +110,19 @@ if __name__ == '__main__':
             dot_route_rid_field=dot_route_rid_field,
             dot_route_fd_field=dot_route_fd_field,
             dot_route_td_field=dot_route_td_field,
-            output_event_feature=output_event_feature
+            output_event_feature=output_event_feature,
+            segmentation_engine=segmentation_engine,
+            run_report=run_report,
+            scratch_workspace=scratch_workspace
         )
+        run_report.status = 'success'
     except Exception, err:
+        run_report.status = 'failed'
         logger.error("Error: {0}".format(err.args[0]))
         logger.error(traceback.format_exc())
 
     finally:
-        # clear_scratch_gdb(scratch_gdb)
+        run_report.save(get_report_path(output_event_feature, 'transfer_here_event_attribute_to_dot'))
+        scratch_workspace.cleanup()
         pass
 